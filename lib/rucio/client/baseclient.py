@@ -40,12 +40,14 @@ from urllib.parse import urlparse
 
 from rucio import version
 from rucio.common import exception
+from rucio.common.cache import DiskCache
 from rucio.common.config import config_get, config_get_bool, config_get_int
 from rucio.common.exception import (CannotAuthenticate, ClientProtocolNotSupported,
                                     NoAuthInformation, MissingClientParameter,
                                     MissingModuleException, ServerConnectionException, ServerSSLCertificateExpiredException)
 from rucio.common.extra import import_extras
-from rucio.common.utils import build_url, get_tmp_dir, my_key_generator, parse_response, ssh_sign, setup_logger, date_to_str
+from rucio.common.http_encoding import JSON_STREAM, MSGPACK_STREAM, compress, iter_msgpack_stream, msgpack_available, negotiate_encoding
+from rucio.common.utils import build_url, datetime_parser, get_tmp_dir, my_key_generator, parse_response, ssh_sign, setup_logger, date_to_str
 
 EXTRA_MODULES = import_extras(['requests_kerberos', 'cryptography'])
 
@@ -63,6 +65,10 @@ REGION = make_region(function_key_generator=my_key_generator).configure(
 
 STATUS_CODES_TO_RETRY = [502, 503, 504]
 MAX_RETRY_BACK_OFF_SECONDS = 10
+# Request bodies smaller than this are sent uncompressed
+REQUEST_COMPRESSION_THRESHOLD = 4096
+# Seconds during which the responses kept in the metadata cache are used without revalidation
+METADATA_CACHE_TTL = 900
 
 
 @REGION.cache_on_arguments(namespace='host_to_choose')
@@ -107,6 +113,9 @@ class BaseClient(object):
         self.auth_host = auth_host
         self.logger = logger or LOG
         self.session = Session()
+        # Content encoding accepted by each server for the request bodies, as advertised in its responses
+        self.request_encodings = {}
+        self.request_compression_threshold = config_get_int('client', 'request_compression_threshold', False, REQUEST_COMPRESSION_THRESHOLD)
         self.user_agent = "%s/%s" % (user_agent, version.version_string())  # e.g. "rucio-clients/0.2.13"
         sys.argv[0] = sys.argv[0].split('/')[-1]
         self.script_id = '::'.join(sys.argv[0:2])
@@ -143,6 +152,14 @@ class BaseClient(object):
         self.auth_oidc_refresh_before_exp = config_get_int('client', 'auth_oidc_refresh_before_exp', False, 20)
         self.sslexpiry_warnlimit_weeks: int = config_get_int('client', 'sslexpiry_warnlimit_weeks', False, 2)
         self.sslexpiry_warnclient: bool = config_get_bool('client', 'sslexpiry_warnclient', False, True)
+        self.metadata_cache = None
+        self.metadata_cache_ttl = config_get_int('client', 'metadata_cache_ttl', False, METADATA_CACHE_TTL)
+        if config_get_bool('client', 'metadata_cache', False, False):
+            metadata_cache_dir = config_get('client', 'metadata_cache_dir', False, path.join(get_tmp_dir(), '.rucio_metadata_cache'))
+            try:
+                self.metadata_cache = DiskCache(metadata_cache_dir)
+            except OSError as error:
+                self.logger.warning('Cannot use the metadata cache directory %s: %s' % (metadata_cache_dir, error))
 
         if auth_type is None:
             self.logger.debug('No auth_type passed. Trying to get it from the environment variable RUCIO_AUTH_TYPE and config file.')
@@ -333,16 +350,107 @@ class BaseClient(object):
 
         :param response: the response received from the server.
         """
-        if 'content-type' in response.headers and response.headers['content-type'] == 'application/x-json-stream':
+        if 'content-type' in response.headers and response.headers['content-type'] == JSON_STREAM:
             for line in response.iter_lines():
                 if line:
                     yield parse_response(line)
+        elif 'content-type' in response.headers and response.headers['content-type'] == MSGPACK_STREAM:
+            yield from iter_msgpack_stream(response.iter_content(chunk_size=64 * 1024), object_hook=datetime_parser)
         elif 'content-type' in response.headers and response.headers['content-type'] == 'application/json':
             yield parse_response(response.text)
         else:  # Exception ?
             if response.text:
                 yield response.text
 
+    def _send_cached_request(self, url, cacheable=None):
+        """
+        Helper method to send a GET request whose successful response is kept in the metadata cache, if it
+        is enabled. A cached response is used during metadata_cache_ttl seconds, then it is revalidated with
+        the ETag or Last-Modified date sent by the server.
+
+        :param url: the http url to use.
+        :param cacheable: (optional) function called with a successful response, returning False if it must not be cached.
+        :return: the HTTP response.
+        """
+        if self.metadata_cache is None:
+            return self._send_request(url, type_='GET')
+
+        parsed = urlparse(url)
+        key = ' '.join([self.host, str(self.vo), str(self.account), parsed.path, parsed.query])
+        cached = self.metadata_cache.get(key)
+        headers = {}
+        if cached is not None:
+            stored_at, entry = cached
+            if time.time() - stored_at < self.metadata_cache_ttl:
+                self.logger.debug('Metadata cache hit: %s' % url)
+                return self._cached_response(url, entry)
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        result = self._send_request(url, headers=headers, type_='GET')
+        if cached is not None and result.status_code == codes.not_modified:  # pylint: disable-msg=E1101
+            self.metadata_cache.touch(key)
+            return self._cached_response(url, entry)
+        if result.status_code == codes.ok and (cacheable is None or cacheable(result)):
+            self.metadata_cache.set(key, {'etag': result.headers.get('ETag'),
+                                          'last_modified': result.headers.get('Last-Modified'),
+                                          'content_type': result.headers.get('Content-Type'),
+                                          'text': result.text})
+        elif cached is not None:
+            self.metadata_cache.delete(key)
+        return result
+
+    @staticmethod
+    def _cached_response(url, entry):
+        """
+        Helper method to rebuild a response kept in the metadata cache.
+
+        :param url: the http url of the request.
+        :param entry: the cached entry.
+        :return: the HTTP response.
+        """
+        response = Response()
+        response.status_code = codes.ok
+        response.url = url
+        response.encoding = 'utf-8'
+        if entry.get('content_type'):
+            response.headers['Content-Type'] = entry['content_type']
+        response._content = entry['text'].encode('utf-8')
+        response._content_consumed = True
+        return response
+
+    def _stream_headers(self, headers=None):
+        """
+        Helper method to request the compact msgpack encoding of a x-json-stream response,
+        when it is supported. The response must be read with :func:`_load_json_data`.
+
+        :param headers: the other http headers of the request.
+        :returns: the http headers of the request.
+        """
+        headers = dict(headers or {})
+        if msgpack_available() and 'Accept' not in headers:
+            headers['Accept'] = '%s, %s;q=0.9' % (MSGPACK_STREAM, JSON_STREAM)
+        return headers
+
+    def _compress_data(self, url, hds, data):
+        """
+        Helper method to compress a request body, if it is large enough and the server accepts a supported encoding.
+
+        :param url: the http url of the request.
+        :param hds: the http headers of the request, updated with the Content-Encoding.
+        :param data: the request body.
+        :returns: the request body to send.
+        """
+        encoding = self.request_encodings.get(urlparse(url).netloc)
+        if not encoding or not data or len(data) < self.request_compression_threshold or 'Content-Encoding' in hds:
+            return data
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        hds['Content-Encoding'] = encoding
+        return compress(data, encoding)
+
     def _reduce_data(self, data, maxlen=132):
         text = data if isinstance(data, str) else data.decode("utf-8")
         if len(text) > maxlen:
@@ -396,6 +504,9 @@ class BaseClient(object):
         if type_ != "GET" and data:
             text = self._reduce_data(data)
             self.logger.debug("Request data (length=%d): [%s]" % (len(data), text))
+        plain_data = data
+        if type_ != "GET":
+            data = self._compress_data(url, hds, data)
 
         result = None
         SSLvalid: bool = False
@@ -413,6 +524,12 @@ class BaseClient(object):
                     self.logger.debug("Unknown request type %s. Request was not sent" % (type_,))
                     return None
                 self.logger.debug("HTTP Response: %s %s" % (result.status_code, result.reason))
+                self.request_encodings[urlparse(url).netloc] = negotiate_encoding(result.headers.get('Accept-Encoding'))
+                if result.status_code == codes.unsupported_media_type and 'Content-Encoding' in hds:  # pylint: disable-msg=E1101
+                    # The server does not accept this encoding anymore, send the request body uncompressed
+                    data = plain_data
+                    del hds['Content-Encoding']
+                    continue
                 if result.status_code in STATUS_CODES_TO_RETRY:
                     self._back_off(retry, 'server returned {}'.format(result.status_code))
                     continue
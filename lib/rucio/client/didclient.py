@@ -63,7 +63,7 @@ class DIDClient(BaseClient):
 
         url = build_url(choice(self.list_hosts), path=path, params=payload)
 
-        r = self._send_request(url, type_='GET')
+        r = self._send_request(url, headers=self._stream_headers(), type_='GET')
 
         if r.status_code == codes.ok:
             dids = self._load_json_data(r)
@@ -354,7 +354,7 @@ class DIDClient(BaseClient):
 
         path = '/'.join([self.DIDS_BASEURL, quote_plus(scope), quote_plus(name), 'dids'])
         url = build_url(choice(self.list_hosts), path=path)
-        r = self._send_request(url, type_='GET')
+        r = self._send_request(url, headers=self._stream_headers(), type_='GET')
         if r.status_code == codes.ok:
             return self._load_json_data(r)
         exc_cls, exc_msg = self._get_exception(headers=r.headers, status_code=r.status_code, data=r.content)
@@ -391,7 +391,7 @@ class DIDClient(BaseClient):
             payload['long'] = True
         url = build_url(choice(self.list_hosts), path=path, params=payload)
 
-        r = self._send_request(url, type_='GET')
+        r = self._send_request(url, headers=self._stream_headers(), type_='GET')
         if r.status_code == codes.ok:
             return self._load_json_data(r)
         else:
@@ -416,7 +416,8 @@ class DIDClient(BaseClient):
         elif dynamic:
             params['dynamic_depth'] = 'FILE'
         url = build_url(choice(self.list_hosts), path=path, params=params)
-        r = self._send_request(url, type_='GET')
+        # The metadata of the files is immutable, unlike the one of the collections
+        r = self._send_cached_request(url, cacheable=lambda response: not params and loads(response.text).get('type') == 'FILE')
         if r.status_code == codes.ok:
             return next(self._load_json_data(r))
         else:
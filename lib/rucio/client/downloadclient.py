@@ -24,17 +24,20 @@ import signal
 import time
 import subprocess
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from queue import Queue, Empty, deque
-from threading import Thread
+from threading import BoundedSemaphore, Lock, Thread
+from urllib.parse import urlparse
 
 from rucio.client.client import Client
-from rucio.common.config import config_get
+from rucio.common.config import config_get, config_get_int
 from rucio.common.exception import (InputValidationError, NoFilesDownloaded, NotAllFilesDownloaded, RucioException)
 from rucio.common.didtype import DID
 from rucio.common.pcache import Pcache
-from rucio.common.utils import adler32, detect_client_location, generate_uuid, parse_replicas_from_string, \
+from rucio.common.utils import adler32, detect_client_location, generate_uuid, \
     send_trace, sizefmt, execute, parse_replicas_from_file, extract_scope
-from rucio.common.utils import GLOBALLY_SUPPORTED_CHECKSUMS, CHECKSUM_ALGO_DICT, PREFERRED_CHECKSUM
+from rucio.common.utils import GLOBALLY_SUPPORTED_CHECKSUMS, CHECKSUM_ALGO_DICT, CHECKSUM_HASHERS, PREFERRED_CHECKSUM
 from rucio.rse import rsemanager as rsemgr
 from rucio import version
 
@@ -54,6 +57,83 @@ class FileDownloadState(str, enum.Enum):
     FAILED = "FAILED"
 
 
+class AdaptiveConcurrency:
+    """
+    Adapts the number of download threads to the measured throughput: starting from `initial`,
+    `step` threads are added as long as the previous addition improved the throughput by at
+    least `min_gain`, up to `maximum` threads.
+    """
+
+    def __init__(self, initial, maximum, interval=5, step=2, min_gain=0.1):
+        self.maximum = maximum
+        self.target = min(initial, maximum)
+        self.interval = interval
+        self.step = step
+        self.min_gain = min_gain
+        self._bytes = 0
+        self._lock = Lock()
+        self._sampled_at = time.monotonic()
+        self._throughput = None
+        self._growing = True
+
+    def add_bytes(self, nbytes):
+        """
+        Count downloaded bytes in the throughput.
+        """
+        with self._lock:
+            self._bytes += nbytes
+
+    def update(self):
+        """
+        Measure the throughput since the previous measure, at most once per interval, and adapt the target.
+
+        :returns: the target number of threads
+        """
+        now = time.monotonic()
+        if not self._growing or now - self._sampled_at < self.interval:
+            return self.target
+        with self._lock:
+            nbytes, self._bytes = self._bytes, 0
+        if not nbytes:
+            # Nothing finished yet, keep measuring over a longer period
+            return self.target
+
+        throughput = nbytes / max(now - self._sampled_at, 1e-6)
+        self._sampled_at = now
+        if self._throughput is not None and throughput < self._throughput * (1 + self.min_gain):
+            self._growing = False
+        else:
+            self._throughput = throughput
+            self.target = min(self.maximum, self.target + self.step)
+            self._growing = self.target < self.maximum
+        return self.target
+
+
+class HostConcurrencyLimiter:
+    """
+    Limits the number of concurrent downloads from each storage host.
+    """
+
+    def __init__(self, max_per_host):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def limit(self, pfn):
+        """
+        Context manager holding one of the download slots of the host of the PFN.
+        """
+        host = urlparse(pfn).hostname
+        if not host or self.max_per_host <= 0:
+            yield
+            return
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            yield
+
+
 class BaseExtractionTool:
 
     def __init__(self, program_name, useability_check_args, extract_args, logger=logging.log):
@@ -177,6 +257,13 @@ class DownloadClient:
         self.extraction_tools.append(BaseExtractionTool('tar', '--version', extract_args, logger=self.logger))
         self.extract_scope_convention = config_get('common', 'extract_scope', False, None)
 
+        # Concurrency of the downloads: the number of threads grows with the throughput up to max_threads,
+        # and files larger than two chunks are downloaded with parallel range requests when the protocol supports them
+        self.max_threads = config_get_int('download', 'max_threads', False, 16, check_config_table=False)
+        self.host_limiter = HostConcurrencyLimiter(config_get_int('download', 'max_connections_per_host', False, 8, check_config_table=False))
+        self.chunk_size = config_get_int('download', 'chunk_size', False, 16 * 1024 * 1024, check_config_table=False)
+        self.chunk_streams = config_get_int('download', 'chunk_streams', False, 4, check_config_table=False)
+
     def download_pfns(self, items, num_threads=2, trace_custom_fields={}, traces_copy_out=None, deactivate_file_download_exceptions=False):
         """
         Download items with a given PFN. This function can only download files, no datasets.
@@ -356,7 +443,8 @@ class DownloadClient:
 
     def _download_multithreaded(self, input_items, num_threads, trace_custom_fields={}, traces_copy_out=None):
         """
-        Starts an appropriate number of threads to download items from the input list.
+        Starts an appropriate number of threads to download items from the input list, and adds
+        threads as long as it improves the measured throughput.
         (This function is meant to be used as class internal only)
 
         :param input_items: list containing the input items to download
@@ -369,9 +457,9 @@ class DownloadClient:
         logger = self.logger
 
         num_files = len(input_items)
-        nlimit = 5
+        max_threads = max(1, min(num_files, self.max_threads))
         num_threads = max(1, num_threads)
-        num_threads = min(num_files, num_threads, nlimit)
+        num_threads = min(num_threads, max_threads)
 
         input_queue = Queue()
         output_queue = Queue()
@@ -382,15 +470,16 @@ class DownloadClient:
             self._download_worker(input_queue, output_queue, trace_custom_fields, traces_copy_out, '')
             return list(output_queue.queue)
 
-        logger(logging.INFO, 'Using %d threads to download %d files' % (num_threads, num_files))
-        threads = []
-        for thread_num in range(0, num_threads):
-            log_prefix = 'Thread %s/%s: ' % (thread_num, num_threads)
+        concurrency = AdaptiveConcurrency(initial=num_threads, maximum=max_threads)
+
+        def start_thread(thread_num):
+            log_prefix = 'Thread %s/%s: ' % (thread_num, max_threads)
             kwargs = {'input_queue': input_queue,
                       'output_queue': output_queue,
                       'trace_custom_fields': trace_custom_fields,
                       'traces_copy_out': traces_copy_out,
-                      'log_prefix': log_prefix}
+                      'log_prefix': log_prefix,
+                      'concurrency': concurrency}
             try:
                 thread = Thread(target=self._download_worker, kwargs=kwargs)
                 thread.start()
@@ -399,17 +488,33 @@ class DownloadClient:
                 logger(logging.WARNING, 'Failed to start thread %d' % thread_num)
                 logger(logging.DEBUG, error)
 
+        logger(logging.INFO, 'Using %d threads to download %d files' % (num_threads, num_files))
+        threads = []
+        for thread_num in range(0, num_threads):
+            start_thread(thread_num)
+        num_started = num_threads
+
         try:
             logger(logging.DEBUG, 'Waiting for threads to finish')
-            for thread in threads:
-                thread.join()
+            while True:
+                alive_threads = [thread for thread in threads if thread.is_alive()]
+                if not alive_threads:
+                    break
+                alive_threads[0].join(timeout=1)
+
+                target = concurrency.update()
+                if num_started < target and not input_queue.empty():
+                    logger(logging.INFO, 'Increasing the number of download threads from %d to %d' % (num_started, target))
+                    while num_started < target:
+                        start_thread(num_started)
+                        num_started += 1
         except KeyboardInterrupt:
             logger(logging.WARNING, 'You pressed Ctrl+C! Exiting gracefully')
             for thread in threads:
                 thread.kill_received = True
         return list(output_queue.queue)
 
-    def _download_worker(self, input_queue, output_queue, trace_custom_fields, traces_copy_out, log_prefix):
+    def _download_worker(self, input_queue, output_queue, trace_custom_fields, traces_copy_out, log_prefix, concurrency=None):
         """
         This function runs as long as there are items in the input queue,
         downloads them and stores the output in the output queue.
@@ -420,6 +525,7 @@ class DownloadClient:
         :param trace_custom_fields: Custom key value pairs to send with the traces
         :param traces_copy_out: reference to an external list, where the traces should be uploaded
         :param log_prefix: string that will be put at the beginning of every log message
+        :param concurrency: optional AdaptiveConcurrency measuring the throughput of the downloads
         """
         logger = self.logger
 
@@ -434,6 +540,8 @@ class DownloadClient:
                 trace.update(trace_custom_fields)
                 download_result = self._download_item(item, trace, traces_copy_out, log_prefix)
                 output_queue.put(download_result)
+                if concurrency and download_result.get('clientState') == FileDownloadState.DONE:
+                    concurrency.add_bytes(download_result.get('bytes') or 0)
             except KeyboardInterrupt:
                 logger(logging.WARNING, 'You pressed Ctrl+C! Exiting gracefully')
                 os.kill(os.getpgid(), signal.SIGINT)
@@ -637,8 +745,9 @@ class DownloadClient:
 
                 start_time = time.time()
 
+                checksums = None
                 try:
-                    protocol.get(pfn, temp_file_path, transfer_timeout=transfer_timeout)
+                    checksums = self._get_pfn(protocol, pfn, temp_file_path, item, transfer_timeout, log_prefix)
                     success = True
                 except Exception as error:
                     logger(logging.DEBUG, error)
@@ -648,7 +757,7 @@ class DownloadClient:
                 end_time = time.time()
 
                 if success and not item.get('merged_options', {}).get('ignore_checksum', False):
-                    verified, rucio_checksum, local_checksum = _verify_checksum(item, temp_file_path)
+                    verified, rucio_checksum, local_checksum = _verify_checksum(item, temp_file_path, checksums)
                     if not verified:
                         success = False
                         os.unlink(temp_file_path)
@@ -733,6 +842,37 @@ class DownloadClient:
 
         return item
 
+    def _get_pfn(self, protocol, pfn, dest_file_path, item, transfer_timeout, log_prefix=''):
+        """
+        Downloads one PFN with a connected protocol, with parallel range requests when the protocol
+        supports them and the file is larger than two chunks.
+        (This function is meant to be used as class internal only)
+
+        :param protocol: the connected protocol
+        :param pfn: the PFN to download
+        :param dest_file_path: the path of the downloaded file
+        :param item: dictionary that describes the item to download
+        :param transfer_timeout: timeout in seconds
+        :param log_prefix: string that will be put at the beginning of every log message
+
+        :returns: dictionary {checksum_name: checksum} of the checksums computed during the download, None if they were not computed
+        """
+        size = item.get('bytes')
+        if self.chunk_streams > 1 and size and size >= 2 * self.chunk_size and hasattr(protocol, 'get_range'):
+            checksum_names = []
+            checksum_name = _checksum_to_verify(item)
+            if checksum_name in CHECKSUM_HASHERS and not item.get('merged_options', {}).get('ignore_checksum', False):
+                checksum_names.append(checksum_name)
+            try:
+                return _download_in_chunks(protocol, pfn, dest_file_path, size, self.chunk_size, self.chunk_streams,
+                                           self.host_limiter, checksum_names=checksum_names, transfer_timeout=transfer_timeout)
+            except Exception as error:
+                self.logger(logging.DEBUG, '%sDownload with range requests failed, retrying with a single stream: %s' % (log_prefix, error))
+
+        with self.host_limiter.limit(pfn):
+            protocol.get(pfn, dest_file_path, transfer_timeout=transfer_timeout)
+        return None
+
     def download_aria2c(self, items, trace_custom_fields={}, filters={}, deactivate_file_download_exceptions=False, sort=None):
         """
         Uses aria2c to download the items with given DIDs. This function can also download datasets and wildcarded DIDs.
@@ -1175,17 +1315,17 @@ class DownloadClient:
             if nrandom:
                 logger(logging.INFO, 'Selecting %d random replicas from DID(s): %s' % (nrandom, [str(did) for did in input_dids]))
 
-            metalink_str = self.client.list_replicas([{'scope': did.scope, 'name': did.name} for did in input_dids],
-                                                     schemes=schemes,
-                                                     ignore_availability=False,
-                                                     rse_expression=rse_expression,
-                                                     client_location=self.client_location,
-                                                     sort=sort,
-                                                     resolve_archives=not item.get('no_resolve_archives'),
-                                                     resolve_parents=True,
-                                                     nrandom=nrandom,
-                                                     metalink=True)
-            file_items = parse_replicas_from_string(metalink_str)
+            file_items = list(self.client.list_replicas([{'scope': did.scope, 'name': did.name} for did in input_dids],
+                                                        schemes=schemes,
+                                                        ignore_availability=False,
+                                                        rse_expression=rse_expression,
+                                                        client_location=self.client_location,
+                                                        sort=sort,
+                                                        resolve_archives=not item.get('no_resolve_archives'),
+                                                        resolve_parents=True,
+                                                        nrandom=nrandom,
+                                                        metalink=True,
+                                                        parse_metalink=True))
             for file in file_items:
                 if impl:
                     file['impl'] = impl
@@ -1656,20 +1796,88 @@ class DownloadClient:
         return supported_impl
 
 
-def _verify_checksum(item, path):
-    rucio_checksum = item.get(PREFERRED_CHECKSUM)
-    local_checksum = None
-    checksum_algo = CHECKSUM_ALGO_DICT.get(PREFERRED_CHECKSUM)
-
-    if rucio_checksum and checksum_algo:
-        local_checksum = checksum_algo(path)
-        return rucio_checksum == local_checksum, rucio_checksum, local_checksum
+def _download_in_chunks(protocol, pfn, dest_file_path, size, chunk_size, streams, host_limiter, checksum_names=(), transfer_timeout=None):
+    """
+    Downloads a file with parallel range requests. Each chunk is written at its offset as soon as it
+    is received, and the checksums are computed incrementally over the received chunks at the
+    beginning of the file while the next chunks are downloaded, instead of re-reading the whole
+    file at the end.
+
+    :param protocol: connected protocol implementing get_range(pfn, offset, length, transfer_timeout)
+    :param pfn: the PFN to download
+    :param dest_file_path: the path of the downloaded file
+    :param size: the size of the file in bytes
+    :param chunk_size: the size of the range requests in bytes
+    :param streams: the number of parallel range requests
+    :param host_limiter: HostConcurrencyLimiter holding one slot of the host per range request
+    :param checksum_names: names of the checksums to compute (keys of CHECKSUM_HASHERS)
+    :param transfer_timeout: timeout in seconds of each range request
+
+    :returns: dictionary {checksum_name: hexadecimal checksum}
+    """
+    hashers = {checksum_name: CHECKSUM_HASHERS[checksum_name]() for checksum_name in checksum_names}
+    chunks = [(offset, min(chunk_size, size - offset)) for offset in range(0, size, chunk_size)]
+    lock = Lock()
+
+    with open(dest_file_path, 'wb+') as dest_file:
+        dest_file.truncate(size)
+
+        def fetch(offset, length):
+            with host_limiter.limit(pfn):
+                data = protocol.get_range(pfn, offset, length, transfer_timeout=transfer_timeout)
+            if len(data) != length:
+                raise RucioException('Received %d bytes instead of %d at offset %d of %s' % (len(data), length, offset, pfn))
+            with lock:
+                dest_file.seek(offset)
+                dest_file.write(data)
+
+        received = set()
+        next_to_hash = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(streams, len(chunks)))) as executor:
+            futures = {executor.submit(fetch, offset, length): index for index, (offset, length) in enumerate(chunks)}
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    received.add(futures[future])
+                    while next_to_hash in received:
+                        offset, length = chunks[next_to_hash]
+                        if hashers:
+                            with lock:
+                                dest_file.seek(offset)
+                                data = dest_file.read(length)
+                            for hasher in hashers.values():
+                                hasher.update(data)
+                        next_to_hash += 1
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    return {checksum_name: hasher.hexdigest() for checksum_name, hasher in hashers.items()}
+
+
+def _checksum_to_verify(item):
+    """
+    :returns: the name of the checksum used to verify a downloaded item, None if the item has no supported checksum
+    """
+    if item.get(PREFERRED_CHECKSUM) and CHECKSUM_ALGO_DICT.get(PREFERRED_CHECKSUM):
+        return PREFERRED_CHECKSUM
 
     for checksum_name in GLOBALLY_SUPPORTED_CHECKSUMS:
-        rucio_checksum = item.get(checksum_name)
-        checksum_algo = CHECKSUM_ALGO_DICT.get(checksum_name)
-        if rucio_checksum and checksum_algo:
-            local_checksum = checksum_algo(path)
-            return rucio_checksum == local_checksum, rucio_checksum, local_checksum
-
-    return False, None, None
+        if item.get(checksum_name) and CHECKSUM_ALGO_DICT.get(checksum_name):
+            return checksum_name
+    return None
+
+
+def _verify_checksum(item, path, checksums=None):
+    checksum_name = _checksum_to_verify(item)
+    if not checksum_name:
+        return False, None, None
+
+    rucio_checksum = item[checksum_name]
+    if checksums and checksum_name in checksums:
+        # Computed during the download
+        local_checksum = checksums[checksum_name]
+    else:
+        local_checksum = CHECKSUM_ALGO_DICT[checksum_name](path)
+    return rucio_checksum == local_checksum, rucio_checksum, local_checksum
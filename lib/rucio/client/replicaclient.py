@@ -21,7 +21,7 @@ from urllib.parse import quote_plus
 
 from rucio.client.baseclient import BaseClient
 from rucio.client.baseclient import choice
-from rucio.common.utils import build_url, render_json, chunks
+from rucio.common.utils import build_url, render_json, chunks, parse_replicas_metalink_stream
 
 
 class ReplicaClient(BaseClient):
@@ -29,6 +29,7 @@ class ReplicaClient(BaseClient):
 
     REPLICAS_BASEURL = 'replicas'
     REPLICAS_CHUNK_SIZE = 1000
+    METALINK_CHUNK_SIZE = 64 * 1024
 
     def quarantine_replicas(self, replicas, rse=None, rse_id=None):
         """
@@ -131,7 +132,7 @@ class ReplicaClient(BaseClient):
                       client_location=None, sort=None, domain=None,
                       signature_lifetime=None, nrandom=None,
                       resolve_archives=True, resolve_parents=False,
-                      updated_after=None):
+                      updated_after=None, parse_metalink=False):
         """
         List file replicas for a list of data identifiers (DIDs).
 
@@ -152,6 +153,8 @@ class ReplicaClient(BaseClient):
         :param resolve_archives: When set to True, find archives which contain the replicas.
         :param resolve_parents: When set to True, find all parent datasets which contain the replicas.
         :param updated_after: epoch timestamp or datetime object (UTC time), only return replicas updated after this time
+        :param parse_metalink: If set together with metalink, the metalink is parsed incrementally while it is received
+                               and the files are returned as with :func:`rucio.common.utils.parse_replicas_metalink`.
 
         :returns: A list of dictionaries with replica information.
 
@@ -197,12 +200,16 @@ class ReplicaClient(BaseClient):
         headers = {}
         if metalink:
             headers['Accept'] = 'application/metalink4+xml'
+        else:
+            headers = self._stream_headers(headers)
 
         # pass json dict in querystring
         r = self._send_request(url, headers=headers, type_='POST', data=dumps(data), stream=True)
         if r.status_code == codes.ok:
             if not metalink:
                 return self._load_json_data(r)
+            if parse_metalink:
+                return parse_replicas_metalink_stream(r.iter_content(chunk_size=self.METALINK_CHUNK_SIZE))
             return r.text
         exc_cls, exc_msg = self._get_exception(headers=r.headers, status_code=r.status_code, data=r.content)
         raise exc_cls(exc_msg)
@@ -41,7 +41,7 @@ class RSEClient(BaseClient):
         path = '/'.join([self.RSE_BASEURL, rse])
         url = build_url(choice(self.list_hosts), path=path)
 
-        r = self._send_request(url, type_='GET')
+        r = self._send_cached_request(url)
         if r.status_code == codes.ok:
             rse = loads(r.text)
             return rse
@@ -182,7 +182,7 @@ class RSEClient(BaseClient):
         """
         path = '/'.join([self.RSE_BASEURL, rse, 'attr/'])
         url = build_url(choice(self.list_hosts), path=path)
-        r = self._send_request(url, type_='GET')
+        r = self._send_cached_request(url)
         if r.status_code == codes.ok:
             attributes = loads(r.text)
             return attributes
@@ -258,7 +258,7 @@ class RSEClient(BaseClient):
         params['protocol_domain'] = protocol_domain
         url = build_url(choice(self.list_hosts), path=path, params=params)
 
-        r = self._send_request(url, type_='GET')
+        r = self._send_cached_request(url)
         if r.status_code == codes.ok:
             protocols = loads(r.text)
             return protocols
@@ -22,6 +22,8 @@ import socket
 import logging
 import time
 import random
+from queue import Queue, Empty
+from threading import Event, Thread
 
 from rucio.client.client import Client
 from rucio.common.config import config_get_int, config_get
@@ -29,7 +31,7 @@ from rucio.common.exception import (RucioException, RSEWriteBlocked, DataIdentif
                                     DataIdentifierNotFound, NoFilesUploaded, NotAllFilesUploaded, FileReplicaAlreadyExists,
                                     ResourceTemporaryUnavailable, ServiceUnavailable, InputValidationError, RSEChecksumUnavailable,
                                     ScopeNotFound)
-from rucio.common.utils import (adler32, detect_client_location, execute, generate_uuid, make_valid_did, md5, send_trace,
+from rucio.common.utils import (calculate_checksums_bulk, detect_client_location, execute, generate_uuid, make_valid_did, send_trace,
                                 retry, GLOBALLY_SUPPORTED_CHECKSUMS)
 from rucio.rse import rsemanager as rsemgr
 from rucio import version
@@ -37,6 +39,8 @@ from rucio import version
 
 class UploadClient:
 
+    REGISTRATION_BULK_SIZE = 100
+
     def __init__(self, _client=None, logger=None, tracing=True):
         """
         Initialises the basic settings for an UploadClient object
@@ -58,7 +62,9 @@ class UploadClient:
             logger(logging.DEBUG, 'Tracing is turned off.')
         self.default_file_scope = 'user.' + self.client.account
         self.rses = {}
+        self.rse_attributes = {}
         self.rse_expressions = {}
+        self.account_scopes = None
 
         self.trace = {}
         self.trace['hostname'] = socket.getfqdn()
@@ -68,7 +74,7 @@ class UploadClient:
         self.trace['eventType'] = 'upload'
         self.trace['eventVersion'] = version.RUCIO_VERSION[0]
 
-    def upload(self, items, summary_file_path=None, traces_copy_out=None, ignore_availability=False, activity=None):
+    def upload(self, items, summary_file_path=None, traces_copy_out=None, ignore_availability=False, activity=None, num_threads=1):
         """
         :param items: List of dictionaries. Each dictionary describing a file to upload. Keys:
             path                  - path of the file that will be uploaded
@@ -91,6 +97,8 @@ class UploadClient:
         :param traces_copy_out: reference to an external list, where the traces should be uploaded
         :param ignore_availability: ignore the availability of a RSE
         :param activity: the activity set to the rule if no dataset is specified
+        :param num_threads: number of files to upload in parallel. The files, their replica states and
+                            dataset attachments are registered in bulk.
 
         :returns: 0 on success
 
@@ -125,6 +133,10 @@ class UploadClient:
                 rse_settings = self.rses.setdefault(rse, rsemgr.get_rse_info(rse, vo=self.client.vo))
                 if not ignore_availability and rse_settings['availability_write'] != 1:
                     raise RSEWriteBlocked('%s is not available for writing. No actions have been taken' % rse)
+                try:
+                    self.rse_attributes[rse] = self.client.list_rse_attributes(rse)
+                except:
+                    logger(logging.WARNING, 'Attributes of the RSE: %s not available.' % rse)
 
             dataset_scope = file.get('dataset_scope')
             dataset_name = file.get('dataset_name')
@@ -144,171 +156,89 @@ class UploadClient:
         registered_dataset_dids = set()
         num_succeeded = 0
         summary = []
-        for file in files:
-            basename = file['basename']
-            logger(logging.INFO, 'Preparing upload for file %s' % basename)
-
-            no_register = file.get('no_register')
-            register_after_upload = file.get('register_after_upload') and not no_register
-            pfn = file.get('pfn')
-            force_scheme = file.get('force_scheme')
-            impl = file.get('impl')
-            delete_existing = False
-
-            trace = copy.deepcopy(self.trace)
-            # appending trace to list reference, if the reference exists
-            if traces_copy_out is not None:
-                traces_copy_out.append(trace)
-
-            rse = file['rse']
-            trace['scope'] = file['did_scope']
-            trace['datasetScope'] = file.get('dataset_scope', '')
-            trace['dataset'] = file.get('dataset_name', '')
-            trace['remoteSite'] = rse
-            trace['filesize'] = file['bytes']
-
-            file_did = {'scope': file['did_scope'], 'name': file['did_name']}
-            dataset_did_str = file.get('dataset_did_str')
-            rse_settings = self.rses[rse]
-            rse_sign_service = rse_settings.get('sign_url', None)
-            is_deterministic = rse_settings.get('deterministic', True)
-            if not is_deterministic and not pfn:
-                logger(logging.ERROR, 'PFN has to be defined for NON-DETERMINISTIC RSE.')
-                continue
-            if pfn and is_deterministic:
-                logger(logging.WARNING, 'Upload with given pfn implies that no_register is True, except non-deterministic RSEs')
-                no_register = True
-
-            # resolving local area networks
-            domain = 'wan'
-            rse_attributes = {}
-            try:
-                rse_attributes = self.client.list_rse_attributes(rse)
-            except:
-                logger(logging.WARNING, 'Attributes of the RSE: %s not available.' % rse)
-            if (self.client_location and 'lan' in rse_settings['domain'] and 'site' in rse_attributes):
-                if self.client_location['site'] == rse_attributes['site']:
-                    domain = 'lan'
-            logger(logging.DEBUG, '{} domain is used for the upload'.format(domain))
-
-            # FIXME:
-            # Rewrite preferred_impl selection - also check test_upload.py/test_download.py and fix impl order (see FIXME there)
-            #
-            # if not impl and not force_scheme:
-            #    impl = self.preferred_impl(rse_settings, domain)
-
-            if not no_register and not register_after_upload:
-                self._register_file(file, registered_dataset_dids, ignore_availability=ignore_availability, activity=activity)
-
-            # if register_after_upload, file should be overwritten if it is not registered
-            # otherwise if file already exists on RSE we're done
-            if register_after_upload:
-                if rsemgr.exists(rse_settings, pfn if pfn else file_did, domain=domain, scheme=force_scheme, impl=impl, auth_token=self.auth_token, vo=self.client.vo, logger=logger):
-                    try:
-                        self.client.get_did(file['did_scope'], file['did_name'])
-                        logger(logging.INFO, 'File already registered. Skipping upload.')
-                        trace['stateReason'] = 'File already exists'
-                        continue
-                    except DataIdentifierNotFound:
-                        logger(logging.INFO, 'File already exists on RSE. Previous left overs will be overwritten.')
-                        delete_existing = True
-            elif not is_deterministic and not no_register:
-                if rsemgr.exists(rse_settings, pfn, domain=domain, scheme=force_scheme, impl=impl, auth_token=self.auth_token, vo=self.client.vo, logger=logger):
-                    logger(logging.INFO, 'File already exists on RSE with given pfn. Skipping upload. Existing replica has to be removed first.')
-                    trace['stateReason'] = 'File already exists'
-                    continue
-                elif rsemgr.exists(rse_settings, file_did, domain=domain, scheme=force_scheme, impl=impl, auth_token=self.auth_token, vo=self.client.vo, logger=logger):
-                    logger(logging.INFO, 'File already exists on RSE with different pfn. Skipping upload.')
-                    trace['stateReason'] = 'File already exists'
+        pending_registrations = []
+        pending_states = {}
+        pending_attachments = {}
+        registration_kwargs = {'registered_dataset_dids': registered_dataset_dids,
+                               'ignore_availability': ignore_availability,
+                               'activity': activity}
+
+        # the files registered before their upload are registered in bulk, before the first transfer
+        self._register_files([file for file in files if self._is_registered_before_upload(file)], **registration_kwargs)
+
+        def _register_uploaded_files():
+            self._register_uploaded_files(pending_registrations, pending_states, pending_attachments, **registration_kwargs)
+
+        def _handle_result(file, success):
+            if not success:
+                return 0
+            if summary_file_path:
+                summary.append(copy.deepcopy(file))
+            if file.get('register_after_upload') and not file.get('no_register'):
+                pending_registrations.append(file)
+            no_register = file.get('no_register') or (file.get('pfn') and self.rses[file['rse']].get('deterministic', True))
+            if not no_register:
+                if not file.get('register_after_upload'):
+                    pending_states.setdefault(file['rse'], []).append(file)
+                # add file to dataset if needed
+                if file.get('dataset_did_str'):
+                    pending_attachments.setdefault((file['dataset_scope'], file['dataset_name']), []).append(file)
+            return 1
+
+        upload_kwargs = {'traces_copy_out': traces_copy_out}
+        num_threads = min(max(1, num_threads), len(files))
+        if num_threads < 2:
+            for file in files:
+                num_succeeded += _handle_result(file, self._upload_file(file, **upload_kwargs))
+                _register_uploaded_files()
+        else:
+            logger(logging.INFO, 'Using %d threads to upload %d files' % (num_threads, len(files)))
+            input_queue = Queue()
+            for file in files:
+                input_queue.put(file)
+            output_queue = Queue(maxsize=2 * self.REGISTRATION_BULK_SIZE)
+            stop_event = Event()
+            threads = []
+            for _ in range(num_threads):
+                thread = Thread(target=self._upload_worker, kwargs={'input_queue': input_queue,
+                                                                    'output_queue': output_queue,
+                                                                    'stop_event': stop_event,
+                                                                    'upload_kwargs': upload_kwargs})
+                thread.start()
+                threads.append(thread)
+
+            # register the uploaded files in bulk while the remaining files are being transferred
+            error = None
+            num_finished_threads = 0
+            num_pending = 0
+            while num_finished_threads < num_threads:
+                result = output_queue.get()
+                if result is None:
+                    num_finished_threads += 1
                     continue
-            else:
-                if rsemgr.exists(rse_settings, pfn if pfn else file_did, domain=domain, scheme=force_scheme, impl=impl, auth_token=self.auth_token, vo=self.client.vo, logger=logger):
-                    logger(logging.INFO, 'File already exists on RSE. Skipping upload')
-                    trace['stateReason'] = 'File already exists'
+                file, success, worker_error = result
+                if worker_error is not None:
+                    # stop the other workers after their current file
+                    stop_event.set()
+                    error = error or worker_error
                     continue
-
-            # protocol handling and upload
-            protocols = rsemgr.get_protocols_ordered(rse_settings=rse_settings, operation='write', scheme=force_scheme, domain=domain, impl=impl)
-            protocols.reverse()
-            success = False
-            state_reason = ''
-            logger(logging.DEBUG, str(protocols))
-            while not success and len(protocols):
-                protocol = protocols.pop()
-                cur_scheme = protocol['scheme']
-                logger(logging.INFO, 'Trying upload with %s to %s' % (cur_scheme, rse))
-                lfn = {}
-                lfn['filename'] = basename
-                lfn['scope'] = file['did_scope']
-                lfn['name'] = file['did_name']
-
-                for checksum_name in GLOBALLY_SUPPORTED_CHECKSUMS:
-                    if checksum_name in file:
-                        lfn[checksum_name] = file[checksum_name]
-
-                lfn['filesize'] = file['bytes']
-
-                sign_service = None
-                if cur_scheme == 'https':
-                    sign_service = rse_sign_service
-
-                trace['protocol'] = cur_scheme
-                trace['transferStart'] = time.time()
-                logger(logging.DEBUG, 'Processing upload with the domain: {}'.format(domain))
-                try:
-                    pfn = self._upload_item(rse_settings=rse_settings,
-                                            rse_attributes=rse_attributes,
-                                            lfn=lfn,
-                                            source_dir=file['dirname'],
-                                            domain=domain,
-                                            impl=impl,
-                                            force_scheme=cur_scheme,
-                                            force_pfn=pfn,
-                                            transfer_timeout=file.get('transfer_timeout'),
-                                            delete_existing=delete_existing,
-                                            sign_service=sign_service)
-                    logger(logging.DEBUG, 'Upload done.')
-                    success = True
-                    file['upload_result'] = {0: True, 1: None, 'success': True, 'pfn': pfn}  # needs to be removed
-                except (ServiceUnavailable, ResourceTemporaryUnavailable, RSEOperationNotSupported, RucioException) as error:
-                    logger(logging.WARNING, 'Upload attempt failed')
-                    logger(logging.INFO, 'Exception: %s' % str(error), exc_info=True)
-                    state_reason = str(error)
-
-            if success:
-                num_succeeded += 1
-                trace['transferEnd'] = time.time()
-                trace['clientState'] = 'DONE'
-                file['state'] = 'A'
-                logger(logging.INFO, 'Successfully uploaded file %s' % basename)
-                self._send_trace(trace)
-
-                if summary_file_path:
-                    summary.append(copy.deepcopy(file))
-
-                if not no_register:
-                    if register_after_upload:
-                        self._register_file(file, registered_dataset_dids, ignore_availability=ignore_availability, activity=activity)
-                    else:
-                        replica_for_api = self._convert_file_for_api(file)
-                        try:
-                            self.client.update_replicas_states(rse, files=[replica_for_api])
-                        except Exception as error:
-                            logger(logging.ERROR, 'Failed to update replica state for file {}'.format(basename))
-                            logger(logging.DEBUG, 'Details: {}'.format(str(error)))
-
-                # add file to dataset if needed
-                if dataset_did_str and not no_register:
+                num_succeeded += _handle_result(file, success)
+                num_pending += 1
+                if num_pending >= self.REGISTRATION_BULK_SIZE:
+                    num_pending = 0
                     try:
-                        self.client.attach_dids(file['dataset_scope'], file['dataset_name'], [file_did])
-                    except Exception as error:
-                        logger(logging.WARNING, 'Failed to attach file to the dataset')
-                        logger(logging.DEBUG, 'Attaching to dataset {}'.format(str(error)))
-            else:
-                trace['clientState'] = 'FAILED'
-                trace['stateReason'] = state_reason
-                self._send_trace(trace)
-                logger(logging.ERROR, 'Failed to upload file %s' % basename)
+                        _register_uploaded_files()
+                    except Exception as registration_error:
+                        stop_event.set()
+                        error = error or registration_error
+            for thread in threads:
+                thread.join()
+            try:
+                _register_uploaded_files()
+            except Exception as registration_error:
+                error = error or registration_error
+            if error is not None:
+                raise error
 
         if summary_file_path:
             logger(logging.DEBUG, 'Summary will be available at {}'.format(summary_file_path))
@@ -337,36 +267,270 @@ class UploadClient:
             raise NotAllFilesUploaded()
         return 0
 
-    def _register_file(self, file, registered_dataset_dids, ignore_availability=False, activity=None):
+    def _upload_file(self, file, traces_copy_out=None):
         """
-        Registers the given file in Rucio. Creates a dataset if
-        needed. Registers the file DID and creates the replication
-        rule if needed. Adds a replica to the file did.
+        Uploads a single file to its RSE. Registering the file, updating the
+        replica state and attaching the file to its dataset is left to the caller,
+        to be done in bulk.
+        (This function is meant to be used as class internal only)
+
+        :param file: dictionary describing the file to upload
+        :param traces_copy_out: reference to an external list, where the traces should be uploaded
+
+        :returns: True if the file was uploaded, False otherwise
+        """
+        logger = self.logger
+        basename = file['basename']
+        logger(logging.INFO, 'Preparing upload for file %s' % basename)
+
+        no_register = file.get('no_register')
+        register_after_upload = file.get('register_after_upload') and not no_register
+        pfn = file.get('pfn')
+        force_scheme = file.get('force_scheme')
+        impl = file.get('impl')
+        delete_existing = False
+
+        trace = copy.deepcopy(self.trace)
+        # appending trace to list reference, if the reference exists
+        if traces_copy_out is not None:
+            traces_copy_out.append(trace)
+
+        rse = file['rse']
+        trace['scope'] = file['did_scope']
+        trace['datasetScope'] = file.get('dataset_scope', '')
+        trace['dataset'] = file.get('dataset_name', '')
+        trace['remoteSite'] = rse
+        trace['filesize'] = file['bytes']
+
+        file_did = {'scope': file['did_scope'], 'name': file['did_name']}
+        rse_settings = self.rses[rse]
+        rse_sign_service = rse_settings.get('sign_url', None)
+        is_deterministic = rse_settings.get('deterministic', True)
+        if not is_deterministic and not pfn:
+            logger(logging.ERROR, 'PFN has to be defined for NON-DETERMINISTIC RSE.')
+            return False
+        if pfn and is_deterministic:
+            logger(logging.WARNING, 'Upload with given pfn implies that no_register is True, except non-deterministic RSEs')
+            no_register = True
+
+        # resolving local area networks
+        domain = 'wan'
+        rse_attributes = self.rse_attributes.get(rse, {})
+        if (self.client_location and 'lan' in rse_settings['domain'] and 'site' in rse_attributes):
+            if self.client_location['site'] == rse_attributes['site']:
+                domain = 'lan'
+        logger(logging.DEBUG, '{} domain is used for the upload'.format(domain))
+
+        # FIXME:
+        # Rewrite preferred_impl selection - also check test_upload.py/test_download.py and fix impl order (see FIXME there)
+        #
+        # if not impl and not force_scheme:
+        #    impl = self.preferred_impl(rse_settings, domain)
+
+        # if register_after_upload, file should be overwritten if it is not registered
+        # otherwise if file already exists on RSE we're done
+        if register_after_upload:
+            if rsemgr.exists(rse_settings, pfn if pfn else file_did, domain=domain, scheme=force_scheme, impl=impl, auth_token=self.auth_token, vo=self.client.vo, logger=logger):
+                try:
+                    self.client.get_did(file['did_scope'], file['did_name'])
+                    logger(logging.INFO, 'File already registered. Skipping upload.')
+                    trace['stateReason'] = 'File already exists'
+                    return False
+                except DataIdentifierNotFound:
+                    logger(logging.INFO, 'File already exists on RSE. Previous left overs will be overwritten.')
+                    delete_existing = True
+        elif not is_deterministic and not no_register:
+            if rsemgr.exists(rse_settings, pfn, domain=domain, scheme=force_scheme, impl=impl, auth_token=self.auth_token, vo=self.client.vo, logger=logger):
+                logger(logging.INFO, 'File already exists on RSE with given pfn. Skipping upload. Existing replica has to be removed first.')
+                trace['stateReason'] = 'File already exists'
+                return False
+            elif rsemgr.exists(rse_settings, file_did, domain=domain, scheme=force_scheme, impl=impl, auth_token=self.auth_token, vo=self.client.vo, logger=logger):
+                logger(logging.INFO, 'File already exists on RSE with different pfn. Skipping upload.')
+                trace['stateReason'] = 'File already exists'
+                return False
+        else:
+            if rsemgr.exists(rse_settings, pfn if pfn else file_did, domain=domain, scheme=force_scheme, impl=impl, auth_token=self.auth_token, vo=self.client.vo, logger=logger):
+                logger(logging.INFO, 'File already exists on RSE. Skipping upload')
+                trace['stateReason'] = 'File already exists'
+                return False
+
+        # protocol handling and upload
+        protocols = rsemgr.get_protocols_ordered(rse_settings=rse_settings, operation='write', scheme=force_scheme, domain=domain, impl=impl)
+        protocols.reverse()
+        success = False
+        state_reason = ''
+        logger(logging.DEBUG, str(protocols))
+        while not success and len(protocols):
+            protocol = protocols.pop()
+            cur_scheme = protocol['scheme']
+            logger(logging.INFO, 'Trying upload with %s to %s' % (cur_scheme, rse))
+            lfn = {}
+            lfn['filename'] = basename
+            lfn['scope'] = file['did_scope']
+            lfn['name'] = file['did_name']
+
+            for checksum_name in GLOBALLY_SUPPORTED_CHECKSUMS:
+                if checksum_name in file:
+                    lfn[checksum_name] = file[checksum_name]
+
+            lfn['filesize'] = file['bytes']
+
+            sign_service = None
+            if cur_scheme == 'https':
+                sign_service = rse_sign_service
+
+            trace['protocol'] = cur_scheme
+            trace['transferStart'] = time.time()
+            logger(logging.DEBUG, 'Processing upload with the domain: {}'.format(domain))
+            try:
+                pfn = self._upload_item(rse_settings=rse_settings,
+                                        rse_attributes=rse_attributes,
+                                        lfn=lfn,
+                                        source_dir=file['dirname'],
+                                        domain=domain,
+                                        impl=impl,
+                                        force_scheme=cur_scheme,
+                                        force_pfn=pfn,
+                                        transfer_timeout=file.get('transfer_timeout'),
+                                        delete_existing=delete_existing,
+                                        sign_service=sign_service)
+                logger(logging.DEBUG, 'Upload done.')
+                success = True
+                file['upload_result'] = {0: True, 1: None, 'success': True, 'pfn': pfn}  # needs to be removed
+            except (ServiceUnavailable, ResourceTemporaryUnavailable, RSEOperationNotSupported, RucioException) as error:
+                logger(logging.WARNING, 'Upload attempt failed')
+                logger(logging.INFO, 'Exception: %s' % str(error), exc_info=True)
+                state_reason = str(error)
+
+        if success:
+            trace['transferEnd'] = time.time()
+            trace['clientState'] = 'DONE'
+            file['state'] = 'A'
+            logger(logging.INFO, 'Successfully uploaded file %s' % basename)
+            self._send_trace(trace)
+        else:
+            trace['clientState'] = 'FAILED'
+            trace['stateReason'] = state_reason
+            self._send_trace(trace)
+            logger(logging.ERROR, 'Failed to upload file %s' % basename)
+        return success
+
+    def _upload_worker(self, input_queue, output_queue, stop_event, upload_kwargs):
+        """
+        This function runs as long as there are files in the input queue,
+        uploads them and stores the tuples (file, success, error) in the output queue.
+        None is stored in the output queue once the worker is done.
+        (This function is meant to be used as class internal only)
+
+        :param input_queue: queue containing the files to upload
+        :param output_queue: queue where the results will be stored
+        :param stop_event: event set to stop the worker before its next file
+        :param upload_kwargs: keyword arguments passed to _upload_file
+        """
+        while not stop_event.is_set():
+            try:
+                file = input_queue.get_nowait()
+            except Empty:
+                break
+            try:
+                output_queue.put((file, self._upload_file(file, **upload_kwargs), None))
+            except Exception as error:
+                output_queue.put((file, False, error))
+                break
+        output_queue.put(None)
+
+    def _is_registered_before_upload(self, file):
+        """
+        Checks if the file is registered before it is uploaded, rather than after
+        its upload or not at all.
         (This function is meant to be used as class internal only)
 
         :param file: dictionary describing the file
+
+        :returns: True if the file is registered before its upload
+        """
+        if file.get('no_register') or file.get('register_after_upload'):
+            return False
+        # a pfn implies no_register on deterministic RSEs, and is mandatory on non-deterministic RSEs
+        if self.rses[file['rse']].get('deterministic', True):
+            return not file.get('pfn')
+        return bool(file.get('pfn'))
+
+    def _register_uploaded_files(self, pending_registrations, pending_states, pending_attachments, registered_dataset_dids, ignore_availability=False, activity=None):
+        """
+        Registers the files uploaded with register_after_upload, updates the replica
+        states and attaches the files to their datasets in bulk, then empties the given
+        list and dictionaries.
+        (This function is meant to be used as class internal only)
+
+        :param pending_registrations: list of files to register
+        :param pending_states: dictionary {rse: [files]} of replicas to set available
+        :param pending_attachments: dictionary {(dataset_scope, dataset_name): [files]} of files to attach
         :param registered_dataset_dids: set of dataset dids that were already registered
         :param ignore_availability: ignore the availability of a RSE
         :param activity: the activity set to the rule if no dataset is specified
 
-        :raises DataIdentifierAlreadyExists: if file DID is already registered and the checksums do not match
+        :raises DataIdentifierAlreadyExists: if a file DID is already registered and the checksums do not match
         """
         logger = self.logger
-        logger(logging.DEBUG, 'Registering file')
+        registrations = list(pending_registrations)
+        pending_registrations.clear()
+        states = dict(pending_states)
+        pending_states.clear()
+        attachments = dict(pending_attachments)
+        pending_attachments.clear()
 
-        # verification whether the scope exists
-        account_scopes = []
-        try:
-            account_scopes = self.client.list_scopes_for_account(self.client.account)
-        except ScopeNotFound:
-            pass
-        if account_scopes and file['did_scope'] not in account_scopes:
-            logger(logging.WARNING, 'Scope {} not found for the account {}.'.format(file['did_scope'], self.client.account))
+        self._register_files(registrations, registered_dataset_dids, ignore_availability=ignore_availability, activity=activity)
 
-        rse = file['rse']
-        dataset_did_str = file.get('dataset_did_str')
-        # register a dataset if we need to
-        if dataset_did_str and dataset_did_str not in registered_dataset_dids:
+        for rse, files in states.items():
+            try:
+                self.client.update_replicas_states(rse, files=[self._convert_file_for_api(file) for file in files])
+            except Exception as error:
+                logger(logging.ERROR, 'Failed to update replica state for files {}'.format(', '.join(file['basename'] for file in files)))
+                logger(logging.DEBUG, 'Details: {}'.format(str(error)))
+
+        for (dataset_scope, dataset_name), files in attachments.items():
+            try:
+                self.client.attach_dids(dataset_scope, dataset_name, [{'scope': file['did_scope'], 'name': file['did_name']} for file in files])
+            except Exception as error:
+                logger(logging.WARNING, 'Failed to attach files to the dataset')
+                logger(logging.DEBUG, 'Attaching to dataset {}'.format(str(error)))
+
+    def _register_files(self, files, registered_dataset_dids, ignore_availability=False, activity=None):
+        """
+        Registers the given files in Rucio. Creates the datasets if
+        needed. Registers the file DIDs and creates the replication
+        rules if needed. Adds the replicas to the file DIDs, with one
+        request per RSE.
+        (This function is meant to be used as class internal only)
+
+        :param files: list of dictionaries describing the files
+        :param registered_dataset_dids: set of dataset dids that were already registered
+        :param ignore_availability: ignore the availability of a RSE
+        :param activity: the activity set to the rule if no dataset is specified
+
+        :raises DataIdentifierAlreadyExists: if a file DID is already registered and the checksums do not match
+        """
+        if not files:
+            return
+        logger = self.logger
+        logger(logging.DEBUG, 'Registering %d files' % len(files))
+
+        # verification whether the scope exists
+        if self.account_scopes is None:
+            try:
+                self.account_scopes = self.client.list_scopes_for_account(self.client.account)
+            except ScopeNotFound:
+                self.account_scopes = []
+        if self.account_scopes:
+            for file_scope in set(file['did_scope'] for file in files) - set(self.account_scopes):
+                logger(logging.WARNING, 'Scope {} not found for the account {}.'.format(file_scope, self.client.account))
+
+        # register the datasets if we need to
+        for file in files:
+            dataset_did_str = file.get('dataset_did_str')
+            if not dataset_did_str or dataset_did_str in registered_dataset_dids:
+                continue
             registered_dataset_dids.add(dataset_did_str)
             try:
                 logger(logging.DEBUG, 'Trying to create dataset: %s' % dataset_did_str)
@@ -375,7 +539,7 @@ class UploadClient:
                                         meta=file.get('dataset_meta'),
                                         rules=[{'account': self.client.account,
                                                 'copies': 1,
-                                                'rse_expression': rse,
+                                                'rse_expression': file['rse'],
                                                 'grouping': 'DATASET',
                                                 'lifetime': file.get('lifetime')}])
                 logger(logging.INFO, 'Successfully created dataset %s' % dataset_did_str)
@@ -385,37 +549,45 @@ class UploadClient:
                 if file.get('lifetime') is not None:
                     raise InputValidationError('Dataset %s exists and lifetime %s given. Prohibited to modify parent dataset lifetime.' % (dataset_did_str,
                                                                                                                                            file.get('lifetime')))
-        else:
-            logger(logging.DEBUG, 'Skipping dataset registration')
 
-        file_scope = file['did_scope']
-        file_name = file['did_name']
-        file_did = {'scope': file_scope, 'name': file_name}
-        replica_for_api = self._convert_file_for_api(file)
-        try:
-            # if the remote checksum is different this did must not be used
-            meta = self.client.get_metadata(file_scope, file_name)
-            logger(logging.INFO, 'File DID already exists')
-            logger(logging.DEBUG, 'local checksum: %s, remote checksum: %s' % (file['adler32'], meta['adler32']))
-
-            if str(meta['adler32']).lstrip('0') != str(file['adler32']).lstrip('0'):
-                logger(logging.ERROR, 'Local checksum %s does not match remote checksum %s' % (file['adler32'], meta['adler32']))
-
-                raise DataIdentifierAlreadyExists
-
-            # add file to rse if it is not registered yet
-            replicastate = list(self.client.list_replicas([file_did], all_states=True))
-            if rse not in replicastate[0]['rses']:
-                self.client.add_replicas(rse=rse, files=[replica_for_api])
-                logger(logging.INFO, 'Successfully added replica in Rucio catalogue at %s' % rse)
-        except DataIdentifierNotFound:
-            logger(logging.DEBUG, 'File DID does not exist')
-            self.client.add_replicas(rse=rse, files=[replica_for_api])
-            logger(logging.INFO, 'Successfully added replica in Rucio catalogue at %s' % rse)
-            if not dataset_did_str:
-                # only need to add rules for files if no dataset is given
-                self.client.add_replication_rule([file_did], copies=1, rse_expression=rse, lifetime=file.get('lifetime'), ignore_availability=ignore_availability, activity=activity)
-                logger(logging.INFO, 'Successfully added replication rule at %s' % rse)
+        file_dids = [{'scope': file['did_scope'], 'name': file['did_name']} for file in files]
+        existing_dids = {(meta['scope'], meta['name']): meta for meta in self.client.get_metadata_bulk(file_dids)}
+        replica_rses = {}
+        if existing_dids:
+            replica_rses = {(replica['scope'], replica['name']): replica['rses']
+                            for replica in self.client.list_replicas([{'scope': scope, 'name': name} for scope, name in existing_dids], all_states=True)}
+
+        # add the files to their RSE if they are not registered there yet
+        replicas_by_rse = {}
+        rules_by_rse = {}
+        for file in files:
+            did = (file['did_scope'], file['did_name'])
+            if did in existing_dids:
+                # if the remote checksum is different this did must not be used
+                logger(logging.INFO, 'File DID %s:%s already exists' % did)
+                meta = existing_dids[did]
+                logger(logging.DEBUG, 'local checksum: %s, remote checksum: %s' % (file['adler32'], meta['adler32']))
+                if str(meta['adler32']).lstrip('0') != str(file['adler32']).lstrip('0'):
+                    logger(logging.ERROR, 'Local checksum %s does not match remote checksum %s' % (file['adler32'], meta['adler32']))
+                    raise DataIdentifierAlreadyExists
+                if file['rse'] in replica_rses.get(did, {}):
+                    continue
+            else:
+                logger(logging.DEBUG, 'File DID %s:%s does not exist' % did)
+                if not file.get('dataset_did_str'):
+                    # only need to add rules for files if no dataset is given
+                    rules_by_rse.setdefault((file['rse'], file.get('lifetime')), []).append({'scope': file['did_scope'], 'name': file['did_name']})
+            # the same file may be given several times
+            existing_dids[did] = {'adler32': file['adler32']}
+            replica_rses.setdefault(did, {})[file['rse']] = []
+            replicas_by_rse.setdefault(file['rse'], []).append(self._convert_file_for_api(file))
+
+        for rse, replicas in replicas_by_rse.items():
+            self.client.add_replicas(rse=rse, files=replicas)
+            logger(logging.INFO, 'Successfully added %d replicas in Rucio catalogue at %s' % (len(replicas), rse))
+        for (rse, lifetime), dids in rules_by_rse.items():
+            self.client.add_replication_rule(dids, copies=1, rse_expression=rse, lifetime=lifetime, ignore_availability=ignore_availability, activity=activity)
+            logger(logging.INFO, 'Successfully added %d replication rules at %s' % (len(dids), rse))
 
     def _get_file_guid(self, file):
         """
@@ -445,8 +617,9 @@ class UploadClient:
 
     def _collect_file_info(self, filepath, item):
         """
-        Collects infos (e.g. size, checksums, etc.) about the file and
-        returns them as a dictionary
+        Collects infos (e.g. size, guid, etc.) about the file and
+        returns them as a dictionary. The checksums are added in bulk
+        by _collect_and_validate_file_info
         (This function is meant to be used as class internal only)
 
         :param filepath: path where the file is stored
@@ -460,8 +633,6 @@ class UploadClient:
         new_item['basename'] = os.path.basename(filepath)
 
         new_item['bytes'] = os.stat(filepath).st_size
-        new_item['adler32'] = adler32(filepath)
-        new_item['md5'] = md5(filepath)
         new_item['meta'] = {'guid': self._get_file_guid(new_item)}
         new_item['state'] = 'C'
         if not new_item.get('did_scope'):
@@ -527,6 +698,10 @@ class UploadClient:
         if not len(files):
             raise InputValidationError('No valid input files given')
 
+        # all checksums of a file are computed in a single read, and files are hashed in parallel
+        for file, checksums in zip(files, calculate_checksums_bulk([file['path'] for file in files], ['adler32', 'md5'])):
+            file.update(checksums)
+
         return files
 
     def _convert_file_for_api(self, file):
@@ -14,16 +14,32 @@
 # limitations under the License.
 from __future__ import absolute_import
 
+import hashlib
+import json
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from threading import Lock
 from typing import TYPE_CHECKING
+
 from dogpile.cache import make_region
+from dogpile.cache.api import NO_VALUE
+from dogpile.cache.proxy import ProxyBackend
 
-from rucio.common.config import config_get
+from rucio.common.config import config_get, config_get_int
 from rucio.common.utils import is_client
 
 if TYPE_CHECKING:
-    from typing import Callable, Optional
+    from typing import Any, Callable, Optional, Tuple
 
 CACHE_URL = config_get('cache', 'url', False, '127.0.0.1:11211', check_config_table=False)
+LOCAL_CACHE_TTL = config_get_int('cache', 'local_cache_ttl', False, 5, check_config_table=False)
+LOCAL_CACHE_SIZE = config_get_int('cache', 'local_cache_size', False, 8 * 1024 * 1024, check_config_table=False)
+LOCAL_MUTEX_STRIPES = 64
 
 ENABLE_CACHING = True
 _mc_client = None
@@ -43,20 +59,218 @@ finally:
         _mc_client.close()
 
 
+class _LocalFallbackMutex:
+    """
+    Distributed mutex of the proxied backend which falls back to a process-local lock
+    while the backend is unavailable. The local lock is shared by all the mutexes of a key.
+    """
+
+    def __init__(self, mutex, local_lock, backend_errors, on_error):
+        self.mutex = mutex
+        self.backend_errors = backend_errors
+        self.on_error = on_error
+        self.local_lock = local_lock
+        self.locally_acquired = False
+
+    def acquire(self, wait=True):
+        try:
+            return self.mutex.acquire(wait)
+        except self.backend_errors:
+            self.on_error()
+        acquired = self.local_lock.acquire(wait)
+        if acquired:
+            self.locally_acquired = True
+        return acquired
+
+    def release(self):
+        if self.locally_acquired:
+            self.locally_acquired = False
+            self.local_lock.release()
+            return
+        try:
+            self.mutex.release()
+        except self.backend_errors:
+            self.on_error()
+
+    def locked(self):
+        if self.local_lock.locked():
+            return True
+        try:
+            return self.mutex.locked()
+        except self.backend_errors:
+            self.on_error()
+            return False
+
+
+class LocalCacheProxy(ProxyBackend):
+    """
+    Bounded in-process LRU tier in front of the proxied (memcached) backend.
+
+    Values are kept pickled, so that callers never share mutable objects, and are served
+    locally during `ttl` seconds, which bounds how long a change done by another process
+    can go unnoticed. The least recently used values are evicted once their total size
+    exceeds `max_size` bytes. If the proxied backend fails, the error is counted and the
+    local value is served even if it is older than `ttl`, and the distributed
+    mutex of the backend falls back to a process-local lock, taken from a fixed set
+    of `LOCAL_MUTEX_STRIPES` locks so that the mutexes of a key always share the same one.
+    """
+
+    def __init__(self, name: str, ttl: int = LOCAL_CACHE_TTL, max_size: int = LOCAL_CACHE_SIZE, backend_errors=(OSError, )):
+        super().__init__()
+        from rucio.core.monitor import MetricManager
+        metrics = MetricManager(module=__name__)
+
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.backend_errors = backend_errors
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._mutex_locks = [Lock() for _ in range(LOCAL_MUTEX_STRIPES)]
+        self._hits = metrics.counter('local.{region}.hits').labels(region=name)
+        self._misses = metrics.counter('local.{region}.misses').labels(region=name)
+        self._errors = metrics.counter('backend.{region}.errors').labels(region=name)
+        self._backend_timer = metrics.timer('backend.{region}.get')
+
+    def _get_local(self, key, allow_stale=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return NO_VALUE
+            stored_at, serialized = entry
+            if not allow_stale and stored_at < time.monotonic() - self.ttl:
+                return NO_VALUE
+            self._entries.move_to_end(key)
+        return pickle.loads(serialized)
+
+    def _set_local(self, key, value):
+        serialized = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._delete_local(key)
+            if len(serialized) > self.max_size:
+                return
+            self._entries[key] = (time.monotonic(), serialized)
+            self.size += len(serialized)
+            while self.size > self.max_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def _delete_local(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def get(self, key):
+        value = self._get_local(key)
+        if value is not NO_VALUE:
+            self._hits.inc()
+            return value
+
+        self._misses.inc()
+        try:
+            with self._backend_timer.labels(region=self.name):
+                value = self.proxied.get(key)
+        except self.backend_errors:
+            self._errors.inc()
+            return self._get_local(key, allow_stale=True)
+        if value is NO_VALUE:
+            with self._lock:
+                self._delete_local(key)
+        else:
+            self._set_local(key, value)
+        return value
+
+    def get_multi(self, keys):
+        values = [self._get_local(key) for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is NO_VALUE]
+        if len(missing) < len(keys):
+            self._hits.inc(len(keys) - len(missing))
+        if not missing:
+            return values
+
+        self._misses.inc(len(missing))
+        try:
+            with self._backend_timer.labels(region=self.name):
+                fetched = dict(zip(missing, self.proxied.get_multi(missing)))
+        except self.backend_errors:
+            self._errors.inc()
+            fetched = {key: self._get_local(key, allow_stale=True) for key in missing}
+        else:
+            for key, value in fetched.items():
+                if value is NO_VALUE:
+                    with self._lock:
+                        self._delete_local(key)
+                else:
+                    self._set_local(key, value)
+        return [fetched[key] if value is NO_VALUE else value for key, value in zip(keys, values)]
+
+    def set(self, key, value):
+        self._set_local(key, value)
+        try:
+            self.proxied.set(key, value)
+        except self.backend_errors:
+            self._errors.inc()
+
+    def set_multi(self, mapping):
+        for key, value in mapping.items():
+            self._set_local(key, value)
+        try:
+            self.proxied.set_multi(mapping)
+        except self.backend_errors:
+            self._errors.inc()
+
+    def delete(self, key):
+        with self._lock:
+            self._delete_local(key)
+        try:
+            self.proxied.delete(key)
+        except self.backend_errors:
+            self._errors.inc()
+
+    def delete_multi(self, keys):
+        with self._lock:
+            for key in keys:
+                self._delete_local(key)
+        try:
+            self.proxied.delete_multi(keys)
+        except self.backend_errors:
+            self._errors.inc()
+
+    def get_mutex(self, key):
+        mutex = self.proxied.get_mutex(key)
+        if mutex is None:
+            return None
+        local_lock = self._mutex_locks[hash(key) % len(self._mutex_locks)]
+        return _LocalFallbackMutex(mutex, local_lock=local_lock, backend_errors=self.backend_errors, on_error=self._errors.inc)
+
+
 def make_region_memcached(
         expiration_time: int,
         function_key_generator: "Optional[Callable]" = None,
-        memcached_expire_time: "Optional[int]" = None
+        memcached_expire_time: "Optional[int]" = None,
+        name: "Optional[str]" = None,
 ):
     """
     Make and configure a dogpile.cache.pymemcache region
+
+    Unless disabled by setting local_cache_ttl or local_cache_size to 0 in the
+    cache section of the configuration, a LocalCacheProxy is put in front of memcached.
+
+    :param name: name of the region used in the metrics; defaults to the name of the calling module.
     """
+    if not name:
+        name = sys._getframe(1).f_globals.get('__name__', 'default')
+
     if function_key_generator:
-        region = make_region(function_key_generator=function_key_generator)
+        region = make_region(name=name, function_key_generator=function_key_generator)
     else:
-        region = make_region()
+        region = make_region(name=name)
 
     if ENABLE_CACHING:
+        wrap = []
+        if LOCAL_CACHE_TTL > 0 and LOCAL_CACHE_SIZE > 0:
+            wrap.append(LocalCacheProxy(name=name, backend_errors=(pymemcache.exceptions.MemcacheError, OSError)))
         region.configure(
             'dogpile.cache.pymemcache',
             expiration_time=expiration_time,
@@ -64,9 +278,112 @@ def make_region_memcached(
                 'url': CACHE_URL,
                 'distributed_lock': True,
                 'memcached_expire_time': memcached_expire_time if memcached_expire_time else expiration_time + 60,  # must be bigger than expiration_time
-            }
+            },
+            wrap=wrap,
         )
     else:
         region.configure('dogpile.cache.null')
 
     return region
+
+
+class DiskCache(object):
+    """
+    Cache of JSON serializable values in a local directory, shared between the processes of a user.
+
+    Each value is stored in its own file, replaced atomically, whose modification time is the time
+    the value was stored or last revalidated. Files older than `max_age` seconds are removed from
+    time to time when values are stored. The errors of the file system are not raised, the cache
+    then behaves as if it was empty.
+    """
+
+    PURGE_PROBABILITY = 0.01
+
+    def __init__(self, directory: str, max_age: int = 7 * 24 * 3600):
+        """
+        :param directory: the directory of the cache, created if it does not exist.
+        :param max_age: the age in seconds after which the files are removed.
+        :raises OSError: if the directory cannot be created.
+        """
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def get(self, key: str) -> "Optional[Tuple[float, Any]]":
+        """
+        :param key: the key of the value.
+        :returns: tuple of the time the value was stored and the value, or None if the key is not cached.
+        """
+        try:
+            with open(self._path(key)) as file_:
+                stored_at = os.fstat(file_.fileno()).st_mtime
+                entry = json.load(file_)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get('key') != key:
+            return None
+        return stored_at, entry.get('value')
+
+    def set(self, key: str, value: "Any"):
+        """
+        :param key: the key of the value.
+        :param value: the JSON serializable value.
+        """
+        try:
+            file_d, file_n = tempfile.mkstemp(dir=self.directory, prefix='.')
+        except OSError:
+            return
+        try:
+            with os.fdopen(file_d, 'w') as file_:
+                json.dump({'key': key, 'value': value}, file_)
+            os.replace(file_n, self._path(key))
+        except OSError:
+            self._remove(file_n)
+            return
+        if random.random() < self.PURGE_PROBABILITY:
+            self.purge()
+
+    def touch(self, key: str):
+        """
+        Mark a value as stored now, after it was revalidated.
+
+        :param key: the key of the value.
+        """
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def delete(self, key: str):
+        """
+        :param key: the key of the value.
+        """
+        self._remove(self._path(key))
+
+    def purge(self, max_age: "Optional[int]" = None):
+        """
+        Remove the values stored more than max_age seconds ago.
+
+        :param max_age: the maximum age in seconds, by default the one of the cache.
+        """
+        oldest = time.time() - (self.max_age if max_age is None else max_age)
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < oldest:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
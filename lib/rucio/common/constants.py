@@ -64,6 +64,9 @@ FTS_JOB_TYPE = namedtuple('FTS_JOB_TYPE', ['MULTIPLE_REPLICA', 'MULTI_HOP', 'SES
 
 MAX_MESSAGE_LENGTH = 4000
 
+# Number of buckets of the consistent hashing ring used to partition the work between the daemon threads
+HASH_RING_BUCKETS = 4096
+
 
 class SuspiciousAvailability(enum.Enum):
     ALL = 0
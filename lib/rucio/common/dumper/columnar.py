@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+# Copyright European Organization for Nuclear Research (CERN) since 2012
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Columnar dump format.
+
+The records are stored column by column in a single file which is memory-mapped when read:
+
+- integer columns are arrays of 64 bits integers;
+- datetime columns are arrays of 64 bits integers, the microseconds since the epoch;
+- string columns are dictionary encoded, an array of 32 bits codes indexing a sorted
+  dictionary of the distinct values, which is also used as index to look up a value.
+
+The description of the columns is stored as JSON at the end of the file, followed by its
+length and the magic bytes, so the file can be written in a single pass.
+"""
+
+import bisect
+import datetime
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+MAGIC = b'RUCIOCOL'
+VERSION = 1
+
+INT, DATETIME, STR = 'int', 'datetime', 'str'
+
+_NULL_INT = -2 ** 63
+_NULL_CODE = 2 ** 32 - 1
+_EPOCH = datetime.datetime(1970, 1, 1)
+_FOOTER = struct.Struct('<Q8s')
+
+
+class ColumnarFormatError(Exception):
+    """
+    The file is not a valid columnar dump.
+    """
+
+
+def _to_micros(value):
+    if value is None:
+        return _NULL_INT
+    return (value - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _from_micros(value):
+    if value == _NULL_INT:
+        return None
+    return _EPOCH + datetime.timedelta(microseconds=value)
+
+
+def _kind_of(value):
+    if isinstance(value, bool):
+        return STR
+    if isinstance(value, int):
+        return INT
+    if isinstance(value, datetime.datetime):
+        return DATETIME
+    return STR
+
+
+class _ColumnBuilder(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.kind = None
+        self.values = array('q')
+        self.codes = array('I')
+        self.dictionary = {}
+        # Number of null values before the first value, which determines the kind of the column
+        self.nulls = 0
+
+    def append(self, value):
+        if self.kind is None:
+            if value is None:
+                self.nulls += 1
+                return
+            self.kind = _kind_of(value)
+            if self.kind == STR:
+                self.codes.extend([_NULL_CODE] * self.nulls)
+            else:
+                self.values.extend([_NULL_INT] * self.nulls)
+
+        if self.kind == STR:
+            if value is None:
+                self.codes.append(_NULL_CODE)
+            else:
+                self.codes.append(self.dictionary.setdefault(str(value), len(self.dictionary)))
+        elif self.kind == INT:
+            self.values.append(_NULL_INT if value is None else value)
+        else:
+            self.values.append(_to_micros(value))
+
+    def write(self, file_, offset):
+        """
+        Write the column and return its description.
+        """
+        kind = self.kind
+        if kind is None:
+            # Only null values, stored as an empty string column
+            kind = STR
+            self.codes.extend([_NULL_CODE] * self.nulls)
+        description = {'name': self.name, 'kind': kind}
+
+        if kind == STR:
+            # Sort the dictionary and remap the codes, so the values can be looked up by bisection
+            values = sorted(self.dictionary)
+            remap = array('I', [0] * len(values))
+            for new_code, value in enumerate(values):
+                remap[self.dictionary[value]] = new_code
+            codes = array('I', (code if code == _NULL_CODE else remap[code] for code in self.codes))
+
+            encoded = [value.encode() for value in values]
+            offsets = array('Q', [0])
+            for value in encoded:
+                offsets.append(offsets[-1] + len(value))
+
+            description['dictionary_size'] = len(values)
+            offset = _write_section(file_, offset, description, 'offsets', offsets.tobytes())
+            offset = _write_section(file_, offset, description, 'strings', b''.join(encoded))
+            offset = _write_section(file_, offset, description, 'codes', codes.tobytes())
+        else:
+            offset = _write_section(file_, offset, description, 'values', self.values.tobytes())
+        return description, offset
+
+
+def _write_section(file_, offset, description, section, data):
+    # Align the sections on 8 bytes so they can be cast from the memory map
+    padding = -offset % 8
+    file_.write(b'\0' * padding)
+    offset += padding
+    file_.write(data)
+    description[section] = [offset, len(data)]
+    return offset + len(data)
+
+
+def write_columnar(file_: "Any", fieldnames: "Sequence[str]", rows: "Iterable[Sequence]", metadata: "Optional[dict]" = None) -> int:
+    """
+    Write rows in the columnar format.
+
+    :param file_: The binary file object to write to.
+    :param fieldnames: The names of the columns.
+    :param rows: The rows, as sequences of values in the order of the field names. The values
+                 are integers, datetimes, strings or None.
+    :param metadata: Optional JSON serializable dictionary stored with the columns.
+    :returns: The number of rows written.
+    """
+    columns = [_ColumnBuilder(name) for name in fieldnames]
+    nb_rows = 0
+    for row in rows:
+        if len(row) != len(columns):
+            raise ValueError('Row {0} has {1} values, {2} expected'.format(nb_rows, len(row), len(columns)))
+        for column, value in zip(columns, row):
+            column.append(value)
+        nb_rows += 1
+
+    offset = 0
+    descriptions = []
+    for column in columns:
+        description, offset = column.write(file_, offset)
+        descriptions.append(description)
+
+    footer = json.dumps({
+        'version': VERSION,
+        'byteorder': sys.byteorder,
+        'rows': nb_rows,
+        'columns': descriptions,
+        'metadata': metadata or {},
+    }).encode()
+    file_.write(footer)
+    file_.write(_FOOTER.pack(len(footer), MAGIC))
+    return nb_rows
+
+
+class Column(object):
+    """
+    A column of a columnar dump, which can be indexed as a sequence.
+    """
+
+    def __init__(self, buffer, description, nb_rows):
+        self.name = description['name']
+        self.kind = description['kind']
+        self._nb_rows = nb_rows
+        if self.kind == STR:
+            self.codes = _section(buffer, description, 'codes', 'I')
+            self._offsets = _section(buffer, description, 'offsets', 'Q')
+            start, length = description['strings']
+            self._strings = buffer[start:start + length]
+        else:
+            self.codes = _section(buffer, description, 'values', 'q')
+
+    def __len__(self):
+        return self._nb_rows
+
+    def value(self, code: int) -> "Any":
+        """
+        Decode a stored code into its value.
+        """
+        if self.kind == INT:
+            return None if code == _NULL_INT else code
+        if self.kind == DATETIME:
+            return _from_micros(code)
+        if code == _NULL_CODE:
+            return None
+        return self._string(code)
+
+    def _string(self, code):
+        return bytes(self._strings[self._offsets[code]:self._offsets[code + 1]]).decode()
+
+    def code(self, value: "Any") -> "Optional[int]":
+        """
+        Encode a value into its stored code.
+
+        :returns: The code, or None if the value is not present in the column.
+        """
+        if self.kind == INT:
+            return _NULL_INT if value is None else int(value)
+        if self.kind == DATETIME:
+            return _to_micros(value)
+        if value is None:
+            return _NULL_CODE
+        value = str(value)
+        size = len(self._offsets) - 1
+        # The dictionary is sorted
+        code = bisect.bisect_left(_Dictionary(self, size), value)
+        if code < size and self._string(code) == value:
+            return code
+        return None
+
+    def __getitem__(self, index):
+        return self.value(self.codes[index])
+
+    def __iter__(self):
+        for code in self.codes:
+            yield self.value(code)
+
+    def release(self):
+        self.codes.release()
+        if self.kind == STR:
+            self._offsets.release()
+            self._strings.release()
+
+
+class _Dictionary(object):
+    """
+    Sequence view of the sorted dictionary of a string column, for bisection.
+    """
+
+    def __init__(self, column, size):
+        self._column = column
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        return self._column._string(index)
+
+
+def _section(buffer, description, section, format_):
+    start, length = description[section]
+    return buffer[start:start + length].cast(format_)
+
+
+class ColumnarDump(object):
+    """
+    Read-only memory-mapped columnar dump.
+
+    Examples:
+    with ColumnarDump(path) as dump:
+        sizes = dump.column('size')
+        total = sum(sizes[index] for index in dump.select([('state', 'A')]))
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._columns = {}
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ColumnarFormatError('{0} is empty'.format(path))
+        self._buffer = memoryview(self._mmap)
+
+        try:
+            footer = self._read_footer()
+        except Exception:
+            self.close()
+            raise
+
+        self.metadata = footer['metadata']
+        self._nb_rows = footer['rows']
+        self._descriptions = {description['name']: description for description in footer['columns']}
+        self.fieldnames = [description['name'] for description in footer['columns']]
+
+    def _read_footer(self):
+        if len(self._buffer) < _FOOTER.size:
+            raise ColumnarFormatError('{0} is not a columnar dump'.format(self.path))
+        footer_length, magic = _FOOTER.unpack(self._buffer[-_FOOTER.size:])
+        footer_start = len(self._buffer) - _FOOTER.size - footer_length
+        if magic != MAGIC or footer_start < 0:
+            raise ColumnarFormatError('{0} is not a columnar dump'.format(self.path))
+        footer = json.loads(bytes(self._buffer[footer_start:footer_start + footer_length]).decode())
+        if footer['version'] != VERSION or footer['byteorder'] != sys.byteorder:
+            raise ColumnarFormatError('{0}: unsupported version {1} or byte order {2}'.format(self.path, footer['version'], footer['byteorder']))
+        return footer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._nb_rows
+
+    def close(self):
+        for column in self._columns.values():
+            column.release()
+        self._columns = {}
+        self._buffer.release()
+        self._mmap.close()
+        self._file.close()
+
+    def column(self, name: str) -> Column:
+        """
+        Get a column by name.
+        """
+        if name not in self._columns:
+            if name not in self._descriptions:
+                raise KeyError('{0} has no column {1}'.format(self.path, name))
+            self._columns[name] = Column(self._buffer, self._descriptions[name], self._nb_rows)
+        return self._columns[name]
+
+    def select(self, conditions: "Iterable[Tuple[str, Any]]" = ()) -> "Iterator[int]":
+        """
+        Find the rows matching all the equality conditions, comparing the stored codes
+        so that the values of the rows are not decoded.
+
+        :param conditions: Iterable of (column name, expected value).
+        :returns: Generator of the indices of the matching rows.
+        """
+        checks = []
+        for name, expected in conditions:
+            column = self.column(name)
+            code = column.code(expected)
+            if code is None:
+                return
+            checks.append((column.codes, code))
+
+        if not checks:
+            yield from range(self._nb_rows)
+            return
+
+        (first_codes, first_code), others = checks[0], checks[1:]
+        for index, code in enumerate(first_codes):
+            if code == first_code and all(codes[index] == expected for codes, expected in others):
+                yield index
+
+    def rows(self, fieldnames: "Optional[List[str]]" = None, indices: "Optional[Iterable[int]]" = None) -> "Iterator[tuple]":
+        """
+        Read the rows, restricted to some columns.
+
+        :param fieldnames: The names of the columns to read, by default all of them.
+        :param indices: The indices of the rows to read, by default all of them.
+        :returns: Generator of the rows as tuples of values.
+        """
+        columns = [self.column(name) for name in (fieldnames or self.fieldnames)]
+        if indices is None:
+            indices = range(self._nb_rows)
+        for index in indices:
+            yield tuple(column[index] for column in columns)
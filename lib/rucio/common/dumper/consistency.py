@@ -22,6 +22,7 @@ import tempfile
 
 from rucio.common import dumper
 from rucio.common.dumper import error, DUMPS_CACHE_DIR, data_models, path_parsing
+from rucio.common.external_sort import external_sort, field_key, read_lines
 
 
 subcommands = ['consistency', 'consistency-manual']
@@ -36,7 +37,7 @@ class Consistency(data_models.DataModel):
     @classmethod
     def dump(cls, subcommand, ddm_endpoint, storage_dump, prev_date_fname=None, next_date_fname=None,
              prev_date=None, next_date=None, sort_rucio_replica_dumps=True, date=None,
-             cache_dir=DUMPS_CACHE_DIR):
+             cache_dir=DUMPS_CACHE_DIR, sort_processes=1):
         logger = logging.getLogger('auditor.consistency')
         if subcommand == 'consistency':
             prev_date_fname = data_models.Replica.download(
@@ -79,18 +80,20 @@ class Consistency(data_models.DataModel):
             return '/'.join(relative)
 
         if sort_rucio_replica_dumps:
-            prev_date_fname_sorted = gnu_sort(
+            prev_date_fname_sorted = sort_file(
                 parse_and_filter_file(prev_date_fname, parser=parser, cache_dir=cache_dir),
                 delimiter=',',
                 fieldspec='1',
                 cache_dir=cache_dir,
+                processes=sort_processes,
             )
 
-            next_date_fname_sorted = gnu_sort(
+            next_date_fname_sorted = sort_file(
                 parse_and_filter_file(next_date_fname, parser=parser, cache_dir=cache_dir),
                 delimiter=',',
                 fieldspec='1',
                 cache_dir=cache_dir,
+                processes=sort_processes,
             )
         else:
             prev_date_fname_sorted = parse_and_filter_file(
@@ -130,7 +133,7 @@ class Consistency(data_models.DataModel):
                 sd_prefix,
             )
 
-        storage_dump_fname_sorted = gnu_sort(
+        storage_dump_fname_sorted = sort_file(
             parse_and_filter_file(
                 storage_dump,
                 parser=strip_storage_dump,
@@ -139,6 +142,7 @@ class Consistency(data_models.DataModel):
             ),
             prefix=sd_prefix,
             cache_dir=cache_dir,
+            processes=sort_processes,
         )
 
         with open(prev_date_fname_sorted) as prevf:
@@ -332,6 +336,47 @@ def gnu_sort(file_path, prefix=None, delimiter=None, fieldspec=None, cache_dir=D
     return sorted_path
 
 
+def sort_file(file_path, prefix=None, delimiter=None, fieldspec=None, cache_dir=DUMPS_CACHE_DIR,
+              chunk_size=None, processes=1, compress=False):
+    '''
+    Sort the file with path `file_path` with an external merge sort, the
+    original file is unchanged, the output file is saved with path
+    <cache_dir>/<prefix>_sorted, as with `gnu_sort`.
+
+    :param prefix: If given the output file will be named <prefix>_sorted.
+    Otherwise the prefix is the name of the input file.
+    :param delimiter: Delimiter character if the data is formated in
+    columns.
+    :param fieldspec: Number of the column from which the lines are compared
+    (as a -k argument of the sort command without end field).
+    :param cachedir: Working dir where the output file and the sorted runs
+    are placed.
+    :param chunk_size: Maximum number of lines sorted in memory by each process.
+    :param processes: Number of processes sorting the runs.
+    :param compress: Whether to compress the sorted runs.
+
+    Note: The lines are compared byte by byte, as GNU sort with the
+    environment variable LC_ALL set to C.
+    '''
+    assert (delimiter is None and fieldspec is None) or (delimiter is not None and fieldspec is not None)
+    key = None if delimiter is None else field_key(delimiter.encode(), int(fieldspec))
+
+    prefix = os.path.basename(file_path) if prefix is None else prefix
+
+    sorted_name = '_'.join((prefix, 'sorted'))
+    sorted_path = os.path.join(cache_dir, sorted_name)
+
+    if os.path.exists(sorted_path):
+        return sorted_path
+
+    with dumper.temp_file(cache_dir, final_name=sorted_name, binary=True) as (output, _):
+        kwargs = {} if chunk_size is None else {'chunk_size': chunk_size}
+        external_sort(read_lines(file_path), output, key=key, processes=processes,
+                      compress=compress, tmp_dir=cache_dir, **kwargs)
+
+    return sorted_path
+
+
 def populate_args(argparser):
     # Option to download the rucio replica dumps automaticaly
     parser = argparser.add_parser(
@@ -28,6 +28,7 @@ from tabulate import tabulate
 from typing import TYPE_CHECKING
 
 from rucio.common.dumper import DUMPS_CACHE_DIR
+from rucio.common.dumper import columnar
 from rucio.common.dumper import HTTPDownloadFailed
 from rucio.common.dumper import get_requests_session
 from rucio.common.dumper import http_download_to_file
@@ -45,8 +46,11 @@ class DataModel(object):
     """
 
     BASE_URL = 'https://rucio-hadoop.cern.ch/'
+    COLUMNAR_SUFFIX = '.columnar'
     _FIELD_NAMES = None
     SCHEMA = []
+    # Attributes set by the constructor in addition to the SCHEMA fields
+    EXTRA_FIELDS = ()
     URI = None
     name = None
 
@@ -151,6 +155,62 @@ class DataModel(object):
         instance.date = date
         return instance
 
+    @classmethod
+    def to_columnar(cls, file, output):
+        """
+        Convert a text dump to the columnar format.
+
+        :param file: Iterable of the lines of the text dump.
+        :param output: The binary file object to write the columnar dump to.
+        :returns: The number of converted records.
+        """
+        fieldnames = cls.get_fieldnames() + list(cls.EXTRA_FIELDS)
+        records = (cls(*(field.strip() for field in line.split('\t'))) for line in file)
+        rows = (tuple(getattr(record, name) for name in fieldnames) for record in records)
+        return columnar.write_columnar(output, fieldnames, rows, metadata={'model': cls.__name__})
+
+    @classmethod
+    def each_columnar(cls, dump, rse=None, date=None, filter_=None):
+        """
+        Iterate over the records of a columnar dump, as `each` over the lines of a text dump.
+
+        :param dump: The ColumnarDump.
+        :param filter_: Either a Filter, whose conditions are evaluated on the stored columns
+                        so only the matching records are built, or a callable on the records.
+        """
+        conditions = ()
+        if isinstance(filter_, Filter):
+            conditions = [(cond.attribute, cond.expected) for cond in filter_.conditions]
+            filter_ = None
+        fieldnames = [name for name in cls.get_fieldnames() + list(cls.EXTRA_FIELDS) if name in dump.fieldnames]
+        for values in dump.rows(fieldnames, dump.select(conditions)):
+            record = cls.__new__(cls)
+            for name, value in zip(fieldnames, values):
+                setattr(record, name, value)
+            record.rse = rse
+            record.date = date
+            if filter_ is None or filter_(record):
+                yield record
+
+    @classmethod
+    def columnar_file(cls, filename):
+        """
+        Convert a downloaded dump to the columnar format, unless it is already converted.
+
+        :param filename: The path of the text dump.
+        :returns: The path of the columnar dump, next to the text dump.
+        """
+        path = filename + cls.COLUMNAR_SUFFIX
+        if not os.path.exists(path):
+            directory, name = os.path.split(path)
+            file = smart_open(filename)
+            try:
+                with temp_file(directory, final_name=name, binary=True) as (output, _):
+                    cls.to_columnar(file, output)
+            finally:
+                file.close()
+        return path
+
     @classmethod
     def download(cls, rse, date='latest', cache_dir=DUMPS_CACHE_DIR):
         """
@@ -204,14 +264,22 @@ class DataModel(object):
         return path
 
     @classmethod
-    def dump(cls, rse, date='latest', filter_=None):
+    def dump(cls, rse, date='latest', filter_=None, columnar=False):
         filename = cls.download(rse, date)
 
+        if columnar:
+            return cls._each_columnar_file(cls.columnar_file(filename), rse, date, filter_)
+
         # Should check errors, content size at least
         file = smart_open(filename)
 
         return cls.each(file, rse, date, filter_)
 
+    @classmethod
+    def _each_columnar_file(cls, path, rse, date, filter_):
+        with columnar.ColumnarDump(path) as dump:
+            yield from cls.each_columnar(dump, rse, date, filter_)
+
 
 class Dataset(DataModel):
     URI = 'datasets_per_rse'
@@ -229,6 +297,7 @@ class Dataset(DataModel):
 
 class CompleteDataset(DataModel):
     URI = 'consistency_datasets'
+    EXTRA_FIELDS = ('state',)
     SCHEMA = (
         ('rse', str),
         ('scope', str),
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# Copyright European Organization for Nuclear Research (CERN) since 2012
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Sorting and comparison of files too large to be held in memory.
+
+The lines are sorted in chunks into runs stored on disk, which are then merged. The lines
+are handled as bytes, so the order is the byte order, as with `LC_ALL=C sort`.
+"""
+
+import functools
+import gzip
+import heapq
+import multiprocessing
+import os
+import tempfile
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+
+DEFAULT_CHUNK_SIZE = 1000000
+
+
+def _field_key(delimiter, index, line):
+    # As sort, equal keys are ordered by the whole line
+    return (line.split(delimiter, index)[-1], line) if index else line
+
+
+def field_key(delimiter: bytes, field: int) -> "Callable":
+    """
+    Key to sort the lines starting from a field until the end of the line, as `sort -t <delimiter> -k <field>`.
+
+    :param delimiter: The delimiter of the fields.
+    :param field: The number of the first field of the key, starting at 1.
+    :returns: The key function, which can be used with multiple processes.
+    """
+    return functools.partial(_field_key, delimiter, field - 1)
+
+
+def _open_run(path, mode, compress):
+    if compress:
+        return gzip.open(path, mode, compresslevel=1)
+    return open(path, mode)
+
+
+def _write_run(lines, key, path, compress):
+    lines.sort(key=key)
+    with _open_run(path, 'wb', compress) as run:
+        for line in lines:
+            run.write(line + b'\n')
+    return path
+
+
+def _read_run(path, compress):
+    with _open_run(path, 'rb', compress) as run:
+        for line in run:
+            yield line[:-1]
+
+
+def _chunks(lines, chunk_size):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_lines(path: str, strip: bool = False) -> "Iterator[bytes]":
+    """
+    Read the lines of a file without their line ending.
+
+    :param path: The path of the file.
+    :param strip: If True, the leading and trailing whitespaces are removed as well.
+    :returns: A generator of the lines, as bytes.
+    """
+    with open(path, 'rb') as file_:
+        for line in file_:
+            yield line.strip() if strip else line.rstrip(b'\r\n')
+
+
+def external_sort(lines: "Iterable[bytes]", output: "BinaryIO", key: "Optional[Callable]" = None, unique: bool = False,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, processes: int = 1, compress: bool = False,
+                  tmp_dir: "Optional[str]" = None) -> dict:
+    """
+    Sort lines with bounded memory. The lines are sorted in chunks of `chunk_size` lines, which
+    are written as runs in a temporary directory, and the runs are merged into the output.
+
+    :param lines: The lines to sort, as bytes without line ending.
+    :param output: The binary file object to write the sorted lines to, one per line.
+    :param key: The key to sort the lines, by default the whole line.
+    :param unique: If True, only the first of equal lines is written.
+    :param chunk_size: The maximum number of lines held in memory by each process.
+    :param processes: The number of processes sorting the chunks.
+    :param compress: If True, the runs are compressed.
+    :param tmp_dir: The directory in which the temporary directory for the runs is created.
+    :returns: A dictionary with the number of lines read and written, and the number of runs.
+    """
+    stats = {'lines': 0, 'sorted_lines': 0, 'runs': 0}
+
+    def _counted(lines):
+        for line in lines:
+            stats['lines'] += 1
+            yield line
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir, prefix='external_sort_') as run_dir:
+        runs = []
+        chunks = _chunks(_counted(lines), chunk_size)
+        if processes > 1:
+            with multiprocessing.Pool(processes) as pool:
+                pending = []
+                for chunk in chunks:
+                    if len(pending) >= processes:
+                        runs.append(pending.pop(0).get())
+                    path = os.path.join(run_dir, str(len(runs) + len(pending)))
+                    pending.append(pool.apply_async(_write_run, (chunk, key, path, compress)))
+                runs.extend(result.get() for result in pending)
+        else:
+            for chunk in chunks:
+                runs.append(_write_run(chunk, key, os.path.join(run_dir, str(len(runs))), compress))
+        stats['runs'] = len(runs)
+
+        previous = None
+        for line in heapq.merge(*[_read_run(run, compress) for run in runs], key=key):
+            if unique and line == previous:
+                continue
+            output.write(line + b'\n')
+            stats['sorted_lines'] += 1
+            previous = line
+    return stats
+
+
+def intersect(sorted_a: "Iterable[bytes]", sorted_b: "Iterable[bytes]") -> "Iterator[bytes]":
+    """
+    Merge-join two sorted iterables.
+
+    :param sorted_a: The first sorted iterable, without duplicates.
+    :param sorted_b: The second sorted iterable, without duplicates.
+    :returns: A generator of the elements present in both iterables, in order.
+    """
+    iter_b = iter(sorted_b)
+    value_b = next(iter_b, None)
+    for value_a in sorted_a:
+        while value_b is not None and value_b < value_a:
+            value_b = next(iter_b, None)
+        if value_b is None:
+            return
+        if value_b == value_a:
+            yield value_a
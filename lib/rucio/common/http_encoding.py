@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# Copyright European Organization for Nuclear Research (CERN) since 2012
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Encodings of the HTTP bodies exchanged between the clients and the REST server:
+
+- the request and response bodies can be compressed with gzip, or with zstandard when the
+  zstandard module is installed on both sides;
+- the x-json-stream responses of the bulk list endpoints can be encoded with msgpack, when the
+  msgpack module is installed on both sides.
+"""
+
+import json
+import zlib
+from typing import TYPE_CHECKING
+
+from rucio.common.extra import import_extras
+
+if TYPE_CHECKING:
+    from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+EXTRA_MODULES = import_extras(['msgpack', 'zstandard'])
+
+if EXTRA_MODULES['msgpack']:
+    import msgpack  # pylint: disable=import-error
+
+if EXTRA_MODULES['zstandard']:
+    import zstandard  # pylint: disable=import-error
+
+JSON_STREAM = 'application/x-json-stream'
+MSGPACK_STREAM = 'application/x-rucio-msgpack-stream'
+
+# wbits of zlib for the gzip format
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+_DECODING_ERRORS = (zlib.error, EOFError, OSError)
+if EXTRA_MODULES['zstandard']:
+    _DECODING_ERRORS += (zstandard.ZstdError,)
+
+
+def content_encodings() -> "List[str]":
+    """
+    :returns: the supported content encodings, the preferred one first.
+    """
+    if EXTRA_MODULES['zstandard']:
+        return ['zstd', 'gzip']
+    return ['gzip']
+
+
+def msgpack_available() -> bool:
+    """
+    :returns: True if the msgpack encoding of the streams is supported.
+    """
+    return bool(EXTRA_MODULES['msgpack'])
+
+
+def negotiate_encoding(accept_encoding: "Optional[str]") -> "Optional[str]":
+    """
+    Choose the preferred supported encoding accepted by the other side.
+
+    :param accept_encoding: the value of an Accept-Encoding header.
+    :returns: the content encoding, or None if no supported encoding is accepted.
+    """
+    accepted = set()
+    for value in (accept_encoding or '').split(','):
+        encoding, _, params = value.strip().partition(';')
+        params = params.replace(' ', '')
+        if params in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(encoding.strip().lower())
+    for encoding in content_encodings():
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compressor(encoding: str):
+    """
+    :param encoding: a supported content encoding.
+    :returns: a compression object with the compress(data) and flush() methods.
+    """
+    if encoding == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, _GZIP_WBITS)
+    if encoding == 'zstd' and EXTRA_MODULES['zstandard']:
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise ValueError('Unsupported content encoding %s' % encoding)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    :param data: the data to compress.
+    :param encoding: a supported content encoding.
+    :returns: the compressed data.
+    """
+    compression = compressor(encoding)
+    return compression.compress(data) + compression.flush()
+
+
+def compress_stream(chunks: "Iterable[Union[str, bytes]]", encoding: str) -> "Iterator[bytes]":
+    """
+    Compress a stream of chunks.
+
+    :param chunks: iterable of strings or bytes.
+    :param encoding: a supported content encoding.
+    :yields: the compressed data, as it is produced by the compression.
+    """
+    compression = compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compression.compress(chunk)
+            if data:
+                yield data
+        yield compression.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def decompress(data: bytes, encoding: str, max_size: "Optional[int]" = None) -> bytes:
+    """
+    :param data: the compressed data.
+    :param encoding: a supported content encoding.
+    :param max_size: the maximum size of the decompressed data.
+    :returns: the decompressed data.
+    :raises ValueError: if the encoding is not supported, the data is invalid, or the decompressed data is larger than max_size.
+    """
+    try:
+        if encoding == 'gzip':
+            decompression = zlib.decompressobj(_GZIP_WBITS)
+            result = decompression.decompress(data, max_size + 1 if max_size else 0)
+        elif encoding == 'zstd' and EXTRA_MODULES['zstandard']:
+            blocks, size = [], 0
+            with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+                for block in iter(lambda: reader.read(1024 * 1024), b''):
+                    blocks.append(block)
+                    size += len(block)
+                    if max_size and size > max_size:
+                        break
+            result = b''.join(blocks)
+        else:
+            raise ValueError('Unsupported content encoding %s' % encoding)
+    except _DECODING_ERRORS as error:
+        raise ValueError('Invalid %s data: %s' % (encoding, error))
+    if max_size and len(result) > max_size:
+        raise ValueError('The decompressed data is larger than %d bytes' % max_size)
+    return result
+
+
+def accepts_msgpack_stream(accept_mimetypes) -> bool:
+    """
+    :param accept_mimetypes: the accepted mimetypes of a request, as (mimetype, quality) pairs.
+    :returns: True if the msgpack encoding is supported, and explicitly accepted by the request.
+    """
+    return msgpack_available() and any(mimetype == MSGPACK_STREAM and quality > 0 for mimetype, quality in accept_mimetypes)
+
+
+def json_stream_to_msgpack(chunks: "Iterable[Union[str, bytes]]") -> "Iterator[bytes]":
+    """
+    Encode the objects of an x-json-stream with msgpack.
+
+    :param chunks: iterable of strings or bytes, each made of complete JSON lines.
+    :yields: the msgpack encoding of the objects of each chunk.
+    """
+    packer = msgpack.Packer()
+    for chunk in chunks:
+        data = b''.join(packer.pack(json.loads(line)) for line in chunk.splitlines() if line.strip())
+        if data:
+            yield data
+
+
+def iter_msgpack_stream(chunks: "Iterable[bytes]", object_hook: "Optional[Callable]" = None) -> "Iterator":
+    """
+    Decode the objects of a msgpack stream.
+
+    :param chunks: iterable of bytes.
+    :param object_hook: function called with every decoded dictionary, as in json.loads.
+    :yields: the decoded objects.
+    """
+    unpacker = msgpack.Unpacker(object_hook=object_hook, raw=False, max_buffer_size=0)
+    for chunk in chunks:
+        unpacker.feed(chunk)
+        yield from unpacker
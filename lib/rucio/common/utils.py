@@ -19,7 +19,6 @@ import datetime
 import errno
 import getpass
 import hashlib
-import io
 import itertools
 import json
 import logging
@@ -36,6 +35,7 @@ import time
 from typing import Optional, Tuple
 import zlib
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from functools import partial, wraps
 from uuid import uuid4 as uuid
@@ -248,6 +248,113 @@ def set_preferred_checksum(checksum_name):
         PREFERRED_CHECKSUM = checksum_name
 
 
+# Size of the blocks in which files are fed to the checksum algorithms
+CHECKSUM_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class _Adler32:
+    """
+    Incremental Adler-32 checksum with the same interface as the hashlib objects.
+    """
+
+    def __init__(self):
+        # adler starting value is _not_ 0
+        self.value = 1
+
+    def update(self, block):
+        self.value = zlib.adler32(block, self.value)
+
+    def hexdigest(self):
+        # backflip on 32bit -- can be removed once everything is fully migrated to 64bit
+        value = self.value
+        if value < 0:
+            value = value + 2 ** 32
+        return str('%08x' % value)
+
+
+class _CRC32:
+    """
+    Incremental CRC32 checksum with the same interface as the hashlib objects.
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, block):
+        self.value = zlib.crc32(block, self.value)
+
+    def hexdigest(self):
+        return "%X" % (self.value & 0xFFFFFFFF)
+
+
+CHECKSUM_HASHERS = {
+    'adler32': _Adler32,
+    'md5': hashlib.md5,
+    'sha256': hashlib.sha256,
+    'crc32': _CRC32,
+}
+
+
+def calculate_checksums(file, checksum_names=None, block_size=CHECKSUM_BLOCK_SIZE):
+    """
+    Calculate several checksums of a file while reading its content only once.
+
+    The file is memory-mapped when possible and every block is handed to all
+    checksum algorithms before the next one is read.
+
+    :param file: file name
+    :param checksum_names: list of checksum names (keys of CHECKSUM_HASHERS). Defaults to GLOBALLY_SUPPORTED_CHECKSUMS.
+    :param block_size: size of the blocks fed to the checksum algorithms
+    :returns: dictionary {checksum_name: hexadecimal checksum}
+    """
+    hashers = {name: CHECKSUM_HASHERS[name]() for name in (checksum_names or GLOBALLY_SUPPORTED_CHECKSUMS)}
+
+    with open(file, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # empty files and special files can not be mapped
+            mapped = None
+
+        if mapped is not None:
+            with mapped, memoryview(mapped) as view:
+                for offset in range(0, len(view), block_size):
+                    with view[offset:offset + block_size] as block:
+                        for hasher in hashers.values():
+                            hasher.update(block)
+        else:
+            buffer = bytearray(block_size)
+            with memoryview(buffer) as view:
+                for size in iter(partial(f.readinto, buffer), 0):
+                    with view[:size] as block:
+                        for hasher in hashers.values():
+                            hasher.update(block)
+
+    return {name: hasher.hexdigest() for name, hasher in hashers.items()}
+
+
+def calculate_checksums_bulk(files, checksum_names=None, threads=None):
+    """
+    Calculate several checksums of many files, using a pool of threads.
+
+    The checksum algorithms release the GIL while processing large blocks,
+    so the files are effectively hashed in parallel.
+
+    :param files: list of file names
+    :param checksum_names: list of checksum names (keys of CHECKSUM_HASHERS). Defaults to GLOBALLY_SUPPORTED_CHECKSUMS.
+    :param threads: number of threads to use. Defaults to the number of CPUs, at most 8.
+    :returns: list of dictionaries {checksum_name: hexadecimal checksum}, in the order of files
+    """
+    files = list(files)
+    if threads is None:
+        threads = min(8, os.cpu_count() or 1)
+    if threads <= 1 or len(files) <= 1:
+        return [calculate_checksums(file, checksum_names) for file in files]
+
+    with ThreadPoolExecutor(max_workers=min(threads, len(files))) as executor:
+        return list(executor.map(partial(calculate_checksums, checksum_names=checksum_names), files))
+
+
 def adler32(file):
     """
     An Adler-32 checksum is obtained by calculating two 16-bit checksums A and B
@@ -257,40 +364,11 @@ def adler32(file):
     :param file: file name
     :returns: Hexified string, padded to 8 values.
     """
-
-    # adler starting value is _not_ 0
-    adler = 1
-
-    can_mmap = False
-    # try:
-    #    with open(file, 'r+b') as f:
-    #        can_mmap = True
-    # except:
-    #    pass
-
     try:
-        # use mmap if possible
-        if can_mmap:
-            with open(file, 'r+b') as f:
-                m = mmap.mmap(f.fileno(), 0)
-                # partial block reads at slightly increased buffer sizes
-                for block in iter(partial(m.read, io.DEFAULT_BUFFER_SIZE * 8), b''):
-                    adler = zlib.adler32(block, adler)
-        else:
-            with open(file, 'rb') as f:
-                # partial block reads at slightly increased buffer sizes
-                for block in iter(partial(f.read, io.DEFAULT_BUFFER_SIZE * 8), b''):
-                    adler = zlib.adler32(block, adler)
-
+        return calculate_checksums(file, ['adler32'])['adler32']
     except Exception as e:
         raise Exception('FATAL - could not get Adler-32 checksum of file %s: %s' % (file, e))
 
-    # backflip on 32bit -- can be removed once everything is fully migrated to 64bit
-    if adler < 0:
-        adler = adler + 2 ** 32
-
-    return str('%08x' % adler)
-
 
 CHECKSUM_ALGO_DICT['adler32'] = adler32
 
@@ -302,15 +380,11 @@ def md5(file):
     :param file: file name
     :returns: string of 32 hexadecimal digits
     """
-    hash_md5 = hashlib.md5()
     try:
-        with open(file, "rb") as f:
-            list(map(hash_md5.update, iter(lambda: f.read(4096), b"")))
+        return calculate_checksums(file, ['md5'])['md5']
     except Exception as e:
         raise Exception('FATAL - could not get MD5 checksum of file %s - %s' % (file, e))
 
-    return hash_md5.hexdigest()
-
 
 CHECKSUM_ALGO_DICT['md5'] = md5
 
@@ -322,11 +396,7 @@ def sha256(file):
     :param file: file name
     :returns: string of 32 hexadecimal digits
     """
-    with open(file, "rb") as f:
-        bytes_ = f.read()  # read entire file as bytes
-        readable_hash = hashlib.sha256(bytes_).hexdigest()
-        print(readable_hash)
-        return readable_hash
+    return calculate_checksums(file, ['sha256'])['sha256']
 
 
 CHECKSUM_ALGO_DICT['sha256'] = sha256
@@ -339,10 +409,7 @@ def crc32(file):
     :param file: file name
     :returns: string of 32 hexadecimal digits
     """
-    prev = 0
-    for eachLine in open(file, "rb"):
-        prev = zlib.crc32(eachLine, prev)
-    return "%X" % (prev & 0xFFFFFFFF)
+    return calculate_checksums(file, ['crc32'])['crc32']
 
 
 CHECKSUM_ALGO_DICT['crc32'] = crc32
@@ -1283,6 +1350,9 @@ def parse_replicas_from_string(string):
             raise MetalinkJsonParsingError(string, xml_err, json_err)
 
 
+METALINK_NS = '{urn:ietf:params:xml:ns:metalink}'
+
+
 def parse_replicas_metalink(root):
     """
     Transforms the metalink tree into a list of dictionaries where
@@ -1293,51 +1363,77 @@ def parse_replicas_metalink(root):
 
     :returns: a list with a dictionary for each file
     """
-    files = []
+    # loop over all <file> tags of the metalink string
+    return [_parse_replicas_metalink_file(file_tag_obj) for file_tag_obj in root.findall(METALINK_NS + 'file')]
+
+
+def parse_replicas_metalink_stream(chunks):
+    """
+    Incrementally parses the metalink output of list_replicas. Only the <file>
+    tag being parsed is kept in memory.
 
-    # metalink namespace
-    ns = '{urn:ietf:params:xml:ns:metalink}'
+    :param chunks: iterable of bytes or strings, e.g. the content of an http response.
+
+    :returns: a generator of dictionaries, one for each file, as in parse_replicas_metalink
+    """
+    parser = ElementTree.XMLPullParser(events=('start', 'end'))
+    root = None
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if root is None:
+                root = element
+            elif event == 'end' and element.tag == METALINK_NS + 'file':
+                yield _parse_replicas_metalink_file(element)
+                root.remove(element)
+    parser.close()
+
+
+def _parse_replicas_metalink_file(file_tag_obj):
+    """
+    Transforms one <file> tag of a metalink tree into a dictionary describing the file with its replicas.
+
+    :param file_tag_obj: the <file> element
+
+    :returns: the dictionary describing the file
+    """
     str_to_bool = {'true': True, 'True': True, 'false': False, 'False': False}
 
-    # loop over all <file> tags of the metalink string
-    for file_tag_obj in root.findall(ns + 'file'):
-        # search for identity-tag
-        identity_tag_obj = file_tag_obj.find(ns + 'identity')
-        if not ElementTree.iselement(identity_tag_obj):
-            raise InputValidationError('Failed to locate identity-tag inside %s' % ElementTree.tostring(file_tag_obj))
-
-        cur_file = {'did': identity_tag_obj.text,
-                    'adler32': None,
-                    'md5': None,
-                    'sources': []}
-
-        parent_dids = set()
-        parent_dids_tag_obj = file_tag_obj.find(ns + 'parents')
-        if ElementTree.iselement(parent_dids_tag_obj):
-            for did_tag_obj in parent_dids_tag_obj.findall(ns + 'did'):
-                parent_dids.add(did_tag_obj.text)
-        cur_file['parent_dids'] = parent_dids
-
-        size_tag_obj = file_tag_obj.find(ns + 'size')
-        cur_file['bytes'] = int(size_tag_obj.text) if ElementTree.iselement(size_tag_obj) else None
-
-        for hash_tag_obj in file_tag_obj.findall(ns + 'hash'):
-            hash_type = hash_tag_obj.get('type')
-            if hash_type:
-                cur_file[hash_type] = hash_tag_obj.text
-
-        for url_tag_obj in file_tag_obj.findall(ns + 'url'):
-            key_rename_map = {'location': 'rse'}
-            src = {}
-            for k, v in url_tag_obj.items():
-                k = key_rename_map.get(k, k)
-                src[k] = str_to_bool.get(v, v)
-            src['pfn'] = url_tag_obj.text
-            cur_file['sources'].append(src)
-
-        files.append(cur_file)
-
-    return files
+    # search for identity-tag
+    identity_tag_obj = file_tag_obj.find(METALINK_NS + 'identity')
+    if not ElementTree.iselement(identity_tag_obj):
+        raise InputValidationError('Failed to locate identity-tag inside %s' % ElementTree.tostring(file_tag_obj))
+
+    cur_file = {'did': identity_tag_obj.text,
+                'adler32': None,
+                'md5': None,
+                'sources': []}
+
+    parent_dids = set()
+    parent_dids_tag_obj = file_tag_obj.find(METALINK_NS + 'parents')
+    if ElementTree.iselement(parent_dids_tag_obj):
+        for did_tag_obj in parent_dids_tag_obj.findall(METALINK_NS + 'did'):
+            parent_dids.add(did_tag_obj.text)
+    cur_file['parent_dids'] = parent_dids
+
+    size_tag_obj = file_tag_obj.find(METALINK_NS + 'size')
+    cur_file['bytes'] = int(size_tag_obj.text) if ElementTree.iselement(size_tag_obj) else None
+
+    for hash_tag_obj in file_tag_obj.findall(METALINK_NS + 'hash'):
+        hash_type = hash_tag_obj.get('type')
+        if hash_type:
+            cur_file[hash_type] = hash_tag_obj.text
+
+    for url_tag_obj in file_tag_obj.findall(METALINK_NS + 'url'):
+        key_rename_map = {'location': 'rse'}
+        src = {}
+        for k, v in url_tag_obj.items():
+            k = key_rename_map.get(k, k)
+            src[k] = str_to_bool.get(v, v)
+        src['pfn'] = url_tag_obj.text
+        cur_file['sources'].append(src)
+
+    return cur_file
 
 
 def get_thread_with_periodic_running_function(interval, action, graceful_stop):
@@ -13,13 +13,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from enum import Enum
 from re import match
 from traceback import format_exc
 from typing import TYPE_CHECKING
 
-from sqlalchemy import and_
+from dogpile.cache.api import NO_VALUE
+from sqlalchemy import and_, event
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import exc
 
@@ -27,6 +30,7 @@ import rucio.core.account_counter
 import rucio.core.rse
 
 from rucio.common import exception
+from rucio.common.cache import make_region_memcached
 from rucio.common.config import config_get_bool
 from rucio.core.vo import vo_exists
 from rucio.db.sqla import models
@@ -34,8 +38,12 @@ from rucio.db.sqla.constants import AccountStatus, AccountType
 from rucio.db.sqla.session import read_session, transactional_session, stream_session
 
 if TYPE_CHECKING:
+    from typing import Dict
     from sqlalchemy.orm import Session
 
+REGION = make_region_memcached(expiration_time=60)
+_SNAPSHOT = threading.local()
+
 
 @transactional_session
 def add_account(account, type_, email, *, session: "Session"):
@@ -219,13 +227,93 @@ def list_account_attributes(account, *, session: "Session"):
     except exc.NoResultFound:
         raise exception.AccountNotFound("Account ID '{0}' does not exist".format(account))
 
-    query = session.query(models.AccountAttrAssociation).filter_by(account=account)
-    for attr in query:
-        attr_list.append({'key': attr.key, 'value': attr.value})
+    for key, value in get_account_attributes(account, session=session).items():
+        attr_list.append({'key': key, 'value': value})
 
     return attr_list
 
 
+@contextmanager
+def account_attributes_snapshot():
+    """
+    Within this context, the attributes of each account are read at most once by the current thread.
+    Nested contexts share the snapshot of the outermost one.
+    """
+    if getattr(_SNAPSHOT, 'attributes', None) is not None:
+        yield
+        return
+    _SNAPSHOT.attributes = {}
+    try:
+        yield
+    finally:
+        _SNAPSHOT.attributes = None
+
+
+def _invalidate_account_attributes(account):
+    """
+    Drop the cached attributes of an account.
+
+    :param account: the account name.
+    """
+    REGION.delete('account_attributes_%s' % getattr(account, 'internal', account))
+    if getattr(_SNAPSHOT, 'attributes', None) is not None:
+        _SNAPSHOT.attributes.pop(account, None)
+
+
+def _invalidate_account_attributes_on_commit(account, session):
+    """
+    Drop the cached attributes of an account once they are changed, and again once the transaction
+    is committed, as a concurrent reader can cache the attributes of before the change until then.
+    The accounts to invalidate are kept in the session, with a single listener per session.
+
+    :param account: the account name.
+    :param session: The database session in use.
+    """
+    _invalidate_account_attributes(account)
+    pending = session.info.get('account_attributes_to_invalidate')
+    if pending is None:
+        pending = session.info['account_attributes_to_invalidate'] = set()
+        event.listen(session, 'after_commit', _invalidate_pending_account_attributes)
+    pending.add(account)
+
+
+def _invalidate_pending_account_attributes(session):
+    """
+    Drop the cached attributes of the accounts changed in the transaction committed by the session.
+
+    :param session: The database session in use.
+    """
+    pending = session.info.get('account_attributes_to_invalidate')
+    while pending:
+        _invalidate_account_attributes(pending.pop())
+
+
+@read_session
+def get_account_attributes(account, *, session: "Session") -> "Dict":
+    """
+    Get the attributes of an account, from the snapshot of the current thread or from the cache if possible.
+
+    :param account: the account name.
+    :param session: The database session in use.
+
+    :returns: a dictionary with the value of each attribute.
+    """
+    snapshot = getattr(_SNAPSHOT, 'attributes', None)
+    if snapshot is not None and account in snapshot:
+        return snapshot[account]
+
+    cache_key = 'account_attributes_%s' % getattr(account, 'internal', account)
+    attributes = REGION.get(cache_key)
+    if attributes is NO_VALUE:
+        query = session.query(models.AccountAttrAssociation.key, models.AccountAttrAssociation.value).filter_by(account=account)
+        attributes = {key: value for key, value in query}
+        REGION.set(cache_key, attributes)
+
+    if snapshot is not None:
+        snapshot[account] = attributes
+    return attributes
+
+
 @read_session
 def has_account_attribute(account, key, *, session: "Session"):
     """
@@ -237,7 +325,7 @@ def has_account_attribute(account, key, *, session: "Session"):
 
     :returns: True or False
     """
-    if session.query(models.AccountAttrAssociation.value).filter_by(account=account, key=key).first():
+    if key in get_account_attributes(account, session=session):
         return True
     return False
 
@@ -263,6 +351,7 @@ def add_account_attribute(account, key, value, *, session: "Session"):
     new_attr = models.AccountAttrAssociation(account=account, key=key, value=value)
     try:
         new_attr.save(session=session)
+        _invalidate_account_attributes_on_commit(account, session=session)
     except IntegrityError as error:
         if match('.*IntegrityError.*ORA-00001: unique constraint.*ACCOUNT_ATTR_MAP_PK.*violated.*', error.args[0]) \
            or match('.*IntegrityError.*1062.*Duplicate entry.*for key.*', error.args[0]) \
@@ -288,6 +377,7 @@ def del_account_attribute(account, key, *, session: "Session"):
     if aid is None:
         raise exception.AccountNotFound('Attribute ({0}) does not exist for the account {1}!'.format(key, account))
     aid.delete(session=session)
+    _invalidate_account_attributes_on_commit(account, session=session)
 
 
 @read_session
@@ -16,12 +16,14 @@ import datetime
 from typing import TYPE_CHECKING
 
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy import literal, insert, select
+from sqlalchemy import and_, bindparam, literal, insert, or_, select, update
 
+from rucio.common.utils import chunks
 from rucio.db.sqla import models, filter_thread_work
 from rucio.db.sqla.session import read_session, transactional_session
 
 if TYPE_CHECKING:
+    from typing import Dict
     from sqlalchemy.orm import Session
 
 MAX_COUNTERS = 10
@@ -126,8 +128,76 @@ def update_account_counter(account, rse_id, *, session: "Session"):
                             files=sum([updated_account_counter.files for updated_account_counter in updated_account_counters]),
                             bytes=sum([updated_account_counter.bytes for updated_account_counter in updated_account_counters])).save(session=session)
 
-    for update in updated_account_counters:
-        update.delete(flush=False, session=session)
+    for updated_account_counter in updated_account_counters:
+        updated_account_counter.delete(flush=False, session=session)
+
+
+@transactional_session
+def update_account_counters(total_workers, worker_number, limit=10000, *, session: "Session") -> "Dict":
+    """
+    Read a batch of updated_account_counters of this worker, sum them per account and rse_id,
+    apply the sums to the account_counters in bulk and delete the consumed rows.
+
+    :param total_workers:      Number of total workers.
+    :param worker_number:      id of the executing worker.
+    :param limit:              Maximum number of updated_account_counters to consume.
+    :param session:            Database session in use.
+    :returns:                  Dictionary with the number of consumed rows and of updated counters.
+    """
+    query = session.query(models.UpdatedAccountCounter.id,
+                          models.UpdatedAccountCounter.account,
+                          models.UpdatedAccountCounter.rse_id,
+                          models.UpdatedAccountCounter.files,
+                          models.UpdatedAccountCounter.bytes)
+
+    if session.bind.dialect.name == 'oracle':
+        hash_variable = 'CONCAT(account, rse_id)'
+    else:
+        hash_variable = 'concat(account, rse_id)'
+
+    query = filter_thread_work(session=session, query=query, total_threads=total_workers, thread_id=worker_number, hash_variable=hash_variable)
+    if limit:
+        query = query.limit(limit)
+
+    ids = []
+    deltas = {}
+    for id_, account, rse_id, files, bytes_ in query:
+        ids.append(id_)
+        delta = deltas.setdefault((account, rse_id), [0, 0])
+        delta[0] += files
+        delta[1] += bytes_
+
+    if not deltas:
+        return {'rows': 0, 'counters': 0}
+
+    existing = set()
+    for chunk in chunks(list(deltas), 100):
+        query = session.query(models.AccountUsage.account, models.AccountUsage.rse_id).\
+            filter(or_(*[and_(models.AccountUsage.account == account, models.AccountUsage.rse_id == rse_id) for account, rse_id in chunk]))
+        existing.update((account, rse_id) for account, rse_id in query)
+
+    if existing:
+        stmt = update(
+            models.AccountUsage
+        ).where(
+            models.AccountUsage.account == bindparam('b_account'),
+            models.AccountUsage.rse_id == bindparam('b_rse_id')
+        ).values(
+            files=models.AccountUsage.files + bindparam('b_files'),
+            bytes=models.AccountUsage.bytes + bindparam('b_bytes')
+        ).execution_options(
+            synchronize_session=False
+        )
+        session.execute(stmt, [{'b_account': account, 'b_rse_id': rse_id, 'b_files': deltas[(account, rse_id)][0], 'b_bytes': deltas[(account, rse_id)][1]}
+                               for account, rse_id in existing])
+
+    session.bulk_insert_mappings(models.AccountUsage, [{'account': account, 'rse_id': rse_id, 'files': files, 'bytes': bytes_}
+                                                       for (account, rse_id), (files, bytes_) in deltas.items() if (account, rse_id) not in existing])
+
+    for chunk in chunks(ids, 1000):
+        session.query(models.UpdatedAccountCounter).filter(models.UpdatedAccountCounter.id.in_(chunk)).delete(synchronize_session=False)
+
+    return {'rows': len(ids), 'counters': len(deltas)}
 
 
 @transactional_session
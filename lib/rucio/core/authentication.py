@@ -15,11 +15,15 @@
 
 import datetime
 import hashlib
+import logging
 import random
 import re
 import sys
+import threading
+import time
 import traceback
 from base64 import b64decode
+from collections import OrderedDict
 from typing import TYPE_CHECKING
 
 import paramiko
@@ -28,10 +32,11 @@ from dogpile.cache import make_region
 from sqlalchemy import and_, or_, select, delete
 
 from rucio.common.cache import make_region_memcached
-from rucio.common.config import config_get_bool
+from rucio.common.config import config_get_bool, config_get_int
 from rucio.common.exception import CannotAuthenticate, RucioException
 from rucio.common.utils import chunks, generate_uuid
 from rucio.core.account import account_exists
+from rucio.core.monitor import MetricManager
 from rucio.core.oidc import validate_jwt
 from rucio.db.sqla import filter_thread_work
 from rucio.db.sqla import models
@@ -82,10 +87,114 @@ def token_key_generator(namespace, fni, **kwargs):
     return generate_key
 
 
-if config_get_bool('cache', 'use_external_cache_for_auth_tokens', default=False):
-    TOKENREGION = make_region_memcached(expiration_time=900, function_key_generator=token_key_generator)
+# Seconds during which the validation of a token is cached
+TOKEN_CACHE_EXPIRATION = 900
+
+EXTERNAL_TOKEN_CACHE = config_get_bool('cache', 'use_external_cache_for_auth_tokens', default=False)
+if EXTERNAL_TOKEN_CACHE:
+    TOKENREGION = make_region_memcached(expiration_time=TOKEN_CACHE_EXPIRATION, function_key_generator=token_key_generator)
 else:
-    TOKENREGION = make_region(function_key_generator=token_key_generator).configure('dogpile.cache.memory', expiration_time=900)
+    TOKENREGION = make_region(function_key_generator=token_key_generator).configure('dogpile.cache.memory', expiration_time=TOKEN_CACHE_EXPIRATION)
+
+METRICS = MetricManager(module=__name__)
+
+# Key in TOKENREGION of the identifier of the last revocation of tokens
+TOKEN_REVOCATIONS_KEY = '__token_revocations__'
+
+
+class LocalTokenCache:
+    """
+    Bounded in-process LRU cache of validated tokens in front of TOKENREGION, so that tokens used
+    repeatedly are validated without any network round trip.
+
+    Valid tokens are kept until they expire, at most `positive_ttl` seconds as in TOKENREGION, invalid
+    tokens during `negative_ttl` seconds. At most once every `revocation_check_interval` seconds, the
+    identifier of the last revocation in TOKENREGION is read, and the whole cache is cleared if tokens
+    were revoked since the previous check. The revocations only reach the other processes if TOKENREGION
+    is shared, with cache.use_external_cache_for_auth_tokens; otherwise the tokens deleted by another
+    process are accepted until their cached validation expires, as without this cache.
+    """
+
+    def __init__(self, max_size: int, negative_ttl: int, revocation_check_interval: int, positive_ttl: int = TOKEN_CACHE_EXPIRATION):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.positive_ttl = positive_ttl
+        self.revocation_check_interval = revocation_check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._revocations = None
+        self._revocations_checked_at = None
+        self._hits = METRICS.counter('token_cache.hits')
+        self._misses = METRICS.counter('token_cache.misses')
+
+    def _check_revocations(self):
+        now = time.monotonic()
+        if self._revocations_checked_at is not None and now < self._revocations_checked_at + self.revocation_check_interval:
+            return
+        self._revocations_checked_at = now
+        revocations = TOKENREGION.get(TOKEN_REVOCATIONS_KEY)
+        if revocations != self._revocations:
+            self._revocations = revocations
+            self.clear()
+
+    def get(self, key):
+        """
+        :param key: The token.
+        :returns: The cached validation of the token: a dictionary if the token is valid, None if
+                  the token is invalid, or NO_VALUE if the token is not in the cache.
+        """
+        if self.max_size <= 0:
+            return NO_VALUE
+        self._check_revocations()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < datetime.datetime.utcnow():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses.inc()
+                return NO_VALUE
+            self._entries.move_to_end(key)
+        self._hits.inc()
+        return None if entry[1] is None else dict(entry[1])
+
+    def set(self, key, value):
+        """
+        :param key:   The token.
+        :param value: The validation of the token, None if the token is invalid.
+        """
+        if self.max_size <= 0:
+            return
+        now = datetime.datetime.utcnow()
+        if value is None:
+            expires_at = now + datetime.timedelta(seconds=self.negative_ttl)
+        else:
+            expires_at = min(value.get('lifetime', datetime.datetime(1970, 1, 1)), now + datetime.timedelta(seconds=self.positive_ttl))
+        with self._lock:
+            self._entries[key] = (expires_at, None if value is None else dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_multi(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+LOCAL_TOKEN_CACHE = LocalTokenCache(
+    max_size=config_get_int('cache', 'local_token_cache_size', False, 10000, check_config_table=False),
+    negative_ttl=config_get_int('cache', 'local_token_cache_negative_ttl', False, 10, check_config_table=False),
+    revocation_check_interval=config_get_int('cache', 'local_token_cache_revocation_check_interval', False, 10, check_config_table=False),
+)
 
 
 @transactional_session
@@ -401,6 +510,8 @@ def delete_expired_tokens(total_workers, worker_number, limit=1000, *, session:
                                      .filter(models.Token.token.in_(tokens)) \
                                      .with_for_update(skip_locked=True) \
                                      .delete(synchronize_session='fetch')
+            # The cached validations of the expired tokens are rejected anyway, there is no need to revoke them
+            _forget_tokens(tokens)
 
     except Exception as error:
         raise RucioException(error.args)
@@ -459,29 +570,65 @@ def validate_auth_token(token, *, session: "Session"):
     if not token:
         return None
 
-    # Be gentle with bash variables, there can be whitespace
-    token = token.strip()
-    cache_key = token.replace(' ', '')
-
-    # Check if token ca be found in cache region
-    value = TOKENREGION.get(cache_key)
-    if value is NO_VALUE:  # no cached entry found
-        value = query_token(token, session=session)
-        if not value:
-            # identify JWT access token and validte
-            # & save it in Rucio if scope and audience are correct
-            if len(token.split(".")) == 3:
-                value = validate_jwt(token, session=session)
+    with METRICS.timer('validate_auth_token'):
+        # Be gentle with bash variables, there can be whitespace
+        token = token.strip()
+        cache_key = token.replace(' ', '')
+
+        # Check if token can be found in the cache of this process
+        value = LOCAL_TOKEN_CACHE.get(cache_key)
+        if value is not NO_VALUE:
+            return value
+
+        # Check if token ca be found in cache region
+        value = TOKENREGION.get(cache_key)
+        if value is NO_VALUE:  # no cached entry found
+            value = query_token(token, session=session)
+            if not value:
+                # identify JWT access token and validte
+                # & save it in Rucio if scope and audience are correct
+                if len(token.split(".")) == 3:
+                    value = validate_jwt(token, session=session)
                 if not value:
+                    LOCAL_TOKEN_CACHE.set(cache_key, None)
                     return None
-            else:
-                return None
-        # save token in the cache
-        TOKENREGION.set(cache_key, value)
-    if value.get('lifetime', datetime.datetime(1970, 1, 1)) < datetime.datetime.utcnow():  # check if expired
-        TOKENREGION.delete(cache_key)
-        return None
-    return value
+            # save token in the cache
+            TOKENREGION.set(cache_key, value)
+        if value.get('lifetime', datetime.datetime(1970, 1, 1)) < datetime.datetime.utcnow():  # check if expired
+            TOKENREGION.delete(cache_key)
+            return None
+        LOCAL_TOKEN_CACHE.set(cache_key, value)
+        return value
+
+
+def _forget_tokens(tokens):
+    """
+    Drop deleted tokens from the shared and the local caches.
+
+    :param tokens: The deleted tokens.
+    """
+    cache_keys = [token.strip().replace(' ', '') for token in tokens]
+    if cache_keys:
+        TOKENREGION.delete_multi(cache_keys)
+        LOCAL_TOKEN_CACHE.delete_multi(cache_keys)
+
+
+@transactional_session
+def revoke_auth_token(token, *, session: "Session"):
+    """
+    Revoke an authentication token before its expiration. With a shared TOKENREGION, the other
+    processes drop the token from their local cache within local_token_cache_revocation_check_interval
+    seconds; otherwise only this process forgets it at once.
+
+    :param token: Authentication token as a variable-length string.
+    :param session: The database session in use.
+    """
+    token = token.strip()
+    session.query(models.Token).filter(models.Token.token == token).delete(synchronize_session=False)
+    _forget_tokens([token])
+    if not EXTERNAL_TOKEN_CACHE:
+        logging.warning('The revocation of the tokens only reaches the other processes with cache.use_external_cache_for_auth_tokens')
+    TOKENREGION.set(TOKEN_REVOCATIONS_KEY, generate_uuid())
 
 
 def token_dictionary(token: models.Token):
@@ -511,3 +658,4 @@ def __delete_expired_tokens_account(account, *, session: "Session"):
             .where(models.Token.token.in_(t)) \
             .prefix_with("/*+ INDEX(TOKENS_ACCOUNT_EXPIRED_AT_IDX) */")
         session.execute(stmt_delete)
+    _forget_tokens(tokens)
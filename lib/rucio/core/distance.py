@@ -27,6 +27,14 @@ if TYPE_CHECKING:
     from sqlalchemy.orm import Session
 
 
+def _invalidate_distance_graph():
+    """
+    Drop the distance graph used for path finding after a change of distances.
+    """
+    from rucio.core.topology import invalidate_distance_graph
+    invalidate_distance_graph()
+
+
 @transactional_session
 def add_distance(src_rse_id, dest_rse_id, distance=None, *, session: "Session"):
     """
@@ -41,6 +49,7 @@ def add_distance(src_rse_id, dest_rse_id, distance=None, *, session: "Session"):
     try:
         new_distance = Distance(src_rse_id=src_rse_id, dest_rse_id=dest_rse_id, distance=distance)
         new_distance.save(session=session)
+        _invalidate_distance_graph()
     except IntegrityError:
         raise exception.Duplicate()
     except DatabaseError as error:
@@ -97,6 +106,7 @@ def delete_distances(src_rse_id=None, dest_rse_id=None, *, session: "Session"):
             query = query.filter(Distance.dest_rse_id == dest_rse_id)
 
         query.delete()
+        _invalidate_distance_graph()
     except IntegrityError as error:
         raise exception.RucioException(error.args)
 
@@ -118,6 +128,7 @@ def update_distances(src_rse_id=None, dest_rse_id=None, distance=None, *, sessio
         if dest_rse_id:
             query = query.filter(Distance.dest_rse_id == dest_rse_id)
         query.update({Distance.distance: distance})
+        _invalidate_distance_graph()
     except IntegrityError as error:
         raise exception.RucioException(error.args)
 
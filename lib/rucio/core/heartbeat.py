@@ -22,6 +22,7 @@ from sqlalchemy.sql import distinct
 
 from rucio.db.sqla.models import Heartbeats
 from rucio.db.sqla.session import read_session, transactional_session
+from rucio.common.constants import HASH_RING_BUCKETS
 from rucio.common.exception import DatabaseException
 from rucio.common.utils import pid_exists
 
@@ -30,6 +31,8 @@ if TYPE_CHECKING:
 
 
 DEFAULT_EXPIRATION_DELAY = datetime.timedelta(days=1).total_seconds()
+# Number of positions of each heartbeat on the consistent hashing ring
+HASH_RING_VIRTUAL_NODES = 32
 
 
 @transactional_session
@@ -103,33 +106,74 @@ def live(executable, hostname, pid, thread=None, older_than=600, hash_executable
 
     :returns heartbeats: Dictionary {assign_thread, nr_threads}
     """
+    thread_id = thread.ident if thread else 0
+    heartbeats = live_bulk(executable=executable, hostname=hostname, pid=pid, threads=[thread], older_than=older_than,
+                           hash_executable=hash_executable, payloads={thread_id: payload}, session=session)
+    return heartbeats[thread_id]
+
+
+@transactional_session
+def live_bulk(executable, hostname, pid, threads, older_than=600, hash_executable=None, payloads=None, with_hash_ranges=False, *, session: "Session"):
+    """
+    Register the heartbeats of several threads of a process on a given node at once.
+    The heartbeats are upserted with one statement per distinct payload and the thread
+    assignments of all threads are computed from a single query.
+
+    :param executable: Executable name as a string, e.g., conveyor-submitter.
+    :param hostname: Hostname as a string, e.g., rucio-daemon-prod-01.cern.ch.
+    :param pid: UNIX Process ID as a number, e.g., 1234.
+    :param threads: List of Python Thread Objects. None stands for the thread with id 0.
+    :param older_than: Ignore specified heartbeats older than specified nr of seconds.
+    :param hash_executable: Hash of the executable.
+    :param payloads: Dictionary {thread id: payload} of the payload identifiers of the threads.
+    :param with_hash_ranges: If True, also return the buckets of the consistent hashing ring assigned to each thread.
+    :param session: The database session in use.
+
+    :returns heartbeats: Dictionary {thread id: {assign_thread, nr_threads}}, with hash_ranges if requested
+    """
     if not hash_executable:
         hash_executable = calc_hash(executable)
-
-    if thread:
-        thread_id = thread.ident
-        thread_name = thread.name
-    else:
-        thread_id = 0
-        thread_name = "thread"
-
-    # upsert the heartbeat
-    rowcount = session.query(Heartbeats)\
-        .filter_by(executable=hash_executable,
-                   hostname=hostname,
-                   pid=pid,
-                   thread_id=thread_id)\
-        .update({'updated_at': datetime.datetime.utcnow(), 'payload': payload})
-    if not rowcount:
-        Heartbeats(executable=hash_executable,
-                   readable=executable[:Heartbeats.readable.property.columns[0].type.length],
-                   hostname=hostname,
-                   pid=pid,
-                   thread_id=thread_id,
-                   thread_name=thread_name,
-                   payload=payload).save(session=session)
-
-    # assign thread identifier
+    payloads = payloads or {}
+
+    thread_names = {}
+    for thread in threads:
+        if thread:
+            thread_names[thread.ident] = thread.name
+        else:
+            thread_names[0] = "thread"
+
+    # upsert the heartbeats
+    query = session.query(Heartbeats.thread_id)\
+                   .filter_by(executable=hash_executable,
+                              hostname=hostname,
+                              pid=pid)\
+                   .filter(Heartbeats.thread_id.in_(list(thread_names)))
+    existing_thread_ids = {thread_id for thread_id, in query}
+    thread_ids_by_payload = {}
+    for thread_id in existing_thread_ids:
+        thread_ids_by_payload.setdefault(payloads.get(thread_id), []).append(thread_id)
+    now = datetime.datetime.utcnow()
+    for payload, thread_ids in thread_ids_by_payload.items():
+        session.query(Heartbeats)\
+            .filter_by(executable=hash_executable,
+                       hostname=hostname,
+                       pid=pid)\
+            .filter(Heartbeats.thread_id.in_(thread_ids))\
+            .update({'updated_at': now, 'payload': payload}, synchronize_session=False)
+
+    readable = executable[:Heartbeats.readable.property.columns[0].type.length]
+    new_heartbeats = [{'executable': hash_executable,
+                       'readable': readable,
+                       'hostname': hostname,
+                       'pid': pid,
+                       'thread_id': thread_id,
+                       'thread_name': thread_name,
+                       'payload': payloads.get(thread_id)}
+                      for thread_id, thread_name in thread_names.items() if thread_id not in existing_thread_ids]
+    if new_heartbeats:
+        session.bulk_insert_mappings(Heartbeats, new_heartbeats)
+
+    # assign thread identifiers
     query = session.query(Heartbeats.hostname,
                           Heartbeats.pid,
                           Heartbeats.thread_id)\
@@ -146,14 +190,61 @@ def live(executable, hostname, pid, thread=None, older_than=600, hash_executable
 
     # there is no universally applicable rownumber in SQLAlchemy
     # so we have to do it in Python
-    assign_thread = 0
+    assign_threads = {}
     for r in range(len(result)):
-        if result[r][0] == hostname and result[r][1] == pid and result[r][2] == thread_id:
-            assign_thread = r
-            break
+        if result[r][0] == hostname and result[r][1] == pid:
+            assign_threads[result[r][2]] = r
+
+    heartbeats = {thread_id: {'assign_thread': assign_threads.get(thread_id, 0),
+                              'nr_threads': len(result)}
+                  for thread_id in thread_names}
+    if with_hash_ranges:
+        ranges = hash_ring_ranges(['%s:%s:%s' % (r[0], r[1], r[2]) for r in result])
+        for thread_id, heartbeat in heartbeats.items():
+            heartbeat['hash_ranges'] = ranges.get('%s:%s:%s' % (hostname, pid, thread_id), [])
+    return heartbeats
 
-    return {'assign_thread': assign_thread,
-            'nr_threads': len(result)}
+
+def hash_ring_ranges(members, nb_buckets=HASH_RING_BUCKETS, virtual_nodes=HASH_RING_VIRTUAL_NODES):
+    """
+    Consistent hashing partitioner. Each member is placed at `virtual_nodes` positions on a ring
+    of `nb_buckets` buckets, and each bucket belongs to the member at the next position on the ring.
+    When a member joins or leaves, only the buckets next to its own positions change owner, so the
+    work of the other members is not reshuffled as with a modulo of the number of members.
+
+    :param members: List of the identifiers of the members, as strings.
+    :param nb_buckets: Number of buckets of the ring.
+    :param virtual_nodes: Number of positions of each member on the ring.
+
+    :returns: Dictionary {member: sorted list of the (first, last) ranges of buckets owned by the member}
+    """
+    positions = {}
+    for member in sorted(set(members)):
+        for node in range(virtual_nodes):
+            position = int(hashlib.md5(('%s:%s' % (member, node)).encode('utf-8')).hexdigest(), 16) % nb_buckets
+            positions.setdefault(position, member)
+
+    ranges = {member: [] for member in members}
+    ring = sorted(positions.items())
+    # the arc of the first position starts after the last position, at the end of the ring
+    previous = ring[-1][0] - nb_buckets if ring else 0
+    for position, member in ring:
+        first = previous + 1
+        if first < 0:
+            ranges[member].append((first + nb_buckets, nb_buckets - 1))
+            first = 0
+        ranges[member].append((first, position))
+        previous = position
+
+    for member, member_ranges in ranges.items():
+        merged = []
+        for first, last in sorted(member_ranges):
+            if merged and merged[-1][1] + 1 == first:
+                merged[-1] = (merged[-1][0], last)
+            else:
+                merged.append((first, last))
+        ranges[member] = merged
+    return ranges
 
 
 @transactional_session
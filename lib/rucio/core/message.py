@@ -29,7 +29,7 @@ from rucio.db.sqla.models import Message, MessageHistory
 from rucio.db.sqla.session import transactional_session
 
 if TYPE_CHECKING:
-    from typing import Any, Dict, List, Optional
+    from typing import Any, Dict, List, Optional, Tuple
     from sqlalchemy.orm import Session
 
     MessageType = Dict[str, Any]
@@ -99,6 +99,8 @@ def retrieve_messages(bulk: int = 1000,
                       event_type: "Optional[str]" = None,
                       lock: bool = False,
                       old_mode: bool = True,
+                      exclude_services: "Optional[List[str]]" = None,
+                      hash_ranges: "Optional[List[Tuple[int, int]]]" = None,
                       *, session: "Session") -> "MessagesListType":
     """
     Retrieve up to $bulk messages.
@@ -109,6 +111,8 @@ def retrieve_messages(bulk: int = 1000,
     :param event_type: Return only specified event_type. If None, returns everything.
     :param lock: Select exclusively some rows.
     :param old_mode: If True, doesn't return email if event_type is None.
+    :param exclude_services: Do not return the messages of these services.
+    :param hash_ranges: The buckets of the consistent hashing ring assigned to the caller thread, instead of thread and total_threads.
     :param session: The database session to use.
 
     :returns messages: List of dictionaries {id, created_at, event_type, payload, services}
@@ -116,11 +120,13 @@ def retrieve_messages(bulk: int = 1000,
     messages = []
     try:
         subquery = session.query(Message.id)
-        subquery = filter_thread_work(session=session, query=subquery, total_threads=total_threads, thread_id=thread)
+        subquery = filter_thread_work(session=session, query=subquery, total_threads=total_threads, thread_id=thread, hash_ranges=hash_ranges)
         if event_type:
             subquery = subquery.filter_by(event_type=event_type)
         elif old_mode:
             subquery = subquery.filter(Message.event_type != 'email')
+        if exclude_services:
+            subquery = subquery.filter(Message.services.notin_(exclude_services))
 
         # Step 1:
         # MySQL does not support limits in nested queries, limit on the outer query instead.
@@ -153,20 +159,21 @@ def retrieve_messages(bulk: int = 1000,
 
         # Step 3:
         # Assemble message object
-        for id_, created_at, event_type, payload, services in query:
-            message = {'id': id_,
-                       'created_at': created_at,
-                       'event_type': event_type,
-                       'services': services}
+        rows = query.all()
 
-            # Only switch SQL context when necessary
-            if payload == 'nolimit':
-                nolimit_query = session.query(Message.payload_nolimit).filter(Message.id == id_).one()[0]
-                message['payload'] = json.loads(str(nolimit_query))
-            else:
-                message['payload'] = json.loads(str(payload))
+        # Only switch SQL context when necessary, in bulk for all the messages of the batch
+        payloads_nolimit = {}
+        for ids in chunks([id_ for id_, _, _, payload, _ in rows if payload == 'nolimit'], 1000):
+            payloads_nolimit.update(session.query(Message.id, Message.payload_nolimit).filter(Message.id.in_(ids)))
 
-            messages.append(message)
+        for id_, created_at, event_type, payload, services in rows:
+            if payload == 'nolimit':
+                payload = payloads_nolimit[id_]
+            messages.append({'id': id_,
+                             'created_at': created_at,
+                             'event_type': event_type,
+                             'payload': json.loads(str(payload)),
+                             'services': services})
 
         return messages
 
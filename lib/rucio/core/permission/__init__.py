@@ -13,12 +13,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+import enum
+import hashlib
 from os import environ
 from typing import TYPE_CHECKING
 
 from configparser import NoOptionError, NoSectionError
+from dogpile.cache import make_region
+from dogpile.cache.api import NO_VALUE
+
 from rucio.common import config, exception
+from rucio.common.types import InternalType
 from rucio.common.utils import check_policy_package_version
+from rucio.core.account import account_attributes_snapshot, get_account_attributes
 
 import importlib
 
@@ -29,6 +37,10 @@ if TYPE_CHECKING:
 # dictionary of permission modules for each VO
 permission_modules = {}
 
+# The decisions are cached for a short time when permission.decision_cache_ttl is set, in seconds
+DECISION_CACHE_TTL = config.config_get_int('permission', 'decision_cache_ttl', raise_exception=False, default=0, check_config_table=False)
+REGION = make_region().configure('dogpile.cache.memory', expiration_time=DECISION_CACHE_TTL)
+
 try:
     multivo = config.config_get_bool('common', 'multi_vo')
 except (NoOptionError, NoSectionError):
@@ -102,7 +114,55 @@ def load_permission_for_vo(vo):
     permission_modules[vo] = module
 
 
+class _Uncacheable(Exception):
+    pass
+
+
+def _freeze(value):
+    """
+    Convert the arguments of an action to a hashable value identifying them.
+
+    :param value: The value to convert.
+    :returns: A hashable representation of the value.
+    :raises _Uncacheable: If the value cannot be reliably identified, e.g. arbitrary objects.
+    """
+    if value is None or isinstance(value, (str, bytes, bool, int, float, datetime.datetime, datetime.date)):
+        return value
+    if isinstance(value, InternalType):
+        return (type(value).__name__, value.internal)
+    if isinstance(value, enum.Enum):
+        return (type(value).__name__, value.name)
+    if isinstance(value, (list, tuple)):
+        return ('list', tuple(_freeze(item) for item in value))
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted(((_freeze(key), _freeze(item)) for key, item in value.items()), key=repr)))
+    raise _Uncacheable()
+
+
+def _decision_key(issuer, action, kwargs, session):
+    """
+    Key of a permission decision. It contains the attributes of the issuer, so that the decisions
+    are not reused once the attributes of the issuer change.
+
+    :returns: The key, or None if the decision cannot be cached.
+    """
+    try:
+        frozen = _freeze((issuer, action, kwargs, get_account_attributes(issuer, session=session)))
+    except _Uncacheable:
+        return None
+    return hashlib.sha256(repr(frozen).encode()).hexdigest()
+
+
 def has_permission(issuer, action, kwargs, *, session: "Optional[Session]" = None):
     if issuer.vo not in permission_modules:
         load_permission_for_vo(issuer.vo)
-    return permission_modules[issuer.vo].has_permission(issuer, action, kwargs, session=session)
+    with account_attributes_snapshot():
+        key = _decision_key(issuer, action, kwargs, session) if DECISION_CACHE_TTL > 0 else None
+        if key is not None:
+            decision = REGION.get(key)
+            if decision is not NO_VALUE:
+                return decision
+        decision = permission_modules[issuer.vo].has_permission(issuer, action, kwargs, session=session)
+        if key is not None:
+            REGION.set(key, decision)
+        return decision
@@ -35,7 +35,7 @@ from sqlalchemy.exc import DatabaseError, IntegrityError
 from sqlalchemy.orm import aliased
 from sqlalchemy.orm.exc import FlushError, NoResultFound
 from sqlalchemy.sql import label
-from sqlalchemy.sql.expression import case, select, text, false, true, null, literal, literal_column
+from sqlalchemy.sql.expression import bindparam, case, select, text, false, true, null, literal, literal_column
 
 import rucio.core.did
 import rucio.core.lock
@@ -66,6 +66,7 @@ if TYPE_CHECKING:
 
 REGION = make_region_memcached(expiration_time=60)
 METRICS = MetricManager(module=__name__)
+LOGGER = logging.getLogger(__name__)
 
 
 ScopeName = namedtuple('ScopeName', ['scope', 'name'])
@@ -795,12 +796,11 @@ def _get_list_replicas_protocols(
 
 
 def _build_list_replicas_pfn(
-        scope: "InternalScope",
+        pfn: str,
         name: str,
         rse_id: str,
         domain: str,
         protocol: "RSEProtocol",
-        path: str,
         sign_urls: bool,
         signature_lifetime: int,
         client_location: "Dict[str, Any]",
@@ -809,14 +809,10 @@ def _build_list_replicas_pfn(
         session: "Session",
 ) -> str:
     """
-    Generate the PFN for the given scope/name on the rse.
+    Finalize the PFN generated by the protocol for the given name on the rse.
     If needed, sign the PFN url
     If relevant, add the server-side root proxy to te pfn url
     """
-    pfn: str = list(protocol.lfns2pfns(lfns={'scope': scope.external,
-                                             'name': name,
-                                             'path': path}).values())[0]
-
     # do we need to sign the URLs?
     if sign_urls and protocol.attributes['scheme'] == 'https':
         service = get_rse_attribute(rse_id, 'sign_url', session=session)
@@ -891,135 +887,168 @@ def _list_replicas(replicas, show_pfns, schemes, files_wo_replica, client_locati
             except Exception:
                 pass  # do not hard fail if site cannot be resolved or is empty
 
-    file, protocols_by_rse_id, pfns_cache = {}, {}, {}
-
-    for _, replica_group in groupby(replicas, key=lambda x: (x[0], x[1])):  # Group by scope/name
-        file = {}
-        pfns = {}
-        for scope, name, archive_scope, archive_name, bytes_, md5, adler32, path, state, rse_id, rse, rse_type, volatile in replica_group:
-            if isinstance(archive_scope, str):
-                archive_scope = InternalScope(archive_scope, fromExternal=False)
-
-            # it is the first row in the scope/name group
-            if not file:
-                file['scope'], file['name'] = scope, name
-                file['bytes'], file['md5'], file['adler32'] = bytes_, md5, adler32
-                file['pfns'], file['rses'], file['states'] = {}, {}, {}
-                if resolve_parents:
-                    file['parents'] = ['%s:%s' % (parent['scope'].internal, parent['name'])
-                                       for parent in rucio.core.did.list_all_parent_dids(scope, name, session=session)]
-
-            if not rse_id:
-                continue
-
-            rse_key = rse if by_rse_name else rse_id
-            file['states'][rse_key] = str(state.name if state else state)
-
-            if not show_pfns:
+    protocols_by_rse_id = {}
+
+    def _replica_protocols(rse_id, archive_scope, archive_name):
+        # It's the first time we see this RSE, initialize the protocols needed for PFN generation
+        if rse_id not in protocols_by_rse_id:
+            # select the lan door in autoselect mode, otherwise use the wan door
+            domain = input_domain
+            if domain is None:
+                domain = 'wan'
+                if local_rses and rse_id in local_rses:
+                    domain = 'lan'
+
+            # FIXME: if a list_replicas call iterates over both non-archive and archive replicas
+            # on the same rse_id, the protocols will not be correctly initialized for whatever comes
+            # second. This is because of the "additional_schemes" logic:
+            protocols_by_rse_id[rse_id] = _get_list_replicas_protocols(
+                rse_id=rse_id,
+                domain=domain,
+                schemes=schemes,
+                # We want 'root' for archives even if it wasn't included into 'schemes'
+                additional_schemes=['root'] if archive_scope and archive_name else [],
+                session=session,
+            )
+        return protocols_by_rse_id[rse_id]
+
+    # The files are handled in chunks, so that the PFNs of a chunk are generated with one lfns2pfns call per RSE and protocol
+    replica_groups = ((scope_name, list(replica_group)) for scope_name, replica_group in groupby(replicas, key=lambda x: (x[0], x[1])))  # Group by scope/name
+    for replica_groups_chunk in chunks(replica_groups, 1000):
+        lfns_by_protocol = defaultdict(dict)
+        if show_pfns:
+            for _, replica_group in replica_groups_chunk:
+                for scope, name, archive_scope, archive_name, _, _, _, path, _, rse_id, _, _, _ in replica_group:
+                    if not rse_id:
+                        continue
+                    if isinstance(archive_scope, str):
+                        archive_scope = InternalScope(archive_scope, fromExternal=False)
+                    # If the current "replica" is a constituent inside an archive, we must construct the pfn for the
+                    # parent (archive) file
+                    t_scope, t_name = (archive_scope, archive_name) if archive_scope and archive_name else (scope, name)
+                    for protocol_index, (_, protocol, _) in enumerate(_replica_protocols(rse_id, archive_scope, archive_name)):
+                        lfns_by_protocol[rse_id, protocol_index]['%s:%s' % (t_scope.external, t_name)] = {
+                            'scope': t_scope.external,
+                            'name': t_name,
+                            # the path of cachable PFNs is computed by the protocol
+                            'path': None if 'determinism_type' in protocol.attributes else path,
+                        }
+
+        pfns_by_protocol = {}
+        for (rse_id, protocol_index), lfns in lfns_by_protocol.items():
+            _, protocol, _ = protocols_by_rse_id[rse_id][protocol_index]
+            try:
+                pfns_by_protocol[rse_id, protocol_index] = protocol.lfns2pfns(lfns=list(lfns.values()))
                 continue
+            except Exception:
+                LOGGER.warning('Cannot generate the PFNs of %d replicas on %s with %s at once, generating them one by one',
+                               len(lfns), rse_id, protocol.attributes['scheme'], exc_info=True)
+            # do not lose the PFNs of the whole batch because of a single replica
+            pfns = pfns_by_protocol[rse_id, protocol_index] = {}
+            for lfn in lfns.values():
+                try:
+                    pfns.update(protocol.lfns2pfns(lfns=lfn))
+                except Exception:
+                    LOGGER.error('Cannot generate the PFN of %s:%s on %s with %s', lfn['scope'], lfn['name'], rse_id, protocol.attributes['scheme'], exc_info=True)
+
+        for _, replica_group in replica_groups_chunk:
+            file = {}
+            pfns = {}
+            for scope, name, archive_scope, archive_name, bytes_, md5, adler32, path, state, rse_id, rse, rse_type, volatile in replica_group:
+                if isinstance(archive_scope, str):
+                    archive_scope = InternalScope(archive_scope, fromExternal=False)
+
+                # it is the first row in the scope/name group
+                if not file:
+                    file['scope'], file['name'] = scope, name
+                    file['bytes'], file['md5'], file['adler32'] = bytes_, md5, adler32
+                    file['pfns'], file['rses'], file['states'] = {}, {}, {}
+                    if resolve_parents:
+                        file['parents'] = ['%s:%s' % (parent['scope'].internal, parent['name'])
+                                           for parent in rucio.core.did.list_all_parent_dids(scope, name, session=session)]
+
+                if not rse_id:
+                    continue
 
-            # It's the first time we see this RSE, initialize the protocols needed for PFN generation
-            if rse_id not in protocols_by_rse_id:
-                # select the lan door in autoselect mode, otherwise use the wan door
-                domain = input_domain
-                if domain is None:
-                    domain = 'wan'
-                    if local_rses and rse_id in local_rses:
-                        domain = 'lan'
-
-                # FIXME: if a list_replicas call iterates over both non-archive and archive replicas
-                # on the same rse_id, the protocols will not be correctly initialized for whatever comes
-                # second. This is because of the "additional_schemes" logic:
-                protocols = _get_list_replicas_protocols(
-                    rse_id=rse_id,
-                    domain=domain,
-                    schemes=schemes,
-                    # We want 'root' for archives even if it wasn't included into 'schemes'
-                    additional_schemes=['root'] if archive_scope and archive_name else [],
-                    session=session,
-                )
-                protocols_by_rse_id[rse_id] = protocols
-
-            # build the pfns
-            for domain, protocol, priority in protocols_by_rse_id[rse_id]:
-                # If the current "replica" is a constituent inside an archive, we must construct the pfn for the
-                # parent (archive) file and append the xrdcl.unzip query string to it.
-                if archive_scope and archive_name:
-                    t_scope = archive_scope
-                    t_name = archive_name
-                else:
-                    t_scope = scope
-                    t_name = name
+                rse_key = rse if by_rse_name else rse_id
+                file['states'][rse_key] = str(state.name if state else state)
 
-                if 'determinism_type' in protocol.attributes:  # PFN is cachable
-                    try:
-                        path = pfns_cache['%s:%s:%s' % (protocol.attributes['determinism_type'], t_scope.internal, t_name)]
-                    except KeyError:  # No cache entry scope:name found for this protocol
-                        path = protocol._get_path(t_scope, t_name)
-                        pfns_cache['%s:%s:%s' % (protocol.attributes['determinism_type'], t_scope.internal, t_name)] = path
+                if not show_pfns:
+                    continue
 
-                try:
-                    pfn = _build_list_replicas_pfn(
-                        scope=t_scope,
-                        name=t_name,
-                        rse_id=rse_id,
-                        domain=domain,
-                        protocol=protocol,
-                        path=path,
-                        sign_urls=sign_urls,
-                        signature_lifetime=signature_lifetime,
-                        client_location=client_location,
-                        session=session,
-                    )
-
-                    client_extract = False
+                # build the pfns
+                for protocol_index, (domain, protocol, priority) in enumerate(protocols_by_rse_id[rse_id]):
                     if archive_scope and archive_name:
-                        domain = 'zip'
-                        pfn = add_url_query(pfn, {'xrdcl.unzip': name})
-                        if protocol.attributes['scheme'] == 'root':
-                            # xroot supports downloading files directly from inside an archive. Disable client_extract and prioritize xroot.
-                            client_extract = False
-                            priority = -1
-                        else:
-                            client_extract = True
-
-                    pfns[pfn] = {
-                        'rse_id': rse_id,
-                        'rse': rse,
-                        'type': str(rse_type.name),
-                        'volatile': volatile,
-                        'domain': domain,
-                        'priority': priority,
-                        'client_extract': client_extract
-                    }
+                        t_scope, t_name = archive_scope, archive_name
+                    else:
+                        t_scope, t_name = scope, name
 
-                except Exception:
-                    # never end up here
-                    print(format_exc())
+                    pfn = pfns_by_protocol[rse_id, protocol_index].get('%s:%s' % (t_scope.external, t_name))
+                    if pfn is None:
+                        # the PFN could not be generated, the error is already logged
+                        continue
 
-                if protocol.attributes['scheme'] == 'srm':
                     try:
-                        file['space_token'] = protocol.attributes['extended_attributes']['space_token']
-                    except KeyError:
-                        file['space_token'] = None
-
-        # fill the 'pfns' and 'rses' dicts in file
-        if pfns:
-            # set the total order for the priority
-            # --> exploit that L(AN) comes before W(AN) before Z(IP) alphabetically
-            # and use 1-indexing to be compatible with metalink
-            sorted_pfns = sorted(pfns.items(), key=lambda item: (item[1]['domain'], item[1]['priority'], item[0]))
-            for i, (pfn, pfn_value) in enumerate(list(sorted_pfns), start=1):
-                pfn_value['priority'] = i
-                file['pfns'][pfn] = pfn_value
-
-            sorted_pfns = sorted(file['pfns'].items(), key=lambda item: (item[1]['rse_id'], item[1]['priority'], item[0]))
-            for pfn, pfn_value in sorted_pfns:
-                rse_key = pfn_value['rse'] if by_rse_name else pfn_value['rse_id']
-                file['rses'].setdefault(rse_key, []).append(pfn)
-
-        if file:
-            yield file
+                        pfn = _build_list_replicas_pfn(
+                            pfn=pfn,
+                            name=t_name,
+                            rse_id=rse_id,
+                            domain=domain,
+                            protocol=protocol,
+                            sign_urls=sign_urls,
+                            signature_lifetime=signature_lifetime,
+                            client_location=client_location,
+                            session=session,
+                        )
+
+                        client_extract = False
+                        if archive_scope and archive_name:
+                            domain = 'zip'
+                            pfn = add_url_query(pfn, {'xrdcl.unzip': name})
+                            if protocol.attributes['scheme'] == 'root':
+                                # xroot supports downloading files directly from inside an archive. Disable client_extract and prioritize xroot.
+                                client_extract = False
+                                priority = -1
+                            else:
+                                client_extract = True
+
+                        pfns[pfn] = {
+                            'rse_id': rse_id,
+                            'rse': rse,
+                            'type': str(rse_type.name),
+                            'volatile': volatile,
+                            'domain': domain,
+                            'priority': priority,
+                            'client_extract': client_extract
+                        }
+
+                    except Exception:
+                        # never end up here
+                        print(format_exc())
+
+                    if protocol.attributes['scheme'] == 'srm':
+                        try:
+                            file['space_token'] = protocol.attributes['extended_attributes']['space_token']
+                        except KeyError:
+                            file['space_token'] = None
+
+            # fill the 'pfns' and 'rses' dicts in file
+            if pfns:
+                # set the total order for the priority
+                # --> exploit that L(AN) comes before W(AN) before Z(IP) alphabetically
+                # and use 1-indexing to be compatible with metalink
+                sorted_pfns = sorted(pfns.items(), key=lambda item: (item[1]['domain'], item[1]['priority'], item[0]))
+                for i, (pfn, pfn_value) in enumerate(list(sorted_pfns), start=1):
+                    pfn_value['priority'] = i
+                    file['pfns'][pfn] = pfn_value
+
+                sorted_pfns = sorted(file['pfns'].items(), key=lambda item: (item[1]['rse_id'], item[1]['priority'], item[0]))
+                for pfn, pfn_value in sorted_pfns:
+                    rse_key = pfn_value['rse'] if by_rse_name else pfn_value['rse_id']
+                    file['rses'].setdefault(rse_key, []).append(pfn)
+
+            if file:
+                yield file
 
     for scope, name, bytes_, md5, adler32 in _list_files_wo_replicas(files_wo_replica, session=session):
         yield {
@@ -3000,6 +3029,70 @@ def touch_replica(replica, *, session: "Session"):
     return True
 
 
+@transactional_session
+def touch_replicas(replicas, *, session: "Session"):
+    """
+    Update the accessed_at timestamp of the given file replicas/dids in bulk but don't wait if one of the rows is locked.
+
+    :param replicas: a list of dictionaries with the information of the affected replicas.
+    :param session: The database session in use.
+
+    :returns: True, if successful, False otherwise.
+    """
+    if not replicas:
+        return True
+
+    now, none_value = datetime.utcnow(), None
+    params = [{'b_scope': replica['scope'], 'b_name': replica['name'], 'b_rse_id': replica['rse_id'], 'b_accessed_at': replica.get('accessed_at') or now}
+              for replica in replicas]
+    try:
+        session.query(models.RSEFileAssociation.rse_id).\
+            filter(or_(*[and_(models.RSEFileAssociation.scope == replica['scope'],
+                              models.RSEFileAssociation.name == replica['name'],
+                              models.RSEFileAssociation.rse_id == replica['rse_id']) for replica in replicas])).\
+            with_for_update(nowait=True).all()
+
+        stmt = update(models.RSEFileAssociation).\
+            where(models.RSEFileAssociation.rse_id == bindparam('b_rse_id'),
+                  models.RSEFileAssociation.scope == bindparam('b_scope'),
+                  models.RSEFileAssociation.name == bindparam('b_name')).\
+            prefix_with("/*+ index(REPLICAS REPLICAS_PK) */", dialect='oracle').\
+            execution_options(synchronize_session=False).\
+            values(accessed_at=bindparam('b_accessed_at'),
+                   tombstone=case([(and_(models.RSEFileAssociation.tombstone != none_value,
+                                         models.RSEFileAssociation.tombstone != OBSOLETE),
+                                    bindparam('b_accessed_at'))],
+                                  else_=models.RSEFileAssociation.tombstone))
+        session.execute(stmt, params)
+
+        # A file replicated on several RSEs is updated with its latest access
+        dids = {}
+        for param in params:
+            key = (param['b_scope'], param['b_name'])
+            if key not in dids or dids[key]['b_accessed_at'] < param['b_accessed_at']:
+                dids[key] = param
+
+        session.query(models.DataIdentifier.name).\
+            filter(or_(*[and_(models.DataIdentifier.scope == scope,
+                              models.DataIdentifier.name == name) for scope, name in dids])).\
+            filter(models.DataIdentifier.did_type == DIDType.FILE).\
+            with_for_update(nowait=True).all()
+
+        stmt = update(models.DataIdentifier).\
+            where(models.DataIdentifier.scope == bindparam('b_scope'),
+                  models.DataIdentifier.name == bindparam('b_name'),
+                  models.DataIdentifier.did_type == DIDType.FILE).\
+            prefix_with("/*+ INDEX(DIDS DIDS_PK) */", dialect='oracle').\
+            execution_options(synchronize_session=False).\
+            values(accessed_at=bindparam('b_accessed_at'))
+        session.execute(stmt, list(dids.values()))
+
+    except DatabaseError:
+        return False
+
+    return True
+
+
 @transactional_session
 def update_replica_state(rse_id, scope, name, state, *, session: "Session"):
     """
@@ -4211,10 +4304,10 @@ def _resolve_dids_wo_temp_tables(dids, unavailable, ignore_availability, all_sta
     # Accumulate all the dids which were requested explicitly (not via a container/dataset).
     # If any replicas for these dids will be found latter, the associated did will be removed from the list,
     # leaving, at the end, only the requested dids which didn't have any replicas at all.
-    files_wo_replica = []
+    files_wo_replica = {}
     for did in [dict(tupleized) for tupleized in set(tuple(item.items()) for item in dids)]:
         if 'type' in did and did['type'] in (DIDType.FILE, DIDType.FILE.value) or 'did_type' in did and did['did_type'] in (DIDType.FILE, DIDType.FILE.value):  # pylint: disable=no-member
-            files_wo_replica.append({'scope': did['scope'], 'name': did['name']})
+            files_wo_replica[did['scope'], did['name']] = {'scope': did['scope'], 'name': did['name']}
             file_clause.append(and_(models.RSEFileAssociation.scope == did['scope'],
                                     models.RSEFileAssociation.name == did['name']))
 
@@ -4234,7 +4327,7 @@ def _resolve_dids_wo_temp_tables(dids, unavailable, ignore_availability, all_sta
                                                models.ConstituentAssociation.child_name == name))
 
             if did_type == DIDType.FILE:
-                files_wo_replica.append({'scope': scope, 'name': name})
+                files_wo_replica[scope, name] = {'scope': scope, 'name': name}
                 file_clause.append(and_(models.RSEFileAssociation.scope == scope,
                                         models.RSEFileAssociation.name == name))
 
@@ -4365,8 +4458,7 @@ def _list_replicas_for_constituents_wo_temp_tables(constituent_clause, state_cla
         constituent_query = constituent_query.filter(models.RSEFileAssociation.updated_at >= updated_after)
 
     for replica in constituent_query.yield_per(500):
-        scope, name = replica[0], replica[1]
-        {'scope': scope, 'name': name} in files_wo_replica and files_wo_replica.remove({'scope': scope, 'name': name})
+        files_wo_replica.pop((replica[0], replica[1]), None)
         yield replica
 
 
@@ -4416,7 +4508,7 @@ def _list_replicas_for_files_wo_temp_tables(file_clause, state_clause, files_wo_
             .with_hint(models.RSEFileAssociation, text="INDEX(REPLICAS REPLICAS_PK)", dialect_name='oracle')
 
         for scope, name, bytes_, md5, adler32, path, state, rse_id, rse, rse_type, volatile in replica_query.all():
-            {'scope': scope, 'name': name} in files_wo_replica and files_wo_replica.remove({'scope': scope, 'name': name})
+            files_wo_replica.pop((scope, name), None)
             yield scope, name, None, None, bytes_, md5, adler32, path, state, rse_id, rse, rse_type, volatile
 
 
@@ -4470,6 +4562,6 @@ def _list_replicas_wo_temp_tables(
 
     yield from _pick_n_random(
         nrandom,
-        _list_replicas(replica_tuples, pfns, schemes, files_wo_replica, client_location, domain,
+        _list_replicas(replica_tuples, pfns, schemes, files_wo_replica.values(), client_location, domain,
                        sign_urls, signature_lifetime, resolve_parents, filter_, by_rse_name, session=session)
     )
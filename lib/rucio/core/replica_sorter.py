@@ -13,10 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
 import random
 import shutil
 import socket
 import tarfile
+import threading
+import time
 from collections import OrderedDict
 from datetime import datetime, timedelta
 from math import asin, cos, radians, sin, sqrt
@@ -28,17 +31,30 @@ from urllib.parse import urlparse
 import geoip2.database
 import requests
 from dogpile.cache.api import NO_VALUE
+from sqlalchemy import and_, false, func, select
 
 from rucio.common import utils
 from rucio.common.cache import make_region_memcached
 from rucio.common.config import config_get, config_get_bool, config_get_int
 from rucio.common.exception import InvalidRSEExpression
+from rucio.core.monitor import MetricManager
 from rucio.core.rse_expression_parser import parse_expression
+from rucio.db.sqla import models
+from rucio.db.sqla.constants import RequestState
+from rucio.db.sqla.session import read_session
 
 if TYPE_CHECKING:
-    from typing import Dict, List, Optional
+    from typing import Dict, List, Optional, Tuple
+
+    from sqlalchemy.orm import Session
 
 REGION = make_region_memcached(expiration_time=900, function_key_generator=utils.my_key_generator)
+METRICS = MetricManager(module=__name__)
+LOGGER = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6378
+# Distance used when the location of one of the hosts is unknown: one host is on the Moon
+UNKNOWN_DISTANCE = 360000
 
 # This product uses GeoLite data created by MaxMind,
 # available from <a href="http://www.maxmind.com">http://www.maxmind.com</a>
@@ -103,6 +119,99 @@ def __geoip_db():
     return geoip2.database.Reader(str(db_path))
 
 
+class HostCoordinatesCache:
+    """
+    Bounded in-process LRU cache of the coordinates of the hosts, so that the distances between known
+    hosts are computed without any GeoIP lookup or cache round trip. The coordinates are stored in
+    radians with the cosine of the latitude, as used by the haversine formula. Only the successful
+    lookups are cached, during `ttl` seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = METRICS.counter('coordinates_cache.hits')
+        self._misses = METRICS.counter('coordinates_cache.misses')
+
+    def get(self, host: str) -> "Optional[Tuple[float, float, float]]":
+        """
+        :param host: A hostname or IP.
+        :returns: The (latitude, longitude, cosine of the latitude) of the host, or None if it is not in the cache.
+        """
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[host]
+                entry = None
+            if entry is None:
+                self._misses.inc()
+                return None
+            self._entries.move_to_end(host)
+        self._hits.inc()
+        return entry[1]
+
+    def set(self, host: str, latitude: float, longitude: float) -> "Tuple[float, float, float]":
+        """
+        :param host: A hostname or IP.
+        :param latitude: The latitude of the host, in degrees.
+        :param longitude: The longitude of the host, in degrees.
+        :returns: The cached coordinates of the host.
+        """
+        coordinates = _coordinates(latitude, longitude)
+        if self.max_size <= 0:
+            return coordinates
+        with self._lock:
+            self._entries[host] = (time.monotonic() + self.ttl, coordinates)
+            self._entries.move_to_end(host)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return coordinates
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+HOST_COORDINATES = HostCoordinatesCache(
+    max_size=config_get_int('core', 'geoip_coordinates_cache_size', False, 10000, check_config_table=False),
+    ttl=config_get_int('core', 'geoip_coordinates_cache_ttl', False, 86400, check_config_table=False),
+)
+
+
+def _coordinates(latitude, longitude):
+    latitude, longitude = radians(float(latitude)), radians(float(longitude))
+    return latitude, longitude, cos(latitude)
+
+
+def _distance(coordinates1, coordinates2):
+    """
+    Great-circle distance in km between two coordinates of HostCoordinatesCache.
+    """
+    lat1, long1, cos_lat1 = coordinates1
+    lat2, long2, cos_lat2 = coordinates2
+    return EARTH_RADIUS * 2 * asin(sqrt(sin((lat2 - lat1) / 2)**2 + cos_lat1 * cos_lat2 * sin((long2 - long1) / 2)**2))
+
+
+def __client_coordinates(client_location):
+    if client_location.get('latitude') and client_location.get('longitude'):
+        return _coordinates(client_location['latitude'], client_location['longitude'])
+    return HOST_COORDINATES.get(client_location['ip'])
+
+
+def __lookup_coordinates(se, gi):
+    """
+    Look up the coordinates of one host in the GeoLite DB and cache them.
+    :param se : A hostname or IP.
+    :param gi : A Reader object (geoip2 API).
+    """
+    latitude, longitude = __get_lat_long(se, gi)
+    if latitude is None or longitude is None:
+        return None
+    return HOST_COORDINATES.set(se, latitude, longitude)
+
+
 def __get_lat_long(se, gi):
     """
     Get the latitude and longitude on one host using the GeoLite DB
@@ -126,6 +235,11 @@ def __get_distance(se1, client_location, ignore_error):
     :param client_location : contains {'ip', 'fqdn', 'site', 'latitude', 'longitude'}
     :ignore_error: Ignore exception when the GeoLite DB cannot be retrieved
     """
+    coordinates1 = HOST_COORDINATES.get(se1)
+    coordinates2 = __client_coordinates(client_location)
+    if coordinates1 and coordinates2:
+        return _distance(coordinates1, coordinates2)
+
     # does not cache ignore_error, str.lower on hostnames/ips is fine
     canonical_parties = list(map(lambda x: str(x).lower(), [se1, client_location['ip'], client_location.get('latitude', ''), client_location.get('longitude', '')]))
     canonical_parties.sort()
@@ -135,29 +249,162 @@ def __get_distance(se1, client_location, ignore_error):
         try:
             gi = __geoip_db()
 
-            lat1, long1 = __get_lat_long(se1, gi)
-            if client_location.get('latitude') and client_location.get('longitude'):
-                lat2 = client_location['latitude']
-                long2 = client_location['longitude']
-            else:
-                lat2, long2 = __get_lat_long(client_location['ip'], gi)
-
-            if lat1 and lat2:
-                long1, lat1, long2, lat2 = map(radians, [long1, lat1, long2, lat2])
-                dlon = long2 - long1
-                dlat = lat2 - lat1
-                cache_val = 6378 * 2 * asin(sqrt(sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2))
-                REGION.set(cache_key, cache_val)
-                return cache_val
+            if not coordinates1:
+                coordinates1 = __lookup_coordinates(se1, gi)
+            if not coordinates2:
+                coordinates2 = __lookup_coordinates(client_location['ip'], gi)
+
+            if coordinates1 and coordinates2:
+                return _distance(coordinates1, coordinates2)
         except Exception as error:
             if not ignore_error:
                 raise error
-        # One host is on the Moon
-        cache_val = 360000
+        # Only the failures are cached, the coordinates of the known hosts are in HOST_COORDINATES
+        cache_val = UNKNOWN_DISTANCE
         REGION.set(cache_key, cache_val)
     return cache_val
 
 
+class NetworkMetrics:
+    """
+    In-memory table of the network metrics between the RSEs and the sites, used by the closeness and
+    dynamic sorters: the smallest distance from each RSE to the RSEs of each site, and the number of
+    transfers submitted from each RSE. The table is loaded on first use, then refreshed in a
+    background thread once it is older than `refresh_interval` seconds, so that sorting only does
+    dictionary lookups.
+    """
+
+    def __init__(self, refresh_interval: int):
+        self.refresh_interval = refresh_interval
+        self._tables = None
+        self._loaded_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Reload the table from the database.
+        """
+        with METRICS.timer('network_metrics.refresh'):
+            tables = list_network_metrics()
+        self._tables = tables
+        self._loaded_at = time.monotonic()
+
+    def __refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as error:
+            # Keep the previous table, the refresh is retried after the next interval
+            LOGGER.warning('Cannot refresh the network metrics: %s', error)
+            self._loaded_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+    def tables(self) -> "Tuple[Dict, Dict]":
+        """
+        :returns: Tuple of the dictionaries {rse: {site: distance}} and {rse: submitted transfers},
+                  where the RSEs are given both by id and by name.
+        """
+        if self._tables is None:
+            with self._lock:
+                if self._tables is None:
+                    try:
+                        self.refresh()
+                    except Exception as error:
+                        # Sort without metrics, the replicas keep their order, until the next refresh
+                        LOGGER.warning('Cannot load the network metrics: %s', error)
+                        self._tables = ({}, {})
+                        self._loaded_at = time.monotonic()
+        elif time.monotonic() > self._loaded_at + self.refresh_interval and not self._refreshing:
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self.__refresh_in_background, daemon=True).start()
+        return self._tables
+
+
+@read_session
+def list_network_metrics(*, session: "Session") -> "Tuple[Dict, Dict]":
+    """
+    Load the network metrics between the RSEs and the sites.
+
+    :param session: The database session in use.
+    :returns: Tuple of the dictionaries {rse: {site: distance}} of the smallest distance from each RSE
+              to the RSEs of each site, and {rse: transfers} of the number of transfers submitted
+              from each RSE. The RSEs are given both by id and by name.
+    """
+    names = {}
+    distances = {}
+    stmt = select(
+        models.RSE.id,
+        models.RSE.rse,
+        models.RSEAttrAssociation.value
+    ).join(
+        models.RSEAttrAssociation,
+        and_(models.RSEAttrAssociation.rse_id == models.RSE.id,
+             models.RSEAttrAssociation.key == 'site'),
+        isouter=True
+    ).where(
+        models.RSE.deleted == false()
+    )
+    for rse_id, rse, site in session.execute(stmt):
+        names[rse_id] = rse
+        distances[rse_id] = {}
+        if site is not None:
+            # The RSEs of the site of the client are the closest
+            distances[rse_id][str(site)] = 0
+
+    stmt = select(
+        models.Distance.src_rse_id,
+        models.RSEAttrAssociation.value,
+        func.min(models.Distance.distance)
+    ).join(
+        models.RSEAttrAssociation,
+        and_(models.RSEAttrAssociation.rse_id == models.Distance.dest_rse_id,
+             models.RSEAttrAssociation.key == 'site')
+    ).where(
+        models.Distance.distance.isnot(None)
+    ).group_by(
+        models.Distance.src_rse_id,
+        models.RSEAttrAssociation.value
+    )
+    for rse_id, site, distance in session.execute(stmt):
+        if rse_id in distances:
+            distances[rse_id].setdefault(str(site), distance)
+
+    stmt = select(
+        models.Request.source_rse_id,
+        func.count()
+    ).where(
+        models.Request.state == RequestState.SUBMITTED,
+        models.Request.source_rse_id.isnot(None)
+    ).group_by(
+        models.Request.source_rse_id
+    )
+    transfers = {rse_id: count for rse_id, count in session.execute(stmt) if rse_id in names}
+
+    for rse_id, rse in names.items():
+        distances[rse] = distances[rse_id]
+        if rse_id in transfers:
+            transfers[rse] = transfers[rse_id]
+    return distances, transfers
+
+
+NETWORK_METRICS = NetworkMetrics(
+    refresh_interval=config_get_int('core', 'network_metrics_refresh_interval', False, 300, check_config_table=False),
+)
+
+
+def _replica_rse(value):
+    """
+    The RSE of a replica of the dictionaries given to sort_replicas, either the RSE itself or a
+    (domain, priority, rse, client_extract) tuple.
+    """
+    if isinstance(value, tuple) and len(value) == 4:
+        return value[2]
+    return value
+
+
 def site_selector(replicas, site, vo):
     """
     Return a list of replicas located on one site.
@@ -237,20 +484,30 @@ def sort_geoip(dictreplica: "Dict", client_location: "Dict", ignore_error: bool
     :param ignore_error: Ignore exception when the GeoLite DB cannot be retrieved
     """
 
-    def distance(pfn):
-        return __get_distance(urlparse(pfn).hostname, client_location, ignore_error)
-
-    return list(sorted(dictreplica, key=distance))
+    # The replicas of one RSE share a few hostnames, the distance is computed once per host
+    hosts = {pfn: urlparse(pfn).hostname for pfn in dictreplica}
+    distances = {host: __get_distance(host, client_location, ignore_error) for host in set(hosts.values())}
+    return list(sorted(dictreplica, key=lambda pfn: distances[hosts[pfn]]))
 
 
 def sort_closeness(dictreplica: "Dict", client_location: "Dict") -> "List":
     """
-    Return a list of replicas sorted by AGIS closeness. NOT IMPLEMENTED
+    Return a list of replicas sorted by the distance from their RSE to the site of the client. The
+    replicas of the RSEs without any distance to the site are put last.
     :param dictreplica: A dict with replicas as keys (URIs).
     :param client_location: Location dictionary containing {'ip', 'fqdn', 'site', 'latitude', 'longitude'}
     """
 
-    return list(dictreplica.keys())
+    site = client_location.get('site')
+    if not site:
+        return list(dictreplica.keys())
+
+    distances, _ = NETWORK_METRICS.tables()
+
+    def closeness(pfn):
+        return distances.get(_replica_rse(dictreplica[pfn]), {}).get(site, float('inf'))
+
+    return list(sorted(dictreplica, key=closeness))
 
 
 def sort_ranking(dictreplica: "Dict", client_location: "Dict") -> "List":
@@ -265,9 +522,24 @@ def sort_ranking(dictreplica: "Dict", client_location: "Dict") -> "List":
 
 def sort_dynamic(dictreplica: "Dict", client_location: "Dict") -> "List":
     """
-    Return a list of replicas sorted by dynamic network metrics. NOT IMPLEMENTED
+    Return a list of replicas sorted by dynamic network metrics: the distance from their RSE to the
+    site of the client, increased with the number of transfers submitted from the RSE. Without site,
+    the replicas are sorted by the number of transfers submitted from their RSE.
     :param dictreplica: A dict with replicas as keys (URIs).
     :param client_location: Location dictionary containing {'ip', 'fqdn', 'site', 'latitude', 'longitude'}
     """
 
-    return list(dictreplica.keys())
+    site = client_location.get('site')
+    distances, transfers = NETWORK_METRICS.tables()
+    load_scale = config_get_int('core', 'network_metrics_load_scale', False, 100, check_config_table=False)
+
+    def cost(pfn):
+        rse = _replica_rse(dictreplica[pfn])
+        load = transfers.get(rse, 0)
+        distance = distances.get(rse, {}).get(site) if site else 1
+        if distance is None:
+            return float('inf'), load
+        # Every load_scale submitted transfers count as much as the distance itself
+        return distance * (1 + load / load_scale), load
+
+    return list(sorted(dictreplica, key=cost))
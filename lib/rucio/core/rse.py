@@ -45,6 +45,14 @@ RSE_SETTINGS = ["continent", "city", "region_code", "country_name", "time_zone",
 REGION = make_region_memcached(expiration_time=900)
 
 
+def _invalidate_rse_expressions():
+    """
+    Drop the RSE expression index after a change of RSEs or of their attributes.
+    """
+    from rucio.core.rse_expression_parser import invalidate_expression_index
+    invalidate_expression_index()
+
+
 class RseData:
     """
     Helper data class storing rse data grouped in one place.
@@ -377,6 +385,7 @@ def del_rse(rse_id, *, session: "Session"):
         raise exception.RSENotFound('RSE with id \'%s\' cannot be found' % rse_id)
     rse = old_rse.rse
     old_rse.delete(session=session)
+    _invalidate_rse_expressions()
     try:
         del_rse_attribute(rse_id=rse_id, key=rse, session=session)
     except exception.RSEAttributeNotFound:
@@ -643,6 +652,7 @@ def add_rse_attribute(rse_id, key, value, *, session: "Session"):
     except IntegrityError:
         rse = get_rse_name(rse_id=rse_id, session=session)
         raise exception.Duplicate("RSE attribute '%(key)s-%(value)s\' for RSE '%(rse)s' already exists!" % locals())
+    _invalidate_rse_expressions()
     return True
 
 
@@ -664,6 +674,7 @@ def del_rse_attribute(rse_id, key, *, session: "Session"):
     except sqlalchemy.orm.exc.NoResultFound:
         raise exception.RSEAttributeNotFound('RSE attribute \'%s\' cannot be found' % key)
     rse_attr.delete(session=session)
+    _invalidate_rse_expressions()
     return True
 
 
@@ -726,6 +737,27 @@ def get_rses_with_attribute(key, *, session: "Session"):
     return rse_list
 
 
+@read_session
+def list_rse_attribute_map(*, session: "Session"):
+    """
+    List the attributes of all non-deleted RSEs.
+
+    :param session: The database session in use.
+
+    :returns: A dictionary with the dictionary of RSE attributes by rse_id.
+    """
+    rse_attrs = {}
+
+    query = session.query(models.RSEAttrAssociation.rse_id,
+                          models.RSEAttrAssociation.key,
+                          models.RSEAttrAssociation.value)\
+                   .join(models.RSE, models.RSE.id == models.RSEAttrAssociation.rse_id)\
+                   .filter(models.RSE.deleted == false())
+    for rse_id, key, value in query:
+        rse_attrs.setdefault(rse_id, {})[key] = value
+    return rse_attrs
+
+
 @read_session
 def get_rses_with_attribute_value(key, value, lookup_key, vo='def', *, session: "Session"):
     """
@@ -1501,6 +1533,7 @@ def update_rse(rse_id: str, parameters: 'Dict[str, Any]', *, session: "Session")
         query = session.query(models.RSEAttrAssociation).filter_by(rse_id=rse_id).filter(models.RSEAttrAssociation.key == rse)
         rse_attr = query.one()
         rse_attr.delete(session=session)
+    _invalidate_rse_expressions()
 
 
 @read_session
@@ -14,13 +14,16 @@
 # limitations under the License.
 from typing import TYPE_CHECKING
 
+from sqlalchemy import bindparam, update
 from sqlalchemy.orm.exc import NoResultFound
 
 from rucio.common.exception import CounterNotFound
+from rucio.common.utils import chunks
 from rucio.db.sqla import models, filter_thread_work
 from rucio.db.sqla.session import read_session, transactional_session
 
 if TYPE_CHECKING:
+    from typing import Dict
     from sqlalchemy.orm import Session
 
 
@@ -139,8 +142,67 @@ def update_rse_counter(rse_id, *, session: "Session"):
                         files=sum_files,
                         source='rucio').save(session=session)
 
-    for update in updated_rse_counters:
-        update.delete(flush=False, session=session)
+    for updated_rse_counter in updated_rse_counters:
+        updated_rse_counter.delete(flush=False, session=session)
+
+
+@transactional_session
+def update_rse_counters(total_workers, worker_number, limit=10000, *, session: "Session") -> "Dict":
+    """
+    Read a batch of updated_rse_counters of this worker, sum them per rse_id,
+    apply the sums to the rse_counters in bulk and delete the consumed rows.
+
+    :param total_workers:      Number of total workers.
+    :param worker_number:      id of the executing worker.
+    :param limit:              Maximum number of updated_rse_counters to consume.
+    :param session:            Database session in use.
+    :returns:                  Dictionary with the number of consumed rows and of updated counters.
+    """
+    query = session.query(models.UpdatedRSECounter.id,
+                          models.UpdatedRSECounter.rse_id,
+                          models.UpdatedRSECounter.files,
+                          models.UpdatedRSECounter.bytes)
+    query = filter_thread_work(session=session, query=query, total_threads=total_workers, thread_id=worker_number, hash_variable='rse_id')
+    if limit:
+        query = query.limit(limit)
+
+    ids = []
+    deltas = {}
+    for id_, rse_id, files, bytes_ in query:
+        ids.append(id_)
+        delta = deltas.setdefault(rse_id, [0, 0])
+        delta[0] += files
+        delta[1] += bytes_
+
+    if not deltas:
+        return {'rows': 0, 'counters': 0}
+
+    existing = set()
+    for chunk in chunks(list(deltas), 1000):
+        query = session.query(models.RSEUsage.rse_id).filter(models.RSEUsage.source == 'rucio', models.RSEUsage.rse_id.in_(chunk))
+        existing.update(rse_id for rse_id, in query)
+
+    if existing:
+        stmt = update(
+            models.RSEUsage
+        ).where(
+            models.RSEUsage.rse_id == bindparam('b_rse_id'),
+            models.RSEUsage.source == 'rucio'
+        ).values(
+            files=models.RSEUsage.files + bindparam('b_files'),
+            used=models.RSEUsage.used + bindparam('b_bytes')
+        ).execution_options(
+            synchronize_session=False
+        )
+        session.execute(stmt, [{'b_rse_id': rse_id, 'b_files': deltas[rse_id][0], 'b_bytes': deltas[rse_id][1]} for rse_id in existing])
+
+    session.bulk_insert_mappings(models.RSEUsage, [{'rse_id': rse_id, 'source': 'rucio', 'files': files, 'used': bytes_}
+                                                   for rse_id, (files, bytes_) in deltas.items() if rse_id not in existing])
+
+    for chunk in chunks(ids, 1000):
+        session.query(models.UpdatedRSECounter).filter(models.UpdatedRSECounter.id.in_(chunk)).delete(synchronize_session=False)
+
+    return {'rows': len(ids), 'counters': len(deltas)}
 
 
 @transactional_session
@@ -15,15 +15,17 @@
 
 import abc
 import re
+from functools import lru_cache
 from typing import TYPE_CHECKING
+from uuid import uuid4
 
-from dogpile.cache.api import NoValue
-from hashlib import sha256
+from dogpile.cache.api import NO_VALUE
 
 from rucio.common.cache import make_region_memcached
 from rucio.common.exception import InvalidRSEExpression, RSEWriteBlocked
-from rucio.core.rse import list_rses, get_rses_with_attribute, get_rse_attribute
-from rucio.db.sqla.session import transactional_session
+from rucio.core.rse import list_rses, list_rse_attribute_map
+from rucio.db.sqla import models
+from rucio.db.sqla.session import read_session, transactional_session
 
 if TYPE_CHECKING:
     from sqlalchemy.orm import Session
@@ -39,6 +41,9 @@ COMPLEMENT = r'(\\%s)' % (PRIMITIVE)
 PATTERN = r'^%s(%s|%s|%s)*' % (PRIMITIVE, UNION, INTERSECTION, COMPLEMENT)
 
 REGION = make_region_memcached(expiration_time=600)
+GENERATION_KEY = 'rse_expression_index_generation'
+
+_INDEX = None
 
 
 @transactional_session
@@ -46,40 +51,19 @@ def parse_expression(expression, filter_=None, *, session: "Session"):
     """
     Parse a RSE expression and return the list of RSE dictionaries.
 
+    The expression is compiled once per process and evaluated against the
+    per-process :py:class:`RSEExpressionIndex`, so no database query is needed
+    as long as the index is up to date.
+
     :param expression:    RSE expression, e.g: 'CERN|BNL'.
     :param filter_:       Availability filter (dictionary) used for the RSEs. e.g.: {'availability_write': True}
     :param session:       Database session in use.
     :returns:             A list of rse dictionaries.
     :raises:              InvalidRSEExpression, RSENotFound, RSEWriteBlocked
     """
-    result = REGION.get(sha256(expression.encode()).hexdigest())
-    if type(result) is NoValue:
-        # Evaluate the correctness of the parentheses
-        parantheses_open_count = 0
-        parantheses_close_count = 0
-        for char in expression:
-            if (char == '('):
-                parantheses_open_count += 1
-            elif (char == ')'):
-                parantheses_close_count += 1
-            if (parantheses_close_count > parantheses_open_count):
-                raise InvalidRSEExpression('Problem with parantheses.')
-        if (parantheses_open_count != parantheses_close_count):
-            raise InvalidRSEExpression('Problem with parantheses.')
-
-        # Check the expression pattern
-        match = re.match(PATTERN, expression)
-        if match is None:
-            raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
-        else:
-            if match.group() != expression:
-                raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
-        result_tuple = __resolve_term_expression(expression)[0].resolve_elements(session=session)
-        # result_tuple = ([rse_ids], {rse_id: {rse_info}})
-        result = []
-        for rse in list(result_tuple[0]):
-            result.append(result_tuple[1][rse])
-        REGION.set(sha256(expression.encode()).hexdigest(), result)
+    term = compile_expression(expression)
+    index = get_expression_index(session=session)
+    result = index.to_rse_list(term.resolve_elements(index))
 
     # Filter for VO
     vo_result = []
@@ -111,6 +95,211 @@ def parse_expression(expression, filter_=None, *, session: "Session"):
     return final_result
 
 
+@lru_cache(maxsize=1024)
+def compile_expression(expression):
+    """
+    Validate a RSE expression and compile it into a tree of BaseExpressionElement.
+
+    The compiled tree does not depend on the database content and is cached per process.
+
+    :param expression:    RSE expression, e.g: 'CERN|BNL'.
+    :returns:             The root BaseExpressionElement of the expression.
+    :raises:              InvalidRSEExpression
+    """
+    # Evaluate the correctness of the parentheses
+    parantheses_open_count = 0
+    parantheses_close_count = 0
+    for char in expression:
+        if (char == '('):
+            parantheses_open_count += 1
+        elif (char == ')'):
+            parantheses_close_count += 1
+        if (parantheses_close_count > parantheses_open_count):
+            raise InvalidRSEExpression('Problem with parantheses.')
+    if (parantheses_open_count != parantheses_close_count):
+        raise InvalidRSEExpression('Problem with parantheses.')
+
+    # Check the expression pattern
+    match = re.match(PATTERN, expression)
+    if match is None:
+        raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
+    else:
+        if match.group() != expression:
+            raise InvalidRSEExpression('Expression does not comply to RSE Expression syntax')
+    return __resolve_term_expression(expression)[0]
+
+
+@read_session
+def get_expression_index(*, session: "Session"):
+    """
+    Return the per-process RSEExpressionIndex, reloading it if it was invalidated.
+
+    The index is tagged with a generation token shared via the cache region. Any
+    process changing RSEs or RSE attributes replaces the token, which makes all
+    the other processes reload their snapshot on their next evaluation.
+
+    :param session:       Database session in use.
+    :returns:             The RSEExpressionIndex.
+    """
+    global _INDEX
+
+    generation = REGION.get(GENERATION_KEY)
+    index = _INDEX
+    if index is not None and generation is not NO_VALUE and generation == index.generation:
+        return index
+
+    if generation is NO_VALUE:
+        generation = uuid4().hex
+        REGION.set(GENERATION_KEY, generation)
+    index = RSEExpressionIndex.load(generation=generation, session=session)
+    _INDEX = index
+    return index
+
+
+def invalidate_expression_index():
+    """
+    Drop the RSEExpressionIndex of this and all other processes sharing the cache region.
+
+    Has to be called whenever RSEs or RSE attributes are added, changed or removed.
+    """
+    global _INDEX
+
+    _INDEX = None
+    REGION.delete(GENERATION_KEY)
+
+
+def _normalize_value(value):
+    """
+    Normalize an attribute value the same way the BooleanString column type stores it.
+
+    :param value:  The attribute value.
+    :returns:      The normalized string.
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    value = str(getattr(value, 'name', value))
+    if value.lower() in ('true', 'false'):
+        return value.lower()
+    return value
+
+
+class RSEExpressionIndex(object):
+    """
+    Snapshot of all non-deleted RSEs and their attributes used to evaluate RSE expressions.
+
+    Every RSE is assigned one bit, ordered by RSE name, and sets of RSEs are represented
+    as integer bitmasks. Set operations of the expression tree are thus plain integer
+    operations and the resolution of a primitive is a dictionary lookup.
+    """
+
+    RSE_COLUMNS = frozenset(models.RSE.__table__.columns.keys())
+
+    def __init__(self, rses, attributes, generation=None):
+        """
+        Creates an RSEExpressionIndex
+
+        :param rses:          List of RSE dictionaries, as returned by list_rses.
+        :param attributes:    Dictionary of RSE attributes by rse_id.
+        :param generation:    Generation token of the snapshot.
+        """
+        self.generation = generation
+        self._rses = rses
+        self._attributes = []
+        self._key_masks = {}
+        self._value_masks = {}
+        self._derived_masks = {}
+        for position, rse in enumerate(rses):
+            bit = 1 << position
+            rse_attributes = attributes.get(rse['id'], {})
+            self._attributes.append(rse_attributes)
+            for key, value in rse_attributes.items():
+                self._key_masks[key] = self._key_masks.get(key, 0) | bit
+                values = self._value_masks.setdefault(key, {})
+                value = _normalize_value(value)
+                values[value] = values.get(value, 0) | bit
+        self.all_mask = (1 << len(rses)) - 1
+
+    @classmethod
+    def load(cls, generation=None, *, session: "Session"):
+        """
+        Load a new snapshot from the database.
+
+        :param generation:    Generation token of the snapshot.
+        :param session:       Database session in use.
+        :returns:             The RSEExpressionIndex.
+        """
+        return cls(rses=list_rses(session=session),
+                   attributes=list_rse_attribute_map(session=session),
+                   generation=generation)
+
+    def equal(self, key, value=True):
+        """
+        Return the mask of RSEs having the RSE column or attribute `key` equal to `value`.
+
+        :param key:           Name of the RSE column or attribute.
+        :param value:         Value to compare to.
+        :returns:             Bitmask of RSEs.
+        """
+        value = _normalize_value(value)
+        if key not in self.RSE_COLUMNS:
+            return self._value_masks.get(key, {}).get(value, 0)
+
+        cache_key = ('=', key, value)
+        mask = self._derived_masks.get(cache_key)
+        if mask is None:
+            mask = 0
+            for position, rse in enumerate(self._rses):
+                if rse[key] is not None and _normalize_value(rse[key]) == value:
+                    mask |= 1 << position
+            self._derived_masks[cache_key] = mask
+        return mask
+
+    def compare(self, key, operator, value):
+        """
+        Return the mask of RSEs having the numerical attribute `key` smaller or larger than `value`.
+
+        :param key:           Name of the RSE attribute.
+        :param operator:      Either '<' or '>'.
+        :param value:         Value to compare to.
+        :returns:             Bitmask of RSEs.
+        """
+        cache_key = (operator, key, value)
+        mask = self._derived_masks.get(cache_key)
+        if mask is None:
+            mask = 0
+            for position in self.positions(self._key_masks.get(key, 0)):
+                try:
+                    attribute = float(self._attributes[position][key])
+                    if (operator == '<' and attribute < float(value)) or (operator == '>' and attribute > float(value)):
+                        mask |= 1 << position
+                except ValueError:
+                    continue
+            self._derived_masks[cache_key] = mask
+        return mask
+
+    @staticmethod
+    def positions(mask):
+        """
+        Iterate over the positions of the set bits of a mask.
+
+        :param mask:          Bitmask of RSEs.
+        :returns:             Generator of positions.
+        """
+        while mask:
+            lowest_bit = mask & -mask
+            yield lowest_bit.bit_length() - 1
+            mask ^= lowest_bit
+
+    def to_rse_list(self, mask):
+        """
+        Convert a mask to a list of RSE dictionaries.
+
+        :param mask:          Bitmask of RSEs.
+        :returns:             List of (copies of the) RSE dictionaries.
+        """
+        return [dict(self._rses[position]) for position in self.positions(mask)]
+
+
 def __resolve_term_expression(expression):
     """
     Resolves a Term Expression and returns an object of type BaseExpressionElement
@@ -211,13 +400,13 @@ def __extract_term(expression):
 
 class BaseExpressionElement(object, metaclass=abc.ABCMeta):
     @abc.abstractmethod
-    def resolve_elements(self, session):
+    def resolve_elements(self, index):
         """
-        Resolve the ExpressionElement and return a set of RSE ids
+        Resolve the ExpressionElement and return the set of matching RSEs
 
-        :param session:  Database session in use
-        :returns:        (Set of RSE ids, Dictionary of RSE dicts)
-        :rtype:          (Set of Strings, Dictionary of RSE dicts organized by rse_id)
+        :param index:    RSEExpressionIndex to resolve against
+        :returns:        Bitmask of RSEs in the index
+        :rtype:          Integer
         """
         pass
 
@@ -227,17 +416,11 @@ class RSEAll(BaseExpressionElement):
     Representation of all RSEs
     """
 
-    def resolve_elements(self, session):
+    def resolve_elements(self, index):
         """
         Inherited from :py:func:`BaseExpressionElement.resolve_elements`
         """
-        output = list_rses(session=session)
-        if not output:
-            return (set(), {})
-        rse_dict = {}
-        for rse in output:
-            rse_dict[rse['id']] = rse
-        return (set([rse['id'] for rse in output]), rse_dict)
+        return index.all_mask
 
 
 class RSEAttributeEqualCheck(BaseExpressionElement):
@@ -255,17 +438,11 @@ class RSEAttributeEqualCheck(BaseExpressionElement):
         self.key = key
         self.value = value
 
-    def resolve_elements(self, session):
+    def resolve_elements(self, index):
         """
         Inherited from :py:func:`BaseExpressionElement.resolve_elements`
         """
-        output = list_rses({self.key: self.value}, session=session)
-        if not output:
-            return (set(), {})
-        rse_dict = {}
-        for rse in output:
-            rse_dict[rse['id']] = rse
-        return (set([rse['id'] for rse in output]), rse_dict)
+        return index.equal(self.key, self.value)
 
 
 class RSEAttributeSmallerCheck(BaseExpressionElement):
@@ -283,24 +460,11 @@ class RSEAttributeSmallerCheck(BaseExpressionElement):
         self.key = key
         self.value = value
 
-    def resolve_elements(self, session):
+    def resolve_elements(self, index):
         """
         Inherited from :py:func:`BaseExpressionElement.resolve_elements`
         """
-        rse_list = get_rses_with_attribute(key=self.key, session=session)
-        if not rse_list:
-            return (set(), {})
-
-        output = []
-        rse_dict = {}
-        for rse in rse_list:
-            try:
-                if float(get_rse_attribute(rse['id'], self.key, session=session)) < float(self.value):
-                    rse_dict[rse['id']] = rse
-                    output.append(rse['id'])
-            except ValueError:
-                continue
-        return (set(output), rse_dict)
+        return index.compare(self.key, '<', self.value)
 
 
 class RSEAttributeLargerCheck(BaseExpressionElement):
@@ -318,24 +482,11 @@ class RSEAttributeLargerCheck(BaseExpressionElement):
         self.key = key
         self.value = value
 
-    def resolve_elements(self, session):
+    def resolve_elements(self, index):
         """
         Inherited from :py:func:`BaseExpressionElement.resolve_elements`
         """
-        rse_list = get_rses_with_attribute(key=self.key, session=session)
-        if not rse_list:
-            return (set(), {})
-
-        output = []
-        rse_dict = {}
-        for rse in rse_list:
-            try:
-                if float(get_rse_attribute(rse['id'], self.key, session=session)) > float(self.value):
-                    rse_dict[rse['id']] = rse
-                    output.append(rse['id'])
-            except ValueError:
-                continue
-        return (set(output), rse_dict)
+        return index.compare(self.key, '>', self.value)
 
 
 class BaseRSEOperator(BaseExpressionElement, metaclass=abc.ABCMeta):
@@ -383,13 +534,11 @@ class ComplementOperator(BaseRSEOperator):
         """
         self.right_term = right_term
 
-    def resolve_elements(self, session):
+    def resolve_elements(self, index):
         """
         Inherited from :py:func:`BaseExpressionElement.resolve_elements`
         """
-        left_term_tuple = self.left_term.resolve_elements(session=session)
-        right_term_tuple = self.right_term.resolve_elements(session=session)
-        return (left_term_tuple[0] - right_term_tuple[0], dict(list(left_term_tuple[1].items()) + list(right_term_tuple[1].items())))
+        return self.left_term.resolve_elements(index) & ~ self.right_term.resolve_elements(index)
 
 
 class UnionOperator(BaseRSEOperator):
@@ -417,13 +566,11 @@ class UnionOperator(BaseRSEOperator):
         """
         self.right_term = right_term
 
-    def resolve_elements(self, session):
+    def resolve_elements(self, index):
         """
         Inherited from :py:func:`BaseExpressionElement.resolve_elements`
         """
-        left_term_tuple = self.left_term.resolve_elements(session=session)
-        right_term_tuple = self.right_term.resolve_elements(session=session)
-        return (left_term_tuple[0] | right_term_tuple[0], dict(list(left_term_tuple[1].items()) + list(right_term_tuple[1].items())))
+        return self.left_term.resolve_elements(index) | self.right_term.resolve_elements(index)
 
 
 class IntersectOperator(BaseRSEOperator):
@@ -451,10 +598,8 @@ class IntersectOperator(BaseRSEOperator):
         """
         self.right_term = right_term
 
-    def resolve_elements(self, session):
+    def resolve_elements(self, index):
         """
         Inherited from :py:func:`BaseExpressionElement.resolve_elements`
         """
-        left_term_tuple = self.left_term.resolve_elements(session=session)
-        right_term_tuple = self.right_term.resolve_elements(session=session)
-        return (left_term_tuple[0] & right_term_tuple[0], dict(list(left_term_tuple[1].items()) + list(right_term_tuple[1].items())))
+        return self.left_term.resolve_elements(index) & self.right_term.resolve_elements(index)
@@ -16,25 +16,129 @@
 from random import uniform, shuffle
 from typing import TYPE_CHECKING
 
-from rucio.common.exception import InsufficientAccountLimit, InsufficientTargetRSEs, InvalidRuleWeight, RSEOverQuota
-from rucio.core.account import has_account_attribute, get_usage, get_all_rse_usages_per_account
-from rucio.core.account_limit import get_local_account_limit, get_global_account_limits
-from rucio.core.rse import list_rse_attributes, has_rse_attribute, get_rse_limits
-from rucio.core.rse_counter import get_counter as get_rse_counter
+from rucio.common.exception import CounterNotFound, InsufficientAccountLimit, InsufficientTargetRSEs, InvalidRuleWeight, RSEOverQuota
+from rucio.common.utils import chunks
+from rucio.core.account import has_account_attribute, get_all_rse_usages_per_account
+from rucio.core.account_limit import get_global_account_limits
 from rucio.core.rse_expression_parser import parse_expression
+from rucio.db.sqla import models
 from rucio.db.sqla.session import read_session
 
 if TYPE_CHECKING:
     from sqlalchemy.orm import Session
 
 
+class RSESelectorSnapshot():
+    """
+    Snapshot of the RSE attributes, account limits and usages, and RSE space limits and counters used
+    by the RSE selector. The data of the candidate RSEs is loaded in bulk and the snapshot can be
+    shared by the selectors of several rules, e.g. the rules created by one add_rules call.
+    """
+
+    def __init__(self):
+        self.__attributes = {}  # {rse_id: {key: value}}
+        self.__space = {}  # {rse_id: (MaxSpaceAvailable limit, used bytes)}
+        self.__accounts = {}  # {account: {'admin':, 'global_limits':, 'usages':, 'local_limits':}}
+
+    @read_session
+    def load(self, account, rse_ids, *, session: "Session"):
+        """
+        Load the data of the account and of the RSEs which are not in the snapshot yet.
+
+        :param account:  The account.
+        :param rse_ids:  List of RSE ids.
+        :param session:  DB Session in use.
+        """
+        missing = [rse_id for rse_id in set(rse_ids) if rse_id not in self.__attributes]
+        for chunk in chunks(missing, 1000):
+            attributes = {rse_id: {} for rse_id in chunk}
+            for attr in session.query(models.RSEAttrAssociation).filter(models.RSEAttrAssociation.rse_id.in_(chunk)):
+                attributes[attr.rse_id][attr.key] = attr.value
+            space_limits = dict(session.query(models.RSELimit.rse_id, models.RSELimit.value).
+                                filter(models.RSELimit.name == 'MaxSpaceAvailable', models.RSELimit.rse_id.in_(chunk)))
+            used = dict(session.query(models.RSEUsage.rse_id, models.RSEUsage.used).
+                        filter(models.RSEUsage.source == 'rucio', models.RSEUsage.rse_id.in_(chunk)))
+            self.__attributes.update(attributes)
+            self.__space.update({rse_id: (space_limits.get(rse_id), used.get(rse_id)) for rse_id in chunk})
+
+        if account not in self.__accounts:
+            self.__accounts[account] = {'admin': has_account_attribute(account=account, key='admin', session=session),
+                                        'global_limits': None,
+                                        'usages': None,
+                                        'local_limits': {}}
+
+    def __account(self, account, *, session: "Session"):
+        account_data = self.__accounts[account]
+        if account_data['usages'] is None:
+            account_data['global_limits'] = get_global_account_limits(account=account, session=session)
+            account_data['usages'] = {usage['rse_id']: usage['bytes'] for usage in get_all_rse_usages_per_account(account=account, session=session)}
+        return account_data
+
+    def attributes(self, rse_id):
+        """
+        :returns: The attributes of the RSE, as list_rse_attributes.
+        """
+        return self.__attributes[rse_id]
+
+    def is_admin(self, account):
+        """
+        :returns: True if the account has the admin attribute.
+        """
+        return self.__accounts[account]['admin']
+
+    @read_session
+    def global_limits(self, account, *, session: "Session"):
+        """
+        :returns: The global limits of the account, as get_global_account_limits.
+        """
+        return self.__account(account, session=session)['global_limits']
+
+    @read_session
+    def usages(self, account, *, session: "Session"):
+        """
+        :returns: Dictionary {rse_id: bytes} of the usage of the account.
+        """
+        return self.__account(account, session=session)['usages']
+
+    @read_session
+    def local_limits(self, account, rse_ids, *, session: "Session"):
+        """
+        :returns: Dictionary {rse_id: bytes} of the local limits of the account, None if there is no limit.
+        """
+        local_limits = self.__account(account, session=session)['local_limits']
+        missing = [rse_id for rse_id in set(rse_ids) if rse_id not in local_limits]
+        for chunk in chunks(missing, 1000):
+            limits = dict(session.query(models.AccountLimit.rse_id, models.AccountLimit.bytes).
+                          filter(models.AccountLimit.account == account, models.AccountLimit.rse_id.in_(chunk)))
+            for rse_id in chunk:
+                limit = limits.get(rse_id)
+                local_limits[rse_id] = float('inf') if limit == -1 else limit
+        return {rse_id: local_limits[rse_id] for rse_id in rse_ids}
+
+    def space_limit(self, rse_id):
+        """
+        :returns: The MaxSpaceAvailable limit of the RSE, None if there is no limit.
+        """
+        return self.__space[rse_id][0]
+
+    def space_used(self, rse_id):
+        """
+        :returns: The bytes used on the RSE, according to the rucio counter.
+        :raises CounterNotFound: If the RSE has no counter.
+        """
+        used = self.__space[rse_id][1]
+        if used is None:
+            raise CounterNotFound()
+        return used
+
+
 class RSESelector():
     """
     Representation of the RSE selector
     """
 
     @read_session
-    def __init__(self, account, rses, weight, copies, ignore_account_limit=False, *, session: "Session"):
+    def __init__(self, account, rses, weight, copies, ignore_account_limit=False, snapshot=None, *, session: "Session"):
         """
         Initialize the RSE Selector.
 
@@ -43,15 +147,19 @@ class RSESelector():
         :param weight:                Weighting to use.
         :param copies:                Number of copies to create.
         :param ignore_account_limit:  Flag if the quota should be ignored.
+        :param snapshot:              Optional RSESelectorSnapshot shared with other selectors.
         :param session:               DB Session in use.
         :raises:                      InvalidRuleWeight, InsufficientAccountLimit, InsufficientTargetRSEs
         """
         self.account = account
         self.rses = []  # [{'rse_id':, 'weight':, 'staging_area'}]
         self.copies = copies
+        if snapshot is None:
+            snapshot = RSESelectorSnapshot()
+        snapshot.load(account, [rse['id'] for rse in rses], session=session)
         if weight is not None:
             for rse in rses:
-                attributes = list_rse_attributes(rse_id=rse['id'], session=session)
+                attributes = snapshot.attributes(rse['id'])
                 availability_write = True if rse.get('availability_write', True) else False
                 if weight not in attributes:
                     continue  # The RSE does not have the required weight set, therefore it is ignored
@@ -65,7 +173,7 @@ class RSESelector():
                     raise InvalidRuleWeight('The RSE \'%s\' has a non-number specified for the weight \'%s\'' % (rse['rse'], weight))
         else:
             for rse in rses:
-                mock_rse = has_rse_attribute(rse['id'], 'mock', session=session)
+                mock_rse = 'mock' in snapshot.attributes(rse['id'])
                 availability_write = True if rse.get('availability_write', True) else False
                 self.rses.append({'rse_id': rse['id'],
                                   'weight': 1,
@@ -77,14 +185,15 @@ class RSESelector():
             raise InsufficientTargetRSEs('Target RSE set not sufficient for number of copies. (%s copies requested, RSE set size %s)' % (self.copies, len(self.rses)))
 
         rses_with_enough_quota = []
-        if has_account_attribute(account=account, key='admin', session=session) or ignore_account_limit:
+        if snapshot.is_admin(account) or ignore_account_limit:
             for rse in self.rses:
                 rse['quota_left'] = float('inf')
                 rse['space_left'] = float('inf')
                 rses_with_enough_quota.append(rse)
         else:
-            global_quota_limit = get_global_account_limits(account=account, session=session)
-            all_rse_usages = {usage['rse_id']: usage['bytes'] for usage in get_all_rse_usages_per_account(account=account, session=session)}
+            global_quota_limit = snapshot.global_limits(account, session=session)
+            all_rse_usages = snapshot.usages(account, session=session)
+            local_quota_limits = snapshot.local_limits(account, [rse['rse_id'] for rse in self.rses if not rse['mock_rse']], session=session)
             for rse in self.rses:
                 if rse['mock_rse']:
                     rse['quota_left'] = float('inf')
@@ -93,11 +202,11 @@ class RSESelector():
                 else:
                     # check local quota
                     local_quota_left = None
-                    quota_limit = get_local_account_limit(account=account, rse_id=rse['rse_id'], session=session)
+                    quota_limit = local_quota_limits[rse['rse_id']]
                     if quota_limit is None:
                         local_quota_left = 0
                     else:
-                        local_quota_left = quota_limit - get_usage(rse_id=rse['rse_id'], account=account, session=session)['bytes']
+                        local_quota_left = quota_limit - all_rse_usages.get(rse['rse_id'], 0)
 
                     # check global quota
                     rse['global_quota_left'] = {}
@@ -120,11 +229,11 @@ class RSESelector():
                                 rse['global_quota_left'][rse_expression] = global_quota_left
                     if local_quota_left > 0 and all_global_quota_enough:
                         rse['quota_left'] = local_quota_left
-                        space_limit = get_rse_limits(name='MaxSpaceAvailable', rse_id=rse['rse_id'], session=session).get('MaxSpaceAvailable')
+                        space_limit = snapshot.space_limit(rse['rse_id'])
                         if space_limit is None or space_limit < 0:
                             rse['space_left'] = float('inf')
                         else:
-                            rse['space_left'] = space_limit - get_rse_counter(rse_id=rse['rse_id'], session=session)['bytes']
+                            rse['space_left'] = space_limit - snapshot.space_used(rse['rse_id'])
                         rses_with_enough_quota.append(rse)
 
         self.rses = rses_with_enough_quota
@@ -58,13 +58,14 @@ from rucio.core.message import add_message
 from rucio.core.monitor import MetricManager
 from rucio.core.rse import get_rse_name, list_rse_attributes, get_rse, get_rse_usage
 from rucio.core.rse_expression_parser import parse_expression
-from rucio.core.rse_selector import RSESelector
+from rucio.core.rse_selector import RSESelector, RSESelectorSnapshot
 from rucio.core.rule_grouping import apply_rule_grouping, repair_stuck_locks_and_apply_rule_grouping, create_transfer_dict, apply_rule
 from rucio.db.sqla import models, filter_thread_work
 from rucio.db.sqla.constants import (LockState, ReplicaState, RuleState, RuleGrouping,
                                      DIDAvailability, DIDReEvaluation, DIDType, BadFilesStatus,
                                      RequestType, RuleNotification, OBSOLETE, RSEType)
 from rucio.db.sqla.session import read_session, transactional_session, stream_session
+from rucio.db.sqla.util import temp_table_mngr
 
 if TYPE_CHECKING:
     from sqlalchemy.orm import Session
@@ -365,6 +366,9 @@ def add_rules(dids, rules, *, session: "Session", logger=logging.log):
                     all_source_rses.extend(parse_expression(rule.get('source_replica_expression'), filter_={'vo': vo}, session=session))
             all_source_rses = list(set([rse['id'] for rse in all_source_rses]))
 
+        # The quotas and space of the RSEs are loaded once for all the RSE selectors of this call
+        rse_selector_snapshot = RSESelectorSnapshot()
+
         for elem in dids:
             # 2. Get the did
             with METRICS.timer('add_rules.get_did'):
@@ -456,7 +460,8 @@ def add_rules(dids, rules, *, session: "Session", logger=logging.log):
 
                     # 5. Create the RSE selector
                     with METRICS.timer('add_rules.create_rse_selector'):
-                        rseselector = RSESelector(account=rule['account'], rses=rses, weight=rule.get('weight'), copies=rule['copies'], ignore_account_limit=rule.get('ask_approval', False), session=session)
+                        rseselector = RSESelector(account=rule['account'], rses=rses, weight=rule.get('weight'), copies=rule['copies'], ignore_account_limit=rule.get('ask_approval', False),
+                                                  snapshot=rse_selector_snapshot, session=session)
 
                     # 4. Create the replication rule
                     with METRICS.timer('add_rules.create_rule'):
@@ -1857,6 +1862,18 @@ def delete_updated_did(id_, *, session: "Session"):
     session.query(models.UpdatedDID).filter(models.UpdatedDID.id == id_).delete()
 
 
+@transactional_session
+def delete_updated_dids(ids, *, session: "Session"):
+    """
+    Delete a list of updated_dids by id.
+
+    :param ids:                      List of ids of the rows to delete.
+    :param session:                  The database session in use.
+    """
+    for chunk in chunks(ids, 100):
+        session.query(models.UpdatedDID).filter(models.UpdatedDID.id.in_(chunk)).delete(synchronize_session=False)
+
+
 @transactional_session
 def update_rules_for_lost_replica(scope, name, rse_id, nowait=False, *, session: "Session", logger=logging.log):
     """
@@ -3001,16 +3018,9 @@ def __resolve_dids_to_locks_and_replicas(dids, nowait=False, restrict_rses=[], s
             source_replicas[(did.child_scope, did.child_name)] = []
         datasetfiles = [{'scope': dids[0].scope, 'name': dids[0].name, 'files': files}]
 
-        # Prepare the locks and files
-        lock_clauses = []
-        replica_clauses = []
-        for did in dids:
-            lock_clauses.append(and_(models.ReplicaLock.scope == did.child_scope,
-                                     models.ReplicaLock.name == did.child_name))
-            replica_clauses.append(and_(models.RSEFileAssociation.scope == did.child_scope,
-                                        models.RSEFileAssociation.name == did.child_name))
-        lock_clause_chunks = [lock_clauses[x:x + 10] for x in range(0, len(lock_clauses), 10)]
-        replica_clause_chunks = [replica_clauses[x:x + 10] for x in range(0, len(replica_clauses), 10)]
+        # Resolve the locks and replicas of all the files with a join on a temporary table
+        temp_table = temp_table_mngr(session).create_scope_name_table()
+        session.bulk_insert_mappings(temp_table, [{'scope': scope, 'name': name} for scope, name in replicas])
 
         replicas_rse_clause = []
         source_replicas_rse_clause = []
@@ -3023,46 +3033,33 @@ def __resolve_dids_to_locks_and_replicas(dids, nowait=False, restrict_rses=[], s
             for rse_id in source_rses:
                 source_replicas_rse_clause.append(models.RSEFileAssociation.rse_id == rse_id)
 
-        for lock_clause_chunk in lock_clause_chunks:
-            if locks_rse_clause:
-                tmp_locks = session.query(models.ReplicaLock).filter(or_(*lock_clause_chunk), or_(*locks_rse_clause))\
-                    .with_hint(models.ReplicaLock, "index(LOCKS LOCKS_PK)", 'oracle')\
-                    .with_for_update(nowait=nowait).all()
-            else:
-                tmp_locks = session.query(models.ReplicaLock).filter(or_(*lock_clause_chunk))\
-                    .with_hint(models.ReplicaLock, "index(LOCKS LOCKS_PK)", 'oracle')\
-                    .with_for_update(nowait=nowait).all()
-            for lock in tmp_locks:
-                if (lock.scope, lock.name) not in locks:
-                    locks[(lock.scope, lock.name)] = [lock]
-                else:
-                    locks[(lock.scope, lock.name)].append(lock)
-
-        for replica_clause_chunk in replica_clause_chunks:
-            if replicas_rse_clause:
-                tmp_replicas = session.query(models.RSEFileAssociation).filter(or_(*replica_clause_chunk), or_(*replicas_rse_clause), models.RSEFileAssociation.state != ReplicaState.BEING_DELETED)\
-                    .with_hint(models.RSEFileAssociation, "index(REPLICAS REPLICAS_PK)", 'oracle')\
-                    .with_for_update(nowait=nowait).all()
-            else:
-                tmp_replicas = session.query(models.RSEFileAssociation).filter(or_(*replica_clause_chunk), models.RSEFileAssociation.state != ReplicaState.BEING_DELETED)\
-                    .with_hint(models.RSEFileAssociation, "index(REPLICAS REPLICAS_PK)", 'oracle')\
-                    .with_for_update(nowait=nowait).all()
-            for replica in tmp_replicas:
-                if (replica.scope, replica.name) not in replicas:
-                    replicas[(replica.scope, replica.name)] = [replica]
-                else:
-                    replicas[(replica.scope, replica.name)].append(replica)
+        query = session.query(models.ReplicaLock)\
+            .join(temp_table, and_(models.ReplicaLock.scope == temp_table.scope,
+                                   models.ReplicaLock.name == temp_table.name))\
+            .with_hint(models.ReplicaLock, "index(LOCKS LOCKS_PK)", 'oracle')
+        if locks_rse_clause:
+            query = query.filter(or_(*locks_rse_clause))
+        for lock in query.with_for_update(nowait=nowait, of=models.ReplicaLock.state):
+            locks[(lock.scope, lock.name)].append(lock)
+
+        query = session.query(models.RSEFileAssociation)\
+            .join(temp_table, and_(models.RSEFileAssociation.scope == temp_table.scope,
+                                   models.RSEFileAssociation.name == temp_table.name))\
+            .filter(models.RSEFileAssociation.state != ReplicaState.BEING_DELETED)\
+            .with_hint(models.RSEFileAssociation, "index(REPLICAS REPLICAS_PK)", 'oracle')
+        if replicas_rse_clause:
+            query = query.filter(or_(*replicas_rse_clause))
+        for replica in query.with_for_update(nowait=nowait, of=models.RSEFileAssociation.lock_cnt):
+            replicas[(replica.scope, replica.name)].append(replica)
 
         if source_rses:
-            for replica_clause_chunk in replica_clause_chunks:
-                tmp_source_replicas = session.query(models.RSEFileAssociation.scope, models.RSEFileAssociation.name, models.RSEFileAssociation.rse_id).\
-                    filter(or_(*replica_clause_chunk), or_(*source_replicas_rse_clause), models.RSEFileAssociation.state == ReplicaState.AVAILABLE)\
-                    .with_hint(models.RSEFileAssociation, "index(REPLICAS REPLICAS_PK)", 'oracle').all()
-                for scope, name, rse_id in tmp_source_replicas:
-                    if (scope, name) not in source_replicas:
-                        source_replicas[(scope, name)] = [rse_id]
-                    else:
-                        source_replicas[(scope, name)].append(rse_id)
+            query = session.query(models.RSEFileAssociation.scope, models.RSEFileAssociation.name, models.RSEFileAssociation.rse_id)\
+                .join(temp_table, and_(models.RSEFileAssociation.scope == temp_table.scope,
+                                       models.RSEFileAssociation.name == temp_table.name))\
+                .filter(or_(*source_replicas_rse_clause), models.RSEFileAssociation.state == ReplicaState.AVAILABLE)\
+                .with_hint(models.RSEFileAssociation, "index(REPLICAS REPLICAS_PK)", 'oracle')
+            for scope, name, rse_id in query:
+                source_replicas[(scope, name)].append(rse_id)
     else:
         # The evaluate_dids will be containers and/or datasets
         for did in dids:
@@ -16,10 +16,13 @@
 import copy
 import itertools
 import logging
+from array import array
 from typing import TYPE_CHECKING
+from uuid import uuid4
 
-from dogpile.cache.api import NoValue
+from dogpile.cache.api import NoValue, NO_VALUE
 from sqlalchemy import select, false
+from sqlalchemy.orm import aliased
 
 from rucio.common.utils import PriorityQueue
 from rucio.common.cache import make_region_memcached
@@ -39,6 +42,9 @@ if TYPE_CHECKING:
     LoggerFunction = Callable[..., Any]
 
 REGION = make_region_memcached(expiration_time=600)
+GRAPH_GENERATION_KEY = 'distance_graph_generation'
+
+_GRAPH = None
 
 
 class Topology:
@@ -60,6 +66,8 @@ class Topology:
         self.restricted_write_rses = restricted_write_rses or set()
         self.unavailable_read_rses = unavailable_read_rses or set()
         self.unavailable_write_rses = unavailable_write_rses or set()
+        self._matching_schemes = {}
+        self._shortest_paths = {}
 
     @classmethod
     @read_session
@@ -127,11 +135,22 @@ class Topology:
         """
         HOP_PENALTY = config_get_int('transfers', 'hop_penalty', default=10, session=session)  # Penalty to be applied to each further hop
 
+        # Many requests of a submitter cycle share the same sources and destination: re-use their result
+        cache_key = (frozenset(source_rse_ids), dest_rse_id, operation_src, operation_dest, domain, tuple(limit_dest_schemes or ()), HOP_PENALTY)
+        cached = self._shortest_paths.get(cache_key)
+        if cached is not None:
+            paths, inbound_links_used = cached
+            if inbound_links_by_node is not None:
+                inbound_links_by_node.update(inbound_links_used)
+            return {rse_id: [copy.copy(hop) for hop in path] for rse_id, path in paths.items()}
+
+        inbound_links_used = {}
+        graph = get_distance_graph(session=session)
         self.rse_collection.ensure_loaded(itertools.chain(source_rse_ids, [dest_rse_id], self.multihop_rses),
                                           load_attributes=True, load_info=True, session=session)
         if self.multihop_rses:
             # Filter out island source RSEs
-            sources_to_find = {rse_id for rse_id in source_rse_ids if _load_outgoing_distances_node(rse_id=rse_id, session=session)}
+            sources_to_find = {rse_id for rse_id in source_rse_ids if graph.has_outgoing_links(rse_id)}
         else:
             sources_to_find = set(source_rse_ids)
 
@@ -150,9 +169,8 @@ class Topology:
                 break
 
             current_distance = next_hop[current_node]['cumulated_distance']
-            inbound_links = _load_inbound_distances_node(rse_id=current_node, session=session)
-            if inbound_links_by_node is not None:
-                inbound_links_by_node[current_node] = inbound_links
+            inbound_links = graph.inbound_links(current_node)
+            inbound_links_used[current_node] = inbound_links
             for adjacent_node, link_distance in sorted(inbound_links.items(),
                                                        key=lambda item: 0 if item[0] in sources_to_find else 1):
                 if link_distance is None:
@@ -170,9 +188,9 @@ class Topology:
                     continue
 
                 try:
-                    matching_scheme = rsemgr.find_matching_scheme(
-                        rse_settings_src=self.rse_collection[adjacent_node].info,
-                        rse_settings_dest=self.rse_collection[current_node].info,
+                    matching_scheme = self._find_matching_scheme(
+                        src_rse_id=adjacent_node,
+                        dest_rse_id=current_node,
                         operation_src=operation_src,
                         operation_dest=operation_dest,
                         domain=domain,
@@ -208,7 +226,167 @@ class Topology:
                 path.append(hop)
                 hop = next_hop[hop['dest_rse_id']]
             paths[rse_id] = path
-        return paths
+
+        self._shortest_paths[cache_key] = (paths, inbound_links_used)
+        if inbound_links_by_node is not None:
+            inbound_links_by_node.update(inbound_links_used)
+        return {rse_id: [copy.copy(hop) for hop in path] for rse_id, path in paths.items()}
+
+    def _find_matching_scheme(self, src_rse_id, dest_rse_id, operation_src, operation_dest, domain, scheme):
+        """
+        Memoized rsemgr.find_matching_scheme between two RSEs of the topology.
+        The protocols of the RSEs don't change during the lifetime of a Topology object.
+        """
+        key = (src_rse_id, dest_rse_id, operation_src, operation_dest, domain, tuple(scheme) if scheme else None)
+        result = self._matching_schemes.get(key)
+        if result is None:
+            try:
+                result = rsemgr.find_matching_scheme(
+                    rse_settings_src=self.rse_collection[src_rse_id].info,
+                    rse_settings_dest=self.rse_collection[dest_rse_id].info,
+                    operation_src=operation_src,
+                    operation_dest=operation_dest,
+                    domain=domain,
+                    scheme=scheme,
+                )
+            except RSEProtocolNotSupported as error:
+                result = error
+            self._matching_schemes[key] = result
+        if isinstance(result, RSEProtocolNotSupported):
+            raise result
+        return result
+
+
+class DistanceGraph:
+    """
+    Read-only snapshot of the whole distance table.
+
+    The inbound links of all nodes are stored contiguously in flat integer arrays
+    (compressed sparse row layout): the inbound links of the node at position i are
+    at positions inbound_offsets[i] to inbound_offsets[i + 1] of inbound_sources and
+    inbound_distances.
+    """
+
+    def __init__(self, generation, rse_ids, inbound_offsets, inbound_sources, inbound_distances, outgoing_counts):
+        self.generation = generation
+        self.rse_ids = rse_ids
+        self.positions = {rse_id: position for position, rse_id in enumerate(rse_ids)}
+        self.inbound_offsets = inbound_offsets
+        self.inbound_sources = inbound_sources
+        self.inbound_distances = inbound_distances
+        self.outgoing_counts = outgoing_counts
+
+    @classmethod
+    @read_session
+    def load(cls, generation, *, session: "Session"):
+        """
+        Load all the distances between non-deleted RSEs with a single query.
+
+        :param generation:  The generation token of the snapshot.
+        :param session:     The DB Session to use.
+        :returns:           The DistanceGraph.
+        """
+        src_rse = aliased(models.RSE)
+        dest_rse = aliased(models.RSE)
+        stmt = select(
+            models.Distance.src_rse_id,
+            models.Distance.dest_rse_id,
+            models.Distance.distance
+        ).join(
+            src_rse,
+            src_rse.id == models.Distance.src_rse_id
+        ).join(
+            dest_rse,
+            dest_rse.id == models.Distance.dest_rse_id
+        ).where(
+            models.Distance.distance != None,  # noqa: E711
+            src_rse.deleted == false(),
+            dest_rse.deleted == false()
+        )
+
+        positions = {}
+        edges = []
+        for src_rse_id, dest_rse_id, distance in session.execute(stmt):
+            src = positions.setdefault(src_rse_id, len(positions))
+            dest = positions.setdefault(dest_rse_id, len(positions))
+            edges.append((dest, src, distance if distance >= 0 else 0))
+        edges.sort()
+
+        rse_ids = [None] * len(positions)
+        for rse_id, position in positions.items():
+            rse_ids[position] = rse_id
+        inbound_offsets = array('q', [0]) * (len(rse_ids) + 1)
+        outgoing_counts = array('q', [0]) * len(rse_ids)
+        for dest, src, _ in edges:
+            inbound_offsets[dest + 1] += 1
+            outgoing_counts[src] += 1
+        for position in range(len(rse_ids)):
+            inbound_offsets[position + 1] += inbound_offsets[position]
+
+        return cls(generation=generation,
+                   rse_ids=rse_ids,
+                   inbound_offsets=inbound_offsets,
+                   inbound_sources=array('q', (src for _, src, _ in edges)),
+                   inbound_distances=array('q', (distance for _, _, distance in edges)),
+                   outgoing_counts=outgoing_counts)
+
+    def inbound_links(self, rse_id: str) -> "Dict[str, int]":
+        """
+        :param rse_id:  RSE id of the destination node.
+        :returns:       Dictionary {source rse id: distance} of the links towards the node.
+        """
+        position = self.positions.get(rse_id)
+        if position is None:
+            return {}
+        start, end = self.inbound_offsets[position], self.inbound_offsets[position + 1]
+        return {self.rse_ids[src]: distance for src, distance in zip(self.inbound_sources[start:end], self.inbound_distances[start:end])}
+
+    def has_outgoing_links(self, rse_id: str) -> bool:
+        """
+        :param rse_id:  RSE id of the source node.
+        :returns:       True if there is at least one link starting at the node.
+        """
+        position = self.positions.get(rse_id)
+        return position is not None and self.outgoing_counts[position] > 0
+
+
+@read_session
+def get_distance_graph(*, session: "Session"):
+    """
+    Return the per-process DistanceGraph, reloading it if it was invalidated.
+
+    The graph is tagged with a generation token shared via the cache region. Any
+    process changing distances replaces the token, which makes all the other
+    processes reload their snapshot on their next path search.
+
+    :param session:       Database session in use.
+    :returns:             The DistanceGraph.
+    """
+    global _GRAPH
+
+    generation = REGION.get(GRAPH_GENERATION_KEY)
+    graph = _GRAPH
+    if graph is not None and generation is not NO_VALUE and generation == graph.generation:
+        return graph
+
+    if generation is NO_VALUE:
+        generation = uuid4().hex
+        REGION.set(GRAPH_GENERATION_KEY, generation)
+    graph = DistanceGraph.load(generation=generation, session=session)
+    _GRAPH = graph
+    return graph
+
+
+def invalidate_distance_graph():
+    """
+    Drop the DistanceGraph of this and all other processes sharing the cache region.
+
+    Has to be called whenever distances are added, changed or removed.
+    """
+    global _GRAPH
+
+    _GRAPH = None
+    REGION.delete(GRAPH_GENERATION_KEY)
 
 
 @transactional_session
@@ -255,66 +433,6 @@ def get_hops(
     return path
 
 
-@transactional_session
-def _load_outgoing_distances_node(rse_id: str, *, session: "Session"):
-    """
-    Loads the outgoing edges of the distance graph for one node.
-    :param rse_id:    RSE id to load the edges for.
-    :param session:   The DB Session to use.
-    :returns:         Dictionary based graph object.
-    """
-
-    result = REGION.get('outgoing_edges_%s' % str(rse_id))
-    if isinstance(result, NoValue):
-        outgoing_edges = {}
-        stmt = select(
-            models.Distance
-        ).join(
-            models.RSE,
-            models.RSE.id == models.Distance.dest_rse_id
-        ).where(
-            models.Distance.src_rse_id == rse_id,
-            models.RSE.deleted == false()
-        )
-        for distance in session.execute(stmt).scalars():
-            if distance.distance is None:
-                continue
-            outgoing_edges[distance.dest_rse_id] = distance.distance if distance.distance >= 0 else 0
-        REGION.set('outgoing_edges_%s' % str(rse_id), outgoing_edges)
-        result = outgoing_edges
-    return result
-
-
-@transactional_session
-def _load_inbound_distances_node(rse_id: str, *, session: "Session"):
-    """
-    Loads the inbound edges of the distance graph for one node.
-    :param rse_id:    RSE id to load the edges for.
-    :param session:   The DB Session to use.
-    :returns:         Dictionary based graph object.
-    """
-
-    result = REGION.get('inbound_edges_%s' % str(rse_id))
-    if isinstance(result, NoValue):
-        inbound_edges = {}
-        stmt = select(
-            models.Distance
-        ).join(
-            models.RSE,
-            models.RSE.id == models.Distance.src_rse_id
-        ).where(
-            models.Distance.dest_rse_id == rse_id,
-            models.RSE.deleted == false()
-        )
-        for distance in session.execute(stmt).scalars():
-            if distance.distance is None:
-                continue
-            inbound_edges[distance.src_rse_id] = distance.distance if distance.distance >= 0 else 0
-        REGION.set('inbound_edges_%s' % str(rse_id), inbound_edges)
-        result = inbound_edges
-    return result
-
-
 @read_session
 def _get_unavailable_rse_ids(operation: str, *, session: "Session", logger: "LoggerFunction" = logging.log):
     """
@@ -25,10 +25,12 @@ import rucio.db.sqla.util
 from rucio.common import exception
 from rucio.common.logging import setup_logging
 from rucio.common.utils import get_thread_with_periodic_running_function
-from rucio.core.account_counter import get_updated_account_counters, update_account_counter, fill_account_counter_history_table
+from rucio.core.account_counter import update_account_counters, fill_account_counter_history_table
+from rucio.core.monitor import MetricManager
 from rucio.daemons.common import run_daemon
 
 graceful_stop = threading.Event()
+METRICS = MetricManager(module=__name__)
 
 
 def account_update(once=False, sleep_time=10):
@@ -46,26 +48,27 @@ def account_update(once=False, sleep_time=10):
     )
 
 
-def run_once(heartbeat_handler, **_kwargs):
+def run_once(heartbeat_handler, bulk=10000, **_kwargs):
     worker_number, total_workers, logger = heartbeat_handler.live()
 
-    start = time.time()  # NOQA
-    account_rse_ids = get_updated_account_counters(total_workers=total_workers,
-                                                   worker_number=worker_number)
-    logger(logging.DEBUG, 'Index query time %f size=%d' % (time.time() - start, len(account_rse_ids)))
+    with METRICS.timer('update_account_counters'):
+        start_time = time.time()
+        stats = update_account_counters(total_workers=total_workers, worker_number=worker_number, limit=bulk)
+        duration = time.time() - start_time
 
-    # If the list is empty, sent the worker to sleep
-    if not account_rse_ids:
+    # If nothing was updated, sent the worker to sleep
+    if not stats['rows']:
         logger(logging.INFO, 'did not get any work')
         return
 
-    for account_rse_id in account_rse_ids:
-        worker_number, total_workers, logger = heartbeat_handler.live()
-        if graceful_stop.is_set():
-            break
-        start_time = time.time()
-        update_account_counter(account=account_rse_id[0], rse_id=account_rse_id[1])
-        logger(logging.DEBUG, 'update of account-rse counter "%s-%s" took %f' % (account_rse_id[0], account_rse_id[1], time.time() - start_time))
+    METRICS.counter('updated_rows').inc(stats['rows'])
+    METRICS.counter('updated_counters').inc(stats['counters'])
+    logger(logging.INFO, 'applied %d updates to %d account-rse counters in %f seconds (%.1f updates/s)',
+           stats['rows'], stats['counters'], duration, stats['rows'] / max(duration, 1e-6))
+
+    # Continue without sleeping while there is a backlog
+    must_sleep = stats['rows'] < bulk
+    return must_sleep
 
 
 def stop(signum=None, frame=None):
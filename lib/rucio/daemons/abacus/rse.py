@@ -25,10 +25,12 @@ import rucio.db.sqla.util
 from rucio.common import exception
 from rucio.common.logging import setup_logging
 from rucio.common.utils import get_thread_with_periodic_running_function
-from rucio.core.rse_counter import get_updated_rse_counters, update_rse_counter, fill_rse_counter_history_table
+from rucio.core.monitor import MetricManager
+from rucio.core.rse_counter import update_rse_counters, fill_rse_counter_history_table
 from rucio.daemons.common import run_daemon
 
 graceful_stop = threading.Event()
+METRICS = MetricManager(module=__name__)
 
 
 def rse_update(once=False, sleep_time=10):
@@ -46,27 +48,27 @@ def rse_update(once=False, sleep_time=10):
     )
 
 
-def run_once(heartbeat_handler, **_kwargs):
+def run_once(heartbeat_handler, bulk=10000, **_kwargs):
     worker_number, total_workers, logger = heartbeat_handler.live()
 
-    # Select a bunch of rses for to update for this worker
-    start = time.time()  # NOQA
-    rse_ids = get_updated_rse_counters(total_workers=total_workers,
-                                       worker_number=worker_number)
-    logger(logging.DEBUG, 'Index query time %f size=%d' % (time.time() - start, len(rse_ids)))
+    with METRICS.timer('update_rse_counters'):
+        start_time = time.time()
+        stats = update_rse_counters(total_workers=total_workers, worker_number=worker_number, limit=bulk)
+        duration = time.time() - start_time
 
-    # If the list is empty, sent the worker to sleep
-    if not rse_ids:
+    # If nothing was updated, sent the worker to sleep
+    if not stats['rows']:
         logger(logging.INFO, 'did not get any work')
         return
 
-    for rse_id in rse_ids:
-        worker_number, total_workers, logger = heartbeat_handler.live()
-        if graceful_stop.is_set():
-            break
-        start_time = time.time()
-        update_rse_counter(rse_id=rse_id)
-        logger(logging.DEBUG, 'update of rse "%s" took %f' % (rse_id, time.time() - start_time))
+    METRICS.counter('updated_rows').inc(stats['rows'])
+    METRICS.counter('updated_counters').inc(stats['counters'])
+    logger(logging.INFO, 'applied %d updates to %d rse counters in %f seconds (%.1f updates/s)',
+           stats['rows'], stats['counters'], duration, stats['rows'] / max(duration, 1e-6))
+
+    # Continue without sleeping while there is a backlog
+    must_sleep = stats['rows'] < bulk
+    return must_sleep
 
 
 def stop(signum=None, frame=None):
@@ -15,6 +15,8 @@
 
 import queue as Queue
 import bz2
+import contextlib
+import fcntl
 import glob
 import logging
 import os
@@ -27,8 +29,10 @@ from rucio.common.dumper import LogPipeHandler
 from rucio.common.dumper import mkdir
 from rucio.common.dumper import temp_file
 from rucio.common.dumper.consistency import Consistency
+from rucio.common.stopwatch import Stopwatch
 from rucio.common.types import InternalAccount, InternalScope
 from rucio.common.utils import chunks
+from rucio.core.monitor import MetricManager
 from rucio.core.quarantined_replica import add_quarantined_replicas
 from rucio.core.replica import declare_bad_file_replicas, list_replicas
 from rucio.core.rse import get_rse_usage, get_rse_id
@@ -37,34 +41,122 @@ from rucio.daemons.auditor import srmdumps
 from rucio.db.sqla.constants import BadFilesStatus
 
 
-def consistency(rse, delta, configuration, cache_dir, results_dir):
+METRICS = MetricManager(module=__name__)
+
+
+class CacheLockBusy(Exception):
+    """
+    The cache entry is locked by another worker.
+    """
+
+
+@contextlib.contextmanager
+def cache_lock(cache_dir, name, blocking=True):
+    """
+    Lock an entry of the dump cache between the worker processes, so a dump
+    needed by several checks is downloaded and parsed only once.
+
+    :param cache_dir: The directory of the dump cache.
+    :param name: The name of the locked entry.
+    :param blocking: If False, raise CacheLockBusy instead of waiting for the lock.
+    """
+    lock_dir = os.path.join(cache_dir, '.locks')
+    mkdir(cache_dir)
+    mkdir(lock_dir)
+    with open(os.path.join(lock_dir, name), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise CacheLockBusy(name)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def stage(rse, name, timings):
+    """
+    Measure the duration of a stage of a consistency check.
+
+    :param rse: The checked RSE.
+    :param name: The name of the stage.
+    :param timings: Dictionary in which the duration in seconds is stored under the stage name.
+    """
+    stopwatch = Stopwatch()
+    try:
+        yield
+    finally:
+        stopwatch.stop()
+        timings[name] = stopwatch.elapsed
+        METRICS.timer('check.{stage}').labels(stage=name).observe(stopwatch.elapsed)
+        logging.getLogger('auditor-worker').debug('Stage "%s" of the check of "%s" took %.1f seconds', name, rse, stopwatch.elapsed)
+
+
+def consistency(rse, delta, configuration, cache_dir, results_dir, timings=None):
+    """
+    Compare the dump of an RSE with the Rucio replica dumps around its date.
+
+    Raises CacheLockBusy if the same RSE dump is being checked by another worker.
+    Returns the path of the results, or None if the dump was already checked.
+    """
     logger = logging.getLogger('auditor-worker')
-    rsedump, rsedate = srmdumps.download_rse_dump(rse, configuration, destdir=cache_dir)
+    timings = {} if timings is None else timings
+    with stage(rse, 'download_rse_dump', timings), cache_lock(cache_dir, 'ddmendpoint_{0}'.format(rse)):
+        rsedump, rsedate = srmdumps.download_rse_dump(rse, configuration, destdir=cache_dir)
     results_path = os.path.join(results_dir, '{0}_{1}'.format(rse, rsedate.strftime('%Y%m%d')))  # pylint: disable=no-member
 
-    if os.path.exists(results_path + '.bz2') or os.path.exists(results_path):
-        logger.warning('Consistency check for "%s" (dump dated %s) already done, skipping check', rse, rsedate.strftime('%Y%m%d'))  # pylint: disable=no-member
-        return None
-
-    rrdump_prev = ReplicaFromHDFS.download(rse, rsedate - delta, cache_dir=cache_dir)
-    rrdump_next = ReplicaFromHDFS.download(rse, rsedate + delta, cache_dir=cache_dir)
-    results = Consistency.dump(
-        'consistency-manual',
-        rse,
-        rsedump,
-        rrdump_prev,
-        rrdump_next,
-        date=rsedate,
-        cache_dir=cache_dir,
-    )
-    mkdir(results_dir)
-    with temp_file(results_dir, results_path) as (output, _):
-        for result in results:
-            output.write('{0}\n'.format(result.csv()))
+    # Only one worker checks an RSE dump at a time, the others skip it
+    with cache_lock(cache_dir, os.path.basename(results_path), blocking=False):
+        if os.path.exists(results_path + '.bz2') or os.path.exists(results_path):
+            logger.warning('Consistency check for "%s" (dump dated %s) already done, skipping check', rse, rsedate.strftime('%Y%m%d'))  # pylint: disable=no-member
+            return None
+
+        with stage(rse, 'download_rucio_dumps', timings):
+            rrdumps = []
+            for date in (rsedate - delta, rsedate + delta):
+                with cache_lock(cache_dir, 'replicafromhdfs_{0}_{1}'.format(rse, date.strftime('%d-%m-%Y'))):
+                    rrdumps.append(ReplicaFromHDFS.download(rse, date, cache_dir=cache_dir))
+        rrdump_prev, rrdump_next = rrdumps
+
+        with stage(rse, 'compare', timings):
+            results = Consistency.dump(
+                'consistency-manual',
+                rse,
+                rsedump,
+                rrdump_prev,
+                rrdump_next,
+                date=rsedate,
+                cache_dir=cache_dir,
+            )
+            mkdir(results_dir)
+            with temp_file(results_dir, results_path) as (output, _):
+                for result in results:
+                    output.write('{0}\n'.format(result.csv()))
 
     return results_path
 
 
+def order_by_dump_size(rses):
+    """
+    Order the RSEs by decreasing number of files, which is the size of their dumps, so that
+    the longest checks are started first and the load is balanced between the workers.
+
+    :param rses: List of RSE names.
+    :returns: The sorted list of RSE names.
+    """
+    logger = logging.getLogger('auditor')
+    sizes = {}
+    for rse in rses:
+        try:
+            usage = get_rse_usage(rse_id=get_rse_id(rse=rse), source='rucio')
+            sizes[rse] = usage[0]['files'] if usage else 0
+        except Exception:
+            logger.warning('Cannot get the usage of "%s"', rse, exc_info=True)
+            sizes[rse] = 0
+    return sorted(rses, key=lambda rse: sizes[rse], reverse=True)
+
+
 def guess_replica_info(path):
     """Try to extract the scope and name from a path.
 
@@ -216,12 +308,19 @@ def check(queue, retry, terminate, logpipe, cache_dir, results_dir, keep_dumps,
         except Queue.Empty:
             continue
         start = datetime.now()
+        timings = {}
         try:
             logger.debug('Checking "%s"', rse)
             output = consistency(rse, delta, configuration, cache_dir,
-                                 results_dir)
+                                 results_dir, timings=timings)
             if output:
-                process_output(output)
+                with stage(rse, 'process_output', timings):
+                    process_output(output)
+        except CacheLockBusy:
+            # The dumps are still in use by the other worker, keep them and check again later
+            logger.warning('Consistency check for "%s" already running, skipping check', rse)
+            retry.put((rse, attemps))
+            continue
         except:
             elapsed = (datetime.now() - start).total_seconds() / 60
             logger.error('Check of "%s" failed in %d minutes, %d remaining attemps', rse, elapsed, attemps, exc_info=True)
@@ -230,6 +329,7 @@ def check(queue, retry, terminate, logpipe, cache_dir, results_dir, keep_dumps,
             elapsed = (datetime.now() - start).total_seconds() / 60
             logger.info('SUCCESS checking "%s" in %d minutes', rse, elapsed)
             success = True
+        logger.info('Timings of the check of "%s": %s', rse, ', '.join('{0} {1:.1f}s'.format(name, duration) for name, duration in timings.items()))
 
         if not keep_dumps:
             remove = glob.glob(os.path.join(cache_dir, 'replicafromhdfs_{0}_*'.format(rse)))
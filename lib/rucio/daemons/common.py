@@ -29,6 +29,85 @@ from rucio.core.monitor import MetricManager
 METRICS = MetricManager(module=__name__)
 
 
+class _ProcessHeartbeats:
+    """
+    Renews the heartbeats of the threads of this process running the same executable
+    with a single bulk database call, and caches the resulting assignments until the
+    next renewal. Only the threads which checked in since the previous renewal are
+    renewed, so that a hung thread is not kept alive by the others.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, executable, hostname, pid):
+        self.executable = executable
+        self.hostname = hostname
+        self.pid = pid
+        self.lock = threading.Lock()
+        self.threads = {}
+        self.renewed_at = None
+
+    @classmethod
+    def get(cls, executable, hostname, pid):
+        """
+        Return the shared instance for the given executable in this process.
+        """
+        with cls._instances_lock:
+            instance = cls._instances.get((executable, hostname, pid))
+            if instance is None:
+                instance = cls._instances[(executable, hostname, pid)] = cls(executable, hostname, pid)
+            return instance
+
+    def live(self, thread, renewal_interval, older_than=None, force_renew=False, payload=None):
+        """
+        Return the heartbeat of the thread. If it is expired, renew it together with the
+        heartbeats of the other threads which checked in since the previous renewal.
+
+        :returns: Dictionary {assign_thread, nr_threads, hash_ranges}
+        """
+        with self.lock:
+            now = datetime.datetime.now()
+            entry = self.threads.setdefault(thread.ident, {'heartbeat': None, 'renewed_at': None})
+            entry['thread'] = thread
+            entry['last_seen'] = now
+
+            if force_renew \
+                    or not entry['heartbeat'] \
+                    or entry['renewed_at'] < now - datetime.timedelta(seconds=renewal_interval) \
+                    or entry.get('payload') != payload:
+                entry['payload'] = payload
+
+                # forget the threads which stopped asking for heartbeats
+                alive_since = now - datetime.timedelta(seconds=older_than or 600)
+                for thread_id in [thread_id for thread_id, other in self.threads.items() if other['last_seen'] < alive_since]:
+                    del self.threads[thread_id]
+
+                checked_in = {thread_id: other for thread_id, other in self.threads.items()
+                              if thread_id == thread.ident or not self.renewed_at or other['last_seen'] > self.renewed_at}
+                kwargs = {'older_than': older_than} if older_than else {}
+                heartbeats = heartbeat_core.live_bulk(self.executable, self.hostname, self.pid,
+                                                      threads=[other['thread'] for other in checked_in.values()],
+                                                      payloads={thread_id: other['payload'] for thread_id, other in checked_in.items()},
+                                                      with_hash_ranges=True,
+                                                      **kwargs)
+                for thread_id, other in checked_in.items():
+                    other['heartbeat'] = heartbeats[thread_id]
+                    other['renewed_at'] = now
+                self.renewed_at = now
+                METRICS.counter('heartbeat.renewals').inc()
+
+            return entry['heartbeat']
+
+    def die(self, thread):
+        """
+        Stop renewing the heartbeat of the thread and remove it.
+        """
+        with self.lock:
+            self.threads.pop(thread.ident, None)
+        heartbeat_core.die(self.executable, self.hostname, self.pid, thread)
+
+
 class HeartbeatHandler:
     """
     Simple contextmanager which sets a heartbeat and associated logger on entry and cleans up the heartbeat on exit.
@@ -38,7 +117,8 @@ class HeartbeatHandler:
         """
         :param executable: the executable name which will be set in heartbeats
         :param renewal_interval: the interval at which the heartbeat will be renewed in the database.
-        Calls to live() in-between intervals will re-use the locally cached heartbeat.
+        Calls to live() in-between intervals will re-use the locally cached heartbeat. The heartbeats
+        of all threads of the process running the same executable are renewed together.
         :param logger_prefix: the prefix to be prepended to all log messages
         """
         self.executable = executable
@@ -51,6 +131,8 @@ class HeartbeatHandler:
         self.hb_thread = threading.current_thread()
         self.logger_id = hashlib.sha1(f'{self.hostname}:{self.pid}:{self.hb_thread}'.encode('utf-8')).hexdigest()[:7]
 
+        self.process_heartbeats = _ProcessHeartbeats.get(self.executable, self.hostname, self.pid)
+
         self.logger = logging.log
         self.last_heart_beat = None
         self.last_time = None
@@ -63,7 +145,7 @@ class HeartbeatHandler:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.last_heart_beat:
-            heartbeat_core.die(self.executable, self.hostname, self.pid, self.hb_thread)
+            self.process_heartbeats.die(self.hb_thread)
             if self.logger:
                 self.logger(logging.INFO, 'Heartbeat cleaned up')
 
@@ -76,10 +158,8 @@ class HeartbeatHandler:
                 or not self.last_heart_beat \
                 or self.last_time < datetime.datetime.now() - datetime.timedelta(seconds=self.renewal_interval) \
                 or self.last_payload != payload:
-            if self.older_than:
-                self.last_heart_beat = heartbeat_core.live(self.executable, self.hostname, self.pid, self.hb_thread, payload=payload, older_than=self.older_than)
-            else:
-                self.last_heart_beat = heartbeat_core.live(self.executable, self.hostname, self.pid, self.hb_thread, payload=payload)
+            self.last_heart_beat = self.process_heartbeats.live(self.hb_thread, renewal_interval=self.renewal_interval, older_than=self.older_than,
+                                                                force_renew=force_renew, payload=payload)
 
             prefix = '%s[%s:%i/%i]: ' % (self.logger_prefix, self.logger_id, self.last_heart_beat['assign_thread'], self.last_heart_beat['nr_threads'])
             self.logger = formatted_logger(logging.log, prefix + '%s')
@@ -93,6 +173,14 @@ class HeartbeatHandler:
 
         return self.last_heart_beat['assign_thread'], self.last_heart_beat['nr_threads'], self.logger
 
+    @property
+    def hash_ranges(self):
+        """
+        :return: the (first, last) ranges of buckets of the consistent hashing ring assigned to the current worker,
+        to partition the work with filter_thread_work without reshuffling it when another worker restarts
+        """
+        return self.last_heart_beat['hash_ranges']
+
 
 def run_daemon(once, graceful_stop, executable, logger_prefix, partition_wait_time, sleep_time, run_once_fnc, activities=None):
     """
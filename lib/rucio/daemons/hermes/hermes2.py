@@ -22,6 +22,7 @@ import functools
 import datetime
 import json
 import logging
+import queue
 import random
 import re
 import smtplib
@@ -29,6 +30,8 @@ import socket
 import sys
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import TYPE_CHECKING
 from configparser import NoOptionError, NoSectionError
 from email.mime.text import MIMEText
@@ -50,7 +53,7 @@ from rucio.core.monitor import MetricManager
 from rucio.daemons.common import run_daemon
 
 if TYPE_CHECKING:
-    from typing import Callable, List, Dict
+    from typing import Callable, List, Dict, Optional
     from rucio.daemons.common import HeartbeatHandler
 
 logging.getLogger("requests").setLevel(logging.CRITICAL)
@@ -64,6 +67,24 @@ RECONNECT_COUNTER = METRICS.counter(
     labelnames=("host",),
 )
 
+# Pool of HTTP sessions, to reuse the connections to the ElasticSearch and InfluxDB endpoints
+HTTP_SESSIONS = queue.Queue()
+
+
+@contextmanager
+def http_session():
+    """
+    Borrow a HTTP session from the pool, or create a new one if none is available.
+    """
+    try:
+        session = HTTP_SESSIONS.get_nowait()
+    except queue.Empty:
+        session = requests.Session()
+    try:
+        yield session
+    finally:
+        HTTP_SESSIONS.put(session)
+
 
 def default(datetype):
     if isinstance(datetype, (datetime.date, datetime.datetime)):
@@ -352,27 +373,28 @@ def deliver_emails(messages: "List[Dict]", logger: "Callable") -> "List":
     return to_delete
 
 
-def submit_to_elastic(messages: "List[Dict]", endpoint: str, logger: "Callable") -> int:
+def submit_to_elastic(messages: "List[Dict]", endpoint: str, logger: "Callable", session: "Optional[requests.Session]" = None) -> int:
     """
     Aggregate a list of message to ElasticSearch
 
     :param messages:           The list of messages.
     :param endpoint:           The ES endpoint were to send the messages.
     :param logger:             The logger object.
+    :param session:            The HTTP session to use. If None, a new connection is opened.
 
     :returns:                  HTTP status code. 200 and 204 OK. Rest is failure.
     """
     text = ""
     for message in messages:
         text += '{ "index":{ } }\n%s\n' % json.dumps(message, default=default)
-    res = requests.post(
+    res = (session or requests).post(
         endpoint, data=text, headers={"Content-Type": "application/json"}
     )
     return res.status_code
 
 
 def aggregate_to_influx(
-    messages: "List[Dict]", bin_size: int, endpoint: str, logger: "Callable"
+    messages: "List[Dict]", bin_size: int, endpoint: str, logger: "Callable", session: "Optional[requests.Session]" = None
 ) -> int:
     """
     Aggregate a list of message using a certain bin_size
@@ -382,6 +404,7 @@ def aggregate_to_influx(
     :param bin_size:           The size of the bins for the aggreagation (e.g. 10m, 1h, etc.).
     :param endpoint:           The InfluxDB endpoint were to send the messages.
     :param logger:             The logger object.
+    :param session:            The HTTP session to use. If None, a new connection is opened.
 
     :returns:                  HTTP status code. 200 and 204 OK. Rest is failure.
     """
@@ -473,12 +496,258 @@ def aggregate_to_influx(
     if influx_token:
         headers = {"Authorization": "Token %s" % influx_token}
     if points:
-        res = requests.post(endpoint, headers=headers, data=points)
+        res = (session or requests).post(endpoint, headers=headers, data=points)
         logger(logging.DEBUG, "%s", str(res.text))
         return res.status_code
     return 204
 
 
+def deliver_to_influx(messages: "List[Dict]", endpoint: str, logger: "Callable") -> "List[Dict]":
+    """
+    Submit messages to InfluxDB. The submission is done in bulk, so either everything succeeds or fails.
+
+    :param messages:           The list of messages.
+    :param endpoint:           The InfluxDB endpoint were to send the messages.
+    :param logger:             The logger object.
+
+    :returns:                  List of the delivered messages
+    """
+    t_time = time.time()
+    logger(logging.DEBUG, "Will submit to influxDB")
+    with http_session() as session:
+        state = aggregate_to_influx(
+            messages=messages,
+            bin_size="1m",
+            endpoint=endpoint,
+            logger=logger,
+            session=session,
+        )
+    if state in [204, 200]:
+        logger(
+            logging.INFO,
+            "%s messages successfully submitted to influxDB in %s seconds",
+            len(messages),
+            time.time() - t_time,
+        )
+        return messages
+    logger(
+        logging.ERROR,
+        "Failure to submit %s messages to influxDB. Returned status: %s",
+        len(messages),
+        state,
+    )
+    return []
+
+
+def deliver_to_elastic(messages: "List[Dict]", endpoint: str, logger: "Callable") -> "List[Dict]":
+    """
+    Submit messages to ElasticSearch. The submission is done in bulk, so either everything succeeds or fails.
+
+    :param messages:           The list of messages.
+    :param endpoint:           The ES endpoint were to send the messages.
+    :param logger:             The logger object.
+
+    :returns:                  List of the delivered messages
+    """
+    t_time = time.time()
+    with http_session() as session:
+        state = submit_to_elastic(
+            messages=messages,
+            endpoint=endpoint,
+            logger=logger,
+            session=session,
+        )
+    if state in [200, 204]:
+        logger(
+            logging.INFO,
+            "%s messages successfully submitted to elastic in %s seconds",
+            len(messages),
+            time.time() - t_time,
+        )
+        return messages
+    logger(
+        logging.ERROR,
+        "Failure to submit %s messages to elastic. Returned status: %s",
+        len(messages),
+        state,
+    )
+    return []
+
+
+def deliver_to_email(messages: "List[Dict]", logger: "Callable") -> "List[Dict]":
+    """
+    Send messages by email.
+
+    :param messages:           The list of messages.
+    :param logger:             The logger object.
+
+    :returns:                  List of the delivered messages
+    """
+    t_time = time.time()
+    messages_sent = deliver_emails(messages=messages, logger=logger)
+    logger(
+        logging.INFO,
+        "%s messages successfully submitted by emails in %s seconds",
+        len(messages),
+        time.time() - t_time,
+    )
+    return [message for message in messages if message["id"] in messages_sent]
+
+
+def deliver_to_activemq_brokers(messages: "List[Dict]", logger: "Callable") -> "List[Dict]":
+    """
+    Set up the connections to the ActiveMQ brokers and deliver messages to them.
+
+    :param messages:           The list of messages.
+    :param logger:             The logger object.
+
+    :returns:                  List of the delivered messages
+    """
+    conns, destination, username, password, use_ssl = setup_activemq(logger)
+    if not conns:
+        logger(
+            logging.ERROR,
+            "ActiveMQ defined in the services list, cannot be setup",
+        )
+        return []
+    t_time = time.time()
+    messages_sent = deliver_to_activemq(
+        messages=messages,
+        conns=conns,
+        destination=destination,
+        username=username,
+        password=password,
+        use_ssl=use_ssl,
+        logger=logger,
+    )
+    logger(
+        logging.INFO,
+        "%s messages successfully submitted to ActiveMQ in %s seconds",
+        len(messages),
+        time.time() - t_time,
+    )
+    return [message for message in messages if message["id"] in messages_sent]
+
+
+class DeliveryPipeline:
+    """
+    Delivers the messages of each service with its own pool of workers, so that a slow service
+    does not delay the delivery to the other services. Each service has a bounded number of
+    batches of messages waiting for delivery. The messages being delivered are not submitted
+    again, and the delivered messages are returned to be deleted in bulk.
+    """
+
+    def __init__(self, max_workers: int = 1, max_pending_batches: int = 2):
+        """
+        :param max_workers:         The number of workers delivering the messages of each service.
+        :param max_pending_batches: The maximum number of batches of messages being delivered, or waiting to be delivered, for each service.
+        """
+        self.max_workers = max_workers
+        self.max_pending_batches = max_pending_batches
+        self._executors = {}
+        self._pending = {}
+        self._in_flight = set()
+
+    @property
+    def nb_in_flight(self) -> int:
+        """
+        The number of messages being delivered, or waiting to be delivered.
+        """
+        return len(self._in_flight)
+
+    def saturated_services(self) -> "List[str]":
+        """
+        :returns: The services which cannot accept another batch of messages.
+        """
+        return [service for service, pending in self._pending.items() if len(pending) >= self.max_pending_batches]
+
+    def in_flight(self, message: "Dict") -> bool:
+        """
+        :param message: The message.
+        :returns:       True if the message is being delivered, or waiting to be delivered.
+        """
+        return message["id"] in self._in_flight
+
+    def submit(self, service: str, deliver: "Callable", messages: "List[Dict]", logger: "Callable") -> bool:
+        """
+        Queue a batch of messages for delivery to a service.
+
+        :param service:  The name of the service.
+        :param deliver:  The function delivering a list of messages to the service, and returning the delivered messages.
+        :param messages: The list of messages.
+        :param logger:   The logger object.
+
+        :returns:        False if too many batches are already pending for the service, True otherwise.
+        """
+        pending = self._pending.setdefault(service, [])
+        if len(pending) >= self.max_pending_batches:
+            logger(logging.DEBUG, "Too many pending deliveries to %s, %s messages will be submitted later", service, len(messages))
+            return False
+        if service not in self._executors:
+            self._executors[service] = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending.append((self._executors[service].submit(deliver, messages=messages, logger=logger), messages))
+        self._in_flight.update(message["id"] for message in messages)
+        return True
+
+    def collect(self, logger: "Callable", wait: bool = False) -> "List[Dict]":
+        """
+        Collect the messages of the completed deliveries.
+
+        :param logger: The logger object.
+        :param wait:   If True, wait for all the pending deliveries to complete.
+
+        :returns:      List of the delivered messages.
+        """
+        delivered = []
+        for service, pending in self._pending.items():
+            still_pending = []
+            for future, messages in pending:
+                if not wait and not future.done():
+                    still_pending.append((future, messages))
+                    continue
+                try:
+                    delivered.extend(future.result())
+                except Exception as error:
+                    logger(logging.ERROR, "Error sending to %s : %s", service, str(error))
+                self._in_flight.difference_update(message["id"] for message in messages)
+            self._pending[service] = still_pending
+        return delivered
+
+    def close(self, logger: "Callable") -> "List[Dict]":
+        """
+        Wait for all the pending deliveries and stop the workers.
+
+        :param logger: The logger object.
+
+        :returns:      List of the delivered messages.
+        """
+        delivered = self.collect(logger, wait=True)
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        self._executors = {}
+        return delivered
+
+
+def delete_delivered_messages(messages: "List[Dict]", logger: "Callable") -> None:
+    """
+    Delete the delivered messages and archive them to the history.
+
+    :param messages:           The list of messages.
+    :param logger:             The logger object.
+    """
+    logger(logging.INFO, "Deleting %s messages", len(messages))
+    delete_messages(messages=[
+        {
+            "id": message["id"],
+            "created_at": message["created_at"],
+            "updated_at": message["created_at"],
+            "payload": str(message["payload"]),
+            "event_type": message["event_type"],
+        }
+        for message in messages
+    ])
+
+
 def hermes2(once: bool = False, bulk: int = 1000, sleep_time: int = 10) -> None:
     """
     Creates a Hermes2 Worker that can submit messages to different services (InfluXDB, ElasticSearch, ActiveMQ)
@@ -489,21 +758,29 @@ def hermes2(once: bool = False, bulk: int = 1000, sleep_time: int = 10) -> None:
     :param bulk:       The number of requests to process.
     :param sleep_time: Time between two cycles.
     """
-    run_daemon(
-        once=once,
-        graceful_stop=graceful_stop,
-        executable="hermes2",
-        logger_prefix="hermes2",
-        partition_wait_time=1,
-        sleep_time=sleep_time,
-        run_once_fnc=functools.partial(
-            run_once,
-            bulk=bulk,
-        ),
+    pipeline = DeliveryPipeline(
+        max_workers=config_get_int("hermes", "delivery_workers", raise_exception=False, default=1),
+        max_pending_batches=config_get_int("hermes", "max_pending_batches", raise_exception=False, default=2),
     )
+    try:
+        run_daemon(
+            once=once,
+            graceful_stop=graceful_stop,
+            executable="hermes2",
+            logger_prefix="hermes2",
+            partition_wait_time=1,
+            sleep_time=sleep_time,
+            run_once_fnc=functools.partial(
+                run_once,
+                bulk=bulk,
+                pipeline=pipeline,
+            ),
+        )
+    finally:
+        delete_delivered_messages(pipeline.close(logging.log), logging.log)
 
 
-def run_once(heartbeat_handler: "HeartbeatHandler", bulk: int, **_kwargs) -> bool:
+def run_once(heartbeat_handler: "HeartbeatHandler", bulk: int, pipeline: "Optional[DeliveryPipeline]" = None, **_kwargs) -> bool:
 
     worker_number, total_workers, logger = heartbeat_handler.live()
     try:
@@ -512,11 +789,13 @@ def run_once(heartbeat_handler: "HeartbeatHandler", bulk: int, **_kwargs) -> boo
         logger(logging.DEBUG, "No services found, exiting")
         sys.exit(1)
 
+    deliver = {}
     if "influx" in services_list:
-        influx_endpoint = None
         try:
             influx_endpoint = config_get("hermes", "influxdb_endpoint", False, None)
-            if not influx_endpoint:
+            if influx_endpoint:
+                deliver["influx"] = functools.partial(deliver_to_influx, endpoint=influx_endpoint)
+            else:
                 logger(
                     logging.ERROR,
                     "InfluxDB defined in the services list, but no endpoint can be found",
@@ -524,47 +803,51 @@ def run_once(heartbeat_handler: "HeartbeatHandler", bulk: int, **_kwargs) -> boo
         except Exception as err:
             logger(logging.ERROR, str(err))
     if "elastic" in services_list:
-        elastic_endpoint = None
         try:
             elastic_endpoint = config_get("hermes", "elastic_endpoint", False, None)
-            if not elastic_endpoint:
+            if elastic_endpoint:
+                deliver["elastic"] = functools.partial(deliver_to_elastic, endpoint=elastic_endpoint)
+            else:
                 logger(
                     logging.ERROR,
                     "Elastic defined in the services list, but no endpoint can be found",
                 )
         except Exception as err:
             logger(logging.ERROR, str(err))
-    conns = None
     if "activemq" in services_list:
-        try:
-            conns, destination, username, password, use_ssl = setup_activemq(logger)
-            if not conns:
-                logger(
-                    logging.ERROR,
-                    "ActiveMQ defined in the services list, cannot be setup",
-                )
-        except Exception as err:
-            logger(logging.ERROR, str(err))
+        deliver["activemq"] = deliver_to_activemq_brokers
+    deliver["email"] = deliver_to_email
+
+    close_pipeline = pipeline is None
+    if close_pipeline:
+        pipeline = DeliveryPipeline()
+
+    # Delete the messages delivered since the previous cycle, so that they are not retrieved again
+    to_delete = pipeline.collect(logger)
+    if to_delete:
+        delete_delivered_messages(to_delete, logger)
 
     worker_number, total_workers, logger = heartbeat_handler.live()
     message_dict = {}
-    message_ids = []
     start_time = time.time()
+    # The messages of the saturated services stay in the table, they must not starve the other services
     messages = retrieve_messages(
-        bulk=bulk,
+        bulk=bulk + pipeline.nb_in_flight,
         old_mode=False,
         thread=worker_number,
         total_threads=total_workers,
+        exclude_services=pipeline.saturated_services(),
+        # the messages being delivered must stay assigned to this worker when another worker restarts
+        hash_ranges=heartbeat_handler.hash_ranges,
     )
+    messages = [message for message in messages if not pipeline.in_flight(message)][:bulk]
 
-    to_delete = []
     if messages:
         for message in messages:
             service = message["services"]
             if service not in message_dict:
                 message_dict[service] = []
             message_dict[service].append(message)
-            message_ids.append(message["id"])
         logger(
             logging.DEBUG,
             "Retrieved %i messages retrieved in %s seconds",
@@ -572,118 +855,12 @@ def run_once(heartbeat_handler: "HeartbeatHandler", bulk: int, **_kwargs) -> boo
             time.time() - start_time,
         )
 
-        if "influx" in message_dict and influx_endpoint:
-            # For influxDB, bulk submission, either everything succeeds or fails
-            t_time = time.time()
-            logger(logging.DEBUG, "Will submit to influxDB")
-            try:
-                state = aggregate_to_influx(
-                    messages=message_dict["influx"],
-                    bin_size="1m",
-                    endpoint=influx_endpoint,
-                    logger=logger,
-                )
-                if state in [204, 200]:
-                    logger(
-                        logging.INFO,
-                        "%s messages successfully submitted to influxDB in %s seconds",
-                        len(message_dict["influx"]),
-                        time.time() - t_time,
-                    )
-                    for message in message_dict["influx"]:
-                        to_delete.append(message)
-                else:
-                    logger(
-                        logging.ERROR,
-                        "Failure to submit %s messages to influxDB. Returned status: %s",
-                        len(message_dict["influx"]),
-                        state,
-                    )
-            except Exception as error:
-                logger(logging.ERROR, "Error sending to InfluxDB : %s", str(error))
+        for service, service_messages in message_dict.items():
+            if service in deliver:
+                pipeline.submit(service, deliver[service], service_messages, logger)
 
-        if "elastic" in message_dict and elastic_endpoint:
-            # For elastic, bulk submission, either everything succeeds or fails
-            t_time = time.time()
-            try:
-                state = submit_to_elastic(
-                    messages=message_dict["elastic"],
-                    endpoint=elastic_endpoint,
-                    logger=logger,
-                )
-                if state in [200, 204]:
-                    logger(
-                        logging.INFO,
-                        "%s messages successfully submitted to elastic in %s seconds",
-                        len(message_dict["elastic"]),
-                        time.time() - t_time,
-                    )
-                    for message in message_dict["elastic"]:
-                        to_delete.append(message)
-                else:
-                    logger(
-                        logging.ERROR,
-                        "Failure to submit %s messages to elastic. Returned status: %s",
-                        len(message_dict["influx"]),
-                        state,
-                    )
-            except Exception as error:
-                logger(logging.ERROR, "Error sending to Elastic : %s", str(error))
-
-        if "email" in message_dict:
-            t_time = time.time()
-            try:
-                messages_sent = deliver_emails(
-                    messages=message_dict["email"], logger=logger
-                )
-                logger(
-                    logging.INFO,
-                    "%s messages successfully submitted by emails in %s seconds",
-                    len(message_dict["email"]),
-                    time.time() - t_time,
-                )
-                for message in message_dict["email"]:
-                    if message["id"] in messages_sent:
-                        to_delete.append(message)
-            except Exception as error:
-                logger(logging.ERROR, "Error sending email : %s", str(error))
-
-        if "activemq" in message_dict and conns:
-            t_time = time.time()
-            try:
-                messages_sent = deliver_to_activemq(
-                    messages=message_dict["activemq"],
-                    conns=conns,
-                    destination=destination,
-                    username=username,
-                    password=password,
-                    use_ssl=use_ssl,
-                    logger=logger,
-                )
-                logger(
-                    logging.INFO,
-                    "%s messages successfully submitted to ActiveMQ in %s seconds",
-                    len(message_dict["activemq"]),
-                    time.time() - t_time,
-                )
-                for message in message_dict["activemq"]:
-                    if message["id"] in messages_sent:
-                        to_delete.append(message)
-            except Exception as error:
-                logger(logging.ERROR, "Error sending to ActiveMQ : %s", str(error))
-
-    logger(logging.INFO, "Deleting %s messages", len(to_delete))
-    to_delete = [
-        {
-            "id": message["id"],
-            "created_at": message["created_at"],
-            "updated_at": message["created_at"],
-            "payload": str(message["payload"]),
-            "event_type": message["event_type"],
-        }
-        for message in to_delete
-    ]
-    delete_messages(messages=to_delete)
+    if close_pipeline:
+        delete_delivered_messages(pipeline.close(logger), logger)
     must_sleep = True
     return must_sleep
 
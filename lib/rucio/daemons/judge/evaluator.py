@@ -34,7 +34,7 @@ from rucio.common.exception import DatabaseException, DataIdentifierNotFound, Re
 from rucio.common.logging import setup_logging
 from rucio.common.types import InternalScope
 from rucio.core.monitor import MetricManager
-from rucio.core.rule import re_evaluate_did, get_updated_dids, delete_updated_did
+from rucio.core.rule import re_evaluate_did, get_updated_dids, delete_updated_dids
 from rucio.daemons.common import run_daemon
 
 METRICS = MetricManager(module=__name__)
@@ -87,38 +87,32 @@ def run_once(paused_dids, did_limit, heartbeat_handler, **_kwargs):
         logger(logging.DEBUG, 'did not get any work (paused_dids=%s)', str(len(paused_dids)))
         return
 
-    done_dids = {}
+    # Group the updated dids, so that each did is only evaluated once per action
+    grouped_dids = {}  # {(scope, name, rule_evaluation_action): [UpdatedDID]}
     for did in dids:
+        grouped_dids.setdefault((did.scope, did.name, did.rule_evaluation_action), []).append(did)
+
+    for (scope, name, rule_evaluation_action), updated_dids in grouped_dids.items():
         _, _, logger = heartbeat_handler.live()
         if graceful_stop.is_set():
             break
 
-        # Check if this did has already been operated on
-        did_tag = '%s:%s' % (did.scope.internal, did.name)
-        if did_tag in done_dids:
-            if did.rule_evaluation_action in done_dids[did_tag]:
-                logger(logging.DEBUG, 'evaluation of %s:%s already done', did.scope, did.name)
-                delete_updated_did(id_=did.id)
-                continue
-        else:
-            done_dids[did_tag] = []
-
         # Jump paused dids
-        if (did.scope.internal, did.name) in paused_dids:
+        if (scope.internal, name) in paused_dids:
             continue
 
+        updated_did_ids = [updated_did.id for updated_did in updated_dids]
         try:
             start_time = time.time()
-            re_evaluate_did(scope=did.scope, name=did.name, rule_evaluation_action=did.rule_evaluation_action)
-            logger(logging.DEBUG, 'evaluation of %s:%s took %f', did.scope, did.name, time.time() - start_time)
-            delete_updated_did(id_=did.id)
-            done_dids[did_tag].append(did.rule_evaluation_action)
+            re_evaluate_did(scope=scope, name=name, rule_evaluation_action=rule_evaluation_action)
+            logger(logging.DEBUG, 'evaluation of %s:%s took %f (%d updates)', scope, name, time.time() - start_time, len(updated_did_ids))
+            delete_updated_dids(ids=updated_did_ids)
         except DataIdentifierNotFound:
-            delete_updated_did(id_=did.id)
+            delete_updated_dids(ids=updated_did_ids)
         except (DatabaseException, DatabaseError) as e:
             if match('.*ORA-000(01|54).*', str(e.args[0])):
-                paused_dids[(did.scope.internal, did.name)] = datetime.utcnow() + timedelta(seconds=randint(60, 600))
-                logger(logging.WARNING, 'Locks detected for %s:%s', did.scope, did.name)
+                paused_dids[(scope.internal, name)] = datetime.utcnow() + timedelta(seconds=randint(60, 600))
+                logger(logging.WARNING, 'Locks detected for %s:%s', scope, name)
                 METRICS.counter('exceptions.{exception}').labels(exception='LocksDetected').inc()
             elif match('.*QueuePool.*', str(e.args[0])):
                 logger(logging.WARNING, traceback.format_exc())
@@ -131,10 +125,10 @@ def run_once(paused_dids, did_limit, heartbeat_handler, **_kwargs):
                 METRICS.counter('exceptions.{exception}').labels(exception=e.__class__.__name__).inc()
         except ReplicationRuleCreationTemporaryFailed as e:
             METRICS.counter('exceptions.{exception}').labels(exception=e.__class__.__name__).inc()
-            logger(logging.WARNING, 'Replica Creation temporary failed, retrying later for %s:%s', did.scope, did.name)
+            logger(logging.WARNING, 'Replica Creation temporary failed, retrying later for %s:%s', scope, name)
         except FlushError as e:
             METRICS.counter('exceptions.{exception}').labels(exception=e.__class__.__name__).inc()
-            logger(logging.WARNING, 'Flush error for %s:%s', did.scope, did.name)
+            logger(logging.WARNING, 'Flush error for %s:%s', scope, name)
 
 
 def stop(signum=None, frame=None):
@@ -24,9 +24,11 @@ import random
 import threading
 import time
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
 from configparser import NoOptionError, NoSectionError
 from datetime import datetime, timedelta
 from math import log2
+from queue import Queue
 from typing import TYPE_CHECKING
 
 from dogpile.cache.api import NO_VALUE
@@ -130,18 +132,118 @@ def get_rses_to_process(rses, include_rses, exclude_rses, vos):
     return rses
 
 
-def delete_from_storage(heartbeat_handler, hb_payload, replicas, prot, rse_info, is_staging, auto_exclude_threshold, logger=logging.log):
+def __delete_pfn(protocols, pfn):
+    """
+    Delete a PFN with one of the available connected protocols.
+
+    :param protocols:  Queue of the connected protocols, a protocol is used by a single deletion at a time.
+    :param pfn:        The PFN to delete.
+
+    :returns: A tuple with the duration of the deletion and the error raised by the protocol, if any.
+    """
+    prot = protocols.get()
+    stopwatch = Stopwatch()
+    try:
+        prot.delete(pfn)
+        return stopwatch.elapsed, None
+    except Exception as error:
+        return stopwatch.elapsed, error
+    finally:
+        protocols.put(prot)
+
+
+def __handle_deletion_result(replica, deletion_dict, duration, error, rse_name, scheme, deleted_files, logger=logging.log):
+    """
+    Report the result of the deletion of a replica from the storage.
+
+    :param replica:        The replica.
+    :param deletion_dict:  The payload of the deletion message.
+    :param duration:       The duration of the deletion.
+    :param error:          The error raised by the deletion, if any.
+    :param rse_name:       The name of the RSE.
+    :param scheme:         The scheme of the protocol used for the deletion.
+    :param deleted_files:  The list of the replicas which can be removed from the catalog, the replica is appended to it if it is gone from the storage.
+    :param logger:         Optional decorated logger that can be passed from the calling daemons or servers.
+
+    :returns: True if the storage could not be accessed.
+    """
+    if error is None:
+        METRICS.timer('delete.{scheme}.{rse}').labels(scheme=scheme, rse=rse_name).observe(duration)
+
+        deleted_files.append({'scope': replica['scope'], 'name': replica['name']})
+
+        deletion_dict['duration'] = duration
+        add_message('deletion-done', deletion_dict)
+        logger(logging.INFO, 'Deletion SUCCESS of %s:%s as %s on %s in %.2f seconds', replica['scope'], replica['name'], replica['pfn'], rse_name, duration)
+
+    elif isinstance(error, SourceNotFound):
+        err_msg = 'Deletion NOTFOUND of %s:%s as %s on %s in %.2f seconds' % (replica['scope'], replica['name'], replica['pfn'], rse_name, duration)
+        logger(logging.WARNING, '%s', err_msg)
+        deletion_dict['reason'] = 'File Not Found'
+        deletion_dict['duration'] = duration
+        add_message('deletion-not-found', deletion_dict)
+        deleted_files.append({'scope': replica['scope'], 'name': replica['name']})
+
+    elif isinstance(error, (ServiceUnavailable, RSEAccessDenied, ResourceTemporaryUnavailable)):
+        logger(logging.WARNING, 'Deletion NOACCESS of %s:%s as %s on %s: %s in %.2f', replica['scope'], replica['name'], replica['pfn'], rse_name, str(error), duration)
+        deletion_dict['reason'] = str(error)
+        deletion_dict['duration'] = duration
+        add_message('deletion-failed', deletion_dict)
+        return True
+
+    else:
+        logger(logging.CRITICAL, 'Deletion CRITICAL of %s:%s as %s on %s in %.2f seconds : %s', replica['scope'], replica['name'], replica['pfn'], rse_name, duration,
+               ''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+        deletion_dict['reason'] = str(error)
+        deletion_dict['duration'] = duration
+        add_message('deletion-failed', deletion_dict)
+    return False
+
+
+def delete_from_storage(heartbeat_handler, hb_payload, replicas, prot, rse_info, is_staging, auto_exclude_threshold, logger=logging.log,
+                        protocol_factory=None, max_concurrent_deletions=1):
+    """
+    Delete the replicas from the storage. Up to max_concurrent_deletions PFNs are deleted at the same time,
+    each with its own connected protocol, while the results are handled in the order of the replicas.
+
+    :param heartbeat_handler:         The heartbeat handler of the reaper worker.
+    :param hb_payload:                The heartbeat payload of the reaper worker.
+    :param replicas:                  The replicas to delete, with their PFN.
+    :param prot:                      The protocol used for the deletion.
+    :param rse_info:                  The RSE settings.
+    :param is_staging:                True if the RSE is a staging area. The replicas are then not deleted from the storage.
+    :param auto_exclude_threshold:    Number of storage failures after which the RSE is temporarily excluded.
+    :param logger:                    Optional decorated logger that can be passed from the calling daemons or servers.
+    :param protocol_factory:          Callable returning a new protocol for the RSE, used for the additional concurrent deletions.
+    :param max_concurrent_deletions:  Maximum number of concurrent deletions on the storage.
+
+    :returns: The list of the replicas which can be removed from the catalog.
+    """
     deleted_files = []
     rse_name = rse_info['rse']
     rse_id = rse_info['id']
     noaccess_attempts = 0
     pfns_to_bulk_delete = []
+    protocols = Queue()
+    connected_protocols = []
+    deletions = []
+    executor = None
     try:
         prot.connect()
+        protocols.put(prot)
+        if protocol_factory is not None and not is_staging and prot.attributes['scheme'] != 'globus':
+            for _ in range(1, min(max_concurrent_deletions, len(replicas))):
+                try:
+                    extra_prot = protocol_factory()
+                    extra_prot.connect()
+                except Exception as error:
+                    logger(logging.WARNING, 'Cannot open an additional connection to %s, continuing with %d: %s', rse_name, protocols.qsize(), str(error))
+                    break
+                connected_protocols.append(extra_prot)
+                protocols.put(extra_prot)
+        executor = ThreadPoolExecutor(max_workers=protocols.qsize())
+
         for replica in replicas:
-            # Physical deletion
-            _, _, logger = heartbeat_handler.live(payload=hb_payload)
-            stopwatch = Stopwatch()
             deletion_dict = {'scope': replica['scope'].external,
                              'name': replica['name'],
                              'rse': rse_name,
@@ -150,17 +252,13 @@ def delete_from_storage(heartbeat_handler, hb_payload, replicas, prot, rse_info,
                              'url': replica['pfn'],
                              'protocol': prot.attributes['scheme'],
                              'datatype': replica['datatype']}
+            if replica['scope'].vo != 'def':
+                deletion_dict['vo'] = replica['scope'].vo
+            logger(logging.DEBUG, 'Deletion ATTEMPT of %s:%s as %s on %s', replica['scope'], replica['name'], replica['pfn'], rse_name)
+            future = None
             try:
-                if replica['scope'].vo != 'def':
-                    deletion_dict['vo'] = replica['scope'].vo
-                logger(logging.DEBUG, 'Deletion ATTEMPT of %s:%s as %s on %s', replica['scope'], replica['name'], replica['pfn'], rse_name)
                 # For STAGING RSEs, no physical deletion
-                if is_staging:
-                    logger(logging.WARNING, 'Deletion STAGING of %s:%s as %s on %s, will only delete the catalog and not do physical deletion', replica['scope'], replica['name'], replica['pfn'], rse_name)
-                    deleted_files.append({'scope': replica['scope'], 'name': replica['name']})
-                    continue
-
-                if replica['pfn']:
+                if not is_staging and replica['pfn']:
                     pfn = replica['pfn']
                     # sign the URL if necessary
                     if prot.attributes['scheme'] == 'https' and rse_info['sign_url'] is not None:
@@ -168,34 +266,30 @@ def delete_from_storage(heartbeat_handler, hb_payload, replicas, prot, rse_info,
                     if prot.attributes['scheme'] == 'globus':
                         pfns_to_bulk_delete.append(replica['pfn'])
                     else:
-                        prot.delete(pfn)
-                else:
-                    logger(logging.WARNING, 'Deletion UNAVAILABLE of %s:%s as %s on %s', replica['scope'], replica['name'], replica['pfn'], rse_name)
-
-                duration = stopwatch.elapsed
-                METRICS.timer('delete.{scheme}.{rse}').labels(scheme=prot.attributes['scheme'], rse=rse_name).observe(duration)
+                        future = executor.submit(__delete_pfn, protocols, pfn)
+            except Exception as error:
+                future = error
+            deletions.append((replica, deletion_dict, future))
 
+        pending_deletions = []
+        for index, (replica, deletion_dict, future) in enumerate(deletions):
+            # Physical deletion
+            _, _, logger = heartbeat_handler.live(payload=hb_payload)
+            if is_staging:
+                logger(logging.WARNING, 'Deletion STAGING of %s:%s as %s on %s, will only delete the catalog and not do physical deletion', replica['scope'], replica['name'], replica['pfn'], rse_name)
                 deleted_files.append({'scope': replica['scope'], 'name': replica['name']})
+                continue
 
-                deletion_dict['duration'] = duration
-                add_message('deletion-done', deletion_dict)
-                logger(logging.INFO, 'Deletion SUCCESS of %s:%s as %s on %s in %.2f seconds', replica['scope'], replica['name'], replica['pfn'], rse_name, duration)
-
-            except SourceNotFound:
-                duration = stopwatch.elapsed
-                err_msg = 'Deletion NOTFOUND of %s:%s as %s on %s in %.2f seconds' % (replica['scope'], replica['name'], replica['pfn'], rse_name, duration)
-                logger(logging.WARNING, '%s', err_msg)
-                deletion_dict['reason'] = 'File Not Found'
-                deletion_dict['duration'] = duration
-                add_message('deletion-not-found', deletion_dict)
-                deleted_files.append({'scope': replica['scope'], 'name': replica['name']})
+            if isinstance(future, Exception):
+                duration, error = 0, future
+            elif future is not None:
+                duration, error = future.result()
+            else:
+                duration, error = 0, None
+                if not replica['pfn']:
+                    logger(logging.WARNING, 'Deletion UNAVAILABLE of %s:%s as %s on %s', replica['scope'], replica['name'], replica['pfn'], rse_name)
 
-            except (ServiceUnavailable, RSEAccessDenied, ResourceTemporaryUnavailable) as error:
-                duration = stopwatch.elapsed
-                logger(logging.WARNING, 'Deletion NOACCESS of %s:%s as %s on %s: %s in %.2f', replica['scope'], replica['name'], replica['pfn'], rse_name, str(error), duration)
-                deletion_dict['reason'] = str(error)
-                deletion_dict['duration'] = duration
-                add_message('deletion-failed', deletion_dict)
+            if __handle_deletion_result(replica, deletion_dict, duration, error, rse_name, prot.attributes['scheme'], deleted_files, logger=logger):
                 noaccess_attempts += 1
                 if noaccess_attempts >= auto_exclude_threshold:
                     logger(logging.INFO, 'Too many (%d) NOACCESS attempts for %s. RSE will be temporarly excluded.', noaccess_attempts, rse_name)
@@ -203,14 +297,20 @@ def delete_from_storage(heartbeat_handler, hb_payload, replicas, prot, rse_info,
                     METRICS.gauge('excluded_rses.{rse}').labels(rse=rse_name).set(1)
 
                     EXCLUDED_RSE_GAUGE.labels(rse=rse_name).set(1)
+                    pending_deletions = deletions[index + 1:]
                     break
 
-            except Exception as error:
-                duration = stopwatch.elapsed
-                logger(logging.CRITICAL, 'Deletion CRITICAL of %s:%s as %s on %s in %.2f seconds : %s', replica['scope'], replica['name'], replica['pfn'], rse_name, duration, str(traceback.format_exc()))
-                deletion_dict['reason'] = str(error)
-                deletion_dict['duration'] = duration
-                add_message('deletion-failed', deletion_dict)
+        if pending_deletions:
+            # Do not start the remaining deletions, but still handle the ones which were running
+            # when the RSE got excluded, their replicas may already be gone from the storage
+            for _, _, future in pending_deletions:
+                if isinstance(future, Future):
+                    future.cancel()
+            executor.shutdown(wait=True)
+            for replica, deletion_dict, future in pending_deletions:
+                if isinstance(future, Future) and not future.cancelled():
+                    duration, error = future.result()
+                    __handle_deletion_result(replica, deletion_dict, duration, error, rse_name, prot.attributes['scheme'], deleted_files, logger=logger)
 
         if pfns_to_bulk_delete and prot.attributes['scheme'] == 'globus':
             logger(logging.DEBUG, 'Attempting bulk delete on RSE %s for scheme %s', rse_name, prot.attributes['scheme'])
@@ -234,6 +334,13 @@ def delete_from_storage(heartbeat_handler, hb_payload, replicas, prot, rse_info,
         REGION.set('temporary_exclude_%s' % rse_id, True)
         EXCLUDED_RSE_GAUGE.labels(rse=rse_name).set(1)
     finally:
+        if executor is not None:
+            for _, _, future in deletions:
+                if future is not None and not isinstance(future, Exception):
+                    future.cancel()
+            executor.shutdown(wait=True)
+        for extra_prot in connected_protocols:
+            extra_prot.close()
         prot.close()
     return deleted_files
 
@@ -249,6 +356,38 @@ def _rse_deletion_hostname(rse: RseData) -> "Optional[str]":
     return None
 
 
+def __set_pfns(replicas, prot, rse: RseData, logger: "Callable[..., Any]" = logging.log):
+    """
+    Set the PFN of each replica, translating the whole chunk with a single call to the protocol.
+    If the chunk cannot be translated at once, the PFNs are computed one replica at a time.
+
+    :param replicas:  The list of replicas of the RSE.
+    :param prot:      The protocol used for the deletion.
+    :param rse:       The RSE of the replicas.
+    :param logger:    Optional decorated logger that can be passed from the calling daemons or servers.
+    """
+    try:
+        pfns = prot.lfns2pfns([{'scope': replica['scope'].external, 'name': replica['name'], 'path': replica['path']} for replica in replicas])
+    except Exception:
+        pfns = None
+    if pfns is not None:
+        for replica in replicas:
+            pfn = pfns.get('%s:%s' % (replica['scope'].external, replica['name']))
+            if pfn is None:
+                logger(logging.WARNING, 'Failed get pfn of replica %s:%s on %s', replica['scope'], replica['name'], rse.name)
+            replica['pfn'] = str(pfn) if pfn is not None else None
+        return
+
+    for replica in replicas:
+        try:
+            replica['pfn'] = str(list(prot.lfns2pfns({'scope': replica['scope'].external, 'name': replica['name'], 'path': replica['path']}).values())[0])
+        except (ReplicaUnAvailable, ReplicaNotFound) as error:
+            logger(logging.WARNING, 'Failed get pfn UNAVAILABLE replica %s:%s on %s with error %s', replica['scope'], replica['name'], rse.name, str(error))
+            replica['pfn'] = None
+        except Exception:
+            logger(logging.CRITICAL, 'Exception', exc_info=True)
+
+
 def get_max_deletion_threads_by_hostname(hostname):
     """
     Internal method to check RSE usage and limits.
@@ -271,6 +410,46 @@ def get_max_deletion_threads_by_hostname(hostname):
     return result
 
 
+def get_max_concurrent_deletions_by_hostname(hostname):
+    """
+    Internal method to get the number of concurrent deletions a reaper worker runs on a SE.
+
+    :param hostname: the hostname of the SE
+
+    :returns: The maximum number of concurrent deletions on the SE.
+    """
+    result = REGION.get('max_concurrent_deletions_%s' % hostname)
+    if result is NO_VALUE:
+        try:
+            max_concurrent_deletions = config_get('reaper', 'max_concurrent_deletions_%s' % hostname)
+        except (NoOptionError, NoSectionError, RuntimeError):
+            try:
+                max_concurrent_deletions = config_get('reaper', 'max_concurrent_deletions')
+            except (NoOptionError, NoSectionError, RuntimeError):
+                max_concurrent_deletions = 1
+        REGION.set('max_concurrent_deletions_%s' % hostname, max_concurrent_deletions)
+        result = max_concurrent_deletions
+    return int(result)
+
+
+def __delete_replicas_from_catalog(rse: RseData, files, logger: "Callable[..., Any]" = logging.log):
+    """
+    Delete the replicas removed from the storage from the catalog.
+
+    :param rse:     The RSE of the replicas.
+    :param files:   The list of replicas to delete.
+    :param logger:  Optional decorated logger that can be passed from the calling daemons or servers.
+    """
+    del_start = time.time()
+    try:
+        delete_replicas(rse_id=rse.id, files=files)
+    except Exception:
+        logger(logging.CRITICAL, 'Exception', exc_info=True)
+        return
+    logger(logging.DEBUG, 'delete_replicas successed on %s : %s replicas in %s seconds', rse.name, len(files), time.time() - del_start)
+    METRICS.counter('deletion.done').inc(len(files))
+
+
 def __try_reserve_worker_slot(heartbeat_handler: "HeartbeatHandler", rse: RseData, hostname: str, logger: "Callable[..., Any]") -> "Optional[str]":
     """
     The maximum number of concurrent workers is limited per hostname and per RSE due to storage performance reasons.
@@ -540,6 +719,9 @@ def _run_once(rses_to_process, chunk_size, greedy, scheme,
 
     work_remaining_by_rse = {}
     paused_rses = []
+    # The catalog is updated in the background, at most one batch at a time
+    catalog_executor = ThreadPoolExecutor(max_workers=1)
+    catalog_update = None
     for rse, needed_free_space, only_delete_obsolete, enable_greedy in rses_with_params:
         result = REGION.get('pause_deletion_%s' % rse.id, expiration_time=120)
         if result is not NO_VALUE:
@@ -616,33 +798,26 @@ def _run_once(rses_to_process, chunk_size, greedy, scheme,
                     auth_token = token_dict['token']
                     logger(logging.DEBUG, 'OIDC authentication used for deletion.')
             prot = rsemgr.create_protocol(rse.info, 'delete', scheme=scheme, auth_token=auth_token, logger=logger)
+            protocol_factory = functools.partial(rsemgr.create_protocol, rse.info, 'delete', scheme=scheme, auth_token=auth_token, logger=logger)
+            max_concurrent_deletions = get_max_concurrent_deletions_by_hostname(rse_hostname)
             for file_replicas in chunks(replicas, chunk_size):
                 # Refresh heartbeat
                 _, total_workers, logger = heartbeat_handler.live(payload=hb_payload)
                 del_start_time = time.time()
-                for replica in file_replicas:
-                    try:
-                        replica['pfn'] = str(list(rsemgr.lfns2pfns(rse_settings=rse.info,
-                                                                   lfns=[{'scope': replica['scope'].external, 'name': replica['name'], 'path': replica['path']}],
-                                                                   operation='delete', scheme=scheme).values())[0])
-                    except (ReplicaUnAvailable, ReplicaNotFound) as error:
-                        logger(logging.WARNING, 'Failed get pfn UNAVAILABLE replica %s:%s on %s with error %s', replica['scope'], replica['name'], rse.name, str(error))
-                        replica['pfn'] = None
-
-                    except Exception:
-                        logger(logging.CRITICAL, 'Exception', exc_info=True)
+                __set_pfns(file_replicas, prot, rse, logger=logger)
 
                 is_staging = rse.columns['staging_area']
-                deleted_files = delete_from_storage(heartbeat_handler, hb_payload, file_replicas, prot, rse.info, is_staging, auto_exclude_threshold, logger=logger)
+                deleted_files = delete_from_storage(heartbeat_handler, hb_payload, file_replicas, prot, rse.info, is_staging, auto_exclude_threshold, logger=logger,
+                                                    protocol_factory=protocol_factory, max_concurrent_deletions=max_concurrent_deletions)
                 logger(logging.INFO, '%i files processed in %s seconds', len(file_replicas), time.time() - del_start_time)
 
-                # Then finally delete the replicas
-                del_start = time.time()
-                delete_replicas(rse_id=rse.id, files=deleted_files)
-                logger(logging.DEBUG, 'delete_replicas successed on %s : %s replicas in %s seconds', rse.name, len(deleted_files), time.time() - del_start)
-                METRICS.counter('deletion.done').inc(len(deleted_files))
+                # Then finally delete the replicas, while the next files are deleted from the storage
+                if catalog_update is not None:
+                    catalog_update.result()
+                catalog_update = catalog_executor.submit(__delete_replicas_from_catalog, rse, deleted_files, logger=logger)
         except Exception:
             logger(logging.CRITICAL, 'Exception', exc_info=True)
+    catalog_executor.shutdown(wait=True)
 
     if paused_rses:
         logger(logging.INFO, 'Deletion paused for a while for following RSEs: %s', ', '.join(paused_rses))
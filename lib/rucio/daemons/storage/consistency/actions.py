@@ -24,6 +24,7 @@ import logging
 import os
 import re
 import socket
+import tempfile
 import time
 import threading
 import traceback
@@ -31,6 +32,7 @@ import traceback
 from datetime import datetime
 
 from rucio.common import exception
+from rucio.common.external_sort import DEFAULT_CHUNK_SIZE, external_sort, intersect, read_lines
 from rucio.common.logging import formatted_logger, setup_logging
 from rucio.common.types import InternalAccount, InternalScope
 from rucio.common.utils import daemon_sleep
@@ -163,35 +165,41 @@ def write_stats(my_stats, stats_file, stats_key=None):
 # TODO: Consider breaking the logic into two functions, following discussion in https://github.com/rucio/rucio/pull/5120#discussion_r792673599
 
 
-def cmp2dark(new_list, old_list, comm_list, stats_file):
+def cmp2dark(new_list, old_list, comm_list, stats_file, chunk_size=DEFAULT_CHUNK_SIZE, processes=1, compress=False):
 
     t0 = time.time()
     stats_key = "cmp2dark"
     my_stats = stats = None
 
-    with open(new_list, "r") as a_list, open(old_list, "r") as b_list,\
-         open(comm_list, "w") as out_list:
-
-        if stats_file is not None:
-            stats = Stats(stats_file)
-            my_stats = {
-                "elapsed": None,
-                "start_time": t0,
-                "end_time": None,
-                "new_list": new_list,
-                "old_list": old_list,
-                "out_list": out_list.name,
-                "status": "started"
-            }
-            stats[stats_key] = my_stats
-
-        a_set = set(line.strip() for line in a_list)
-        b_set = set(line.strip() for line in b_list)
-
+    if stats_file is not None:
+        stats = Stats(stats_file)
+        my_stats = {
+            "elapsed": None,
+            "start_time": t0,
+            "end_time": None,
+            "new_list": new_list,
+            "old_list": old_list,
+            "out_list": comm_list,
+            "status": "started"
+        }
+        stats[stats_key] = my_stats
 
-# The intersection of the two sets is what can be deleted
-        out_set = a_set & b_set
-        out_list.writelines("\n".join(sorted(list(out_set))))
+# Both lists are sorted on disk, so that the memory usage does not depend on their size
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(comm_list))) as tmp_dir:
+        sort_stats = {}
+        for name, path in (("new_list", new_list), ("old_list", old_list)):
+            with open(os.path.join(tmp_dir, name), "wb") as sorted_list:
+                sort_stats[name] = external_sort((line for line in read_lines(path, strip=True) if line),
+                                                 sorted_list, unique=True, chunk_size=chunk_size,
+                                                 processes=processes, compress=compress, tmp_dir=tmp_dir)
+
+# The intersection of the two lists is what can be deleted
+        common = 0
+        with open(comm_list, "wb") as out_list:
+            for path in intersect(read_lines(os.path.join(tmp_dir, "new_list")),
+                                  read_lines(os.path.join(tmp_dir, "old_list"))):
+                out_list.write(b"\n" + path if common else path)
+                common += 1
 
     t1 = time.time()
 
@@ -199,6 +207,10 @@ def cmp2dark(new_list, old_list, comm_list, stats_file):
         my_stats.update({
             "elapsed": t1 - t0,
             "end_time": t1,
+            "new_list_entries": sort_stats["new_list"]["sorted_lines"],
+            "old_list_entries": sort_stats["old_list"]["sorted_lines"],
+            "sort_runs": sort_stats["new_list"]["runs"] + sort_stats["old_list"]["runs"],
+            "common_entries": common,
             "status": "done"
         })
         stats[stats_key] = my_stats
@@ -23,7 +23,7 @@ from configparser import NoOptionError, NoSectionError
 from datetime import datetime
 import functools
 from json import loads as jloads, dumps as jdumps
-from threading import Event, Thread
+from threading import Event, Lock, Thread
 from time import time
 from typing import Dict
 
@@ -35,10 +35,11 @@ from rucio.common.logging import setup_logging
 from rucio.common.stomp_utils import get_stomp_brokers
 from rucio.common.stopwatch import Stopwatch
 from rucio.common.types import InternalAccount, InternalScope
+from rucio.common.utils import chunks
 from rucio.core.did import touch_dids, list_parent_dids
 from rucio.core.lock import touch_dataset_locks
 from rucio.core.monitor import MetricManager
-from rucio.core.replica import touch_replica, touch_collection_replicas, declare_bad_file_replicas
+from rucio.core.replica import touch_replica, touch_replicas, touch_collection_replicas, declare_bad_file_replicas
 from rucio.core.rse import get_rse_id
 from rucio.db.sqla.constants import DIDType, BadFilesStatus
 
@@ -51,10 +52,61 @@ METRICS = MetricManager(module=__name__)
 graceful_stop = Event()
 
 
+class TraceAggregator(object):
+    """
+    Aggregates the replica accesses and the suspicious files reported by the traces in memory,
+    keeping only the latest access of each replica, until they are flushed to the database.
+    """
+
+    def __init__(self, max_replicas=10000):
+        self.max_replicas = max_replicas
+        self.replicas = {}
+        self.suspicious = {}
+        self.nb_traces = 0
+        self.nb_suspicious = 0
+
+    def __len__(self):
+        return len(self.replicas) + self.nb_suspicious
+
+    def is_full(self):
+        return len(self) >= self.max_replicas
+
+    def add_replica(self, scope, name, rse, rse_id, accessed_at, trace_time, event_version=None):
+        """
+        Add a replica access, only the latest access of a replica is kept.
+        """
+        self.nb_traces += 1
+        key = (scope, name, rse_id)
+        replica = self.replicas.get(key)
+        if replica is None or replica['accessed_at'] < accessed_at:
+            self.replicas[key] = {'scope': scope, 'name': name, 'rse': rse, 'rse_id': rse_id, 'accessed_at': accessed_at,
+                                  'traceTimeentryUnix': trace_time, 'eventVersion': event_version}
+
+    def add_suspicious(self, surl, reason, vo):
+        """
+        Add a suspicious file, grouped with the other files to declare at once.
+        """
+        surls = self.suspicious.setdefault((vo, reason, surl.split(':')[0]), set())
+        if surl not in surls:
+            surls.add(surl)
+            self.nb_suspicious += 1
+
+    def pop(self):
+        """
+        Return the aggregated replicas and suspicious files and reset the aggregator.
+
+        :returns: The tuple (number of traces, list of replicas, {(vo, reason, scheme): set of surls}).
+        """
+        result = self.nb_traces, list(self.replicas.values()), self.suspicious
+        self.replicas, self.suspicious, self.nb_traces, self.nb_suspicious = {}, {}, 0, 0
+        return result
+
+
 class AMQConsumer(object):
     """ActiveMQ message consumer"""
 
-    def __init__(self, broker, conn, queue, chunksize, subscription_id, excluded_usrdns, dataset_queue, bad_files_patterns, logger=logging.log):
+    def __init__(self, broker, conn, queue, chunksize, subscription_id, excluded_usrdns, dataset_queue, bad_files_patterns, logger=logging.log,
+                 flush_interval=0, max_pending_replicas=10000):
         self.__broker = broker
         self.__conn = conn
         self.__queue = queue
@@ -69,6 +121,10 @@ class AMQConsumer(object):
         self.__dataset_queue = dataset_queue
         self.__bad_files_patterns = bad_files_patterns
         self.__logger = logger
+        self.__flush_interval = flush_interval
+        self.__aggregator = TraceAggregator(max_replicas=max_pending_replicas)
+        self.__last_flush = time()
+        self.__lock = Lock()
 
     @METRICS.count_it
     def on_heartbeat_timeout(self):
@@ -111,19 +167,36 @@ class AMQConsumer(object):
             pass
 
         if len(self.__ids) >= self.__chunksize:
-            self.__update_atime()
-            for msg_id in self.__ids:
-                self.__conn.ack(msg_id, self.__subscription_id)
+            with self.__lock:
+                self.__aggregate_reports()
+                # The traces are acknowledged once aggregated, the accesses of the replicas
+                # which cannot be updated later on are resubmitted to the queue
+                for msg_id in self.__ids:
+                    self.__conn.ack(msg_id, self.__subscription_id)
 
-            self.__reports = []
-            self.__ids = []
+                self.__reports = []
+                self.__ids = []
 
-    def __update_atime(self):
+                if self.__aggregator.is_full() or time() - self.__last_flush >= self.__flush_interval:
+                    self.__update_atime()
+
+    def flush(self, force=False):
         """
-        Bulk update atime.
+        Update the aggregated accesses if the flush interval has elapsed.
+
+        :param force: If True, the accesses are updated regardless of the flush interval.
+        """
+        with self.__lock:
+            if force or time() - self.__last_flush >= self.__flush_interval:
+                self.__update_atime()
+
+    def __match_bad_files_patterns(self, state_reason):
+        return any(pattern.match(state_reason) for pattern in self.__bad_files_patterns)
+
+    def __aggregate_reports(self):
+        """
+        Aggregate the received reports.
         """
-        replicas = []
-        rses = []
         for report in self.__reports:
             if 'vo' not in report:
                 report['vo'] = 'def'
@@ -132,18 +205,12 @@ class AMQConsumer(object):
                 # Identify suspicious files
                 try:
                     if self.__bad_files_patterns and report['eventType'] in ['get_sm', 'get_sm_a', 'get'] and 'clientState' in report and report['clientState'] not in ['DONE', 'FOUND_ROOT', 'ALREADY_DONE']:
-                        for pattern in self.__bad_files_patterns:
-                            if 'stateReason' in report and report['stateReason'] and isinstance(report['stateReason'], str) and pattern.match(report['stateReason']):
-                                reason = report['stateReason'][:255]
-                                if 'url' not in report or not report['url']:
-                                    self.__logger(logging.ERROR, 'Missing url in the following trace : ' + str(report))
-                                else:
-                                    try:
-                                        surl = report['url']
-                                        declare_bad_file_replicas([surl, ], reason=reason, issuer=InternalAccount('root', vo=report['vo']), status=BadFilesStatus.SUSPICIOUS)
-                                        self.__logger(logging.INFO, 'Declare suspicious file %s with reason %s' % (report['url'], reason))
-                                    except Exception as error:
-                                        self.__logger(logging.ERROR, 'Failed to declare suspicious file' + str(error))
+                        state_reason = report.get('stateReason')
+                        if state_reason and isinstance(state_reason, str) and self.__match_bad_files_patterns(state_reason):
+                            if 'url' not in report or not report['url']:
+                                self.__logger(logging.ERROR, 'Missing url in the following trace : ' + str(report))
+                            else:
+                                self.__aggregator.add_suspicious(report['url'], state_reason[:255], report['vo'])
                 except Exception as error:
                     self.__logger(logging.ERROR, 'Problem with bad trace : %s . Error %s' % (str(report), str(error)))
 
@@ -203,16 +270,16 @@ class AMQConsumer(object):
                         if 'name' in report:
                             report['filename'] = report['name']
 
-                    rses = report['remoteSite'].strip().split(',')
-                    for rse in rses:
+                    accessed_at = datetime.utcfromtimestamp(report['traceTimeentryUnix'])
+                    for rse in report['remoteSite'].strip().split(','):
                         try:
                             rse_id = get_rse_id(rse=rse, vo=report['vo'])
                         except RSENotFound:
                             self.__logger(logging.WARNING, "Cannot lookup rse_id for %s. Will skip this report.", rse)
                             METRICS.counter('rse_not_found').inc()
                             continue
-                        replicas.append({'name': report['filename'], 'scope': report['scope'], 'rse': rse, 'rse_id': rse_id, 'accessed_at': datetime.utcfromtimestamp(report['traceTimeentryUnix']),
-                                         'traceTimeentryUnix': report['traceTimeentryUnix'], 'eventVersion': report['eventVersion']})
+                        self.__aggregator.add_replica(report['scope'], report['filename'], rse, rse_id, accessed_at,
+                                                      report['traceTimeentryUnix'], report['eventVersion'])
                 else:
                     # if touch event and if datasetScope is in the report then it means
                     # that there is no file scope/name and therefore only the dataset is
@@ -235,11 +302,9 @@ class AMQConsumer(object):
                     else:
                         if 'remoteSite' not in report:
                             continue
-                        replicas.append({'name': report['filename'],
-                                         'scope': report['scope'],
-                                         'rse': rse,
-                                         'rse_id': rse_id,
-                                         'accessed_at': datetime.utcfromtimestamp(report['traceTimeentryUnix'])})
+                        self.__aggregator.add_replica(report['scope'], report['filename'], rse, rse_id,
+                                                      datetime.utcfromtimestamp(report['traceTimeentryUnix']),
+                                                      report['traceTimeentryUnix'], report.get('eventVersion'))
 
             except (KeyError, AttributeError):
                 self.__logger(logging.ERROR, "Cannot handle report.", exc_info=True)
@@ -249,49 +314,98 @@ class AMQConsumer(object):
                 self.__logger(logging.ERROR, "Exception", exc_info=True)
                 continue
 
-            for did in list_parent_dids(report['scope'], report['filename']):
+    def __declare_suspicious(self, suspicious):
+        """
+        Declare the suspicious files, with one call per VO, reason and protocol.
+        """
+        for (vo, reason, _), surls in suspicious.items():
+            issuer = InternalAccount('root', vo=vo)
+            try:
+                declare_bad_file_replicas(sorted(surls), reason=reason, issuer=issuer, status=BadFilesStatus.SUSPICIOUS)
+                self.__logger(logging.INFO, 'Declare %d suspicious files with reason %s' % (len(surls), reason))
+            except Exception:
+                # Declare the files one by one, to not lose all of them because of a single one
+                for surl in surls:
+                    try:
+                        declare_bad_file_replicas([surl, ], reason=reason, issuer=issuer, status=BadFilesStatus.SUSPICIOUS)
+                        self.__logger(logging.INFO, 'Declare suspicious file %s with reason %s' % (surl, reason))
+                    except Exception as error:
+                        self.__logger(logging.ERROR, 'Failed to declare suspicious file' + str(error))
+
+    def __touch_parent_datasets(self, replicas):
+        """
+        Put the parent datasets of the replicas in the dataset queue.
+        """
+        parents = {}
+        for replica in replicas:
+            key = (replica['scope'], replica['name'])
+            if key not in parents:
+                try:
+                    parents[key] = list(list_parent_dids(replica['scope'], replica['name']))
+                except Exception:
+                    self.__logger(logging.ERROR, "Cannot list the parents of %s:%s", replica['scope'], replica['name'], exc_info=True)
+                    parents[key] = []
+            for did in parents[key]:
                 if did['type'] != DIDType.DATASET:
                     continue
                 # do not update _dis datasets
                 if did['scope'].external == 'panda' and '_dis' in did['name']:
                     continue
-                for rse in rses:
-                    try:
-                        rse_id = get_rse_id(rse=rse, vo=report['vo'])
-                    except RSENotFound:
-                        self.__logger(logging.WARNING, "Cannot lookup rse_id for %s. Will skip this report.", rse)
-                        METRICS.counter('rse_not_found').inc()
-                        continue
-                    self.__dataset_queue.put({'scope': did['scope'], 'name': did['name'], 'did_type': did['type'], 'rse_id': rse_id, 'accessed_at': datetime.utcfromtimestamp(report['traceTimeentryUnix'])})
+                self.__dataset_queue.put({'scope': did['scope'], 'name': did['name'], 'did_type': did['type'], 'rse_id': replica['rse_id'], 'accessed_at': replica['accessed_at']})
+
+    def __resubmit(self, replica):
+        """
+        Put the trace of a replica which could not be updated back into the queue for later retry.
+        """
+        resubmit = {'filename': replica['name'],
+                    'scope': replica['scope'].external,
+                    'remoteSite': replica['rse'],
+                    'traceTimeentryUnix': replica['traceTimeentryUnix'],
+                    'eventType': 'get',
+                    'usrdn': 'someuser',
+                    'clientState': 'DONE',
+                    'eventVersion': replica['eventVersion']}
+        if replica['scope'].vo != 'def':
+            resubmit['vo'] = replica['scope'].vo
+        self.__conn.send(body=jdumps(resubmit), destination=self.__queue, headers={'appversion': 'rucio', 'resubmitted': '1'})
+        METRICS.counter('sent_resubmitted').inc()
+
+    def __update_atime(self):
+        """
+        Bulk update atime.
+        """
+        self.__last_flush = time()
+        nb_traces, replicas, suspicious = self.__aggregator.pop()
+
+        if suspicious:
+            self.__declare_suspicious(suspicious)
 
         if not len(replicas):
             return
 
+        METRICS.counter('coalesced_traces').inc(nb_traces - len(replicas))
+        self.__touch_parent_datasets(replicas)
+
+        # Touch events without known RSE only update the datasets
+        replicas = [replica for replica in replicas if replica['rse_id'] is not None]
         self.__logger(logging.DEBUG, "trying to update replicas: %s", replicas)
 
         stopwatch = Stopwatch()
         try:
-            for replica in replicas:
-                # if touch replica hits a locked row put the trace back into queue for later retry
-                if not touch_replica(replica):
-                    resubmit = {'filename': replica['name'],
-                                'scope': replica['scope'].external,
-                                'remoteSite': replica['rse'],
-                                'traceTimeentryUnix': replica['traceTimeentryUnix'],
-                                'eventType': 'get',
-                                'usrdn': 'someuser',
-                                'clientState': 'DONE',
-                                'eventVersion': replica['eventVersion']}
-                    if replica['scope'].vo != 'def':
-                        resubmit['vo'] = replica['scope'].vo
-                    self.__conn.send(body=jdumps(resubmit), destination=self.__queue, headers={'appversion': 'rucio', 'resubmitted': '1'})
-                    METRICS.counter('sent_resubmitted').inc()
+            for chunk in chunks(replicas, 100):
+                if touch_replicas(chunk):
+                    continue
+                # if the bulk update hits a locked row, update the replicas one by one and
+                # put the traces of the locked ones back into queue for later retry
+                for replica in chunk:
+                    if not touch_replica(replica):
+                        self.__resubmit(replica)
             METRICS.timer('update_atime').observe(stopwatch.elapsed)
         except Exception:
             self.__logger(logging.ERROR, "Cannot update replicas.", exc_info=True)
             METRICS.counter('update_error').inc()
 
-        METRICS.counter('updated_replicas').inc()
+        METRICS.counter('updated_replicas').inc(len(replicas))
 
 
 def kronos_file(once: bool = False, dataset_queue: Queue = None, sleep_time: int = 60):
@@ -313,6 +427,8 @@ def kronos_file(once: bool = False, dataset_queue: Queue = None, sleep_time: int
             sleep_time=sleep_time,
         )
     )
+    for consumer in return_values.get('consumers', {}).values():
+        consumer.flush(force=True)
     for conn in return_values['conns']:
         try:
             conn.disconnect()
@@ -326,7 +442,13 @@ def run_once_kronos_file(heartbeat_handler: HeartbeatHandler, return_values: Dic
     """
     _, _, logger = heartbeat_handler.live()
 
+    # Update the aggregated accesses which have not been flushed since the last run
+    for consumer in return_values.get('consumers', {}).values():
+        consumer.flush()
+
     chunksize = config_get_int('tracer-kronos', 'chunksize')
+    flush_interval = config_get_int('tracer-kronos', 'flush_interval', raise_exception=False, default=10)
+    max_pending_replicas = config_get_int('tracer-kronos', 'max_pending_replicas', raise_exception=False, default=10000)
     prefetch_size = config_get_int('tracer-kronos', 'prefetch_size')
     subscription_id = config_get('tracer-kronos', 'subscription_id')
     # Load bad file patterns from config
@@ -374,15 +496,23 @@ def run_once_kronos_file(heartbeat_handler: HeartbeatHandler, return_values: Dic
         if not conn.is_connected():
             logger(logging.INFO, 'connecting to %s' % str(conn.transport._Transport__host_and_ports[0]))
             METRICS.counter('reconnect.{host}').labels(host=conn.transport._Transport__host_and_ports[0][0]).inc()
-            conn.set_listener('rucio-tracer-kronos', AMQConsumer(broker=conn.transport._Transport__host_and_ports[0],
-                                                                 conn=conn,
-                                                                 queue=config_get('tracer-kronos', 'queue'),
-                                                                 chunksize=chunksize,
-                                                                 subscription_id=subscription_id,
-                                                                 excluded_usrdns=excluded_usrdns,
-                                                                 dataset_queue=dataset_queue,
-                                                                 bad_files_patterns=bad_files_patterns,
-                                                                 logger=logger))
+            consumer = AMQConsumer(broker=conn.transport._Transport__host_and_ports[0],
+                                   conn=conn,
+                                   queue=config_get('tracer-kronos', 'queue'),
+                                   chunksize=chunksize,
+                                   subscription_id=subscription_id,
+                                   excluded_usrdns=excluded_usrdns,
+                                   dataset_queue=dataset_queue,
+                                   bad_files_patterns=bad_files_patterns,
+                                   logger=logger,
+                                   flush_interval=flush_interval,
+                                   max_pending_replicas=max_pending_replicas)
+            consumers = return_values.setdefault('consumers', {})
+            if conn in consumers:
+                # flush the accesses aggregated before the connection was lost
+                consumers[conn].flush(force=True)
+            consumers[conn] = consumer
+            conn.set_listener('rucio-tracer-kronos', consumer)
             if not use_ssl:
                 conn.connect(username, password)
             else:
@@ -410,6 +540,28 @@ def kronos_dataset(dataset_queue: Queue, once: bool = False, sleep_time: int = 6
     run_once_kronos_dataset(dataset_queue=dataset_queue, return_values=return_values, heartbeat_handler=return_values['heartbeat_handler'], sleep_time=sleep_time)
 
 
+def __touch_in_bulk(touch, items, dataset_queue, chunk_size=100):
+    """
+    Update the items in chunks, and one by one the items of the chunks which failed.
+
+    :param touch: The function updating a list of items.
+    :param items: The list of items.
+    :param dataset_queue: The queue in which the items which failed are put back to retry them later.
+    :param chunk_size: The number of items updated at once.
+    :returns: The number of items which failed.
+    """
+    failed = 0
+    for chunk in chunks(items, chunk_size):
+        if touch(chunk):
+            continue
+        for item in chunk:
+            # if update fails, put back in queue and retry next time
+            if not touch((item,)):
+                dataset_queue.put(item)
+                failed += 1
+    return failed
+
+
 def run_once_kronos_dataset(dataset_queue: Queue, return_values: dict, heartbeat_handler: HeartbeatHandler, **kwargs):
     if heartbeat_handler is None:
         if "heartbeat_handler" not in return_values.keys():
@@ -440,6 +592,13 @@ def run_once_kronos_dataset(dataset_queue: Queue, return_values: dict, heartbeat
             dslocks[did][rse] = max(dataset['accessed_at'], dslocks[did][rse])
     logger(logging.INFO, 'fetched %d datasets from queue (%ds)' % (len_ds, time() - now))
 
+    update_dslocks = []
+    for did, rses in dslocks.items():
+        scope, name = did.split(':')
+        scope = InternalScope(scope, fromExternal=False)
+        for rse, accessed_at in rses.items():
+            update_dslocks.append({'scope': scope, 'name': name, 'rse_id': rse, 'accessed_at': accessed_at})
+
     total, failed, start = 0, 0, time()
     for did, accessed_at in datasets.items():
         scope, name = did.split(':')
@@ -453,30 +612,12 @@ def run_once_kronos_dataset(dataset_queue: Queue, return_values: dict, heartbeat
         total += 1
     logger(logging.INFO, 'update done for %d datasets, %d failed (%ds)' % (total, failed, time() - start))
 
-    total, failed, start = 0, 0, time()
-    for did, rses in dslocks.items():
-        scope, name = did.split(':')
-        scope = InternalScope(scope, fromExternal=False)
-        for rse, accessed_at in rses.items():
-            update_dslock = {'scope': scope, 'name': name, 'rse_id': rse, 'accessed_at': accessed_at}
-            # if update fails, put back in queue and retry next time
-            if not touch_dataset_locks((update_dslock,)):
-                dataset_queue.put(update_dslock)
-                failed += 1
-            total += 1
+    start = time()
+    total, failed = len(update_dslocks), __touch_in_bulk(touch_dataset_locks, update_dslocks, dataset_queue)
     logger(logging.INFO, 'update done for %d locks, %d failed (%ds)' % (total, failed, time() - start))
 
-    total, failed, start = 0, 0, time()
-    for did, rses in dslocks.items():
-        scope, name = did.split(':')
-        scope = InternalScope(scope, fromExternal=False)
-        for rse, accessed_at in rses.items():
-            update_dslock = {'scope': scope, 'name': name, 'rse_id': rse, 'accessed_at': accessed_at}
-            # if update fails, put back in queue and retry next time
-            if not touch_collection_replicas((update_dslock,)):
-                dataset_queue.put(update_dslock)
-                failed += 1
-            total += 1
+    start = time()
+    total, failed = len(update_dslocks), __touch_in_bulk(touch_collection_replicas, update_dslocks, dataset_queue)
     logger(logging.INFO, 'update done for %d collection replicas, %d failed (%ds)' % (total, failed, time() - start))
 
 
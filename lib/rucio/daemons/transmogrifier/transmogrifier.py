@@ -43,7 +43,7 @@ from rucio.common.stopwatch import Stopwatch
 from rucio.common.types import InternalAccount
 from rucio.common.utils import chunks
 from rucio.core.monitor import MetricManager
-from rucio.core.did import list_new_dids, set_new_dids, get_metadata
+from rucio.core.did import list_new_dids, set_new_dids, get_metadata_bulk
 from rucio.core.rse import list_rses, rse_exists, get_rse_id, list_rse_attributes
 from rucio.core.rse_expression_parser import parse_expression
 from rucio.core.rse_selector import resolve_rse_expression
@@ -287,93 +287,136 @@ def get_subscriptions(logger: "Callable" = logging.log) -> List[Dict]:
     return subscriptions
 
 
-def __is_matching_subscription(subscription, did, metadata):
+def __avg_file_size_predicate(key, value):
     """
-    Internal method to identify if a DID matches a subscription.
+    Internal method to build the predicate of the min_avg_file_size and max_avg_file_size filters.
 
-    :param subscription: The subscription dictionary.
-    :param did: The DID dictionary
-    :param metadata: The metadata dictionnary for the DID
-    :return: True/False
+    :param key: min_avg_file_size or max_avg_file_size.
+    :param value: The limit on the average file size.
+    :return: A function telling if the DID passes the filter.
     """
-    if metadata["hidden"]:
-        return False
-    try:
-        filter_string = loads(subscription["filter"])
-    except ValueError as error:
-        logging.error("%s : Subscription will be skipped" % error)
-        return False
-    # Loop over the keys of filter_string for subscription
-    for key in filter_string:
-        values = filter_string[key]
+    def predicate(did, metadata):
+        length = metadata["length"]
+        size = metadata["bytes"]
+        if not (length and size):
+            # If the DID is evaluated at the creation, length and bytes are not set yet
+            # In that case, just ignore min_avg_file_size and max_avg_file_size filter
+            return True
+        avg_file_size = size / length
+        if key == "min_avg_file_size":
+            return avg_file_size >= value
+        return avg_file_size <= value
+    return predicate
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_filter(filter_string: str) -> Tuple:
+    """
+    Compile the filter of a subscription. The result is cached, so that a filter is only
+    compiled again when it changes.
+
+    :param filter_string: The JSON filter of the subscription.
+    :return: A tuple with the predicates on (did, metadata), the accounts and the DID types of the filter
+             (None if the filter does not restrict them), and the split_rule flag.
+    :raises ValueError: If the filter cannot be parsed.
+    :raises re.error: If a regular expression of the filter is invalid.
+    """
+    filter_ = loads(filter_string)
+    predicates = []
+    accounts = None
+    did_types = None
+    split_rule = filter_.get("split_rule", False)
+    for key, values in filter_.items():
         if key == "pattern":
-            if not re.match(values, did["name"]):
-                return False
+            regex = re.compile(values)
+            predicates.append(lambda did, metadata, regex=regex: regex.match(did["name"]) is not None)
         elif key == "excluded_pattern":
-            if re.match(values, did["name"]):
-                return False
+            regex = re.compile(values)
+            predicates.append(lambda did, metadata, regex=regex: regex.match(did["name"]) is None)
         elif key == "split_rule":
             pass
         elif key == "scope":
-            match_scope = False
-            for scope in values:
-                if re.match(scope, did["scope"].internal):
-                    match_scope = True
-                    break
-            if not match_scope:
-                return False
+            regexes = tuple(re.compile(scope) for scope in values)
+            predicates.append(lambda did, metadata, regexes=regexes: any(regex.match(did["scope"].internal) for regex in regexes))
         elif key == "account":
-            match_account = False
-            if not isinstance(values, list):
-                values = [values]
-            for account in values:
-                if account == metadata["account"].internal:
-                    match_account = True
-                    break
-            if not match_account:
-                return False
+            accounts = frozenset(values if isinstance(values, list) else [values])
         elif key == "did_type":
-            match_did_type = False
-            if not isinstance(values, list):
-                values = [values]
-            for did_type in values:
-                if did_type == metadata["did_type"].name:
-                    match_did_type = True
-                    break
-            if not match_did_type:
-                return False
+            did_types = frozenset(values if isinstance(values, list) else [values])
         elif key in ["min_avg_file_size", "max_avg_file_size"]:
-            length = metadata["length"]
-            size = metadata["bytes"]
-            if length and size:
-                avg_file_size = size / length
-                if key == "min_avg_file_size" and avg_file_size < values:
-                    return False
-                if key == "max_avg_file_size" and avg_file_size > values:
-                    return False
-            else:
-                # If the DID is evaluated at the creation, length and bytes are not set yet
-                # In that case, just ignore min_avg_file_size and max_avg_file_size filter
-                continue
+            predicates.append(__avg_file_size_predicate(key, values))
         else:
-            if not isinstance(values, list):
-                values = [
-                    values,
-                ]
-            has_metadata = False
-            for meta in metadata:
-                if str(meta) == str(key):
-                    has_metadata = True
-                    match_meta = False
-                    for value in values:
-                        if re.match(str(value), str(metadata[meta])):
-                            match_meta = True
-                            break
-                    if not match_meta:
-                        return False
-            if not has_metadata:
-                return False
-    return True
+            regexes = tuple(re.compile(str(value)) for value in (values if isinstance(values, list) else [values]))
+            predicates.append(lambda did, metadata, key=str(key), regexes=regexes: key in metadata and any(regex.match(str(metadata[key])) for regex in regexes))
+    return tuple(predicates), accounts, did_types, split_rule
+
+
+class SubscriptionMatcher:
+    """
+    Identifies the subscriptions matching DIDs.
+
+    The filters of the subscriptions are compiled once, and the subscriptions are indexed by
+    account and DID type, so that only the filters of the candidate subscriptions of a DID are evaluated.
+    """
+
+    def __init__(self, subscriptions: List[Dict], logger: "Callable" = logging.log):
+        """
+        :param subscriptions: The list of subscriptions, ordered by priority.
+        :param logger: The logger.
+        """
+        self.subscriptions = subscriptions
+        self._predicates = {}
+        self._split_rule = {}
+        self._by_account = {}
+        self._any_account = set()
+        self._by_did_type = {}
+        self._any_did_type = set()
+        for idx, subscription in enumerate(subscriptions):
+            try:
+                predicates, accounts, did_types, split_rule = _compile_filter(subscription["filter"])
+            except (ValueError, re.error) as error:
+                logger(logging.ERROR, "%s : Subscription %s will be skipped" % (error, subscription["name"]))
+                continue
+            self._predicates[idx] = predicates
+            self._split_rule[subscription["id"]] = split_rule
+            if accounts is None:
+                self._any_account.add(idx)
+            for account in accounts or []:
+                self._by_account.setdefault(account, set()).add(idx)
+            if did_types is None:
+                self._any_did_type.add(idx)
+            for did_type in did_types or []:
+                self._by_did_type.setdefault(did_type, set()).add(idx)
+
+    def is_split_rule(self, subscription: Dict) -> bool:
+        """
+        :param subscription: The subscription dictionary.
+        :return: True if the rules of the subscription are split.
+        """
+        return self._split_rule.get(subscription["id"], False)
+
+    def match(self, did: Dict, metadata: Dict) -> List[Dict]:
+        """
+        Identify the subscriptions matching a DID.
+
+        :param did: The DID dictionary.
+        :param metadata: The metadata dictionary for the DID.
+        :return: The list of matching subscriptions, ordered by priority.
+        """
+        if metadata["hidden"]:
+            return []
+        candidates = (self._by_account.get(metadata["account"].internal, set()) | self._any_account) \
+            & (self._by_did_type.get(metadata["did_type"].name, set()) | self._any_did_type)
+        return [self.subscriptions[idx] for idx in sorted(candidates)
+                if all(predicate(did, metadata) for predicate in self._predicates[idx])]
+
+    def match_many(self, dids: List[Tuple[Dict, Dict]]) -> List[List[Dict]]:
+        """
+        Identify the subscriptions matching a list of DIDs.
+
+        :param dids: The list of (DID dictionary, metadata dictionary) tuples.
+        :return: The list of matching subscriptions of each DID, in the order of dids.
+        """
+        return [self.match(did, metadata) for did, metadata in dids]
 
 
 def select_algorithm(algorithm: str, rule_ids: list, params: dict, logger: "Callable") -> dict:
@@ -482,15 +525,25 @@ def run_once(heartbeat_handler: "HeartbeatHandler", bulk: int, **_kwargs) -> boo
     #  List all the active subscriptions
     subscriptions = get_subscriptions(logger=logger)
 
-    #  Loop over all the new dids
+    matcher = SubscriptionMatcher(subscriptions, logger=logger)
+
     #  Get the new DIDs based on the is_new flag
     logger(logging.DEBUG, "Listing new dids")
-    for did in list_new_dids(
+    new_dids = list(list_new_dids(
         thread=worker_number,
         total_threads=total_workers,
         chunk_size=bulk,
         did_type=None,
-    ):
+    ))
+
+    #  Identify the subscriptions matching the new datasets and containers
+    collections = [did for did in new_dids if did["did_type"] in (DIDType.DATASET, DIDType.CONTAINER)]
+    metadata = {(meta["scope"], meta["name"]): meta for meta in get_metadata_bulk(collections)}
+    collections = [(did, metadata[(did["scope"], did["name"])]) for did in collections if (did["scope"], did["name"]) in metadata]
+    matching_subscriptions = {(did["scope"], did["name"]): matches for (did, _), matches in zip(collections, matcher.match_many(collections))}
+
+    #  Loop over all the new dids
+    for did in new_dids:
         _, _, logger = heartbeat_handler.live()
         did_success = True
         if not (
@@ -504,168 +557,167 @@ def run_once(heartbeat_handler: "HeartbeatHandler", bulk: int, **_kwargs) -> boo
                 }
             )
             continue
-        metadata = get_metadata(did["scope"], did["name"])
-
-        #  Loop over all the subscriptions
-        for subscription in subscriptions:
-            #  Check if the DID match the subscription
-            if __is_matching_subscription(subscription, did, metadata) is True:
-                filter_string = loads(subscription["filter"])
-                split_rule = filter_string.get("split_rule", False)
-                stime = time.time()
-                logger(
-                    logging.INFO,
-                    "%s:%s matches subscription %s"
-                    % (did["scope"], did["name"], subscription["name"]),
+        if (did["scope"], did["name"]) not in matching_subscriptions:
+            logger(logging.WARNING, "%s:%s not found, skipping it" % (did["scope"], did["name"]))
+            continue
+
+        #  Loop over all the subscriptions matching the DID
+        for subscription in matching_subscriptions[(did["scope"], did["name"])]:
+            split_rule = matcher.is_split_rule(subscription)
+            stime = time.time()
+            logger(
+                logging.INFO,
+                "%s:%s matches subscription %s"
+                % (did["scope"], did["name"], subscription["name"]),
+            )
+            rules = loads(subscription["replication_rules"])
+            created_rules = {}
+            for cnt, rule_dict in enumerate(rules):
+                created_rules[cnt + 1] = []
+                #  Get all the rule and subscription parameters
+                rule_dict = __get_rule_dict(rule_dict, subscription)
+                weight = rule_dict.get("weight", None)
+                source_replica_expression = rule_dict.get(
+                    "source_replica_expression", None
                 )
-                rules = loads(subscription["replication_rules"])
-                created_rules = {}
-                for cnt, rule_dict in enumerate(rules):
-                    created_rules[cnt + 1] = []
-                    #  Get all the rule and subscription parameters
-                    rule_dict = __get_rule_dict(rule_dict, subscription)
-                    weight = rule_dict.get("weight", None)
-                    source_replica_expression = rule_dict.get(
-                        "source_replica_expression", None
+                copies = rule_dict["copies"]
+                success = False
+
+                chained_idx = rule_dict.get("chained_idx", None)
+                #  By default selected_rses contains only the rse_expression
+                #  It is overwritten in 2 cases : Chained subscription and split_rule
+                selected_rses = [rule_dict.get("rse_expression")]
+                if chained_idx:
+                    #  In the case of chained subscription, don't use rseselector but use the rses returned by the algorithm
+                    params = {}
+                    params['rse_expression'] = rule_dict.get("rse_expression")
+                    params['subscription_id'] = subscription["id"]
+                    params['subscription_name'] = subscription["name"]
+                    params['blocklisted_rse_id'] = blocklisted_rse_id
+                    if rule_dict.get("associated_site_idx", None):
+                        params["associated_site_idx"] = rule_dict.get(
+                            "associated_site_idx", None
+                        )
+                    logger(
+                        logging.DEBUG,
+                        "Chained subscription identified. Will use %s",
+                        str(created_rules[chained_idx]),
+                    )
+                    algorithm = rule_dict.get("algorithm", None)
+                    selected_rses = select_algorithm(
+                        algorithm,
+                        created_rules[chained_idx],
+                        params,
+                        logger
                     )
-                    copies = rule_dict["copies"]
-                    success = False
-
-                    chained_idx = rule_dict.get("chained_idx", None)
-                    #  By default selected_rses contains only the rse_expression
-                    #  It is overwritten in 2 cases : Chained subscription and split_rule
-                    selected_rses = [rule_dict.get("rse_expression")]
-                    if chained_idx:
-                        #  In the case of chained subscription, don't use rseselector but use the rses returned by the algorithm
-                        params = {}
-                        params['rse_expression'] = rule_dict.get("rse_expression")
-                        params['subscription_id'] = subscription["id"]
-                        params['subscription_name'] = subscription["name"]
-                        params['blocklisted_rse_id'] = blocklisted_rse_id
-                        if rule_dict.get("associated_site_idx", None):
-                            params["associated_site_idx"] = rule_dict.get(
-                                "associated_site_idx", None
+                    copies = 1
+                elif split_rule:
+                    (
+                        selected_rses,
+                        create_rule,
+                        wont_reevaluate,
+                    ) = __split_rule_select_rses(
+                        subscription_id=subscription["id"],
+                        subscription_name=subscription["name"],
+                        scope=did["scope"],
+                        name=did["name"],
+                        account=rule_dict.get("account"),
+                        weight=weight,
+                        rse_expression=rule_dict.get("rse_expression"),
+                        copies=copies,
+                        blocklisted_rse_id=blocklisted_rse_id,
+                        logger=logger,
+                    )
+                    copies = 1
+                    if not create_rule:
+                        continue
+                    # The DID won't be reevaluated at the next cycle
+                    did_success = did_success and wont_reevaluate
+
+                nb_rule = 0
+                #  Try to create the rule
+                logger(logging.DEBUG, 'selected_rses : %s' % selected_rses)
+                try:
+                    for rse in selected_rses:
+                        if isinstance(selected_rses, dict):
+                            #  selected_rses is a dictionary only when split_rule is True or for chained subscriptions
+                            source_replica_expression = selected_rses[rse].get(
+                                "source_replica_expression",
+                                None,
                             )
+                            weight = selected_rses[rse].get("weight", None)
                         logger(
-                            logging.DEBUG,
-                            "Chained subscription identified. Will use %s",
-                            str(created_rules[chained_idx]),
-                        )
-                        algorithm = rule_dict.get("algorithm", None)
-                        selected_rses = select_algorithm(
-                            algorithm,
-                            created_rules[chained_idx],
-                            params,
-                            logger
+                            logging.INFO,
+                            "Will insert one rule for %s:%s on %s"
+                            % (did["scope"], did["name"], rse),
                         )
-                        copies = 1
-                    elif split_rule:
-                        (
-                            selected_rses,
-                            create_rule,
-                            wont_reevaluate,
-                        ) = __split_rule_select_rses(
-                            subscription_id=subscription["id"],
-                            subscription_name=subscription["name"],
-                            scope=did["scope"],
-                            name=did["name"],
+                        rule_ids = add_rule(
+                            dids=[
+                                {
+                                    "scope": did["scope"],
+                                    "name": did["name"],
+                                }
+                            ],
                             account=rule_dict.get("account"),
-                            weight=weight,
-                            rse_expression=rule_dict.get("rse_expression"),
                             copies=copies,
-                            blocklisted_rse_id=blocklisted_rse_id,
-                            logger=logger,
-                        )
-                        copies = 1
-                        if not create_rule:
-                            continue
-                        # The DID won't be reevaluated at the next cycle
-                        did_success = did_success and wont_reevaluate
-
-                    nb_rule = 0
-                    #  Try to create the rule
-                    logger(logging.DEBUG, 'selected_rses : %s' % selected_rses)
-                    try:
-                        for rse in selected_rses:
-                            if isinstance(selected_rses, dict):
-                                #  selected_rses is a dictionary only when split_rule is True or for chained subscriptions
-                                source_replica_expression = selected_rses[rse].get(
-                                    "source_replica_expression",
-                                    None,
-                                )
-                                weight = selected_rses[rse].get("weight", None)
-                            logger(
-                                logging.INFO,
-                                "Will insert one rule for %s:%s on %s"
-                                % (did["scope"], did["name"], rse),
-                            )
-                            rule_ids = add_rule(
-                                dids=[
-                                    {
-                                        "scope": did["scope"],
-                                        "name": did["name"],
-                                    }
-                                ],
-                                account=rule_dict.get("account"),
-                                copies=copies,
-                                rse_expression=rse,
-                                grouping=rule_dict.get("grouping", "DATASET"),
-                                weight=weight,
-                                lifetime=rule_dict.get("lifetime", None),
-                                locked=rule_dict.get("locked", None),
-                                subscription_id=subscription["id"],
-                                source_replica_expression=source_replica_expression,
-                                activity=rule_dict.get("activity"),
-                                purge_replicas=rule_dict.get("purge_replicas", False),
-                                ignore_availability=rule_dict.get(
-                                    "ignore_availability", None
-                                ),
-                                comment=rule_dict.get("comment"),
-                                delay_injection=rule_dict.get("delay_injection"),
-                            )
-                            created_rules[cnt + 1].append(rule_ids[0])
-                            nb_rule += 1
-                            if nb_rule == copies:
-                                success = True
-                            if split_rule:
-                                success = True
-
-                        METRICS.counter("addnewrule.done").inc(nb_rule)
-                        METRICS.counter("addnewrule.activity.{activity}").labels(activity="".join(rule_dict.get("activity").split())).inc(nb_rule)
-                        success = True
-                    except (
-                        InvalidReplicationRule,
-                        InvalidRuleWeight,
-                        InvalidRSEExpression,
-                        StagingAreaRuleRequiresLifetime,
-                        DuplicateRule,
-                    ) as error:
-                        # Errors that won't be retried
-                        success = True
-                        logger(logging.ERROR, str(error))
-                        METRICS.counter("addnewrule.errortype.{exception}").labels(exception=str(error.__class__.__name__)).inc()
-                    except Exception:
-                        # Errors that will be retried
-                        METRICS.counter("addnewrule.errortype.{exception}").labels(exception="unknown").inc()
-                        logger(logging.ERROR, "Unexpected error", exc_info=True)
-
-                    did_success = did_success and success
-                    if not success:
-                        logger(
-                            logging.ERROR,
-                            "Rule for %s:%s on %s cannot be inserted"
-                            % (
-                                did["scope"],
-                                did["name"],
-                                rule_dict.get("rse_expression"),
+                            rse_expression=rse,
+                            grouping=rule_dict.get("grouping", "DATASET"),
+                            weight=weight,
+                            lifetime=rule_dict.get("lifetime", None),
+                            locked=rule_dict.get("locked", None),
+                            subscription_id=subscription["id"],
+                            source_replica_expression=source_replica_expression,
+                            activity=rule_dict.get("activity"),
+                            purge_replicas=rule_dict.get("purge_replicas", False),
+                            ignore_availability=rule_dict.get(
+                                "ignore_availability", None
                             ),
+                            comment=rule_dict.get("comment"),
+                            delay_injection=rule_dict.get("delay_injection"),
                         )
-                    else:
-                        logger(
-                            logging.INFO,
-                            "%s rule(s) inserted in %f seconds"
-                            % (str(nb_rule), time.time() - stime),
-                        )
+                        created_rules[cnt + 1].append(rule_ids[0])
+                        nb_rule += 1
+                        if nb_rule == copies:
+                            success = True
+                        if split_rule:
+                            success = True
+
+                    METRICS.counter("addnewrule.done").inc(nb_rule)
+                    METRICS.counter("addnewrule.activity.{activity}").labels(activity="".join(rule_dict.get("activity").split())).inc(nb_rule)
+                    success = True
+                except (
+                    InvalidReplicationRule,
+                    InvalidRuleWeight,
+                    InvalidRSEExpression,
+                    StagingAreaRuleRequiresLifetime,
+                    DuplicateRule,
+                ) as error:
+                    # Errors that won't be retried
+                    success = True
+                    logger(logging.ERROR, str(error))
+                    METRICS.counter("addnewrule.errortype.{exception}").labels(exception=str(error.__class__.__name__)).inc()
+                except Exception:
+                    # Errors that will be retried
+                    METRICS.counter("addnewrule.errortype.{exception}").labels(exception="unknown").inc()
+                    logger(logging.ERROR, "Unexpected error", exc_info=True)
+
+                did_success = did_success and success
+                if not success:
+                    logger(
+                        logging.ERROR,
+                        "Rule for %s:%s on %s cannot be inserted"
+                        % (
+                            did["scope"],
+                            did["name"],
+                            rule_dict.get("rse_expression"),
+                        ),
+                    )
+                else:
+                    logger(
+                        logging.INFO,
+                        "%s rule(s) inserted in %f seconds"
+                        % (str(nb_rule), time.time() - stime),
+                    )
 
         if did_success:
             if did["did_type"] == str(DIDType.FILE):
@@ -13,11 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from sqlalchemy.sql.expression import bindparam, text
+from sqlalchemy.sql.expression import bindparam, false, or_, text
 
+from rucio.common.constants import HASH_RING_BUCKETS
 
-def filter_thread_work(session, query, total_threads, thread_id, hash_variable=None):
-    """ Filters a query to partition thread workloads based on the thread id and total number of threads """
+
+def filter_thread_work(session, query, total_threads, thread_id, hash_variable=None, hash_ranges=None):
+    """
+    Filters a query to partition thread workloads based on the thread id and total number of threads,
+    or on the (first, last) ranges of buckets of the consistent hashing ring assigned to the thread.
+    """
+    if hash_ranges is not None:
+        return _filter_hash_ranges(session, query, hash_ranges, hash_variable or 'id')
     if thread_id is not None and total_threads is not None and (total_threads - 1) > 0:
         if session.bind.dialect.name == 'oracle':
             bindparams = [bindparam('thread_id', thread_id), bindparam('total_threads', total_threads - 1)]
@@ -36,3 +43,20 @@ def filter_thread_work(session, query, total_threads, thread_id, hash_variable=N
             else:
                 query = query.filter(text('mod(abs((\'x\'||md5(%s::text))::bit(32)::bigint), %s) = %s' % (hash_variable, total_threads, thread_id)))
     return query
+
+
+def _filter_hash_ranges(session, query, hash_ranges, hash_variable):
+    """ Filters a query on the buckets of the consistent hashing ring, see rucio.core.heartbeat.hash_ring_ranges """
+    if session.bind.dialect.name == 'oracle':
+        bucket = 'ORA_HASH(%s, %s)' % (hash_variable, HASH_RING_BUCKETS - 1)
+    elif session.bind.dialect.name == 'mysql':
+        bucket = 'mod(md5(%s), %s)' % (hash_variable, HASH_RING_BUCKETS)
+    elif session.bind.dialect.name == 'postgresql':
+        bucket = 'mod(abs((\'x\'||md5(%s::text))::bit(32)::bigint), %s)' % (hash_variable, HASH_RING_BUCKETS)
+    else:
+        return query
+    if hash_ranges == [(0, HASH_RING_BUCKETS - 1)]:
+        return query
+    if not hash_ranges:
+        return query.filter(false())
+    return query.filter(or_(*[text('%s BETWEEN %d AND %d' % (bucket, first, last)) for first, last in hash_ranges]))
@@ -71,19 +71,18 @@ class Default(protocol.RSEProtocol):
             hostname = hostname.split("://")[1]
 
         if self.attributes['port'] == 0:
-            for lfn in lfns:
-                scope, name = str(lfn['scope']), lfn['name']
-                path = lfn['path'] if 'path' in lfn and lfn['path'] else self._get_path(scope=scope, name=name)
-                if self.attributes['scheme'] != 'root' and path.startswith('/'):  # do not modify path if it is root
-                    path = path[1:]
-                pfns['%s:%s' % (scope, name)] = ''.join([self.attributes['scheme'], '://', hostname, web_service_path, prefix, path])
+            base_url = ''.join([self.attributes['scheme'], '://', hostname, web_service_path, prefix])
         else:
-            for lfn in lfns:
-                scope, name = str(lfn['scope']), lfn['name']
-                path = lfn['path'] if 'path' in lfn and lfn['path'] else self._get_path(scope=scope, name=name)
-                if self.attributes['scheme'] != 'root' and path.startswith('/'):  # do not modify path if it is root
-                    path = path[1:]
-                pfns['%s:%s' % (scope, name)] = ''.join([self.attributes['scheme'], '://', hostname, ':', str(self.attributes['port']), web_service_path, prefix, path])
+            base_url = ''.join([self.attributes['scheme'], '://', hostname, ':', str(self.attributes['port']), web_service_path, prefix])
+
+        dids = [(str(lfn['scope']), lfn['name'], lfn['path'] if 'path' in lfn and lfn['path'] else None) for lfn in lfns]
+        translated = iter(self._get_paths([(scope, name) for scope, name, path in dids if path is None]))
+        for scope, name, path in dids:
+            if path is None:
+                path = next(translated)
+            if self.attributes['scheme'] != 'root' and path.startswith('/'):  # do not modify path if it is root
+                path = path[1:]
+            pfns['%s:%s' % (scope, name)] = ''.join([base_url, path])
 
         return pfns
 
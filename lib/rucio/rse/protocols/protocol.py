@@ -43,6 +43,7 @@ class RSEDeterministicTranslation(object):
     """
 
     _LFN2PFN_ALGORITHMS = {}
+    _LFN2PFN_BULK_ALGORITHMS = {}
     _DEFAULT_LFN2PFN = "hash"
 
     def __init__(self, rse=None, rse_attributes=None, protocol_attributes=None):
@@ -90,6 +91,27 @@ class RSEDeterministicTranslation(object):
             name = lfn2pfn_callable.__name__
         RSEDeterministicTranslation._LFN2PFN_ALGORITHMS[name] = lfn2pfn_callable
 
+    @staticmethod
+    def register_bulk(lfn2pfn_bulk_callable, name):
+        """
+        Provided a callable function, register it as the batch implementation of an already
+        registered LFN2PFN algorithm.
+
+        The callable will receive four arguments:
+         - lfns: List of (scope, name) tuples.
+         - rse: RSE name the translation is being done for.
+         - rse_attributes: Attributes of the RSE.
+         - protocol_attributes: Attributes of the RSE's protocol
+        The return value should be the list of paths, in the order of `lfns`. The batch
+        implementation is only used as long as the per-LFN callable registered under `name`
+        is not replaced.
+
+        :param lfn2pfn_bulk_callable: Callable function to use for generating paths in bulk.
+        :param name: Name of the algorithm the callable implements.
+        """
+        lfn2pfn_callable = RSEDeterministicTranslation._LFN2PFN_ALGORITHMS[name]
+        RSEDeterministicTranslation._LFN2PFN_BULK_ALGORITHMS[name] = (lfn2pfn_callable, lfn2pfn_bulk_callable)
+
     @staticmethod
     def __hash(scope, name, rse, rse_attrs, protocol_attrs):
         """
@@ -113,6 +135,34 @@ class RSEDeterministicTranslation(object):
             scope = scope.replace('.', '/')
         return '%s/%s/%s/%s' % (scope, hstr[0:2], hstr[2:4], name)
 
+    @staticmethod
+    def __hash_bulk(lfns, rse, rse_attrs, protocol_attrs):
+        """
+        Batch implementation of the hash algorithm.
+
+        The scope directory is computed once per scope and the hashing is done in a single loop.
+
+        :param lfns: List of (scope, name) tuples.
+        :param rse: RSE for PFN (ignored)
+        :param rse_attrs: RSE attributes for PFN (ignored)
+        :param protocol_attrs: RSE protocol attributes for PFN (ignored)
+        :returns: List of paths for use in the PFN generation.
+        """
+        del rse
+        del rse_attrs
+        del protocol_attrs
+        md5 = hashlib.md5
+        scope_dirs = {}
+        paths = []
+        for scope, name in lfns:
+            scope_dir = scope_dirs.get(scope)
+            if scope_dir is None:
+                scope_dir = scope.replace('.', '/') if scope.startswith(('user', 'group')) else scope
+                scope_dirs[scope] = scope_dir
+            hstr = md5(('%s:%s' % (scope, name)).encode('utf-8')).hexdigest()
+            paths.append('%s/%s/%s/%s' % (scope_dir, hstr[0:2], hstr[2:4], name))
+        return paths
+
     @staticmethod
     def __identity(scope, name, rse, rse_attrs, protocol_attrs):
         """
@@ -227,6 +277,7 @@ class RSEDeterministicTranslation(object):
         cls.register(cls.__belleii, "belleii")
         cls.register(cls.__xenon, "xenon")
         cls.register(cls.__lsst, "lsst")
+        cls.register_bulk(cls.__hash_bulk, "hash")
         policy_module = None
         try:
             policy_module = config.config_get('policy', 'lfn2pfn_module')
@@ -240,6 +291,18 @@ class RSEDeterministicTranslation(object):
 
         cls._DEFAULT_LFN2PFN = config.get_lfn2pfn_algorithm_default()
 
+    def _algorithm(self):
+        """ Returns the name of the lfn2pfn algorithm used by the RSE. """
+        # on first call, register any lfn2pfn algorithms from the policy package(s) (server only)
+        if getattr(rsemanager, 'SERVER_MODE', None) and not self.loaded_policy_modules:
+            register_policy_package_algorithms('lfn2pfn', RSEDeterministicTranslation._LFN2PFN_ALGORITHMS)
+            self.loaded_policy_modules = True
+
+        algorithm = self.rse_attributes.get('lfn2pfn_algorithm', 'default')
+        if algorithm == 'default':
+            algorithm = RSEDeterministicTranslation._DEFAULT_LFN2PFN
+        return algorithm
+
     def path(self, scope, name):
         """ Transforms the logical file name into a PFN's path.
 
@@ -248,16 +311,23 @@ class RSEDeterministicTranslation(object):
 
             :returns: RSE specific URI of the physical file
         """
-        # on first call, register any lfn2pfn algorithms from the policy package(s) (server only)
-        if getattr(rsemanager, 'SERVER_MODE', None) and not self.loaded_policy_modules:
-            register_policy_package_algorithms('lfn2pfn', RSEDeterministicTranslation._LFN2PFN_ALGORITHMS)
-            self.loaded_policy_modules = True
+        algorithm_callable = RSEDeterministicTranslation._LFN2PFN_ALGORITHMS[self._algorithm()]
+        return algorithm_callable(scope, name, self.rse, self.rse_attributes, self.protocol_attributes)
 
-        algorithm = self.rse_attributes.get('lfn2pfn_algorithm', 'default')
-        if algorithm == 'default':
-            algorithm = RSEDeterministicTranslation._DEFAULT_LFN2PFN
+    def paths(self, lfns):
+        """ Transforms a list of logical file names into PFN paths.
+            Algorithms with a batch implementation translate the whole list at once.
+
+            :param lfns: list of (scope, name) tuples
+
+            :returns: list of RSE specific paths, in the order of lfns
+        """
+        algorithm = self._algorithm()
         algorithm_callable = RSEDeterministicTranslation._LFN2PFN_ALGORITHMS[algorithm]
-        return algorithm_callable(scope, name, self.rse, self.rse_attributes, self.protocol_attributes)
+        lfn2pfn_callable, bulk_callable = RSEDeterministicTranslation._LFN2PFN_BULK_ALGORITHMS.get(algorithm, (None, None))
+        if bulk_callable is not None and lfn2pfn_callable is algorithm_callable:
+            return bulk_callable(lfns, self.rse, self.rse_attributes, self.protocol_attributes)
+        return [algorithm_callable(scope, name, self.rse, self.rse_attributes, self.protocol_attributes) for scope, name in lfns]
 
 
 RSEDeterministicTranslation._module_init_()  # pylint: disable=protected-access
@@ -308,33 +378,34 @@ class RSEProtocol(object):
             prefix = ''.join(['/', prefix])
         if not prefix.endswith('/'):
             prefix = ''.join([prefix, '/'])
+        base_url = ''.join([self.attributes['scheme'], '://', self.attributes['hostname'], ':', str(self.attributes['port']), prefix])
 
         lfns = [lfns] if isinstance(lfns, dict) else lfns
-        for lfn in lfns:
-            scope, name = str(lfn['scope']), lfn['name']
-            if 'path' in lfn and lfn['path'] is not None:
-                pfns['%s:%s' % (scope, name)] = ''.join([self.attributes['scheme'],
-                                                         '://',
-                                                         self.attributes['hostname'],
-                                                         ':',
-                                                         str(self.attributes['port']),
-                                                         prefix,
-                                                         lfn['path'] if not lfn['path'].startswith('/') else lfn['path'][1:]
-                                                         ])
-            else:
-                try:
-                    pfns['%s:%s' % (scope, name)] = ''.join([self.attributes['scheme'],
-                                                             '://',
-                                                             self.attributes['hostname'],
-                                                             ':',
-                                                             str(self.attributes['port']),
-                                                             prefix,
-                                                             self._get_path(scope=scope, name=name)
-                                                             ])
-                except exception.ReplicaNotFound as e:
-                    self.logger(logging.WARNING, str(e))
+        dids = [(str(lfn['scope']), lfn['name'], lfn.get('path')) for lfn in lfns]
+        to_translate = [(scope, name) for scope, name, path in dids if path is None]
+        if self._translates_in_bulk():
+            translated = iter(self.translator.paths(to_translate))
+        else:
+            translated = iter(self.__get_path_or_none(scope, name) for scope, name in to_translate)
+
+        for scope, name, path in dids:
+            if path is None:
+                path = next(translated)
+                if path is None:
+                    continue
+            elif path.startswith('/'):
+                path = path[1:]
+            pfns['%s:%s' % (scope, name)] = ''.join([base_url, path])
         return pfns
 
+    def __get_path_or_none(self, scope, name):
+        """ Returns the path of the file, or None if the replica is not found. """
+        try:
+            return self._get_path(scope=scope, name=name)
+        except exception.ReplicaNotFound as e:
+            self.logger(logging.WARNING, str(e))
+            return None
+
     def __lfns2pfns_client(self, lfns):
         """ Provides the path of a replica for non-deterministic sites. Will be assigned to get path by the __init__ method if neccessary.
 
@@ -360,6 +431,22 @@ class RSEProtocol(object):
         """
         return self.translator.path(scope, name)
 
+    def _translates_in_bulk(self):
+        """ Checks if the paths of this protocol are computed by the deterministic translator alone. """
+        return self.translator is not None and '_get_path' not in vars(self) and type(self)._get_path is RSEProtocol._get_path
+
+    def _get_paths(self, lfns):
+        """ Transforms a list of logical file names into PFNs' paths.
+            Deterministic RSEs translate the whole list in one pass.
+
+            :param lfns: list of (scope, name) tuples
+
+            :returns: list of RSE specific paths, in the order of lfns
+        """
+        if self._translates_in_bulk():
+            return self.translator.paths(lfns)
+        return [self._get_path(scope=scope, name=name) for scope, name in lfns]
+
     def _get_path_nondeterministic_server(self, scope, name):  # pylint: disable=invalid-name
         """ Provides the path of a replica for non-deterministic sites. Will be assigned to get path by the __init__ method if neccessary. """
         vo = get_rse_vo(self.rse['id'])
@@ -289,6 +289,36 @@ class Default(protocol.RSEProtocol):
         except requests.exceptions.ReadTimeout as error:
             raise exception.ServiceUnavailable(error)
 
+    def get_range(self, pfn, offset, length, transfer_timeout=None):
+        """ Reads a range of bytes of a file stored inside the connected RSE, with an HTTP range request.
+
+            :param pfn: Physical file name of requested file
+            :param offset: Offset of the first byte to read
+            :param length: Number of bytes to read
+            :param transfer_timeout: Transfer timeout (in seconds) - dummy
+
+            :returns: The bytes read
+
+            :raises ServiceUnavailable, SourceNotFound, RSEAccessDenied, RucioException if the range is not served
+        """
+        path = self.path2pfn(pfn)
+        headers = {'Range': 'bytes=%d-%d' % (offset, offset + length - 1)}
+        try:
+            result = self.session.get(path, verify=False, headers=headers, timeout=self.timeout, cert=self.cert)
+            if result.status_code in [206, ]:
+                return result.content
+            elif result.status_code in [404, ]:
+                raise exception.SourceNotFound()
+            elif result.status_code in [401, 403]:
+                raise exception.RSEAccessDenied()
+            else:
+                # catchall exception, including servers ignoring the range
+                raise exception.RucioException(result.status_code, 'Range request not served')
+        except requests.exceptions.ConnectionError as error:
+            raise exception.ServiceUnavailable(error)
+        except requests.exceptions.ReadTimeout as error:
+            raise exception.ServiceUnavailable(error)
+
     def put(self, source, target, source_dir=None, transfer_timeout=None, progressbar=False):
         """ Allows to store files inside the referred RSE.
 
@@ -155,13 +155,13 @@ class Default(protocol.RSEProtocol):
         if not prefix.endswith('/'):
             prefix = ''.join([prefix, '/'])
 
+        base_url = ''.join([self.attributes['scheme'], '://', self.attributes['hostname'], ':', str(self.attributes['port']), prefix])
+
         lfns = [lfns] if type(lfns) == dict else lfns
-        for lfn in lfns:
-            scope, name = lfn['scope'], lfn['name']
-            if 'path' in lfn and lfn['path'] is not None:
-                pfns['%s:%s' % (scope, name)] = ''.join([self.attributes['scheme'], '://', self.attributes['hostname'], ':', str(self.attributes['port']), prefix, lfn['path']])
-            else:
-                pfns['%s:%s' % (scope, name)] = ''.join([self.attributes['scheme'], '://', self.attributes['hostname'], ':', str(self.attributes['port']), prefix, self._get_path(scope=scope, name=name)])
+        dids = [(lfn['scope'], lfn['name'], lfn.get('path')) for lfn in lfns]
+        translated = iter(self._get_paths([(scope, name) for scope, name, path in dids if path is None]))
+        for scope, name, path in dids:
+            pfns['%s:%s' % (scope, name)] = ''.join([base_url, path if path is not None else next(translated)])
         return pfns
 
     def connect(self):
@@ -13,18 +13,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
 from json import loads
+from unittest import mock
 
 import pytest
+from dogpile.cache import make_region
+from sqlalchemy import event
 
 from rucio.api.account import add_account, account_exists, del_account, update_account, get_account_info
 from rucio.common.config import config_get
 from rucio.common.exception import AccountNotFound, Duplicate, InvalidObject
 from rucio.common.types import InternalAccount
 from rucio.common.utils import generate_uuid as uuid
-from rucio.core.account import list_identities, add_account_attribute, list_account_attributes, del_account_attribute
+from rucio.core.account import list_identities, add_account_attribute, list_account_attributes, del_account_attribute, get_account_attributes, _invalidate_account_attributes
 from rucio.core.identity import add_account_identity, add_identity
 from rucio.db.sqla.constants import AccountStatus, IdentityType
+from rucio.db.sqla.session import get_session
 from rucio.tests.common import account_name_generator, headers, auth, vohdr, loginhdr
 
 
@@ -73,6 +78,59 @@ class TestAccountCoreApi:
         with pytest.raises(Duplicate):
             add_account_attribute(account, key, value)
 
+    def test_account_attributes_cache_invalidated_on_commit(self, vo):
+        """ ACCOUNT (CORE): The attributes cached by a concurrent reader before the commit of a change are dropped """
+        account = InternalAccount('root', vo=vo)
+        key = account_name_generator()
+        region = make_region().configure('dogpile.cache.memory', expiration_time=60)
+        with mock.patch('rucio.core.account.REGION', region), ThreadPoolExecutor(max_workers=1) as reader:
+            session_scoped = get_session()
+            session = session_scoped()
+            try:
+                add_account_attribute(account, key, True, session=session)
+                assert key not in reader.submit(get_account_attributes, account).result()
+                session.commit()
+            finally:
+                session_scoped.remove()
+            assert key in reader.submit(get_account_attributes, account).result()
+
+            session = session_scoped()
+            try:
+                del_account_attribute(account, key, session=session)
+                assert key in reader.submit(get_account_attributes, account).result()
+                session.commit()
+            finally:
+                session_scoped.remove()
+            assert key not in reader.submit(get_account_attributes, account).result()
+
+    def test_account_attributes_single_commit_listener(self, vo):
+        """ ACCOUNT (CORE): The attributes changed in a session are invalidated by a single listener on commit """
+        account = InternalAccount('root', vo=vo)
+        keys = [account_name_generator() for _ in range(3)]
+        session_scoped = get_session()
+        session_scoped.remove()
+        session = session_scoped()
+        try:
+            with mock.patch('rucio.core.account.event.listen', wraps=event.listen) as mocked_listen, \
+                    mock.patch('rucio.core.account._invalidate_account_attributes', wraps=_invalidate_account_attributes) as mocked_invalidate:
+                for key in keys:
+                    add_account_attribute(account, key, True, session=session)
+                del_account_attribute(account, keys[0], session=session)
+                assert mocked_listen.call_count == 1
+                mocked_invalidate.reset_mock()
+                session.commit()
+                assert mocked_invalidate.call_count == 1
+
+                # nothing is left to invalidate by the next commit
+                mocked_invalidate.reset_mock()
+                session.commit()
+                mocked_invalidate.assert_not_called()
+            for key in keys[1:]:
+                del_account_attribute(account, key, session=session)
+            session.commit()
+        finally:
+            session_scoped.remove()
+
 
 def test_create_user_success(rest_client, auth_token):
     """ ACCOUNT (REST): send a POST to create a new user """
@@ -17,6 +17,7 @@ import bz2
 import collections
 import multiprocessing
 import os
+import queue as Queue
 import sys
 import tempfile
 from datetime import datetime
@@ -124,3 +125,56 @@ def test_auditor_check_survives_failures_and_queues_failed_rses(mock_auditor):
     assert retry.get() == ('RSE_WITH_EXCEPTION', 0)
     assert retry.get() == ('RSE_WITH_ERROR', 0)
     assert retry.empty()
+
+
+@mock.patch('rucio.common.dumper.consistency.Consistency.dump')
+@mock.patch('rucio.daemons.auditor.hdfs.ReplicaFromHDFS.download', return_value='')
+@mock.patch('rucio.daemons.auditor.srmdumps.download_rse_dump', return_value=('', date))
+def test_auditor_skips_check_running_in_another_worker(mocked_srmdumps, mocked_hdfs, mocked_consistency_dump, tmp_path):
+    cache_dir, results_dir = str(tmp_path / 'cache'), str(tmp_path / 'results')
+
+    with auditor.cache_lock(cache_dir, 'RSENAME_20150101'):
+        with pytest.raises(auditor.CacheLockBusy):
+            with auditor.cache_lock(cache_dir, 'RSENAME_20150101', blocking=False):
+                pass
+        with pytest.raises(auditor.CacheLockBusy):
+            auditor.consistency('RSENAME', timedelta(days=3), None, cache_dir=cache_dir, results_dir=results_dir)
+    assert not mocked_hdfs.called
+
+    timings = {}
+    results_path = auditor.consistency('RSENAME', timedelta(days=3), None, cache_dir=cache_dir, results_dir=results_dir, timings=timings)
+    assert results_path == os.path.join(results_dir, 'RSENAME_20150101')
+    assert mocked_hdfs.call_count == 2
+    assert set(timings) == {'download_rse_dump', 'download_rucio_dumps', 'compare'}
+
+
+@mock.patch('rucio.daemons.auditor.srmdumps.parse_configuration')
+@mock.patch('rucio.daemons.auditor.consistency', side_effect=auditor.CacheLockBusy('RSENAME_20150101'))
+def test_auditor_check_keeps_dumps_of_running_check(mocked_consistency, mocked_configuration, tmp_path):
+    cache_dir = str(tmp_path)
+    dumps = [os.path.join(cache_dir, name) for name in ('ddmendpoint_RSENAME_01-01-2015', 'replicafromhdfs_RSENAME_29-12-2014')]
+    for dump in dumps:
+        open(dump, 'w').close()
+    queue = Queue.Queue()
+    retry = Queue.Queue()
+    queue.put(('RSENAME', 1))
+    wr_pipe = collections.namedtuple('FakePipe', ('send', 'close'))(
+        lambda _: None,
+        lambda: None,
+    )
+    terminate = collections.namedtuple('FakeEvent', ('is_set', ))(queue.empty)
+
+    with mock.patch.object(auditor.logging.getLogger('auditor-worker'), 'info') as mocked_info:
+        auditor.check(queue, retry, terminate, wr_pipe, cache_dir, None, False, 3)
+
+    assert all(os.path.exists(dump) for dump in dumps)
+    assert retry.get_nowait() == ('RSENAME', 1)
+    assert not any('SUCCESS' in call.args[0] for call in mocked_info.call_args_list)
+
+
+@mock.patch('rucio.daemons.auditor.get_rse_id', side_effect=lambda rse: rse)
+@mock.patch('rucio.daemons.auditor.get_rse_usage')
+def test_auditor_order_by_dump_size(mocked_usage, mocked_rse_id):
+    usages = {'SMALL': [{'files': 10}], 'LARGE': [{'files': 1000}], 'EMPTY': []}
+    mocked_usage.side_effect = lambda rse_id, source: usages[rse_id]
+    assert auditor.order_by_dump_size(['SMALL', 'EMPTY', 'LARGE']) == ['LARGE', 'SMALL', 'EMPTY']
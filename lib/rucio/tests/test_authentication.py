@@ -16,7 +16,10 @@
 import base64
 
 import datetime
+from unittest import mock
+
 import pytest
+from dogpile.cache.api import NO_VALUE
 from requests import session
 import time
 
@@ -26,8 +29,10 @@ from rucio.common.exception import Duplicate, AccessDenied
 from rucio.common.types import InternalAccount
 from rucio.common.utils import ssh_sign
 from rucio.core.identity import add_account_identity, del_account_identity
-from rucio.core.authentication import strip_x509_proxy_attributes
+from rucio.core.authentication import strip_x509_proxy_attributes, validate_auth_token, revoke_auth_token, LocalTokenCache
+from rucio.core import authentication
 from rucio.db.sqla import models
+from rucio.db.sqla.session import get_session
 from rucio.db.sqla.constants import IdentityType
 from rucio.tests.common import headers, hdrdict, loginhdr, vohdr
 
@@ -113,6 +118,38 @@ class TestAuthCoreApi:
         result = get_auth_token_user_pass(account='root', username='ddmlab', password='secret', appid='test', ip='127.0.0.1', vo=vo)
         assert result is not None
 
+    def test_validate_auth_token_local_cache(self, vo):
+        """AUTHENTICATION (CORE): Tokens are validated from the local cache until they are revoked."""
+        token = get_auth_token_user_pass(account='root', username='ddmlab', password='secret', appid='test', ip='127.0.0.1', vo=vo)['token']
+        cache = LocalTokenCache(max_size=10, negative_ttl=60, revocation_check_interval=0)
+        with mock.patch.object(authentication, 'LOCAL_TOKEN_CACHE', cache):
+            assert validate_auth_token(token)['account'].external == 'root'
+            assert validate_auth_token('invalid_token') is None
+            with mock.patch.object(authentication, 'query_token', side_effect=AssertionError('token must be cached')):
+                assert validate_auth_token(token)['account'].external == 'root'
+                assert validate_auth_token('invalid_token') is None
+
+            revoke_auth_token(token)
+            assert validate_auth_token(token) is None
+
+    def test_local_token_cache_expiration(self, vo):
+        """AUTHENTICATION (CORE): Valid tokens are kept in the local cache at most as long as in the shared region."""
+        cache = LocalTokenCache(max_size=10, negative_ttl=60, revocation_check_interval=0, positive_ttl=0)
+        cache.set('token', {'lifetime': datetime.datetime.utcnow() + datetime.timedelta(hours=1)})
+        assert cache.get('token') is NO_VALUE
+
+    def test_expired_tokens_dropped_from_local_cache(self, vo):
+        """AUTHENTICATION (CORE): The expired tokens deleted at login are dropped from the local cache."""
+        token = get_auth_token_user_pass(account='root', username='ddmlab', password='secret', appid='test', ip='127.0.0.1', vo=vo)['token']
+        cache = LocalTokenCache(max_size=10, negative_ttl=60, revocation_check_interval=0)
+        with mock.patch.object(authentication, 'LOCAL_TOKEN_CACHE', cache):
+            assert validate_auth_token(token) is not None
+            db_session = get_session()
+            db_session.query(models.Token).filter_by(token=token).update({'expired_at': datetime.datetime.utcnow() - datetime.timedelta(seconds=1)})
+            db_session.commit()
+            get_auth_token_user_pass(account='root', username='ddmlab', password='secret', appid='test', ip='127.0.0.1', vo=vo)
+            assert cache.get(token) is NO_VALUE
+
     def test_get_auth_token_user_pass_fail(self, vo):
         """AUTHENTICATION (CORE): Username and password (correct credentials)."""
         result = get_auth_token_user_pass(account='root', username='ddmlab', password='not_secret', appid='test', ip='127.0.0.1', vo=vo)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Copyright European Organization for Nuclear Research (CERN) since 2012
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import time
+from unittest import mock
+
+from dogpile.cache import make_region
+from dogpile.cache.api import NO_VALUE
+
+from rucio.common.cache import DiskCache, LocalCacheProxy
+
+
+def _make_region(name, ttl=60, max_size=1024 * 1024):
+    proxy = LocalCacheProxy(name=name, ttl=ttl, max_size=max_size)
+    region = make_region(name=name).configure('dogpile.cache.memory', expiration_time=600, wrap=[proxy])
+    return region, proxy
+
+
+def test_local_cache_hit_and_isolation():
+    """ CACHE (COMMON): Values are served from the local tier without sharing mutable objects """
+    region, proxy = _make_region('test_local_cache_hit')
+    region.set('key', ['a'])
+
+    with mock.patch.object(proxy.proxied, 'get', side_effect=AssertionError('backend must not be queried')):
+        value = region.get('key')
+        assert value == ['a']
+        value.append('b')
+        assert region.get('key') == ['a']
+
+    region.delete('key')
+    assert region.get('key') is NO_VALUE
+
+
+def test_local_cache_expiration_and_eviction():
+    """ CACHE (COMMON): Expired values are fetched again and the local tier is bounded in size """
+    region, proxy = _make_region('test_local_cache_expiration', ttl=0, max_size=1024)
+    region.set('key', 'value')
+    with mock.patch.object(proxy.proxied, 'get', wraps=proxy.proxied.get) as backend_get:
+        assert region.get('key') == 'value'
+        assert backend_get.call_count == 1
+
+    region.set_multi({'key%d' % i: 'x' * 300 for i in range(10)})
+    assert proxy.size <= 1024
+    assert region.get_multi(['key0', 'key9']) == ['x' * 300, 'x' * 300]
+
+
+def test_local_cache_backend_outage():
+    """ CACHE (COMMON): Local values are served while the backend is unavailable """
+    region, proxy = _make_region('test_local_cache_outage', ttl=0)
+    region.set('key', 'value')
+
+    with mock.patch.object(proxy.proxied, 'get', side_effect=OSError('connection refused')), \
+            mock.patch.object(proxy.proxied, 'set', side_effect=OSError('connection refused')):
+        assert region.get('key') == 'value'
+        assert region.get('unknown') is NO_VALUE
+        region.set('other', 'value')
+
+
+def test_local_cache_mutex_fallback():
+    """ CACHE (COMMON): The mutexes of a key exclude each other while the backend is unavailable """
+    _, proxy = _make_region('test_local_cache_mutex')
+    backend_mutex = mock.MagicMock()
+    backend_mutex.acquire.side_effect = backend_mutex.locked.side_effect = OSError('connection refused')
+    acquired, release = threading.Event(), threading.Event()
+
+    def _hold():
+        mutex = proxy.get_mutex('key')
+        assert mutex.acquire()
+        acquired.set()
+        release.wait()
+        mutex.release()
+
+    with mock.patch.object(proxy.proxied, 'get_mutex', return_value=backend_mutex):
+        holder = threading.Thread(target=_hold)
+        holder.start()
+        try:
+            assert acquired.wait(10)
+            mutex = proxy.get_mutex('key')
+            assert mutex.locked()
+            assert not mutex.acquire(wait=False)
+        finally:
+            release.set()
+            holder.join()
+
+        assert mutex.acquire(wait=False)
+        mutex.release()
+        assert not mutex.locked()
+
+
+def test_disk_cache(tmp_path):
+    """ CACHE (COMMON): Values are shared through the cache directory and old values are purged """
+    cache = DiskCache(str(tmp_path / 'cache'))
+    assert cache.get('key') is None
+
+    before = time.time()
+    cache.set('key', {'a': [1, 2]})
+    stored_at, value = DiskCache(str(tmp_path / 'cache')).get('key')
+    assert value == {'a': [1, 2]}
+    assert stored_at >= before - 1
+
+    # corrupted files are ignored
+    with open(cache._path('other'), 'w') as file_:
+        file_.write('{not json')
+    assert cache.get('other') is None
+
+    path = cache._path('key')
+    os.utime(path, (before - 3600, before - 3600))
+    assert cache.get('key')[0] < before - 3000
+    cache.touch('key')
+    assert cache.get('key')[0] >= before - 1
+
+    os.utime(path, (before - 3600, before - 3600))
+    cache.purge(max_age=60)
+    assert cache.get('key') is None
+    cache.set('key', 'value')
+    cache.delete('key')
+    assert cache.get('key') is None
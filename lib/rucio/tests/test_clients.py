@@ -21,6 +21,7 @@ from http.server import SimpleHTTPRequestHandler
 from http.server import HTTPServer
 from os import rename
 from threading import Thread
+from urllib.parse import urlparse
 
 import pytest
 
@@ -183,21 +184,81 @@ class TestBaseClient:
             # forcing an SSLError
             client.session.get = Mock(side_effect=SSLError)
             with pytest.raises(ServerSSLCertificateExpiredException):
-                client._send_request(Mock())
+                client._send_request('https://localhost/ping')
 
             # assume SSL valid, test if warning triggered
             class Result_Mock():
                 status_code = 200
                 reason = 'no reason'
+                headers = {}
             client.session.get = Mock(return_value=Result_Mock())
             client.logger.warning = Mock()
-            client._send_request(Mock())
+            client._send_request('https://localhost/ping')
 
             warnstr = ("Server SSL Certificate will expire in less than "
                        f"{client.sslexpiry_warnlimit_weeks} weeks on "
                        f"{date_to_str(now)}.")
             assert warnstr == client.logger.warning.call_args_list[0][0][0]
 
+    def testRequestCompressionPerHost(self, vo):
+        """ CLIENTS (BASECLIENT): Request bodies are compressed for the hosts advertising a supported encoding"""
+        encodings = []
+
+        class AuthHandler(MockServer.Handler):
+            def do_GET(self):
+                self.send_code_and_message(200, {'x-rucio-auth-token': 'sometoken'}, '')
+
+        class CompressingHandler(MockServer.Handler):
+            def do_GET(self):
+                self.send_code_and_message(200, {'Accept-Encoding': 'gzip'}, '')
+
+            def do_POST(self, encodings=encodings):
+                encodings.append(self.headers.get('Content-Encoding'))
+                self.rfile.read(int(self.headers['Content-Length']))
+                self.send_code_and_message(201, {'Accept-Encoding': 'gzip'}, '')
+
+        with MockServer(AuthHandler) as auth_server, MockServer(CompressingHandler) as server:
+            creds = {'username': 'ddmlab', 'password': 'secret'}
+            client = BaseClient(rucio_host=server.base_url, auth_host=auth_server.base_url, account='root', auth_type='userpass', creds=creds, vo=vo)
+            data = 'x' * client.request_compression_threshold
+            client._send_request(server.base_url + '/ping')  # noqa
+            client._send_request(auth_server.base_url + '/auth/validate')  # noqa
+            client._send_request(server.base_url + '/replicas', type_='POST', data=data)  # noqa
+            client._send_request(server.base_url + '/replicas', type_='POST', data=data[:10])  # noqa
+            assert encodings == ['gzip', None]
+            assert client.request_encodings[urlparse(auth_server.base_url).netloc] is None
+
+    def testMetadataCache(self, vo, tmp_path):
+        """ CLIENTS (BASECLIENT): Cached responses are reused, then revalidated with their ETag"""
+        invocations = []
+
+        class ConditionalHandler(MockServer.Handler):
+            def do_GET(self, invocations=invocations):
+                invocations.append(self.headers.get('If-None-Match'))
+                if self.path.startswith('/auth'):
+                    self.send_code_and_message(200, {'x-rucio-auth-token': 'sometoken'}, '')
+                elif self.headers.get('If-None-Match') == 'W/"v1"':
+                    self.send_code_and_message(304, {}, '')
+                else:
+                    self.send_code_and_message(200, {'ETag': 'W/"v1"'}, '{"rse": "MOCK"}')
+
+        config_set('client', 'metadata_cache', 'True')
+        config_set('client', 'metadata_cache_dir', str(tmp_path / 'cache'))
+        with MockServer(ConditionalHandler) as server:
+            creds = {'username': 'ddmlab', 'password': 'secret'}
+            client = BaseClient(rucio_host=server.base_url, auth_host=server.base_url, account='root', auth_type='userpass', creds=creds, vo=vo)
+            url = server.base_url + '/rses/MOCK'
+            del invocations[:]
+            assert client._send_cached_request(url).text == '{"rse": "MOCK"}'  # noqa
+            assert client._send_cached_request(url).text == '{"rse": "MOCK"}'  # noqa
+            assert invocations == [None]
+
+            client.metadata_cache_ttl = 0
+            response = client._send_cached_request(url)  # noqa
+            assert response.status_code == 200
+            assert response.text == '{"rse": "MOCK"}'
+            assert invocations == [None, 'W/"v1"']
+
 
 class TestRucioClients:
     """ To test Clients"""
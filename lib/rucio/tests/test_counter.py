@@ -84,6 +84,30 @@ class TestCoreRSECounter:
         for usage in history_usage:
             assert usage in current_usage
 
+    def test_update_rse_counters_in_bulk(self, rse_factory, db_session):
+        """RSE COUNTER (CORE): Sum the pending updates per counter and apply them in bulk"""
+        rse_update(once=True)
+        _, rse_id = rse_factory.make_mock_rse()
+        _, new_rse_id = rse_factory.make_mock_rse()
+        rse_counter.del_counter(rse_id=rse_id)
+        rse_counter.add_counter(rse_id=rse_id)
+        rse_counter.del_counter(rse_id=new_rse_id)
+
+        for _ in range(5):
+            rse_counter.increase(rse_id=rse_id, files=2, bytes_=10)
+            rse_counter.increase(rse_id=new_rse_id, files=1, bytes_=3)
+        rse_counter.decrease(rse_id=rse_id, files=1, bytes_=5)
+
+        stats = rse_counter.update_rse_counters(total_workers=1, worker_number=0, limit=None)
+        assert stats['rows'] >= 11
+        assert stats['counters'] >= 2
+        assert not db_session.query(models.UpdatedRSECounter).filter(models.UpdatedRSECounter.rse_id.in_([rse_id, new_rse_id])).count()
+
+        # the updates of a counter are summed into its single row, created if missing
+        for rse_id_, expected in ((rse_id, (9, 45)), (new_rse_id, (5, 15))):
+            rows = db_session.query(models.RSEUsage).filter_by(rse_id=rse_id_, source='rucio').all()
+            assert [(row.files, row.used) for row in rows] == [expected]
+
 
 @pytest.mark.noparallel(reason='runs abacus daemons; deletes all account_usage_history rows')
 class TestCoreAccountCounter:
@@ -154,3 +178,24 @@ class TestCoreAccountCounter:
         history_usage = {(usage['rse_id'], usage['files'], usage['account'], usage['bytes']) for usage in db_session.query(models.AccountUsageHistory)}
         assert (rse_id, count, account, sum_) in history_usage
         assert (rse_id, new_count, account, sum_) in history_usage
+
+    def test_update_account_counters_in_bulk(self, jdoe_account, root_account, rse_factory, db_session):
+        """ACCOUNT COUNTER (CORE): Sum the pending updates per counter and apply them in bulk"""
+        account_update(once=True)
+        _, rse_id = rse_factory.make_mock_rse()
+        account_counter.add_counter(rse_id=rse_id, account=jdoe_account)
+
+        for _ in range(5):
+            account_counter.increase(rse_id=rse_id, account=jdoe_account, files=2, bytes_=10)
+            account_counter.increase(rse_id=rse_id, account=root_account, files=1, bytes_=3)
+        account_counter.decrease(rse_id=rse_id, account=jdoe_account, files=1, bytes_=5)
+
+        stats = account_counter.update_account_counters(total_workers=1, worker_number=0, limit=None)
+        assert stats['rows'] >= 11
+        assert stats['counters'] >= 2
+        assert not db_session.query(models.UpdatedAccountCounter).filter_by(rse_id=rse_id).count()
+
+        cnt = get_usage(rse_id=rse_id, account=jdoe_account)
+        assert (cnt['files'], cnt['bytes']) == (9, 45)
+        cnt = get_usage(rse_id=rse_id, account=root_account)
+        assert (cnt['files'], cnt['bytes']) == (5, 15)
@@ -27,11 +27,11 @@ from rucio.client.downloadclient import DownloadClient
 from rucio.common.config import config_add_section, config_set
 from rucio.common.exception import InputValidationError, NoFilesDownloaded, RucioException
 from rucio.common.types import InternalScope
-from rucio.common.utils import generate_uuid
+from rucio.common.utils import adler32, generate_uuid, md5
 from rucio.core import did as did_core
 from rucio.core import scope as scope_core
 from rucio.core.rse import add_protocol
-from rucio.client.downloadclient import FileDownloadState
+from rucio.client.downloadclient import AdaptiveConcurrency, FileDownloadState, HostConcurrencyLimiter, _download_in_chunks
 from rucio.rse import rsemanager as rsemgr
 from rucio.rse.protocols.posix import Default as PosixProtocol
 from rucio.tests.common import skip_rse_tests_with_accounts, scope_name_generator, file_generator
@@ -632,7 +632,7 @@ def test_transfer_timeout(rse_factory, did_factory, download_client):
             mocks_get[0].assert_called_with(ANY, ANY, transfer_timeout=60)
 
 
-def test_download_file_with_impl(rse_factory, did_factory, download_client, mock_scope):
+def test_download_file_with_impl(rse_factory, did_factory, download_client, mock_scope, tmp_path):
     """ Download (CLIENT): Ensure the module associated to the impl value is called """
 
     impl = 'xrootd'
@@ -667,11 +667,11 @@ def test_download_file_with_impl(rse_factory, did_factory, download_client, mock
     with patch('rucio.rse.protocols.%s.Default.get' % impl, side_effect=lambda pfn, dest, **kw: shutil.copy(path, dest)) as mock_get, \
             patch('rucio.rse.protocols.%s.Default.connect' % impl),\
             patch('rucio.rse.protocols.%s.Default.close' % impl):
-        download_client.download_dids([{'did': did_str, 'impl': impl}])
+        download_client.download_dids([{'did': did_str, 'impl': impl, 'base_dir': str(tmp_path)}])
         mock_get.assert_called()
 
 
-def test_download_file_with_supported_protocol_from_config(rse_factory, did_factory, download_client, mock_scope):
+def test_download_file_with_supported_protocol_from_config(rse_factory, did_factory, download_client, mock_scope, tmp_path):
     """ Download (CLIENT): Ensure the module associated to the first protocol supported by both the remote and local config read from rucio.cfg is called """
 
     rse, rse_id = rse_factory.make_rse()
@@ -725,7 +725,7 @@ def test_download_file_with_supported_protocol_from_config(rse_factory, did_fact
     with patch('rucio.rse.protocols.%s.Default.get' % supported_impl, side_effect=lambda pfn, dest, **kw: shutil.copy(path, dest)) as mock_get, \
             patch('rucio.rse.protocols.%s.Default.connect' % supported_impl),\
             patch('rucio.rse.protocols.%s.Default.close' % supported_impl):
-        download_client.download_dids([{'did': did_str, 'impl': supported_impl}])
+        download_client.download_dids([{'did': did_str, 'impl': supported_impl, 'base_dir': str(tmp_path)}])
         mock_get.assert_called()
 
 
@@ -754,3 +754,48 @@ def test_download_states():
     FileDownloadState.FAILED
 
     assert len(FileDownloadState) == 8
+
+
+def test_download_in_chunks():
+    """ Tests the download with parallel range requests and the incremental checksums. """
+    content = os.urandom(1000)
+
+    class RangeProtocol:
+        def __init__(self):
+            self.ranges = []
+
+        def get_range(self, pfn, offset, length, transfer_timeout=None):
+            self.ranges.append((offset, length))
+            return content[offset:offset + length]
+
+    protocol = RangeProtocol()
+    with TemporaryDirectory() as tmp_dir:
+        dest_file_path = os.path.join(tmp_dir, 'file')
+        checksums = _download_in_chunks(protocol, 'https://host.example.com/file', dest_file_path, len(content), chunk_size=64, streams=4,
+                                        host_limiter=HostConcurrencyLimiter(2), checksum_names=['adler32', 'md5'])
+        with open(dest_file_path, 'rb') as f:
+            assert f.read() == content
+        assert checksums == {'adler32': adler32(dest_file_path), 'md5': md5(dest_file_path)}
+    assert sorted(protocol.ranges) == [(offset, min(64, len(content) - offset)) for offset in range(0, len(content), 64)]
+
+    # Truncated ranges fail the download
+    protocol.get_range = lambda pfn, offset, length, transfer_timeout=None: content[offset:offset + length - 1]
+    with TemporaryDirectory() as tmp_dir, pytest.raises(RucioException):
+        _download_in_chunks(protocol, 'https://host.example.com/file', os.path.join(tmp_dir, 'file'), len(content), chunk_size=64, streams=4,
+                            host_limiter=HostConcurrencyLimiter(2))
+
+
+def test_adaptive_concurrency():
+    """ Tests that download threads are added while the throughput increases. """
+    concurrency = AdaptiveConcurrency(initial=2, maximum=10, interval=0, step=2)
+    concurrency.add_bytes(100)
+    assert concurrency.update() == 4
+    # Nothing downloaded during the interval: no decision
+    assert concurrency.update() == 4
+    concurrency.add_bytes(10 ** 9)
+    assert concurrency.update() == 6
+    # The throughput did not improve: stop growing
+    concurrency.add_bytes(1)
+    assert concurrency.update() == 6
+    concurrency.add_bytes(10 ** 12)
+    assert concurrency.update() == 6
@@ -24,6 +24,7 @@ from rucio.common.dumper.consistency import compare3
 from rucio.common.dumper.consistency import gnu_sort
 from rucio.common.dumper.consistency import min3
 from rucio.common.dumper.consistency import parse_and_filter_file
+from rucio.common.dumper.consistency import sort_file
 from rucio.tests.common import make_temp_file
 
 if sys.version_info >= (3, 3):
@@ -417,3 +418,18 @@ class TestConsistency:
 
         os.unlink(path)
         os.unlink(sorted_file)
+
+    def test_sort_file_sorts_as_gnu_sort(self, tmp_path):
+        ''' DUMPER '''
+        unsorted_data = ''.join(['1,z\n', '2,a\n', '3,\xc3\xb1\n', '0,a\n'])
+        path = make_temp_file(tmp_path, unsorted_data)
+
+        for kwargs in ({}, {'delimiter': ',', 'fieldspec': '2'}):
+            expected = gnu_sort(path, prefix='gnu', cache_dir=tmp_path, **kwargs)
+            sorted_file = sort_file(path, prefix='external', cache_dir=tmp_path, chunk_size=2, **kwargs)
+            with open(expected, 'rb') as f, open(sorted_file, 'rb') as g:
+                assert f.read() == g.read()
+            os.unlink(expected)
+            os.unlink(sorted_file)
+
+        os.unlink(path)
@@ -22,7 +22,7 @@ import pytest
 import requests
 
 from rucio.common import dumper
-from rucio.common.dumper import data_models
+from rucio.common.dumper import columnar, data_models
 
 if sys.version_info >= (3, 3):
     from unittest import mock
@@ -136,6 +136,24 @@ CERN-PROD_DATADISK	data12_8TeV	ESD.04972924._000218.pool.root.1	a6152bbc	2498690
         dump_file = self.VALID_DUMP.splitlines(True)
         assert 2 == len(list(self._DataConcrete.each(dump_file)))
 
+    def test_each_columnar(self, tmp_path):
+        """ test each over the columnar conversion of a dump """
+        path = str(tmp_path / 'dump.columnar')
+        with open(path, 'wb') as output:
+            assert self._DataConcrete.to_columnar(self.VALID_DUMP.splitlines(True), output) == 2
+
+        with columnar.ColumnarDump(path) as dump:
+            assert dump.metadata == {'model': '_DataConcrete'}
+            assert dump.column('e').kind == columnar.INT
+            assert dump.column('f').kind == columnar.DATETIME
+            records = list(self._DataConcrete.each_columnar(dump, rse='RSE', date='latest'))
+            expected = list(self._DataConcrete.each(self.VALID_DUMP.splitlines(True), rse='RSE', date='latest'))
+            assert [record.csv() for record in records] == [record.csv() for record in expected]
+            assert [(record.rse, record.date) for record in records] == [('RSE', 'latest')] * 2
+
+            records = list(self._DataConcrete.each_columnar(dump, filter_=lambda record: record.e > 1000000000))
+            assert [record.c for record in records] == ['ESD.04972924._000218.pool.root.1']
+
     def test_parse_line_valid_line(self):
         """ test parse line valid line """
         for line in self.VALID_DUMP.splitlines(True):
@@ -338,3 +356,37 @@ class TestFilter:
         filter_ = data_models.Filter('size=42,state=A', data_models.Replica)
         assert filter_.match(self.replica_1)
         assert not filter_.match(self.replica_2)
+
+
+class TestColumnarReplica(object):
+
+    DUMP = [
+        'RSE\tscope\tname1\tchecksum\t42\t2015-01-01 23:00:00\tpath1\t2015-01-01 23:00:00\tA\n',
+        'RSE\tscope\tname2\tchecksum\t43\t2015-01-01 23:00:00\tpath2\t2015-01-01 23:00:00\tU\n',
+        'RSE\tscope\tname3\tchecksum\t42\t2015-01-01 23:00:00\tpath3\t\tA\n',
+    ]
+
+    def test_filter_columns(self, tmp_path):
+        """ test filtering the columnar dump by column """
+        path = str(tmp_path / 'replicas.columnar')
+        with open(path, 'wb') as output:
+            data_models.Replica.to_columnar(self.DUMP, output)
+
+        with columnar.ColumnarDump(path) as dump:
+            assert len(dump) == 3
+            assert list(dump.select([('state', 'A')])) == [0, 2]
+            assert list(dump.select([('state', 'A'), ('size', 43)])) == []
+            assert list(dump.select([('state', 'D')])) == []
+            assert list(dump.rows(['path', 'update_date'], [2])) == [('path3', None)]
+
+            filter_ = data_models.Filter('size=42,state=A', data_models.Replica)
+            records = list(data_models.Replica.each_columnar(dump, filter_=filter_))
+            assert [record.name for record in records] == ['name1', 'name3']
+            assert all(filter_.match(record) for record in records)
+
+    def test_not_a_columnar_dump(self, tmp_path):
+        """ test opening a file which is not a columnar dump """
+        path = tmp_path / 'replicas'
+        path.write_text(''.join(self.DUMP))
+        with pytest.raises(columnar.ColumnarFormatError):
+            columnar.ColumnarDump(str(path))
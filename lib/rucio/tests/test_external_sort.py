@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright European Organization for Nuclear Research (CERN) since 2012
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import random
+
+import pytest
+
+from rucio.common.external_sort import external_sort, field_key, intersect
+from rucio.daemons.storage.consistency.actions import cmp2dark
+
+
+@pytest.mark.parametrize("processes,compress", [(1, False), (2, True)])
+def test_external_sort(tmp_path, processes, compress):
+    """ EXTERNAL SORT (COMMON): Lines are sorted by byte value across several runs """
+    lines = [('/path/%d/\xf1' % i).encode() for i in range(100)] * 2
+    random.shuffle(lines)
+    output = io.BytesIO()
+
+    stats = external_sort(lines, output, unique=True, chunk_size=15, processes=processes, compress=compress, tmp_dir=str(tmp_path))
+
+    assert output.getvalue().splitlines() == sorted(set(lines))
+    assert stats == {'lines': 200, 'sorted_lines': 100, 'runs': 14}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_external_sort_by_field():
+    """ EXTERNAL SORT (COMMON): Lines are sorted from a field until the end of the line """
+    output = io.BytesIO()
+    external_sort([b'1,z', b'2,a', b'3,b,a', b'0,b'], output, key=field_key(b',', 2), chunk_size=2)
+    assert output.getvalue() == b'2,a\n0,b\n3,b,a\n1,z\n'
+    assert list(intersect([b'a', b'c', b'd'], [b'b', b'c', b'd', b'e'])) == [b'c', b'd']
+
+
+def test_cmp2dark(tmp_path):
+    """ EXTERNAL SORT (COMMON): The dark files are the files reported in both lists """
+    new_list, old_list, comm_list, stats_file = (str(tmp_path / name) for name in ('new', 'old', 'common', 'stats.json'))
+    with open(new_list, 'w') as f:
+        f.write('/c\n/a \n/b\n/a\n\n')
+    with open(old_list, 'w') as f:
+        f.write('/d\n/b\n/a\n')
+
+    cmp2dark(new_list=new_list, old_list=old_list, comm_list=comm_list, stats_file=stats_file, chunk_size=2)
+
+    with open(comm_list) as f:
+        assert f.read() == '/a\n/b'
+    with open(stats_file) as f:
+        stats = json.load(f)['cmp2dark']
+    assert stats['status'] == 'done'
+    assert (stats['new_list_entries'], stats['old_list_entries'], stats['common_entries']) == (3, 3, 2)
@@ -16,10 +16,14 @@
 import random
 import threading
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
 import pytest
 
-from rucio.core.heartbeat import live, die, cardiac_arrest, list_payload_counts, list_heartbeats, sanity_check
+from rucio.common.constants import HASH_RING_BUCKETS
+from rucio.core.heartbeat import live, live_bulk, die, cardiac_arrest, list_payload_counts, list_heartbeats, sanity_check, hash_ring_ranges
+from rucio.daemons.common import _ProcessHeartbeats
 from rucio.db.sqla.models import Heartbeats
 from rucio.db.sqla.session import transactional_session
 
@@ -137,6 +141,99 @@ class TestHeartbeat:
 
         assert list_payload_counts('test5') == {}
 
+    def test_heartbeat_bulk(self, executable_factory):
+        """ HEARTBEAT (CORE): Renew all threads of a process at once """
+
+        pids = [self._pid() for _ in range(2)]
+        # keep the threads running, such that their idents are distinct
+        stop_event = threading.Event()
+        threads = [threading.Thread(target=stop_event.wait) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        try:
+            self._check_heartbeat_bulk(executable_factory(), pids, threads)
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+    def _check_heartbeat_bulk(self, executable, pids, threads):
+        assert live(executable, 'host0', pids[0], threads[0]) == {'assign_thread': 0, 'nr_threads': 1}
+        heartbeats = live_bulk(executable, 'host1', pids[1], threads[1:], payloads={threads[2].ident: 'payload1'})
+        assert set(heartbeats) == {threads[1].ident, threads[2].ident}
+        assert sorted(hb['assign_thread'] for hb in heartbeats.values()) == [1, 2]
+        assert all(hb['nr_threads'] == 3 for hb in heartbeats.values())
+        assert list_payload_counts(executable)['payload1'] == 1
+        assert live_bulk(executable, 'host1', pids[1], threads[1:]) == heartbeats
+        assert 'payload1' not in list_payload_counts(executable)
+
+    def test_heartbeat_hash_ranges(self, executable_factory):
+        """ HEARTBEAT (CORE): The buckets of the consistent hashing ring are shared between all threads """
+
+        pids = [self._pid() for _ in range(2)]
+        stop_event = threading.Event()
+        threads = [threading.Thread(target=stop_event.wait) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        try:
+            executable = executable_factory()
+            live_bulk(executable, 'host0', pids[0], threads[:1])
+            heartbeats = live_bulk(executable, 'host1', pids[1], threads[1:], with_hash_ranges=True)
+            first_heartbeat = live_bulk(executable, 'host0', pids[0], threads[:1], with_hash_ranges=True)
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+        buckets = sorted(bucket for heartbeat in list(heartbeats.values()) + list(first_heartbeat.values())
+                         for first, last in heartbeat['hash_ranges'] for bucket in range(first, last + 1))
+        assert buckets == list(range(HASH_RING_BUCKETS))
+
+    def test_hash_ring_ranges(self):
+        """ HEARTBEAT (CORE): Only the buckets of a member leaving the consistent hashing ring change owner """
+
+        def _owners(ranges):
+            return {bucket: member for member, member_ranges in ranges.items() for first, last in member_ranges for bucket in range(first, last + 1)}
+
+        members = ['host%d:1:%d' % (i, i) for i in range(8)]
+        owners = _owners(hash_ring_ranges(members))
+        assert sorted(owners) == list(range(HASH_RING_BUCKETS))
+        assert set(owners.values()) == set(members)
+
+        new_owners = _owners(hash_ring_ranges(members[1:]))
+        assert sorted(new_owners) == list(range(HASH_RING_BUCKETS))
+        assert all(new_owners[bucket] == owner for bucket, owner in owners.items() if owner != members[0])
+
+        assert hash_ring_ranges(['host0:1:0']) == {'host0:1:0': [(0, HASH_RING_BUCKETS - 1)]}
+
+    def test_process_heartbeats(self):
+        """ HEARTBEAT (DAEMON): Only the threads which checked in since the last renewal are renewed """
+
+        threads = [SimpleNamespace(ident=i + 1, name='thread%d' % i) for i in range(3)]
+        process_heartbeats = _ProcessHeartbeats('test_process_heartbeats', 'host0', self._pid())
+
+        def _live_bulk(executable, hostname, pid, threads, payloads, with_hash_ranges):
+            return {thread.ident: {'assign_thread': 0, 'nr_threads': len(threads), 'hash_ranges': []} for thread in threads}
+
+        with mock.patch('rucio.daemons.common.heartbeat_core.live_bulk', side_effect=_live_bulk) as mocked_live_bulk:
+            def _renewed_threads():
+                return sorted(thread.ident for thread in mocked_live_bulk.call_args.kwargs['threads'])
+
+            process_heartbeats.live(threads[0], renewal_interval=60)
+            process_heartbeats.live(threads[1], renewal_interval=60)
+            assert _renewed_threads() == [threads[1].ident]
+            assert mocked_live_bulk.call_count == 2
+
+            # the heartbeat renewed less than renewal_interval ago is cached
+            assert process_heartbeats.live(threads[1], renewal_interval=60)['nr_threads'] == 1
+            assert mocked_live_bulk.call_count == 2
+
+            # threads[0] hangs, threads[1] checked in since the last renewal
+            process_heartbeats.live(threads[2], renewal_interval=60)
+            assert _renewed_threads() == [threads[1].ident, threads[2].ident]
+
+            process_heartbeats.live(threads[0], renewal_interval=60, force_renew=True)
+            assert _renewed_threads() == [threads[0].ident]
+
     @pytest.mark.noparallel(reason='performs a heartbeat cardiac_arrest')
     @pytest.mark.dirty
     def test_old_heartbeat_cleanup(self, thread_factory, executable_factory):
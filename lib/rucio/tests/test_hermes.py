@@ -19,6 +19,9 @@ Hermes Test
 
 from datetime import datetime
 from json import loads
+from threading import Event
+from unittest import mock
+import logging
 import requests
 import pytest
 
@@ -327,3 +330,120 @@ def test_hermes2(core_config_mock, caches_mock):
 
     # Checking email
     assert service_dict["email"] == 0
+
+
+@pytest.mark.noparallel(reason="fails when run in parallel")
+@pytest.mark.parametrize(
+    "core_config_mock",
+    [
+        {
+            "table_content": [
+                ("hermes", "services_list", "activemq,elastic"),
+                ("hermes", "elastic_endpoint", "http://localhost:9200/ddm_events/doc/_bulk"),
+            ]
+        }
+    ],
+    indirect=True,
+)
+@pytest.mark.parametrize(
+    "caches_mock",
+    [
+        {
+            "caches_to_mock": [
+                "rucio.core.config.REGION",
+            ]
+        }
+    ],
+    indirect=True,
+)
+def test_hermes2_pipeline(core_config_mock, caches_mock):
+    """HERMES (DAEMON): A slow service does not delay the delivery to the other services."""
+    truncate_messages()
+    for i in range(3):
+        add_message("blahblah", {"bytes": i})
+
+    elastic_released = Event()
+
+    def _deliver_to_elastic(messages, endpoint, logger):
+        elastic_released.wait(timeout=60)
+        return messages
+
+    heartbeat_handler = mock.MagicMock()
+    heartbeat_handler.live.return_value = (0, 1, logging.log)
+    heartbeat_handler.hash_ranges = None
+    pipeline = hermes2.DeliveryPipeline()
+    with mock.patch("rucio.daemons.hermes.hermes2.deliver_to_activemq_brokers", side_effect=lambda messages, logger: messages) as activemq, \
+            mock.patch("rucio.daemons.hermes.hermes2.deliver_to_elastic", side_effect=_deliver_to_elastic) as elastic:
+        hermes2.run_once(heartbeat_handler, bulk=100, pipeline=pipeline)
+        for _ in range(50):
+            if all(future.done() for future, _ in pipeline._pending["activemq"]):
+                break
+            time.sleep(0.1)
+        hermes2.run_once(heartbeat_handler, bulk=100, pipeline=pipeline)
+
+        services = [message["services"] for message in retrieve_messages(50, old_mode=False)]
+        assert services == ["elastic"] * 3
+        assert activemq.call_count == 1
+        assert elastic.call_count == 1
+
+        elastic_released.set()
+        hermes2.delete_delivered_messages(pipeline.close(logging.log), logging.log)
+    assert retrieve_messages(50, old_mode=False) == []
+
+
+@pytest.mark.noparallel(reason="fails when run in parallel")
+@pytest.mark.parametrize(
+    "core_config_mock",
+    [
+        {
+            "table_content": [
+                ("hermes", "services_list", "activemq,elastic"),
+                ("hermes", "elastic_endpoint", "http://localhost:9200/ddm_events/doc/_bulk"),
+            ]
+        }
+    ],
+    indirect=True,
+)
+@pytest.mark.parametrize(
+    "caches_mock",
+    [
+        {
+            "caches_to_mock": [
+                "rucio.core.config.REGION",
+            ]
+        }
+    ],
+    indirect=True,
+)
+def test_hermes2_saturated_service(core_config_mock, caches_mock):
+    """HERMES (DAEMON): The older messages of a saturated service do not starve the other services."""
+    truncate_messages()
+    elastic_released = Event()
+
+    def _deliver_to_elastic(messages, endpoint, logger):
+        elastic_released.wait(timeout=60)
+        return messages
+
+    heartbeat_handler = mock.MagicMock()
+    heartbeat_handler.live.return_value = (0, 1, logging.log)
+    heartbeat_handler.hash_ranges = None
+    pipeline = hermes2.DeliveryPipeline(max_pending_batches=1)
+    with mock.patch("rucio.daemons.hermes.hermes2.deliver_to_activemq_brokers", side_effect=lambda messages, logger: messages) as activemq, \
+            mock.patch("rucio.daemons.hermes.hermes2.deliver_to_elastic", side_effect=_deliver_to_elastic) as elastic, \
+            mock.patch("rucio.core.message.config_get_list", return_value=["elastic"]):
+        for i in range(6):
+            add_message("blahblah", {"bytes": i})
+        hermes2.run_once(heartbeat_handler, bulk=3, pipeline=pipeline)
+        assert pipeline.saturated_services() == ["elastic"]
+
+        with mock.patch("rucio.core.message.config_get_list", return_value=["activemq"]):
+            for i in range(3):
+                add_message("blahblah", {"bytes": i})
+        hermes2.run_once(heartbeat_handler, bulk=3, pipeline=pipeline)
+        assert activemq.call_count == 1
+        assert len(activemq.call_args.kwargs["messages"]) == 3
+        assert elastic.call_count == 1
+
+        elastic_released.set()
+        hermes2.delete_delivered_messages(pipeline.close(logging.log), logging.log)
+    assert [message["services"] for message in retrieve_messages(50, old_mode=False)] == ["elastic"] * 3
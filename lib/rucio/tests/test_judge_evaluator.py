@@ -313,6 +313,32 @@ class TestJudgeEvaluator:
 
         assert get_rule(rule_id)['locks_ok_cnt'] == 8
 
+    @pytest.mark.noparallel(reason="uses mock scope and predefined RSEs; runs judge evaluator")
+    def test_judge_add_files_to_dataset_in_several_attachments(self):
+        """ JUDGE EVALUATOR: Test the judge when files are attached to a dataset one at a time"""
+        scope = InternalScope('mock', **self.vo)
+        dataset = 'dataset_' + str(uuid())
+        add_did(scope, dataset, DIDType.DATASET, self.jdoe)
+        add_rule(dids=[{'scope': scope, 'name': dataset}], account=self.jdoe, copies=1, rse_expression=self.rse5, grouping='DATASET', weight=None, lifetime=None, locked=False, subscription_id=None)
+
+        files = create_files(5, scope, self.rse1_id)
+        for file in files:
+            attach_dids(scope, dataset, [file], self.jdoe)
+
+        @transactional_session
+        def __count_updated_dids(*, session=None):
+            return session.query(UpdatedDID).filter_by(scope=scope, name=dataset).count()
+
+        assert __count_updated_dids() == len(files)
+
+        # Fake judge
+        re_evaluator(once=True, did_limit=1000)
+
+        # All the updates of the dataset are handled by a single evaluation
+        assert __count_updated_dids() == 0
+        for file in files:
+            assert len(get_replica_locks(scope=file['scope'], name=file['name'])) == 1
+
     @pytest.mark.noparallel(reason="uses mock scope and predefined RSEs; runs judge evaluator")
     def test_judge_add_files_to_dataset_with_2_rules(self):
         """ JUDGE EVALUATOR: Test the judge when adding files to dataset with 2 rules"""
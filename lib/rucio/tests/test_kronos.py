@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Copyright European Organization for Nuclear Research (CERN) since 2012
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+from datetime import datetime
+from json import dumps
+from queue import Queue
+from types import SimpleNamespace
+from unittest import mock
+
+from rucio.core.replica import add_replica, get_replica
+from rucio.daemons.tracer import kronos
+from rucio.daemons.tracer.kronos import AMQConsumer, TraceAggregator
+from rucio.db.sqla.constants import BadFilesStatus
+
+TRACE_TIME = 1600000000
+
+
+def _trace(did, rse, vo, trace_time=TRACE_TIME, **kwargs):
+    trace = {'eventType': 'get',
+             'eventVersion': 'test',
+             'clientState': 'DONE',
+             'usrdn': 'someuser',
+             'scope': did['scope'].external,
+             'filename': did['name'],
+             'remoteSite': rse,
+             'traceTimeentryUnix': trace_time,
+             'vo': vo}
+    trace.update(kwargs)
+    return trace
+
+
+def _send(consumer, *traces):
+    for trace in traces:
+        consumer.on_message(SimpleNamespace(headers={'message-id': str(id(trace)), 'appversion': 'rucio'}, body=dumps(trace)))
+
+
+def _consumer(conn=None, bad_files_patterns=(), **kwargs):
+    return AMQConsumer(broker='localhost', conn=conn or mock.MagicMock(), queue='/queue/test', subscription_id='test',
+                       excluded_usrdns=set(), dataset_queue=Queue(), bad_files_patterns=list(bad_files_patterns), **kwargs)
+
+
+def _make_replica(rse_id, did_factory, root_account):
+    did = did_factory.random_file_did()
+    add_replica(rse_id=rse_id, account=root_account, bytes_=1, **did)
+    return did
+
+
+def test_trace_aggregator():
+    """ KRONOS (DAEMON): Only the latest access of a replica and the distinct suspicious files are aggregated """
+    aggregator = TraceAggregator(max_replicas=3)
+    for accessed_at in (datetime(2020, 1, 2), datetime(2020, 1, 3), datetime(2020, 1, 1)):
+        aggregator.add_replica('scope', 'name', 'RSE', 'rse_id', accessed_at, 0)
+    aggregator.add_replica('scope', 'name', 'RSE2', 'rse_id2', datetime(2020, 1, 1), 0)
+    for surl in ('root://host/file1', 'root://host/file1', 'davs://host/file1'):
+        aggregator.add_suspicious(surl, 'reason', 'def')
+
+    assert len(aggregator) == 4
+    assert aggregator.is_full()
+
+    nb_traces, replicas, suspicious = aggregator.pop()
+    assert nb_traces == 4
+    assert sorted((replica['rse_id'], replica['accessed_at']) for replica in replicas) == [('rse_id', datetime(2020, 1, 3)), ('rse_id2', datetime(2020, 1, 1))]
+    assert suspicious == {('def', 'reason', 'root'): {'root://host/file1'}, ('def', 'reason', 'davs'): {'davs://host/file1'}}
+    assert len(aggregator) == 0
+    assert not aggregator.is_full()
+
+
+def test_kronos_aggregate_duplicate_traces(vo, rse_factory, did_factory, root_account):
+    """ KRONOS (DAEMON): The duplicate traces of a replica update its access time once, with the latest access """
+    rse, rse_id = rse_factory.make_mock_rse()
+    did = _make_replica(rse_id, did_factory, root_account)
+    conn = mock.MagicMock()
+    consumer = _consumer(conn=conn, chunksize=3, flush_interval=3600)
+
+    with mock.patch('rucio.daemons.tracer.kronos.touch_replicas', wraps=kronos.touch_replicas) as mocked_touch_replicas:
+        _send(consumer, *[_trace(did, rse, vo, trace_time=TRACE_TIME + delay) for delay in (10, 30, 20)])
+        # the traces are acknowledged once aggregated, before the access time is updated
+        assert conn.ack.call_count == 3
+        assert get_replica(rse_id=rse_id, **did)['accessed_at'] is None
+
+        consumer.flush(force=True)
+    assert mocked_touch_replicas.call_count == 1
+    assert len(mocked_touch_replicas.call_args.args[0]) == 1
+    assert get_replica(rse_id=rse_id, **did)['accessed_at'] == datetime.utcfromtimestamp(TRACE_TIME + 30)
+
+
+def test_kronos_flush_on_size(vo, rse_factory, did_factory, root_account):
+    """ KRONOS (DAEMON): The access times are updated once the aggregator is full """
+    rse, rse_id = rse_factory.make_mock_rse()
+    dids = [_make_replica(rse_id, did_factory, root_account) for _ in range(2)]
+    consumer = _consumer(chunksize=1, flush_interval=3600, max_pending_replicas=2)
+
+    _send(consumer, _trace(dids[0], rse, vo))
+    assert get_replica(rse_id=rse_id, **dids[0])['accessed_at'] is None
+
+    _send(consumer, _trace(dids[1], rse, vo))
+    for did in dids:
+        assert get_replica(rse_id=rse_id, **did)['accessed_at'] == datetime.utcfromtimestamp(TRACE_TIME)
+
+
+def test_kronos_flush_on_time(vo, rse_factory, did_factory, root_account):
+    """ KRONOS (DAEMON): The access times are updated once the flush interval has elapsed """
+    rse, rse_id = rse_factory.make_mock_rse()
+    dids = [_make_replica(rse_id, did_factory, root_account) for _ in range(2)]
+
+    with mock.patch('rucio.daemons.tracer.kronos.time', return_value=1000):
+        consumer = _consumer(chunksize=1, flush_interval=10)
+        _send(consumer, _trace(dids[0], rse, vo))
+        consumer.flush()
+    assert get_replica(rse_id=rse_id, **dids[0])['accessed_at'] is None
+
+    with mock.patch('rucio.daemons.tracer.kronos.time', return_value=1010):
+        consumer.flush()
+    assert get_replica(rse_id=rse_id, **dids[0])['accessed_at'] == datetime.utcfromtimestamp(TRACE_TIME)
+
+    # a received chunk also updates the access times once the flush interval has elapsed
+    with mock.patch('rucio.daemons.tracer.kronos.time', return_value=1015):
+        _send(consumer, _trace(dids[1], rse, vo))
+    assert get_replica(rse_id=rse_id, **dids[1])['accessed_at'] is None
+
+    with mock.patch('rucio.daemons.tracer.kronos.time', return_value=1020):
+        _send(consumer, _trace(dids[1], rse, vo))
+    assert get_replica(rse_id=rse_id, **dids[1])['accessed_at'] == datetime.utcfromtimestamp(TRACE_TIME)
+
+
+def test_kronos_declare_suspicious_in_bulk(vo, rse_factory, did_factory, root_account):
+    """ KRONOS (DAEMON): The suspicious files are declared with one call per reason and protocol """
+    rse, rse_id = rse_factory.make_mock_rse()
+    did = _make_replica(rse_id, did_factory, root_account)
+    reason = 'No such file or directory'
+    surls = ['root://host/file2', 'root://host/file1', 'root://host/file1', 'davs://host/file1']
+    traces = [_trace(did, rse, vo, clientState='FAILED', stateReason=reason, url=surl) for surl in surls]
+    consumer = _consumer(chunksize=len(traces), flush_interval=3600, bad_files_patterns=[re.compile('.*No such file.*')])
+
+    with mock.patch('rucio.daemons.tracer.kronos.declare_bad_file_replicas') as mocked_declare:
+        _send(consumer, *traces)
+        mocked_declare.assert_not_called()
+        consumer.flush(force=True)
+    assert sorted(call.args[0] for call in mocked_declare.call_args_list) == [['davs://host/file1'], ['root://host/file1', 'root://host/file2']]
+    for call in mocked_declare.call_args_list:
+        assert call.kwargs['reason'] == reason
+        assert call.kwargs['status'] == BadFilesStatus.SUSPICIOUS
+        assert call.kwargs['issuer'].external == 'root'
+
+    # the files are declared one by one if the bulk declaration fails
+    consumer = _consumer(chunksize=len(traces), flush_interval=3600, bad_files_patterns=[re.compile('.*No such file.*')])
+
+    def _declare(surls, **kwargs):
+        if 'root://host/file1' in surls:
+            raise Exception('cannot declare root://host/file1')
+
+    with mock.patch('rucio.daemons.tracer.kronos.declare_bad_file_replicas', side_effect=_declare) as mocked_declare:
+        _send(consumer, *traces)
+        consumer.flush(force=True)
+    assert sorted(call.args[0] for call in mocked_declare.call_args_list) == [['davs://host/file1'], ['root://host/file1'], ['root://host/file1', 'root://host/file2'], ['root://host/file2']]
+
+
+def test_kronos_touch_in_bulk():
+    """ KRONOS (DAEMON): The items of a chunk which cannot be updated in bulk are updated one by one and retried later """
+    items = [{'name': 'item%d' % i} for i in range(5)]
+    locked = items[3]
+    dataset_queue = Queue()
+
+    def _touch(chunk):
+        return locked not in chunk
+
+    touch = mock.MagicMock(side_effect=_touch)
+    assert getattr(kronos, '__touch_in_bulk')(touch, items, dataset_queue, chunk_size=2) == 1
+    assert [list(call.args[0]) for call in touch.call_args_list] == [items[0:2], items[2:4], [items[2]], [items[3]], items[4:5]]
+    assert dataset_queue.qsize() == 1
+    assert dataset_queue.get() == locked
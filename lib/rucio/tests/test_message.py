@@ -129,6 +129,12 @@ def test_large_payload(core_config_mock, caches_mock):
     messages = retrieve_messages(40)
     assert messages[0]['payload'] == dict_long_payload
 
+    # Messages with and without large payloads are retrieved together
+    add_message(event_type=event_type, payload={"short": True})
+    add_message(event_type=event_type, payload={"mylong_message": long_payload[::-1]})
+    payloads = [message['payload'] for message in retrieve_messages(40) if message['services'] == 'activemq']
+    assert sorted(payloads, key=str) == sorted([dict_long_payload, {"short": True}, {"mylong_message": long_payload[::-1]}], key=str)
+
 
 @pytest.mark.noparallel(reason='fails when run in parallel')
 @pytest.mark.parametrize("core_config_mock", [{"table_content": [
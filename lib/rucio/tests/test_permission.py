@@ -13,12 +13,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest import mock
+
 import pytest
+from dogpile.cache import make_region
 
 from rucio.api.permission import has_permission
 from rucio.common.config import config_get
 from rucio.common.types import InternalAccount, InternalScope
 from rucio.core.scope import add_scope
+from rucio.core import permission
 from rucio.core.account import add_account_attribute, del_account_attribute
 from rucio.tests.common import scope_name_generator
 
@@ -51,6 +55,19 @@ class TestPermissionCoreApi:
         assert has_permission(issuer=self.usr, action='add_scope', kwargs={'account': self.usr}, vo=vo)
         del_account_attribute(InternalAccount(self.usr, vo=vo), 'scope_admin')
 
+    @pytest.mark.noparallel(reason='Add/delete account attribute of an existing account')
+    def test_permission_decision_cache(self, vo):
+        """ PERMISSION(CORE): Check that cached permissions follow the changes of account attributes """
+        region = make_region().configure('dogpile.cache.memory', expiration_time=60)
+        with mock.patch.object(permission, 'DECISION_CACHE_TTL', 60), mock.patch.object(permission, 'REGION', region):
+            assert not has_permission(issuer=self.usr, action='add_rse', kwargs={'rse': 'MOCK'}, vo=vo)
+            with mock.patch.object(permission.permission_modules[vo], 'has_permission', side_effect=AssertionError('decision must be cached')):
+                assert not has_permission(issuer=self.usr, action='add_rse', kwargs={'rse': 'MOCK'}, vo=vo)
+            add_account_attribute(InternalAccount(self.usr, vo=vo), 'admin', True)
+            assert has_permission(issuer=self.usr, action='add_rse', kwargs={'rse': 'MOCK'}, vo=vo)
+            del_account_attribute(InternalAccount(self.usr, vo=vo), 'admin')
+            assert not has_permission(issuer=self.usr, action='add_rse', kwargs={'rse': 'MOCK'}, vo=vo)
+
     def test_permission_get_auth_token_user_pass(self, vo):
         """ PERMISSION(CORE): Check permission to get_auth_token_user_pass """
         assert has_permission(issuer='root', action='get_auth_token_user_pass', kwargs={'account': 'root', 'username': 'ddmlab', 'password': 'secret'}, vo=vo)
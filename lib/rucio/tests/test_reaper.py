@@ -13,7 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
+import threading
+import time
 from datetime import datetime, timedelta
+from unittest import mock
 
 import pytest
 from sqlalchemy import and_, or_
@@ -22,7 +26,7 @@ from rucio.api import replica as replica_api
 from rucio.api import rse as rse_api
 from rucio.db.sqla import models
 from rucio.db.sqla.session import get_session
-from rucio.common.exception import ReplicaNotFound, DataIdentifierNotFound
+from rucio.common.exception import ReplicaNotFound, DataIdentifierNotFound, ServiceUnavailable
 from rucio.common.types import InternalAccount, InternalScope
 from rucio.common.utils import generate_uuid
 from rucio.core import did as did_core
@@ -30,7 +34,8 @@ from rucio.core import message as message_core
 from rucio.core import replica as replica_core
 from rucio.core import rse as rse_core
 from rucio.core import rule as rule_core
-from rucio.daemons.reaper.reaper import reaper
+from rucio.daemons.reaper import reaper as reaper_module
+from rucio.daemons.reaper.reaper import reaper, delete_from_storage
 from rucio.daemons.reaper.dark_reaper import reaper as dark_reaper
 from rucio.daemons.reaper.reaper import run as run_reaper
 from rucio.db.sqla.models import ConstituentAssociationHistory
@@ -73,6 +78,8 @@ def __add_test_rse_and_replicas(vo, scope, rse_name, names, file_size, epoch_tom
     # Run test twice: with, and without, temp tables
     {"overrides": [('core', 'use_temp_tables', 'True')]},
     {"overrides": [('core', 'use_temp_tables', 'False')]},
+    # Delete several files concurrently
+    {"overrides": [('core', 'use_temp_tables', 'True'), ('reaper', 'max_concurrent_deletions', '4')]},
 ], indirect=True)
 @pytest.mark.parametrize("caches_mock", [{"caches_to_mock": [
     'rucio.daemons.reaper.reaper.REGION'
@@ -459,3 +466,120 @@ def test_archive_of_deleted_dids(vo, did_factory, root_account, core_config_mock
         print(did)
         deleted_dids.append(did)
     assert len(deleted_dids) == len(dids)
+
+
+class _RecordingProtocol:
+    """ Protocol recording the concurrent deletions, whose deletions fail for the PFNs in failing_pfns """
+
+    def __init__(self, recorder, failing_pfns=(), delay=0.05):
+        self.attributes = {'scheme': 'mock'}
+        self.recorder = recorder
+        self.failing_pfns = failing_pfns
+        self.delay = delay
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+        self.recorder['connections'] += 1
+
+    def close(self):
+        self.connected = False
+
+    def delete(self, pfn):
+        with self.recorder['lock']:
+            self.recorder['running'] += 1
+            self.recorder['max_running'] = max(self.recorder['max_running'], self.recorder['running'])
+        try:
+            if pfn in self.failing_pfns:
+                raise ServiceUnavailable('storage unavailable')
+            time.sleep(self.delay)
+            with self.recorder['lock']:
+                self.recorder['deleted'].append(pfn)
+        finally:
+            with self.recorder['lock']:
+                self.recorder['running'] -= 1
+
+
+def __delete_from_storage_with_recorder(vo, nb_files, max_concurrent_deletions, auto_exclude_threshold=100, failing_pfns=()):
+    scope = InternalScope('mock', vo=vo)
+    replicas = [{'scope': scope, 'name': 'file_%d' % i, 'pfn': 'mock://localhost/file_%d' % i, 'bytes': 1, 'datatype': None} for i in range(nb_files)]
+    recorder = {'lock': threading.Lock(), 'running': 0, 'max_running': 0, 'connections': 0, 'deleted': []}
+    protocols = []
+
+    def _protocol_factory():
+        protocols.append(_RecordingProtocol(recorder, failing_pfns=failing_pfns))
+        return protocols[-1]
+
+    heartbeat_handler = mock.MagicMock()
+    heartbeat_handler.live.return_value = (0, 1, logging.log)
+    with mock.patch('rucio.daemons.reaper.reaper.add_message') as mocked_add_message, mock.patch('rucio.daemons.reaper.reaper.REGION'):
+        deleted_files = delete_from_storage(heartbeat_handler, {}, replicas, _protocol_factory(), {'rse': 'MOCK', 'id': 'mock_id', 'sign_url': None},
+                                            is_staging=False, auto_exclude_threshold=auto_exclude_threshold,
+                                            protocol_factory=_protocol_factory, max_concurrent_deletions=max_concurrent_deletions)
+    assert not any(protocol.connected for protocol in protocols)
+    messages = [(call.args[0], call.args[1]['url']) for call in mocked_add_message.call_args_list]
+    return deleted_files, recorder, messages
+
+
+def test_delete_from_storage_concurrently(vo):
+    """ REAPER (DAEMON): The files are deleted concurrently, each deletion with its own connection """
+    deleted_files, recorder, messages = __delete_from_storage_with_recorder(vo, nb_files=20, max_concurrent_deletions=4)
+
+    assert recorder['connections'] == 4
+    assert 1 < recorder['max_running'] <= 4
+    assert [deleted_file['name'] for deleted_file in deleted_files] == ['file_%d' % i for i in range(20)]
+    assert messages == [('deletion-done', 'mock://localhost/file_%d' % i) for i in range(20)]
+
+
+def test_delete_from_storage_auto_exclude(vo):
+    """ REAPER (DAEMON): The deletions running when the RSE gets excluded are still reported """
+    failing_pfns = ['mock://localhost/file_0', 'mock://localhost/file_1']
+    deleted_files, recorder, messages = __delete_from_storage_with_recorder(vo, nb_files=50, max_concurrent_deletions=4,
+                                                                            auto_exclude_threshold=2, failing_pfns=failing_pfns)
+
+    # the RSE got excluded after the second failure, the queued deletions were not started
+    assert 0 < len(recorder['deleted']) < 48
+    assert sorted(deleted_file['name'] for deleted_file in deleted_files) == sorted(pfn.split('/')[-1] for pfn in recorder['deleted'])
+    assert sorted(url for event_type, url in messages if event_type == 'deletion-done') == sorted(recorder['deleted'])
+    assert sorted(url for event_type, url in messages if event_type == 'deletion-failed') == failing_pfns
+
+
+@pytest.mark.parametrize("caches_mock", [{"caches_to_mock": [
+    'rucio.daemons.reaper.reaper.REGION'
+]}], indirect=True)
+def test_reaper_catalog_update_overlaps_storage_deletion(vo, caches_mock):
+    """ REAPER (DAEMON): The replicas are removed from the catalog while the next files are deleted from the storage """
+    [cache_region] = caches_mock
+    scope = InternalScope('data13_hip', vo=vo)
+    file_size = 200
+    rse_names, all_dids = [], []
+    for _ in range(2):
+        rse_name, rse_id, dids = __add_test_rse_and_replicas(vo=vo, scope=scope, rse_name=rse_name_generator(),
+                                                             names=['lfn' + generate_uuid() for _ in range(10)], file_size=file_size)
+        rse_core.set_rse_limits(rse_id=rse_id, name='MinFreeSpace', value=5 * file_size)
+        rse_core.set_rse_usage(rse_id=rse_id, source='storage', used=10 * file_size, free=1)
+        rse_names.append(rse_name)
+        all_dids.extend(dids)
+
+    timeline = []
+    delete_replicas_from_catalog = getattr(reaper_module, '__delete_replicas_from_catalog')
+
+    def _delete_from_storage(*args, **kwargs):
+        timeline.append('storage')
+        return delete_from_storage(*args, **kwargs)
+
+    def _delete_replicas_from_catalog(*args, **kwargs):
+        timeline.append('catalog start')
+        time.sleep(1)
+        delete_replicas_from_catalog(*args, **kwargs)
+        timeline.append('catalog end')
+
+    cache_region.invalidate()
+    with mock.patch('rucio.daemons.reaper.reaper.delete_from_storage', side_effect=_delete_from_storage), \
+            mock.patch('rucio.daemons.reaper.reaper.__delete_replicas_from_catalog', side_effect=_delete_replicas_from_catalog):
+        reaper(once=True, rses=[], include_rses='|'.join(rse_names), exclude_rses=None, chunk_size=5)
+
+    # the second RSE is deleted from the storage during the catalog update of the first one,
+    # and the catalog updates do not overlap each other
+    assert timeline == ['storage', 'catalog start', 'storage', 'catalog end', 'catalog start', 'catalog end']
+    assert len(list(replica_core.list_replicas(dids=all_dids, rse_expression='|'.join(rse_names)))) == 10
@@ -29,6 +29,7 @@ from rucio.client.ruleclient import RuleClient
 from rucio.common.exception import (DataIdentifierNotFound, AccessDenied, RSEProtocolPriorityError, RucioException,
                                     ReplicaIsLocked, ReplicaNotFound, ScopeNotFound,
                                     DatabaseException, InputValidationError)
+from rucio.common.http_encoding import MSGPACK_STREAM, compress, decompress, iter_msgpack_stream, msgpack_available
 from rucio.common.schema import get_schema_value
 from rucio.common.utils import generate_uuid, clean_surls, parse_response
 from rucio.core.config import set as cconfig_set
@@ -36,7 +37,7 @@ from rucio.core.did import add_did, attach_dids, get_did, set_status, list_files
 from rucio.core.replica import (add_replica, add_replicas, delete_replicas, get_replicas_state,
                                 get_replica, list_replicas, update_replica_state,
                                 get_RSEcoverage_of_dataset, get_replica_atime,
-                                touch_replica, get_bad_pfns, set_tombstone, add_bad_dids)
+                                touch_replica, touch_replicas, get_bad_pfns, set_tombstone, add_bad_dids)
 from rucio.core.rse import add_protocol, add_rse_attribute, del_rse_attribute
 from rucio.daemons.badreplicas.minos import minos
 from rucio.daemons.badreplicas.minos_temporary_expiration import minos_tu_expiration
@@ -44,6 +45,7 @@ from rucio.db.sqla import models
 from rucio.db.sqla.constants import DIDType, ReplicaState, BadPFNStatus, OBSOLETE
 from rucio.db.sqla.session import transactional_session
 from rucio.rse import rsemanager as rsemgr
+from rucio.rse.protocols import xrootd
 from rucio.tests.common import execute, headers, auth, Mime, accept, did_name_generator
 
 from typing import TYPE_CHECKING
@@ -330,6 +332,31 @@ class TestReplicaCore:
         for i in range(0, nbfiles - 1):
             assert get_replica_atime({'scope': files2[i]['scope'], 'name': files2[i]['name'], 'rse_id': rse_id}) is None
 
+    def test_touch_replicas_in_bulk(self, rse_factory, mock_scope, root_account):
+        """ REPLICA (CORE): Touch the accessed_at timestamp of several replicas at once"""
+        _, rse1_id = rse_factory.make_mock_rse()
+        _, rse2_id = rse_factory.make_mock_rse()
+
+        files = [{'scope': mock_scope, 'name': did_name_generator('file'), 'bytes': 1, 'adler32': '0cc737eb'} for _ in range(3)]
+        add_replicas(rse_id=rse1_id, files=files, account=root_account, ignore_availability=True)
+        add_replicas(rse_id=rse2_id, files=files[:1], account=root_account, ignore_availability=True)
+
+        now = datetime.utcnow()
+        now -= timedelta(microseconds=now.microsecond)
+        before = now - timedelta(hours=1)
+
+        assert touch_replicas([{'scope': mock_scope, 'name': files[0]['name'], 'rse_id': rse1_id, 'accessed_at': before},
+                               {'scope': mock_scope, 'name': files[0]['name'], 'rse_id': rse2_id, 'accessed_at': now},
+                               {'scope': mock_scope, 'name': files[1]['name'], 'rse_id': rse1_id, 'accessed_at': now}])
+
+        assert before == get_replica_atime({'scope': mock_scope, 'name': files[0]['name'], 'rse_id': rse1_id})
+        assert now == get_replica_atime({'scope': mock_scope, 'name': files[0]['name'], 'rse_id': rse2_id})
+        assert now == get_replica_atime({'scope': mock_scope, 'name': files[1]['name'], 'rse_id': rse1_id})
+        assert get_replica_atime({'scope': mock_scope, 'name': files[2]['name'], 'rse_id': rse1_id}) is None
+        assert now == get_did_atime(scope=mock_scope, name=files[0]['name'])
+        assert now == get_did_atime(scope=mock_scope, name=files[1]['name'])
+        assert get_did_atime(scope=mock_scope, name=files[2]['name']) is None
+
     def test_list_replicas_all_states(self, rse_factory, mock_scope, root_account):
         """ REPLICA (CORE): list file replicas with all_states"""
         _, rse1_id = rse_factory.make_mock_rse()
@@ -544,6 +571,66 @@ class TestReplicaCore:
 
         add_replicas(rse_id=rse_id, files=files, account=root_account)
 
+    def test_list_replicas_pfns_in_bulk(self, rse_factory, mock_scope, root_account):
+        """ REPLICA (CORE): The PFNs of the listed replicas are generated with one call per protocol """
+
+        rse, rse_id = rse_factory.make_rse()
+        for scheme in ('root', 'http'):
+            add_protocol(rse_id, {'scheme': scheme,
+                                  'hostname': 'root.aperture.com',
+                                  'port': 1409,
+                                  'prefix': '//test/chamber/',
+                                  'impl': 'rucio.rse.protocols.xrootd.Default',
+                                  'domains': {
+                                      'lan': {'read': 1, 'write': 1, 'delete': 1},
+                                      'wan': {'read': 1, 'write': 1, 'delete': 1}}})
+
+        files = [{'scope': mock_scope, 'name': 'element_%s' % generate_uuid(), 'bytes': 1234, 'adler32': 'deadbeef'} for _ in range(5)]
+        add_replicas(rse_id=rse_id, files=files, account=root_account)
+
+        lfns2pfns = xrootd.Default.lfns2pfns
+        with mock.patch.object(xrootd.Default, 'lfns2pfns', autospec=True, side_effect=lfns2pfns) as mocked_lfns2pfns:
+            replicas = list(list_replicas(dids=[{'scope': f['scope'], 'name': f['name']} for f in files], schemes=['root', 'http']))
+
+        assert mocked_lfns2pfns.call_count == 2
+        assert all(len(call.kwargs['lfns']) == len(files) for call in mocked_lfns2pfns.call_args_list)
+        for replica in replicas:
+            hstr = hashlib.md5(('%s:%s' % (mock_scope, replica['name'])).encode('utf-8')).hexdigest()
+            assert sorted(replica['rses'][rse_id]) == ['%s://root.aperture.com:1409//test/chamber/mock/%s/%s/%s' % (scheme, hstr[0:2], hstr[2:4], replica['name'])
+                                                       for scheme in ('http', 'root')]
+
+    def test_list_replicas_pfns_bulk_failure(self, rse_factory, mock_scope, root_account):
+        """ REPLICA (CORE): The PFNs are generated one by one if they cannot be generated at once """
+
+        rse, rse_id = rse_factory.make_rse()
+        add_protocol(rse_id, {'scheme': 'root',
+                              'hostname': 'root.aperture.com',
+                              'port': 1409,
+                              'prefix': '//test/chamber/',
+                              'impl': 'rucio.rse.protocols.xrootd.Default',
+                              'domains': {
+                                  'lan': {'read': 1, 'write': 1, 'delete': 1},
+                                  'wan': {'read': 1, 'write': 1, 'delete': 1}}})
+
+        files = [{'scope': mock_scope, 'name': 'element_%s' % generate_uuid(), 'bytes': 1234, 'adler32': 'deadbeef'} for _ in range(3)]
+        add_replicas(rse_id=rse_id, files=files, account=root_account)
+        bad_name = files[0]['name']
+
+        lfns2pfns = xrootd.Default.lfns2pfns
+
+        def _lfns2pfns(self, lfns):
+            if any(lfn['name'] == bad_name for lfn in (lfns if isinstance(lfns, list) else [lfns])):
+                raise ValueError('cannot generate the PFN of %s' % bad_name)
+            return lfns2pfns(self, lfns)
+
+        with mock.patch.object(xrootd.Default, 'lfns2pfns', autospec=True, side_effect=_lfns2pfns) as mocked_lfns2pfns:
+            replicas = {replica['name']: replica for replica in list_replicas(dids=[{'scope': f['scope'], 'name': f['name']} for f in files], schemes=['root'])}
+
+        assert mocked_lfns2pfns.call_count == 1 + len(files)
+        assert replicas[bad_name]['pfns'] == {}
+        for file in files[1:]:
+            assert len(replicas[file['name']]['rses'][rse_id]) == 1
+
     def test_set_tombstone(self, rse_factory, mock_scope, root_account):
         """ REPLICA (CORE): set tombstone on replica """
         # Set tombstone on one replica
@@ -796,6 +883,60 @@ def test_rest_list_replicas_content_type(rse_factory, mock_scope, replica_client
     assert [header[1] for header in response.headers if header[0] == 'Content-Type'][0] == Mime.JSON_STREAM
 
 
+def test_rest_list_replicas_content_encoding(rse_factory, mock_scope, replica_client, rest_client, auth_token):
+    """ REPLICA (REST): compress the request and response bodies with the negotiated encoding."""
+    rse, _ = rse_factory.make_mock_rse()
+    scope = mock_scope.external
+    files = [{'scope': scope, 'name': did_name_generator('file'), 'bytes': 1, 'adler32': '0cc737eb'} for _ in range(20)]
+    replica_client.add_replicas(rse=rse, files=files)
+    dids = [{'scope': f['scope'], 'name': f['name']} for f in files]
+
+    # gzip compressed request body and response
+    data = compress(dumps({'dids': dids}).encode(), 'gzip')
+    response = rest_client.post('/replicas/list', data=data, headers=headers(auth(auth_token), accept(Mime.JSON_STREAM), [('Content-Encoding', 'gzip'), ('Accept-Encoding', 'gzip')]))
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'gzip' in response.headers['Accept-Encoding']
+    replicas = [parse_response(line) for line in decompress(response.get_data(), 'gzip').splitlines() if line]
+    assert sorted(replica['name'] for replica in replicas) == sorted(did['name'] for did in dids)
+
+    # uncompressed response, if no supported encoding is accepted
+    response = rest_client.post('/replicas/list', data=dumps({'dids': dids}), headers=headers(auth(auth_token), accept(Mime.JSON_STREAM), [('Accept-Encoding', 'br')]))
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert len([line for line in response.get_data().splitlines() if line]) == len(dids)
+
+    # unsupported or invalid request body encoding
+    response = rest_client.post('/replicas/list', data=data, headers=headers(auth(auth_token), [('Content-Encoding', 'unsupported')]))
+    assert response.status_code == 415
+    response = rest_client.post('/replicas/list', data=b'not gzip', headers=headers(auth(auth_token), [('Content-Encoding', 'gzip')]))
+    assert response.status_code == 400
+
+    # compressed request bodies are not decompressed without a valid token
+    with mock.patch('rucio.web.rest.flaskapi.v1.common.decompress') as mocked_decompress:
+        response = rest_client.post('/replicas/list', data=data, headers=headers(accept(Mime.JSON_STREAM), [('Content-Encoding', 'gzip')]))
+        assert response.status_code == 401
+        response = rest_client.post('/replicas/list', data=data, headers=headers(auth('invalid'), accept(Mime.JSON_STREAM), [('Content-Encoding', 'gzip')]))
+        assert response.status_code == 401
+    mocked_decompress.assert_not_called()
+
+
+@pytest.mark.skipif(not msgpack_available(), reason='msgpack is not installed')
+def test_rest_list_replicas_msgpack_stream(rse_factory, mock_scope, replica_client, rest_client, auth_token):
+    """ REPLICA (REST): encode the replicas with msgpack, if the request accepts it."""
+    rse, _ = rse_factory.make_mock_rse()
+    scope = mock_scope.external
+    files = [{'scope': scope, 'name': did_name_generator('file'), 'bytes': 1, 'adler32': '0cc737eb'} for _ in range(5)]
+    replica_client.add_replicas(rse=rse, files=files)
+    dids = [{'scope': f['scope'], 'name': f['name']} for f in files]
+
+    response = rest_client.post('/replicas/list', data=dumps({'dids': dids}), headers=headers(auth(auth_token), accept('%s, %s;q=0.9' % (MSGPACK_STREAM, Mime.JSON_STREAM))))
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == MSGPACK_STREAM
+    replicas = list(iter_msgpack_stream([response.get_data()]))
+    assert sorted(replica['name'] for replica in replicas) == sorted(did['name'] for did in dids)
+
+
 def test_client_add_list_replicas(rse_factory, replica_client, mock_scope):
     """ REPLICA (CLIENT): Add, change state and list file replicas """
     rse1, _ = rse_factory.make_posix_rse()
@@ -26,6 +26,7 @@ import pytest
 from rucio.common.types import InternalAccount, InternalScope
 from rucio.common.utils import parse_replicas_from_string
 from rucio.core import rse_expression_parser, replica_sorter
+from rucio.core.distance import add_distance
 from rucio.core.replica import add_replicas, delete_replicas
 from rucio.core.rse import add_rse, del_rse, add_rse_attribute, add_protocol, del_rse_attribute
 from rucio.tests.common import rse_name_generator, headers, auth, vohdr, Mime, accept
@@ -481,3 +482,48 @@ def test_get_sorted_list_replicas_no_metalink(vo, rest_client, auth_token, proto
         initial_priorities = _extract_priorities(get_replicas())
         updated_priorities = _extract_priorities(get_replicas())
         assert initial_priorities != updated_priorities, "The replica list is not sorted according to the priorities."
+
+
+def test_sort_geoip_cached_coordinates():
+    """Replicas: test sorting via geoip with the coordinates of the hosts in the local cache."""
+    replica_sorter.HOST_COORDINATES.set('near.example.com', 46.5, 6.6)
+    replica_sorter.HOST_COORDINATES.set('far.example.com', 35.7, 139.7)
+    dictreplica = {'root://far.example.com:1094//f': 'FAR', 'davs://near.example.com:443/f': 'NEAR', 'root://near.example.com:1094//f': 'NEAR'}
+    client_location = {'ip': '127.0.0.1', 'fqdn': None, 'site': None, 'latitude': 46.2, 'longitude': 6.1}
+
+    with mock.patch('rucio.core.replica_sorter.__geoip_db', side_effect=Exception('no lookup expected')):
+        replicas = replica_sorter.sort_geoip(dictreplica, client_location)
+    assert replicas == ['davs://near.example.com:443/f', 'root://near.example.com:1094//f', 'root://far.example.com:1094//f']
+
+
+def test_sort_closeness_and_dynamic(rse_factory):
+    """Replicas: test sorting via the distances from the RSEs to the site of the client."""
+    site = 'SITE_%s' % rse_name_generator()
+    local_rse, local_rse_id = rse_factory.make_mock_rse()
+    near_rse, near_rse_id = rse_factory.make_mock_rse()
+    far_rse, far_rse_id = rse_factory.make_mock_rse()
+    _, unknown_rse_id = rse_factory.make_mock_rse()
+    add_rse_attribute(rse_id=local_rse_id, key='site', value=site)
+    add_distance(near_rse_id, local_rse_id, distance=1)
+    add_distance(far_rse_id, local_rse_id, distance=5)
+    replica_sorter.NETWORK_METRICS.refresh()
+
+    dictreplica = {'root://unknown/f': unknown_rse_id, 'root://far/f': far_rse, 'root://near/f': near_rse_id, 'root://local/f': local_rse}
+    client_location = {'ip': '127.0.0.1', 'fqdn': None, 'site': site}
+    expected = ['root://local/f', 'root://near/f', 'root://far/f', 'root://unknown/f']
+    assert replica_sorter.sort_replicas(dictreplica, client_location, selection='closeness') == expected
+    # No transfers are submitted from these RSEs
+    assert replica_sorter.sort_replicas(dictreplica, client_location, selection='dynamic') == expected
+    assert replica_sorter.sort_replicas(dictreplica, {'ip': '127.0.0.1', 'site': None}, selection='closeness') == list(dictreplica)
+
+
+def test_sort_closeness_without_network_metrics():
+    """Replicas: the closeness sorting keeps the order of the replicas if the network metrics cannot be loaded."""
+    metrics = replica_sorter.NetworkMetrics(refresh_interval=600)
+    dictreplica = {'root://b/f': 'RSE_B', 'root://a/f': 'RSE_A'}
+    client_location = {'ip': '127.0.0.1', 'fqdn': None, 'site': 'SITE'}
+    with mock.patch('rucio.core.replica_sorter.list_network_metrics', side_effect=RuntimeError('database unavailable')), \
+            mock.patch('rucio.core.replica_sorter.NETWORK_METRICS', metrics):
+        assert replica_sorter.sort_replicas(dictreplica, client_location, selection='closeness') == list(dictreplica)
+        assert replica_sorter.sort_replicas(dictreplica, client_location, selection='dynamic') == list(dictreplica)
+    assert metrics.tables() == ({}, {})
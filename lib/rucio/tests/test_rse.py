@@ -384,6 +384,26 @@ def test_delete_rse(vo, rest_client, auth_token):
     assert response.headers.get('ExceptionClass') == 'RSEOperationNotSupported'
 
 
+def test_get_rse_conditional(vo, rest_client, auth_token):
+    """ RSE (REST): Revalidate the RSE details with their ETag """
+    rse_name = rse_name_generator()
+    add_rse(rse_name, vo=vo)
+
+    response = rest_client.get('/rses/{0}'.format(rse_name), headers=headers(auth(auth_token)))
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+
+    response = rest_client.get('/rses/{0}'.format(rse_name), headers=headers(auth(auth_token), hdrdict({'If-None-Match': etag})))
+    assert response.status_code == 304
+    assert not response.get_data()
+
+    update_rse(get_rse_id(rse_name, vo=vo), {'availability_read': False})
+    response = rest_client.get('/rses/{0}'.format(rse_name), headers=headers(auth(auth_token), hdrdict({'If-None-Match': etag})))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
 @pytest.mark.noparallel(reason='uses pre-defined RSE, fails when run in parallel')
 class TestRSEClient:
 
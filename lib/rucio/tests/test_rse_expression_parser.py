@@ -216,6 +216,21 @@ class TestRSEExpressionParserCore:
         expected = sorted([self.rse4_id, self.rse5_id])
         assert value == expected
 
+    def test_attribute_change_invalidates_index(self, rse_factory):
+        """ RSE_EXPRESSION_PARSER (CORE) Test that changing RSE attributes is visible to already evaluated expressions """
+        rse_name, rse_id = rse_factory.make_mock_rse()
+        attribute = attribute_name_generator()
+
+        rse.add_rse_attribute(rse_id, attribute, "de")
+        value = [t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=de" % attribute, **self.filter)]
+        assert value == [rse_id]
+
+        rse.del_rse_attribute(rse_id, attribute)
+        rse.add_rse_attribute(rse_id, attribute, "fr")
+        pytest.raises(InvalidRSEExpression, rse_expression_parser.parse_expression, "%s=de" % attribute, **self.filter)
+        value = [t_rse['id'] for t_rse in rse_expression_parser.parse_expression("%s=fr" % attribute, **self.filter)]
+        assert value == [rse_id]
+
 
 @pytest.mark.noparallel(reason='uses pre-defined RSE')
 class TestRSEExpressionParserClient:
@@ -57,6 +57,51 @@ class TestDeterministicTranslation:
         )
         assert translator.path("foo", "bar") == "foo/4e/99/bar"
 
+    def test_hash_bulk(self):
+        """LFN2PFN: Translate a list of LFNs to paths using the batch hash implementation (Success)"""
+        translator = RSEDeterministicTranslation(
+            rse=self.rse,
+            rse_attributes={
+                'rse': self.rse,
+                'lfn2pfn_algorithm': 'hash',
+            },
+            protocol_attributes=self.protocol_attributes,
+        )
+        lfns = [("foo", "bar"), ("user.foo", "bar"), ("group.phys", "baz"), ("foo", "baz")]
+        assert translator.paths(lfns) == [translator.path(scope, name) for scope, name in lfns]
+        assert translator.paths(lfns)[:2] == ["foo/4e/99/bar", "user/foo/13/7f/bar"]
+
+    def test_bulk_fallback(self):
+        """LFN2PFN: Translate a list of LFNs with an algorithm without batch implementation (Success)"""
+        def static_bulk_test(scope, name, rse, rse_attrs, proto_attrs):
+            """Test function for translating LFNs one at a time."""
+            del rse
+            del rse_attrs
+            del proto_attrs
+            return "%s/static/%s" % (scope, name)
+
+        def static_bulk_test_batch(lfns, rse, rse_attrs, proto_attrs):
+            """Test function registered as batch implementation."""
+            return ["%s/batch/%s" % (scope, name) for scope, name in lfns]
+
+        RSEDeterministicTranslation.register(static_bulk_test)
+        translator = RSEDeterministicTranslation(
+            rse=self.rse,
+            rse_attributes={
+                'rse': self.rse,
+                'lfn2pfn_algorithm': 'static_bulk_test',
+            },
+            protocol_attributes=self.protocol_attributes,
+        )
+        assert translator.paths([("foo", "bar"), ("foo", "baz")]) == ["foo/static/bar", "foo/static/baz"]
+
+        RSEDeterministicTranslation.register_bulk(static_bulk_test_batch, "static_bulk_test")
+        assert translator.paths([("foo", "bar")]) == ["foo/batch/bar"]
+
+        # Replacing the algorithm disables the batch implementation registered for the previous one
+        RSEDeterministicTranslation._LFN2PFN_ALGORITHMS["static_bulk_test"] = lambda scope, name, *args: "replaced"  # pylint: disable=protected-access
+        assert translator.paths([("foo", "bar")]) == ["replaced"]
+
     def test_identity(self):
         """LFN2PFN: Translate to path using identity (Success)"""
         translator = RSEDeterministicTranslation(
@@ -19,7 +19,7 @@ import pytest
 from rucio.common.exception import InsufficientAccountLimit, InsufficientTargetRSEs
 from rucio.core.account_counter import update_account_counter, increase
 from rucio.core.account_limit import set_local_account_limit, set_global_account_limit
-from rucio.core.rse_selector import RSESelector
+from rucio.core.rse_selector import RSESelector, RSESelectorSnapshot
 
 
 @pytest.fixture
@@ -155,3 +155,22 @@ class TestRSESelectorDynamic:
         rse_selector.select_rse(10, [rse2_id], copies=1)
         rses = rse_selector.select_rse(5, [], copies=2)
         assert len(rses) == 2
+
+
+class TestRSESelectorSnapshot:
+
+    def test_shared_snapshot(self, random_account, test_rses):
+        # selectors sharing a snapshot see the same quotas as a selector loading its own data
+        rse1_name, rse1_id, rse1, rse2_name, rse2_id, rse2 = test_rses
+        set_local_account_limit(account=random_account, rse_id=rse1_id, bytes_=20)
+        set_local_account_limit(account=random_account, rse_id=rse2_id, bytes_=-1)
+        increase(rse1_id, random_account, 1, 5)
+        update_account_counter(account=random_account, rse_id=rse1_id)
+        snapshot = RSESelectorSnapshot()
+        expected = {rse['rse_id']: rse['quota_left'] for rse in RSESelector(random_account, [rse1, rse2], None, 1).rses}
+        assert expected == {rse1_id: 15, rse2_id: float('inf')}
+        for _ in range(2):
+            rse_selector = RSESelector(random_account, [rse1, rse2], None, 1, snapshot=snapshot)
+            assert {rse['rse_id']: rse['quota_left'] for rse in rse_selector.rses} == expected
+        assert snapshot.local_limits(random_account, [rse1_id, rse2_id]) == {rse1_id: 20, rse2_id: float('inf')}
+        assert snapshot.usages(random_account) == {rse1_id: 5}
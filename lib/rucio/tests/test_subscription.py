@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from datetime import datetime
-from json import loads
+from json import dumps, loads
 from json.decoder import JSONDecodeError
 
 import pytest
@@ -32,7 +32,7 @@ from rucio.core.rule import add_rule
 from rucio.core.rse import add_rse_attribute
 from rucio.core.scope import add_scope
 from rucio.core import subscription as subscription_core
-from rucio.daemons.transmogrifier.transmogrifier import run, get_subscriptions
+from rucio.daemons.transmogrifier.transmogrifier import run, get_subscriptions, SubscriptionMatcher
 from rucio.db.sqla.constants import AccountType, DIDType
 from rucio.tests.common import headers, auth, did_name_generator, rse_name_generator
 
@@ -437,6 +437,27 @@ class TestSubscriptionClient:
         assert len(rules) == 2
 
 
+def test_subscription_matcher():
+    """ SUBSCRIPTION (DAEMON): Test the indexed matching of DIDs against the subscription filters """
+    subscriptions = [{'id': 1, 'name': 'by_account', 'filter': dumps({'account': 'tier0', 'pattern': '^data.*', 'split_rule': True})},
+                     {'id': 2, 'name': 'by_did_type', 'filter': dumps({'did_type': ['CONTAINER'], 'scope': ['^mc']})},
+                     {'id': 3, 'name': 'by_metadata', 'filter': dumps({'datatype': ['AOD', 'ESD'], 'excluded_pattern': '.*_tid.*'})},
+                     {'id': 4, 'name': 'invalid', 'filter': '{]'}]
+    matcher = SubscriptionMatcher(subscriptions)
+
+    def _metadata(account, did_type, hidden=False, **kwargs):
+        return dict({'account': InternalAccount(account), 'did_type': did_type, 'hidden': hidden}, **kwargs)
+
+    dataset = {'scope': InternalScope('data18'), 'name': 'data18.AOD'}
+    container = {'scope': InternalScope('mc16'), 'name': 'mc16.AOD_tid01'}
+    matches = matcher.match_many([(dataset, _metadata('tier0', DIDType.DATASET, datatype='AOD')),
+                                  (container, _metadata('tier0', DIDType.CONTAINER, datatype='AOD')),
+                                  (container, _metadata('panda', DIDType.CONTAINER, datatype='ESD', hidden=True))])
+    assert [[subscription['name'] for subscription in match] for match in matches] == [['by_account', 'by_metadata'], ['by_did_type'], []]
+    assert matcher.is_split_rule(subscriptions[0])
+    assert not matcher.is_split_rule(subscriptions[1])
+
+
 @pytest.mark.noparallel(reason='uses daemon')
 class TestDaemon:
     def test_run_transmogrifier_chained_subscription_associated_sites_algo(self, rse_factory, vo, rucio_client, root_account):
@@ -17,7 +17,7 @@ import pytest
 from concurrent.futures import ThreadPoolExecutor
 
 from rucio.common.exception import NoDistance
-from rucio.core.distance import add_distance
+from rucio.core.distance import add_distance, update_distances
 from rucio.core.replica import add_replicas
 from rucio.core.request import list_transfer_requests_and_source_replicas
 from rucio.core.transfer import build_transfer_paths
@@ -159,6 +159,29 @@ def test_get_hops(rse_factory):
     assert hop4['dest_rse_id'] == rse6_id
 
 
+def test_get_hops_after_distance_update(rse_factory):
+    _, rse1_id = rse_factory.make_mock_rse()
+    _, rse2_id = rse_factory.make_mock_rse()
+    _, rse3_id = rse_factory.make_mock_rse()
+    all_rses = {rse1_id, rse2_id, rse3_id}
+
+    add_distance(rse1_id, rse2_id, distance=10)
+    add_distance(rse2_id, rse3_id, distance=10)
+    add_distance(rse1_id, rse3_id, distance=100)
+
+    [hop1, hop2] = get_hops(source_rse_id=rse1_id, dest_rse_id=rse3_id, multihop_rses=all_rses)
+    assert hop1['dest_rse_id'] == rse2_id
+    assert hop2['dest_rse_id'] == rse3_id
+
+    # The distance graph is reloaded after a change of the distances
+    update_distances(src_rse_id=rse1_id, dest_rse_id=rse3_id, distance=1)
+    [hop] = Topology(rse_collection=rse_core.RseCollection(), multihop_rses=all_rses).search_shortest_paths(
+        source_rse_ids=[rse1_id], dest_rse_id=rse3_id, operation_src='third_party_copy_read',
+        operation_dest='third_party_copy_write', domain='wan', limit_dest_schemes=[])[rse1_id]
+    assert hop['source_rse_id'] == rse1_id
+    assert hop['dest_rse_id'] == rse3_id
+
+
 def test_disk_vs_tape_priority(rse_factory, root_account, mock_scope):
     tape1_rse_name, tape1_rse_id = rse_factory.make_posix_rse(rse_type=RSEType.TAPE)
     tape2_rse_name, tape2_rse_id = rse_factory.make_posix_rse(rse_type=RSEType.TAPE)
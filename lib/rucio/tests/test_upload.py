@@ -126,6 +126,36 @@ def test_upload_multi(rse, scope, upload_client, download_client, file_factory):
     assert adler32(local_file2) == adler32(downloaded_file2)
 
 
+def test_upload_multi_threaded(rse, scope, upload_client, rucio_client, file_factory):
+    """ UPLOAD (CLIENT): Files uploaded in parallel are available and attached to their dataset. """
+    local_files = [file_factory.file_generator(use_basedir=True) for _ in range(4)]
+    dataset_name = 'dataset_%s' % generate_uuid()
+    items = [{'path': local_file, 'rse': rse, 'did_scope': scope, 'dataset_scope': scope, 'dataset_name': dataset_name}
+             for local_file in local_files]
+
+    assert upload_client.upload(items, num_threads=3) == 0
+
+    file_names = sorted(os.path.basename(local_file) for local_file in local_files)
+    assert sorted(content['name'] for content in rucio_client.list_content(scope, dataset_name)) == file_names
+    replicas = rucio_client.list_replicas([{'scope': scope, 'name': name} for name in file_names], all_states=True)
+    assert [replica['states'][rse] for replica in replicas] == ['AVAILABLE'] * len(file_names)
+
+
+def test_upload_registers_in_bulk(rse, scope, upload_client, file_factory):
+    """ UPLOAD (CLIENT): The files uploaded together are registered with one request per RSE. """
+    local_files = [file_factory.file_generator(use_basedir=True) for _ in range(3)]
+    items = [{'path': local_file, 'rse': rse, 'did_scope': scope} for local_file in local_files]
+
+    with patch.object(upload_client.client, 'add_replicas', wraps=upload_client.client.add_replicas) as add_replicas, \
+            patch.object(upload_client.client, 'add_replication_rule', wraps=upload_client.client.add_replication_rule) as add_replication_rule:
+        assert upload_client.upload(items, num_threads=2) == 0
+
+    assert add_replicas.call_count == 1
+    assert len(add_replicas.call_args.kwargs['files']) == len(local_files)
+    assert add_replication_rule.call_count == 1
+    assert len(add_replication_rule.call_args.args[0]) == len(local_files)
+
+
 def test_upload_file_already_exists_single(rse, scope, upload_client, file_factory):
     traces = []
     local_file = file_factory.file_generator()
@@ -20,7 +20,8 @@ from re import match
 import pytest
 
 from rucio.common.exception import InvalidType
-from rucio.common.utils import md5, adler32, parse_did_filter_from_string, Availability, retrying
+from rucio.common.utils import md5, adler32, calculate_checksums, calculate_checksums_bulk, crc32, sha256, parse_did_filter_from_string, Availability, retrying, \
+    parse_replicas_from_string, parse_replicas_metalink_stream
 from rucio.common.logging import formatted_logger
 
 
@@ -49,6 +50,24 @@ class TestUtils:
         with pytest.raises(Exception, match='FATAL - could not get Adler-32 checksum of file no_file: \\[Errno 2\\] No such file or directory: \'no_file\''):
             adler32('no_file')
 
+    def test_utils_calculate_checksums(self, file_factory):
+        """(COMMON/UTILS): test calculating several checksums of files in a single pass"""
+        temp_file_1 = file_factory.file_generator(data='hello test\n')
+        temp_file_2 = file_factory.file_generator(data='')
+        checksum_names = ['adler32', 'md5', 'sha256', 'crc32']
+
+        ret = calculate_checksums(temp_file_1, checksum_names, block_size=4)
+        assert ret['adler32'] == '198d03ff'
+        assert ret['md5'] == '31d50dd6285b9ff9f8611d0762265d04'
+        assert ret['sha256'] == 'd1b81a303d340fb689c6b6f4f474d9e04f314ed9ad8925686e4106452b53181b'
+        assert ret['crc32'] == 'C843500'
+        assert sha256(temp_file_1) == ret['sha256']
+        assert crc32(temp_file_1) == ret['crc32']
+
+        ret = calculate_checksums_bulk([temp_file_1, temp_file_2], threads=2)
+        assert ret == [{'adler32': '198d03ff', 'md5': '31d50dd6285b9ff9f8611d0762265d04'},
+                       {'adler32': '00000001', 'md5': 'd41d8cd98f00b204e9800998ecf8427e'}]
+
     def test_parse_did_filter_string(self):
         """(COMMON/UTILS): test parsing of did filter string"""
         test_cases = [{
@@ -181,3 +200,27 @@ def test_retrying():
     with pytest.raises(ValueError):
         retry_on_attribute_error()
     assert len(attempts) == 1
+
+
+def test_parse_replicas_metalink_stream():
+    """ (COMMON/UTILS): metalink parsed incrementally is equal to the parsed complete document """
+    metalink = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<metalink xmlns="urn:ietf:params:xml:ns:metalink">\n'
+        + ''.join(
+            f' <file name="file{i}">\n'
+            f'  <parents>\n   <did>mock:dataset</did>\n  </parents>\n'
+            f'  <identity>mock:file{i}</identity>\n'
+            f'  <hash type="adler32">0cc737eb</hash>\n'
+            f'  <size>{i}</size>\n'
+            f'  <url location="MOCK" domain="wan" priority="1" client_extract="false">root://host/file{i}</url>\n'
+            f' </file>\n'
+            for i in range(20)
+        )
+        + '</metalink>\n'
+    ).encode()
+
+    expected = parse_replicas_from_string(metalink)
+    assert len(expected) == 20
+    chunks = (metalink[i:i + 7] for i in range(0, len(metalink), 7))
+    assert list(parse_replicas_metalink_stream(chunks)) == expected
+    assert expected[3]['sources'] == [{'rse': 'MOCK', 'domain': 'wan', 'priority': '1', 'client_extract': False, 'pfn': 'root://host/file3'}]
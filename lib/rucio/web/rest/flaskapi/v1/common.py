@@ -15,6 +15,7 @@
 
 import itertools
 import json
+from io import BytesIO
 import logging
 import re
 from functools import wraps
@@ -30,6 +31,8 @@ from werkzeug.wrappers import Request, Response
 
 from rucio.api.authentication import validate_auth_token
 from rucio.common.exception import DatabaseException, RucioException, CannotAuthenticate, UnsupportedRequestedContentType
+from rucio.common.http_encoding import (JSON_STREAM, MSGPACK_STREAM, accepts_msgpack_stream, compress, compress_stream,
+                                        content_encodings, decompress, json_stream_to_msgpack, negotiate_encoding)
 from rucio.common.schema import get_schema_value
 from rucio.common.utils import generate_uuid, render_json
 from rucio.core.vo import map_vo
@@ -42,6 +45,13 @@ if TYPE_CHECKING:
 
     HeadersType = Union[Headers, Dict[str, str], Sequence[Tuple[str, str]]]
 
+# Content types of the responses which are compressed, if the request accepts a supported encoding
+COMPRESSIBLE_CONTENT_TYPES = ('application/json', JSON_STREAM, MSGPACK_STREAM, 'application/metalink4+xml')
+# Buffered responses smaller than this are not worth compressing
+MIN_COMPRESSED_SIZE = 1024
+# Default bound of the decompressed request bodies, above the largest legitimate bulk requests
+MAX_DECOMPRESSED_REQUEST_SIZE = 64 * 1024 ** 2
+
 
 class CORSMiddleware(object):
     """
@@ -75,6 +85,48 @@ class CORSMiddleware(object):
         return self.app(environ, start_response)
 
 
+class ContentEncodingMiddleware(object):
+    """
+    Decompresses the request bodies sent with a Content-Encoding, so that the views always
+    read the plain body. Only the requests with a valid X-Rucio-Auth-Token are decompressed,
+    and the size of the decompressed body is bounded by the api.max_decompressed_request_size
+    configuration option.
+    """
+
+    def __init__(self, app: flask.Flask) -> typing.NoReturn:
+        self.app = app
+
+    def __call__(self, environ: typing.Dict, start_response: typing.Callable) -> typing.Union[Response, typing.Iterable[bytes]]:
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if not encoding or encoding == 'identity':
+            return self.app(environ, start_response)
+
+        if encoding not in content_encodings():
+            response = generate_http_error_flask(415, 'UnsupportedContentEncoding', 'Unsupported Content-Encoding %s, supported: %s' % (encoding, ', '.join(content_encodings())))
+            return response(environ, start_response)
+
+        try:
+            auth = validate_auth_token(environ.get('HTTP_X_RUCIO_AUTH_TOKEN'))
+        except Exception:
+            logging.exception('Internal error in validate_auth_token')
+            auth = None
+        if auth is None:
+            response = generate_http_error_flask(401, CannotAuthenticate.__name__, 'Cannot authenticate with given credentials')
+            return response(environ, start_response)
+
+        max_size = config.config_get_int('api', 'max_decompressed_request_size', raise_exception=False, default=MAX_DECOMPRESSED_REQUEST_SIZE, check_config_table=False)
+        try:
+            data = decompress(Request(environ).get_data(), encoding, max_size=max_size)
+        except ValueError as error:
+            response = generate_http_error_flask(400, 'InvalidRequestBody', 'Cannot decode the %s request body: %s' % (encoding, error))
+            return response(environ, start_response)
+
+        environ['wsgi.input'] = BytesIO(data)
+        environ['CONTENT_LENGTH'] = str(len(data))
+        del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
+
+
 class ErrorHandlingMethodView(MethodView):
     """
     Special MethodView that handles generic RucioExceptions and more generic
@@ -168,9 +220,52 @@ def response_headers(response):
         response.headers['Cache-Control'] = 'post-check=0, pre-check=0'
         response.headers['Pragma'] = 'no-cache'
 
+    # Advertise the encodings supported for the request bodies (RFC 7694)
+    response.headers['Accept-Encoding'] = ', '.join(content_encodings())
+    _make_conditional(response)
+    _compress_response(response)
+
     return response
 
 
+def _make_conditional(response):
+    """
+    Tag the successful JSON responses to the GET requests, so that the clients caching them
+    can revalidate them, and reply 304 Not Modified if the request matches the tag.
+    """
+    if flask.request.method != 'GET' or response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+        return
+    if response.mimetype != 'application/json':
+        return
+    # Weak, as the same tag is used for all the content encodings of the response
+    response.add_etag(weak=True)
+    response.make_conditional(flask.request)
+
+
+def _compress_response(response):
+    """
+    Compress the body of a successful response with the preferred encoding accepted by the request.
+    """
+    if not 200 <= response.status_code < 300 or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return
+    if response.mimetype not in COMPRESSIBLE_CONTENT_TYPES:
+        return
+    encoding = negotiate_encoding(flask.request.headers.get('Accept-Encoding'))
+    if not encoding:
+        return
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESSED_SIZE:
+            return
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+
+
 def check_accept_header_wrapper_flask(supported_content_types):
     """ Decorator to check if an endpoint supports the requested content type. """
 
@@ -222,16 +317,20 @@ def try_stream(generator, content_type=None) -> "flask.Response":
 
     :param generator: a generator function or an iterator.
     :param content_type: the response's Content-Type.
-                         'application/x-json-stream' by default.
+                         'application/x-json-stream' by default, which is encoded
+                         with msgpack if the request accepts it.
     :returns: a response object with the specified Content-Type.
     """
     if not content_type:
-        content_type = 'application/x-json-stream'
+        content_type = JSON_STREAM
 
     it = iter(generator)
     try:
         peek = next(it)
-        return flask.Response(flask.stream_with_context(itertools.chain((peek,), it)), content_type=content_type)
+        stream = itertools.chain((peek,), it)
+        if content_type == JSON_STREAM and accepts_msgpack_stream(flask.request.accept_mimetypes):
+            stream, content_type = json_stream_to_msgpack(stream), MSGPACK_STREAM
+        return flask.Response(flask.stream_with_context(stream), content_type=content_type)
     except StopIteration:
         return flask.Response('', content_type=content_type)
 
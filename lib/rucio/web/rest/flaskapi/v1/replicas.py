@@ -38,6 +38,29 @@ from rucio.web.rest.flaskapi.v1.common import check_accept_header_wrapper_flask,
 from rucio.web.rest.flaskapi.authenticated_bp import AuthenticatedBlueprint
 
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _coalesce(strings, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Join the small strings produced by a response generator into chunks of
+    about chunk_size characters, such that the response isn't written line by line.
+
+    :param strings: iterable of strings.
+    :param chunk_size: minimal size of the yielded chunks, except for the last one.
+    :yields: the concatenated strings.
+    """
+    buffer, size = [], 0
+    for string in strings:
+        buffer.append(string)
+        size += len(string)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
 def _sorted_with_priorities(replicas, sorted_pfns, limit=None):
     """
     Pick up to "limit" replicas from "replicas" in the order given by sorted_pfns.
@@ -239,7 +262,7 @@ class Replicas(ErrorHandlingMethodView):
                 response_generator = _generate_metalink_response(rfiles, 'atlas', detailed_url=False)
             else:
                 response_generator = _generate_json_response(rfiles)
-            return try_stream(response_generator, content_type=content_type)
+            return try_stream(_coalesce(response_generator), content_type=content_type)
         except DataIdentifierNotFound as error:
             return generate_http_error_flask(404, error)
 
@@ -722,7 +745,7 @@ class ListReplicas(ErrorHandlingMethodView):
                 response_generator = _generate_metalink_response(rfiles, policy_schema)
             else:
                 response_generator = _generate_json_response(rfiles)
-            return try_stream(response_generator, content_type=content_type)
+            return try_stream(_coalesce(response_generator), content_type=content_type)
         except InvalidObject as error:
             return generate_http_error_flask(400, error)
         except DataIdentifierNotFound as error:
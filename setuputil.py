@@ -40,6 +40,10 @@ clients_requirements_table = {
     'dumper': [
         'python-magic',
     ],
+    'compression': [
+        'msgpack',
+        'zstandard',
+    ],
 }
 
 dev_requirements = [
@@ -93,6 +97,10 @@ server_requirements_table = {
         'globus-sdk',
     ],
     'saml': ['python3-saml'],
+    'compression': [
+        'msgpack',
+        'zstandard',
+    ],
     'dev': dev_requirements
 }
 